@@ -12,20 +12,110 @@
 import os
 import sys
 
+# Command names and aliases mapped to the module implementing them.
+# This makes possible to import just the module of the requested
+# command at startup, instead of all of them, which would pull in
+# the whole Entropy Client stack even for "equo version".
+# Commands not listed here are still found by load_all().
+COMMANDS = {
+    "cache": "cache",
+    "cleanup": "cleanup",
+    "conf": "conf",
+    "config": "config",
+    "deptest": "deptest",
+    "dt": "deptest",
+    "download": "download",
+    "fetch": "download",
+    "help": "help",
+    "-h": "help",
+    "--help": "help",
+    "hop": "hop",
+    "install": "install",
+    "i": "install",
+    "libtest": "libtest",
+    "lt": "libtest",
+    "mask": "mask",
+    "unmask": "mask",
+    "match": "match",
+    "m": "match",
+    "moo": "moo",
+    "lxnay": "moo",
+    "notice": "notice",
+    "pkg": "pkg",
+    "smart": "pkg",
+    "preservedlibs": "preservedlibs",
+    "pl": "preservedlibs",
+    "query": "query",
+    "q": "query",
+    "remove": "remove",
+    "rm": "remove",
+    "repo": "repo",
+    "rescue": "rescue",
+    "search": "search",
+    "s": "search",
+    "security": "security",
+    "sec": "security",
+    "source": "source",
+    "src": "source",
+    "status": "status",
+    "st": "status",
+    "--info": "status",
+    "ugc": "ugc",
+    "unusedpackages": "unused",
+    "unused": "unused",
+    "update": "update",
+    "up": "update",
+    "upgrade": "upgrade",
+    "u": "upgrade",
+    "version": "version",
+    "--version": "version",
+    "yell": "yell",
+}
+
 _cur_file = sys.modules[__name__].__file__
 _cur_dir = os.path.dirname(_cur_file)
 _excluded_mods = ["descriptor"]
-for py_file in os.listdir(_cur_dir):
-    if not py_file.endswith(".py"):
-        continue
-    if py_file.startswith("_"):
-        continue
-    # strip .py
-    _mod = "solo.commands." + py_file[:-3]
-    if _mod in _excluded_mods:
-        continue
-    try:
-        __import__(_mod)
-    except ValueError:
-        # garbage
-        continue
+
+def load(name):
+    """
+    Return the SoloCommand class bound to the given command name or
+    alias, importing only the module implementing it, if known.
+    Otherwise, all the command modules are imported.
+
+    @param name: command name or alias
+    @type name: string
+    @return: the SoloCommand class or None, if not found
+    @rtype: SoloCommand class or None
+    """
+    from solo.commands.descriptor import SoloCommandDescriptor
+
+    module = COMMANDS.get(name)
+    if module is not None:
+        __import__("solo.commands." + module)
+    else:
+        load_all()
+
+    descriptor = SoloCommandDescriptor.lookup(name)
+    if descriptor is None:
+        return None
+    return descriptor.get_class()
+
+def load_all():
+    """
+    Import all the command modules, registering their
+    SoloCommandDescriptor objects.
+    """
+    for py_file in os.listdir(_cur_dir):
+        if not py_file.endswith(".py"):
+            continue
+        if py_file.startswith("_"):
+            continue
+        # strip .py
+        _mod = py_file[:-3]
+        if _mod in _excluded_mods:
+            continue
+        try:
+            __import__("solo.commands." + _mod)
+        except ValueError:
+            # garbage
+            continue
@@ -16,12 +16,9 @@ import argparse
 from entropy.i18n import _
 from entropy.const import const_convert_to_unicode, \
     const_convert_to_rawstring
-from entropy.locks import EntropyResourcesLock
 from entropy.output import darkgreen, teal, purple, print_error, \
     print_generic, bold, brown
 from entropy.exceptions import PermissionDenied
-from entropy.client.interfaces import Client
-from entropy.core.settings.base import SystemSettings
 
 import entropy.tools
 
@@ -316,12 +313,14 @@ class SoloCommand(object):
         Return the Entropy Client object.
         This method is not thread safe.
         """
+        from entropy.client.interfaces import Client
         return Client(*args, **kwargs)
 
     def _entropy_class(self):
         """
         Return the Entropy Client class object.
         """
+        from entropy.client.interfaces import Client
         return Client
 
     def _entropy_bashcomp(self):
@@ -332,6 +331,7 @@ class SoloCommand(object):
         Entropy object loaded by _entropy() at the cost
         of less consistency checks.
         """
+        from entropy.client.interfaces import Client
         return Client(indexing=False, repo_validation=False)
 
     def _entropy_ws(self, entropy_client, repository_id, tx_cb=False):
@@ -372,6 +372,8 @@ class SoloCommand(object):
         Resources Lock, for given repository at repo.
         The signature of func is: int func(entropy_client).
         """
+        from entropy.locks import EntropyResourcesLock
+
         client_class = None
         client = None
         acquired = False
@@ -416,6 +418,8 @@ class SoloCommand(object):
         Resources Lock in shared mode, for given repository at repo.
         The signature of func is: int func(entropy_client).
         """
+        from entropy.locks import EntropyResourcesLock
+
         client_class = None
         client = None
         acquired = False
@@ -443,6 +447,7 @@ class SoloCommand(object):
         """
         Return a SystemSettings instance.
         """
+        from entropy.core.settings.base import SystemSettings
         return SystemSettings()
 
     def _show_did_you_mean(self, entropy_client, package, from_installed):
@@ -32,8 +32,11 @@ class SoloCommandDescriptor(object):
     @staticmethod
     def obtain():
         """
-        Get the list of registered SoloCommandDescriptor object
+        Get the list of registered SoloCommandDescriptor object.
+        All the command modules are imported, if not already.
         """
+        from solo.commands import load_all
+        load_all()
         return SoloCommandDescriptor.SOLO_COMMANDS[:]
 
     @staticmethod
@@ -49,6 +52,25 @@ class SoloCommandDescriptor(object):
         """
         return SoloCommandDescriptor.SOLO_COMMANDS_MAP[name]
 
+    @staticmethod
+    def lookup(name):
+        """
+        Get an already registered SoloCommandDescriptor object
+        through its name or one of its aliases.
+
+        @param name: name or alias of the SoloCommandDescriptor
+        @type name: string
+        @return: the SoloCommandDescriptor object or None, if not found
+        @rtype: SoloCommandDescriptor or None
+        """
+        descriptor = SoloCommandDescriptor.SOLO_COMMANDS_MAP.get(name)
+        if descriptor is not None:
+            return descriptor
+        for descriptor in SoloCommandDescriptor.SOLO_COMMANDS:
+            if name in descriptor.get_class().ALIASES:
+                return descriptor
+        return None
+
     def __init__(self, klass, name, description):
         self._klass = klass
         self._name = name
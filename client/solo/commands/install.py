@@ -605,7 +605,8 @@ Install or update packages or package files.
             # state.
             notif_acquired = notification_lock.try_acquire_shared()
 
-            for count, pkg_match in enumerate(run_queue, 1):
+            actions = []
+            for pkg_match in run_queue:
 
                 metaopts = {
                     'removeconfig': config_files,
@@ -621,16 +622,18 @@ Install or update packages or package files.
                     metaopts['install_source'] = \
                         etpConst['install_sources']['automatic_dependency']
 
-                package_id, repository_id = pkg_match
-                atom = entropy_client.open_repository(
-                    repository_id).retrieveAtom(package_id)
-
-                pkg = None
-                try:
-                    pkg = action_factory.get(
+                actions.append(
+                    action_factory.get(
                         action_factory.INSTALL_ACTION,
-                        pkg_match, opts=metaopts)
+                        pkg_match, opts=metaopts))
+
+            # unpack the upcoming packages while the current one is
+            # being merged
+            pipeline = action_factory.get_install_pipeline(actions)
+            try:
+                for count, pkg in enumerate(actions, 1):
 
+                    atom = pkg.atom()
                     xterm_header = "equo (%s) :: %d of %d ::" % (
                         _("install"), count, total)
 
@@ -641,15 +644,18 @@ Install or update packages or package files.
                         count=(count, total),
                         header=darkgreen(" +++ ") + ">>> ")
 
+                    pipeline.advance(pkg)
                     exit_st = pkg.start()
+                    pkg.finalize()
                     if exit_st != 0:
                         if ugc_thread is not None:
                             ugc_thread.join()
                         return 1, True
 
-                finally:
-                    if pkg is not None:
-                        pkg.finalize()
+            finally:
+                pipeline.close()
+                for pkg in actions:
+                    pkg.finalize()
 
         finally:
             if notif_acquired:
@@ -85,6 +85,24 @@ Test system integrity by looking for missing libraries.
                             help=_("dump results to files"))
         _commands.append("--dump")
 
+        parser.add_argument("--json", action="store_true",
+                            default=False,
+                            help=_("print machine readable (JSON) "
+                                   "results to stdout"))
+        _commands.append("--json")
+
+        parser.add_argument("--jobs", "-j", type=int, metavar="<jobs>",
+                            default=4,
+                            help=_("number of parallel scanning jobs"))
+        _commands.append("--jobs")
+        _commands.append("-j")
+
+        parser.add_argument("--no-cache", action="store_true",
+                            default=False,
+                            help=_("do not use the cached metadata of "
+                                   "unchanged files"))
+        _commands.append("--no-cache")
+
         self._commands = _commands
         return parser
 
@@ -117,19 +135,30 @@ Test system integrity by looking for missing libraries.
         pretend = self._nsargs.pretend
         listfiles = self._nsargs.listfiles
         dump = self._nsargs.dump
+        json_report = self._nsargs.json
+        jobs = max(1, self._nsargs.jobs)
+        use_cache = not self._nsargs.no_cache
         inst_repo = entropy_client.installed_repository()
 
-        if listfiles:
+        if listfiles or json_report:
             quiet = True
 
+        report_file = None
+        if json_report:
+            report_file = sys.stdout
+
         qa = entropy_client.QA()
 
         with inst_repo.shared():
             pkgs_matched, brokenlibs, exit_st = qa.test_shared_objects(
-                inst_repo, dump_results_to_file=dump, silent=quiet)
+                inst_repo, dump_results_to_file=dump, silent=quiet,
+                jobs=jobs, use_cache=use_cache, report_file=report_file)
             if exit_st != 0:
                 return 1
 
+        if json_report:
+            return 0
+
         if listfiles:
             for lib in brokenlibs:
                 entropy_client.output(lib, level="generic")
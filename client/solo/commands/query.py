@@ -362,11 +362,12 @@ Repository query tools.
         results = {}
         reverse_symlink_map = entropy_client.Settings(
             )['system_rev_symlinks']
+        owners = inst_repo.searchBelongsMany(files)
 
         for xfile in files:
             outcome = results.setdefault(xfile, set())
 
-            pkg_ids = inst_repo.searchBelongs(xfile)
+            pkg_ids = owners[xfile]
             if not pkg_ids:
                 # try real path if possible
                 pkg_ids = inst_repo.searchBelongs(
@@ -25,6 +25,7 @@ from entropy.exceptions import SystemDatabaseError, OnlineMirrorError, \
 
 import entropy.tools
 
+from solo.commands import load as load_command
 from solo.commands.descriptor import SoloCommandDescriptor
 from solo.utils import read_client_release
 
@@ -246,6 +247,15 @@ def warn_live_system():
              " severely compromised")))
     print_warning("")
 
+def get_catch_all_command():
+    """
+    Return the SoloCommand class handling unknown commands.
+    """
+    for descriptor in SoloCommandDescriptor.obtain():
+        klass = descriptor.get_class()
+        if klass.CATCH_ALL:
+            return klass
+
 def main():
 
     is_color = "--color" in sys.argv
@@ -259,17 +269,6 @@ def main():
 
     install_exception_handler()
 
-    descriptors = SoloCommandDescriptor.obtain()
-    args_map = {}
-    catch_all = None
-    for descriptor in descriptors:
-        klass = descriptor.get_class()
-        if klass.CATCH_ALL:
-            catch_all = klass
-        args_map[klass.NAME] = klass
-        for alias in klass.ALIASES:
-            args_map[alias] = klass
-
     args = sys.argv[1:]
     # convert args to unicode, to avoid passing
     # raw string stuff down to entropy layers
@@ -299,11 +298,16 @@ def main():
         last_arg = args[-1]
         cmd = args[0]
         args = args[1:]
-    cmd_class = args_map.get(cmd)
-    yell_class = args_map.get("yell")
+
+    # only import the module implementing the requested command,
+    # all of them are imported if it's unknown or the catch all
+    # command is needed.
+    cmd_class = None
+    if cmd is not None:
+        cmd_class = load_command(cmd)
 
     if cmd_class is None:
-        cmd_class = catch_all
+        cmd_class = get_catch_all_command()
 
     cmd_obj = cmd_class(args)
     if is_bashcomp:
@@ -316,10 +320,10 @@ def main():
     # non-root users not allowed
     allowed = True
     if os.getuid() != 0 and \
-            cmd_class is not catch_all and \
+            not cmd_class.CATCH_ALL and \
             not cmd_class.ALLOW_UNPRIVILEGED and \
             "--help" not in args:
-            cmd_class = catch_all
+            cmd_class = get_catch_all_command()
             allowed = False
 
     if allowed:
@@ -330,6 +334,7 @@ def main():
 
         func, func_args = cmd_obj.parse()
         exit_st = func(*func_args)
+        yell_class = load_command("yell")
         if exit_st == -10:
             # syntax error, yell at user
             func, func_args = yell_class(args).parse()
@@ -23,16 +23,368 @@ import tempfile
 
 from entropy.const import etpConst, const_debug_write, \
     const_debug_enabled, const_pid_exists, const_setup_perms, \
-    const_mkdtemp
+    const_mkdtemp, const_setup_file, const_is_python3
 from entropy.core import Singleton
 from entropy.misc import TimeScheduled, ParallelTask, Lifo
 import time
 import threading
 import copy
+import sqlite3
 
 import entropy.dump
 import entropy.tools
 
+class EntropyCacheStore(object):
+
+    """
+    Single file, SQLite-backed, cache storage used by EntropyCacher
+    when the "store" backend is selected. Cached objects are kept into
+    one table, an in-memory index of the stored keys avoids hitting the
+    disk for cache misses. The store size is bounded, least recently
+    used objects are evicted first.
+
+    Sample code:
+
+    >>> store = EntropyCacheStore("/var/lib/entropy/caches", 1024000)
+    >>> store.set("my_identifier", [1, 2, 3])
+    >>> store.get("my_identifier")
+    [1, 2, 3]
+    >>> store.remove_prefix("my_")
+    >>> store.close()
+    """
+
+    FILE_NAME = "__cache_store__.db"
+
+    # when evicting, shrink the store down to this fraction of max_size
+    _EVICTION_RATIO = 0.8
+
+    def __init__(self, cache_dir, max_size):
+        """
+        EntropyCacheStore constructor.
+
+        @param cache_dir: cache directory the store file is placed into
+        @type cache_dir: string
+        @param max_size: maximum size of the stored objects, in bytes
+        @type max_size: int
+        """
+        object.__init__(self)
+        self._cache_dir = cache_dir
+        self._path = os.path.join(cache_dir, EntropyCacheStore.FILE_NAME)
+        self._max_size = max_size
+        self._lock = threading.RLock()
+        self._conn = None
+        # key -> [mtime, atime, size]
+        self._index = None
+        self._data_version_seen = None
+        self._size = 0
+        self._touched = set()
+
+    def path(self):
+        """
+        Return the path to the store file.
+
+        @return: store file path
+        @rtype: string
+        """
+        return self._path
+
+    def _connection(self):
+        """
+        Open the store file, if needed, and load the key index. If the
+        store file is already open, the key index is reloaded when
+        another process has modified the store in the meantime.
+        Must be called with self._lock held.
+        """
+        if self._conn is not None:
+            self._refresh_index(self._conn)
+            return self._conn
+
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir, 0o775)
+            const_setup_perms(self._cache_dir, etpConst['entropygid'])
+
+        conn = sqlite3.connect(self._path, timeout = 30.0,
+            check_same_thread = False)
+        try:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key VARCHAR PRIMARY KEY,
+                data BLOB,
+                mtime FLOAT,
+                atime FLOAT,
+                size INTEGER
+            );
+            """)
+            conn.commit()
+            const_setup_file(self._path, etpConst['entropygid'], 0o664)
+            self._load_index(conn)
+        except sqlite3.Error:
+            conn.close()
+            raise
+
+        self._conn = conn
+        return conn
+
+    def _data_version(self, conn):
+        """
+        Return the SQLite data version of the store file. The value
+        changes whenever another connection (and thus, another process)
+        commits a change to the store.
+        """
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load_index(self, conn):
+        """
+        (Re)load the key index from the store file. Access times of the
+        objects read since last flush are retained.
+        Must be called with self._lock held.
+        """
+        data_version = self._data_version(conn)
+        index = {}
+        size = 0
+        cur = conn.execute("SELECT key, mtime, atime, size FROM cache")
+        for key, mtime, atime, obj_size in cur:
+            index[key] = [mtime, atime, obj_size]
+            size += obj_size
+
+        old_index = self._index
+        if old_index is not None:
+            for key in list(self._touched):
+                meta = index.get(key)
+                if meta is None:
+                    self._touched.discard(key)
+                    continue
+                old_meta = old_index.get(key)
+                if old_meta is not None:
+                    meta[1] = max(meta[1], old_meta[1])
+
+        self._index = index
+        self._size = size
+        self._data_version_seen = data_version
+
+    def _refresh_index(self, conn):
+        """
+        Reload the key index if the store file has been modified by
+        another process since it was last loaded.
+        Must be called with self._lock held.
+        """
+        if self._data_version(conn) != self._data_version_seen:
+            self._load_index(conn)
+
+    def _serialize(self, data):
+        """
+        Serialize data using the entropy.dump pickle settings.
+        """
+        pickle = entropy.dump.pickle
+        if const_is_python3():
+            return pickle.dumps(data,
+                protocol = entropy.dump.COMPAT_PICKLE_PROTOCOL,
+                fix_imports = True)
+        return pickle.dumps(data)
+
+    def _flush_atimes(self, conn):
+        """
+        Write the access times of the objects read since last flush.
+        Must be called with self._lock held.
+        """
+        if not self._touched:
+            return
+        conn.executemany("UPDATE cache SET atime = ? WHERE key = ?",
+            [(self._index[key][1], key) for key in self._touched \
+                 if key in self._index])
+        self._touched.clear()
+
+    def _evict(self, conn):
+        """
+        Evict the least recently used objects until the store size drops
+        below the configured threshold. Must be called with self._lock
+        held.
+        """
+        if self._size <= self._max_size:
+            return
+
+        target = int(self._max_size * EntropyCacheStore._EVICTION_RATIO)
+        keys = sorted(self._index.keys(), key = lambda x: self._index[x][1])
+        evicted = []
+        for key in keys:
+            if self._size <= target:
+                break
+            self._size -= self._index.pop(key)[2]
+            self._touched.discard(key)
+            evicted.append((key,))
+        conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+
+    def get(self, key, aging_days = None):
+        """
+        Return the object stored under key, or None.
+
+        @param key: cache data identifier
+        @type key: string
+        @keyword aging_days: if int, consider the cached object invalid
+            if older than aging_days
+        @type aging_days: int
+        @return: stored object or None
+        @rtype: any Python pickable object or None
+        """
+        with self._lock:
+            try:
+                conn = self._connection()
+            except (sqlite3.Error, OSError, IOError):
+                return None
+
+            meta = self._index.get(key)
+            if meta is None:
+                return None
+
+            cur_t = time.time()
+            if aging_days is not None:
+                if abs(cur_t - meta[0]) > (aging_days * 86400):
+                    # do not remove, other consumers might
+                    # have different aging settings.
+                    return None
+
+            try:
+                row = conn.execute(
+                    "SELECT data FROM cache WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+            if row is None:
+                # removed by another process
+                self._size -= self._index.pop(key)[2]
+                self._touched.discard(key)
+                return None
+
+            meta[1] = cur_t
+            self._touched.add(key)
+
+        try:
+            return entropy.dump.unserialize_string(bytes(row[0]))
+        except (ValueError, EOFError, IOError, OSError,
+            entropy.dump.pickle.UnpicklingError, TypeError,
+            AttributeError, ImportError, SystemError,):
+            return None
+
+    def set_many(self, items):
+        """
+        Store the given objects.
+
+        @param items: list of (key, data) tuples
+        @type items: list
+        @raise IOError: if data cannot be stored
+        """
+        rows = []
+        for key, data in items:
+            try:
+                blob = self._serialize(data)
+            except (RuntimeError, TypeError,
+                    entropy.dump.pickle.PicklingError):
+                continue
+            rows.append((key, blob))
+        if not rows:
+            return
+
+        with self._lock:
+            try:
+                conn = self._connection()
+                # acquire the write lock before touching the index,
+                # so that eviction works on the most recent view of
+                # the store, other processes may be writing to it.
+                conn.execute("BEGIN IMMEDIATE")
+                self._refresh_index(conn)
+                cur_t = time.time()
+                for key, blob in rows:
+                    old = self._index.get(key)
+                    if old is not None:
+                        self._size -= old[2]
+                    self._index[key] = [cur_t, cur_t, len(blob)]
+                    self._size += len(blob)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                    [(key, sqlite3.Binary(blob), cur_t, cur_t, len(blob)) \
+                         for key, blob in rows])
+                self._flush_atimes(conn)
+                self._evict(conn)
+                conn.commit()
+            except (sqlite3.Error, OSError) as err:
+                if self._conn is not None:
+                    try:
+                        self._conn.rollback()
+                    except sqlite3.Error:
+                        pass
+                    # the in-memory index may be out of sync now
+                    self._data_version_seen = None
+                raise IOError("cannot write to %s: %s" % (
+                    self._path, repr(err)))
+
+    def set(self, key, data):
+        """
+        Store the given object under key.
+
+        @param key: cache data identifier
+        @type key: string
+        @param data: picklable object
+        @type data: any picklable object
+        @raise IOError: if data cannot be stored
+        """
+        self.set_many([(key, data)])
+
+    def remove_prefix(self, prefix, keep_suffix = None):
+        """
+        Remove all the objects whose key starts with prefix. An empty
+        prefix removes everything.
+
+        @param prefix: cache data identifier prefix
+        @type prefix: string
+        @keyword keep_suffix: retain the objects whose key ends with it
+        @type keep_suffix: string
+        """
+        with self._lock:
+            try:
+                conn = self._connection()
+            except (sqlite3.Error, OSError, IOError):
+                return
+            keys = [x for x in self._index if x.startswith(prefix)]
+            if keep_suffix is not None:
+                keys = [x for x in keys if not x.endswith(keep_suffix)]
+            for key in keys:
+                self._size -= self._index.pop(key)[2]
+                self._touched.discard(key)
+            try:
+                conn.executemany("DELETE FROM cache WHERE key = ?",
+                    [(x,) for x in keys])
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def sync(self):
+        """
+        Write pending metadata (object access times) to disk.
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._flush_atimes(self._conn)
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        """
+        Write pending metadata and close the store file. The store is
+        reopened automatically on next use.
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            self.sync()
+            self._conn.close()
+            self._conn = None
+            self._index = None
+            self._data_version_seen = None
+            self._size = 0
+
+
 class EntropyCacher(Singleton):
 
     # Max number of cache objects written at once
@@ -46,6 +398,19 @@ class EntropyCacher(Singleton):
     # yet able to write data to disk.
     STASHING_CACHE = True
 
+    # Available cache storage backends: one pickle file per key
+    # (entropy.dump) or a single EntropyCacheStore file.
+    BACKEND_FILES = "files"
+    BACKEND_STORE = "store"
+
+    # Default maximum size of EntropyCacheStore, in bytes
+    STORE_MAX_SIZE = 256 * 1024 * 1024
+
+    _backend = BACKEND_FILES
+    _store_max_size = STORE_MAX_SIZE
+    _stores = {}
+    _stores_lock = threading.Lock()
+
     """
     Entropy asynchronous and synchronous cache writer
     and reader. This class is a Singleton and contains
@@ -171,6 +536,17 @@ class EntropyCacher(Singleton):
                 pass
 
         def _commit_data(_massive_data):
+            if EntropyCacher._backend == EntropyCacher.BACKEND_STORE:
+                by_dir = {}
+                for (key, cache_dir), data in _massive_data:
+                    by_dir.setdefault(cache_dir, []).append((key, data))
+                for cache_dir, items in by_dir.items():
+                    try:
+                        EntropyCacher._get_store(cache_dir).set_many(items)
+                    except IOError:
+                        pass
+                return
+
             for (key, cache_dir), data in _massive_data:
                 d_o = entropy.dump.dumpobj
                 if d_o is not None:
@@ -238,6 +614,74 @@ class EntropyCacher(Singleton):
         """
         return entropy.dump.D_DIR
 
+    @classmethod
+    def set_backend(cls, backend, store_max_size = None):
+        """
+        Select the cache storage backend, either BACKEND_FILES (one file
+        per cached object) or BACKEND_STORE (single EntropyCacheStore file
+        per cache directory). This should be called before start().
+
+        @param backend: cache storage backend identifier
+        @type backend: string
+        @keyword store_max_size: EntropyCacheStore maximum size in bytes
+        @type store_max_size: int
+        @raise ValueError: if backend is not supported
+        """
+        if backend not in (cls.BACKEND_FILES, cls.BACKEND_STORE):
+            raise ValueError("unsupported cache backend: %s" % (backend,))
+        if store_max_size is None:
+            store_max_size = cls.STORE_MAX_SIZE
+        cls._backend = backend
+        cls._store_max_size = store_max_size
+
+    @classmethod
+    def backend(cls):
+        """
+        Return the currently selected cache storage backend.
+
+        @return: cache storage backend identifier
+        @rtype: string
+        """
+        return cls._backend
+
+    @classmethod
+    def _get_store(cls, cache_dir):
+        """
+        Return the EntropyCacheStore instance bound to cache_dir.
+        """
+        with cls._stores_lock:
+            store = cls._stores.get(cache_dir)
+            if store is None:
+                store = EntropyCacheStore(cache_dir, cls._store_max_size)
+                cls._stores[cache_dir] = store
+            return store
+
+    @classmethod
+    def _close_stores(cls):
+        """
+        Close all the open EntropyCacheStore instances.
+        """
+        with cls._stores_lock:
+            stores = list(cls._stores.values())
+            cls._stores.clear()
+        for store in stores:
+            store.close()
+
+    @classmethod
+    def purge_stores(cls):
+        """
+        Remove all the objects from the open EntropyCacheStore instances
+        and close them. This must be called before removing the cache
+        directory, otherwise the open stores would keep serving the
+        removed objects and writing to a deleted file.
+        """
+        with cls._stores_lock:
+            stores = list(cls._stores.values())
+            cls._stores.clear()
+        for store in stores:
+            store.remove_prefix("")
+            store.close()
+
     def start(self):
         """
         This is the method used to start the asynchronous cache
@@ -287,6 +731,7 @@ class EntropyCacher(Singleton):
             self.__cache_writer.join()
             self.__cache_writer = None
         self.sync()
+        EntropyCacher._close_stores()
 
     def sync(self):
         """
@@ -296,6 +741,10 @@ class EntropyCacher(Singleton):
         buffer overloads.
         """
         self.__cacher(run_until_empty = True, sync = True)
+        with EntropyCacher._stores_lock:
+            stores = list(EntropyCacher._stores.values())
+        for store in stores:
+            store.sync()
 
     def discard(self):
         """
@@ -321,6 +770,9 @@ class EntropyCacher(Singleton):
         """
         if cache_dir is None:
             cache_dir = self.current_directory()
+        if EntropyCacher._backend == EntropyCacher.BACKEND_STORE:
+            self._get_store(cache_dir).set(key, data)
+            return
         try:
             with self.__dump_data_lock:
                 entropy.dump.dumpobj(key, data, dump_dir = cache_dir,
@@ -372,6 +824,12 @@ class EntropyCacher(Singleton):
             #    const_debug_write(__name__,
             #        "EntropyCacher.push, sync push %s, into %s" % (
             #            key, cache_dir,))
+            if EntropyCacher._backend == EntropyCacher.BACKEND_STORE:
+                try:
+                    self._get_store(cache_dir).set(key, data)
+                except IOError:
+                    pass
+                return
             with self.__dump_data_lock:
                 entropy.dump.dumpobj(key, data, dump_dir = cache_dir)
 
@@ -397,6 +855,10 @@ class EntropyCacher(Singleton):
             if ram_obj is not None:
                 return ram_obj
 
+        if EntropyCacher._backend == EntropyCacher.BACKEND_STORE:
+            return self._get_store(cache_dir).get(
+                key, aging_days = aging_days)
+
         l_o = entropy.dump.loadobj
         if not l_o:
             return
@@ -414,6 +876,12 @@ class EntropyCacher(Singleton):
         """
         if cache_dir is None:
             cache_dir = cls.current_directory()
+        if cls._backend == cls.BACKEND_STORE:
+            prefix = os.path.dirname(cache_item)
+            if prefix:
+                prefix += "/"
+            cls._get_store(cache_dir).remove_prefix(prefix)
+
         dump_path = os.path.join(cache_dir, cache_item)
 
         dump_dir = os.path.dirname(dump_path)
@@ -433,6 +901,48 @@ class EntropyCacher(Singleton):
                 pass
 
 
+    @classmethod
+    def remove_prefix(cls, prefix, keep_suffix = None, cache_dir = None):
+        """
+        Remove all the cached objects whose key starts with prefix, from
+        the selected cache storage backend. This is used to evict the
+        objects computed against older versions of their source data,
+        which is encoded at the end of their key.
+
+        @param prefix: cache data identifier prefix
+        @type prefix: string
+        @keyword keep_suffix: retain the objects whose key ends with it
+        @type keep_suffix: string
+        @keyword cache_dir: alternative cache directory
+        @type cache_dir: string
+        """
+        if cache_dir is None:
+            cache_dir = cls.current_directory()
+        if cls._backend == cls.BACKEND_STORE:
+            cls._get_store(cache_dir).remove_prefix(
+                prefix, keep_suffix = keep_suffix)
+            return
+
+        prefix_dir = os.path.dirname(prefix)
+        dump_dir = os.path.join(cache_dir, prefix_dir)
+        for currentdir, subdirs, files in os.walk(dump_dir):
+            key_dir = os.path.relpath(currentdir, cache_dir)
+            for item in files:
+                if not item.endswith(entropy.dump.D_EXT):
+                    continue
+                key = item[:-len(entropy.dump.D_EXT)]
+                if key_dir != os.curdir:
+                    key = "%s/%s" % (key_dir, key)
+                if not key.startswith(prefix):
+                    continue
+                if keep_suffix is not None and key.endswith(keep_suffix):
+                    continue
+                try:
+                    os.remove(os.path.join(currentdir, item))
+                except (OSError, IOError,):
+                    pass
+
+
 class MtimePingus(object):
 
     """
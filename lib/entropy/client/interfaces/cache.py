@@ -40,6 +40,9 @@ class CacheMixin:
             with self._repodb_cache_mutex:
                 for repo in self._repodb_cache.values():
                     repo.clearCache()
+            # the cache store file is going to be removed, other
+            # processes will find it empty.
+            self._cacher.purge_stores()
             cache_dir = self._cacher.current_directory()
             try:
                 shutil.rmtree(cache_dir, True)
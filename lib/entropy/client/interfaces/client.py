@@ -14,7 +14,8 @@ import threading
 
 from entropy.core import Singleton
 from entropy.locks import EntropyResourcesLock
-from entropy.fetchers import UrlFetcher, MultipleUrlFetcher
+from entropy.fetchers import UrlFetcher, MultipleUrlFetcher, \
+    UrlConnectionPool
 from entropy.output import TextInterface, bold, red, darkred, blue
 from entropy.client.interfaces.loaders import LoadersMixin
 from entropy.client.interfaces.cache import CacheMixin
@@ -76,6 +77,8 @@ class Client(Singleton, TextInterface, LoadersMixin, CacheMixin,
         self._repo_error_messages_cache = set()
         self._repodb_cache = {}
         self._repodb_cache_mutex = threading.RLock()
+        self._package_indexes = {}
+        self._package_indexes_mutex = threading.Lock()
         self._memory_db_instances = {}
         self._real_installed_repository = None
         self._real_installed_repository_lock = threading.RLock()
@@ -197,6 +200,9 @@ class Client(Singleton, TextInterface, LoadersMixin, CacheMixin,
                     # needs to be started here otherwise repository
                     # cache will be always dropped
                     if self.xcache:
+                        backend, store_max_size = self._cache_backend()
+                        EntropyCacher.set_backend(
+                            backend, store_max_size = store_max_size)
                         self._real_cacher.start()
                     else:
                         # disable STASHING_CACHE or we leak
@@ -204,6 +210,21 @@ class Client(Singleton, TextInterface, LoadersMixin, CacheMixin,
 
         return self._real_cacher
 
+    def _cache_backend(self):
+        """
+        Return the EntropyCacher backend and store size configured in
+        client.conf as a (backend, store_max_size) tuple. If the Entropy
+        Client SystemSettings plugin is no longer available (for example,
+        when the cacher is first used by shutdown(), after destroy()),
+        the default files backend is returned.
+        """
+        try:
+            misc_settings = self.ClientSettings()['misc']
+        except KeyError:
+            return EntropyCacher.BACKEND_FILES, EntropyCacher.STORE_MAX_SIZE
+        return misc_settings['cache_backend'], \
+            misc_settings['cache_store_size']
+
     @property
     def logger(self):
         """
@@ -300,6 +321,7 @@ class Client(Singleton, TextInterface, LoadersMixin, CacheMixin,
         self._cacher.sync()  # enforce, destroy() may kill the current content
         self.destroy(_from_shutdown = True)
         self._cacher.stop()
+        UrlConnectionPool().clear()
         entropy.tools.kill_threads()
 
     @sharedinstlock
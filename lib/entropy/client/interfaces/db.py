@@ -9,8 +9,10 @@
     B{Entropy Package Manager Client EntropyRepository plugin code}.
 
 """
+import array
 import codecs
 import errno
+import hashlib
 import os
 import shutil
 import subprocess
@@ -21,12 +23,13 @@ import time
 from entropy.const import const_debug_write, const_setup_perms, etpConst, \
     const_set_nice_level, const_setup_file, const_convert_to_unicode, \
     const_debug_enabled, const_mkdtemp, const_mkstemp, const_file_readable, \
-    const_file_writable
+    const_file_writable, const_convert_to_rawstring, const_is_python3
 from entropy.output import blue, darkred, red, darkgreen, purple, teal, brown, \
     bold, TextInterface
-from entropy.dump import dumpobj, loadobj
+from entropy.dump import dumpobj
 from entropy.cache import EntropyCacher
 from entropy.db import EntropyRepository
+from entropy.db.delta import EntropyRepositoryDelta
 from entropy.exceptions import RepositoryError, SystemDatabaseError, \
     PermissionDenied
 from entropy.security import Repository as RepositorySecurity
@@ -126,6 +129,12 @@ class InstalledPackagesRepository(CachedRepository):
         # force our own name, always.
         kwargs = kwargs.copy()
         kwargs['name'] = self.NAME
+        # content metadata of installed packages is never distributed,
+        # its layout is selected through the "content-blobs" client.conf
+        # option. Must be set before the schema update is triggered.
+        content_blobs = kwargs.pop('content_blobs', None)
+        if content_blobs is not None:
+            self._CONTENT_BLOBS = content_blobs
         super(InstalledPackagesRepository, self).__init__(
             *args, **kwargs)
 
@@ -174,7 +183,7 @@ class AvailablePackagesRepositoryUpdater(object):
         self._supported_download_items = (
             "db", "dbck", "dblight", "ck", "cklight", "compck",
             "lock", "dbdump", "dbdumplight", "dbdumplightck", "dbdumpck",
-            "meta_file", "meta_file_gpg", "notice_board"
+            "meta_file", "meta_file_gpg", "notice_board", "deltas"
         )
         self._developer_repo = \
             self._settings['repositories']['developer_repo']
@@ -892,6 +901,7 @@ class AvailablePackagesRepositoryUpdater(object):
         ec_hash = etpConst['etpdatabasehashfile']
         repo_lock_file = etpConst['etpdatabasedownloadlockfile']
         notice_board_filename = os.path.basename(repo_data['notice_board'])
+        delta_index_file = etpConst['etpdatabasedeltaindexfile']
         meta_file = etpConst['etpdatabasemetafilesfile']
         meta_file_gpg = etpConst['etpdatabasemetafilesfile'] + \
             etpConst['etpgpgextension']
@@ -971,6 +981,10 @@ class AvailablePackagesRepositoryUpdater(object):
                 "%s/%s" % (uri, meta_file_gpg,),
                 "%s/%s" % (repo_dbpath, meta_file_gpg,),
             ),
+            'deltas': (
+                "%s/%s" % (uri, delta_index_file,),
+                "%s/%s" % (repo_dbpath, delta_index_file,),
+            ),
         }
 
         url, path = mymap.get(item)
@@ -985,7 +999,13 @@ class AvailablePackagesRepositoryUpdater(object):
 
         url, filepath = self._construct_paths(
             uri, item, cmethod, get_signature = get_signature)
+        return self._download_url(url, filepath,
+            disallow_redirect = disallow_redirect)
 
+    def _download_url(self, url, filepath, disallow_redirect = True):
+        """
+        Download the given URL to filepath, return True if successful.
+        """
         # See bug #3495, download the file to
         # a temporary location and then move it
         # if we are successful
@@ -1578,6 +1598,194 @@ class AvailablePackagesRepositoryUpdater(object):
 
         return gpg_rc
 
+    def _delta_database_sync(self, uri, revision, dbfile):
+        """
+        Update the local repository database applying the incremental
+        updates (deltas) published on the mirror, if they cover the gap
+        between the local and the remote repository revision.
+        Return True if the repository database has been updated.
+        """
+        if self.__force or self._developer_repo:
+            # developer repositories ship content metadata,
+            # which is not part of deltas.
+            return False
+        if not self._differential_update:
+            return False
+        if not (os.path.isfile(dbfile) and const_file_writable(dbfile)):
+            return False
+
+        local_revision = AvailablePackagesRepository.revision(
+            self._repository_id)
+        if local_revision == -1 or local_revision >= revision:
+            return False
+
+        repo_sec = None
+        if self._gpg_feature:
+            # deltas are only applied if their signature can be verified,
+            # the whole repository is downloaded otherwise.
+            repo_sec = self._delta_repository_security()
+            if repo_sec is None:
+                return False
+
+        repo_dbpath = os.path.dirname(dbfile)
+        index_url, index_path = self._construct_paths(uri, "deltas", None)
+        gpg_sign_ext = etpConst['etpgpgextension']
+        tmp_dbfile = dbfile + ".delta"
+        files_to_remove = [index_path, index_path + gpg_sign_ext, tmp_dbfile]
+
+        try:
+            if not self._download_item(uri, "deltas",
+                    disallow_redirect = True):
+                return False
+            if repo_sec is not None:
+                if not self._download_item(uri, "deltas",
+                        disallow_redirect = True, get_signature = True):
+                    return False
+                if not self._delta_verify_signature(repo_sec, index_path):
+                    return False
+
+            chain = EntropyRepositoryDelta.findChain(
+                EntropyRepositoryDelta.readIndex(index_path),
+                local_revision, revision)
+            if not chain:
+                const_debug_write(__name__,
+                    "_delta_database_sync: no deltas for %s -> %s" % (
+                        local_revision, revision,))
+                return False
+
+            mytxt = "%s: %s -> %s (%s)" % (
+                red(_("Applying repository deltas")),
+                bold(str(local_revision)),
+                bold(str(revision)),
+                darkgreen(str(len(chain))),
+            )
+            self._entropy.output(
+                mytxt,
+                importance = 1,
+                level = "info",
+                header = "\t"
+            )
+
+            shutil.copy2(dbfile, tmp_dbfile)
+            dbconn = self._entropy.open_generic_repository(tmp_dbfile,
+                xcache = False, indexing_override = False)
+            try:
+                expected_checksum = None
+                for from_revision, to_revision, delta_name, delta_md5 in chain:
+                    delta_path = os.path.join(repo_dbpath, delta_name)
+                    files_to_remove.append(delta_path)
+                    delta_url = "%s/%s" % (uri, delta_name,)
+                    if not self._download_url(delta_url, delta_path):
+                        return False
+                    if not entropy.tools.compare_md5(delta_path, delta_md5):
+                        const_debug_write(__name__,
+                            "_delta_database_sync: bad checksum: %s" % (
+                                delta_name,))
+                        return False
+                    if repo_sec is not None:
+                        files_to_remove.append(delta_path + gpg_sign_ext)
+                        if not self._download_url(delta_url + gpg_sign_ext,
+                                delta_path + gpg_sign_ext):
+                            return False
+                        if not self._delta_verify_signature(
+                                repo_sec, delta_path):
+                            return False
+
+                    unpacked_path = entropy.tools.unpack_bzip2(delta_path)
+                    files_to_remove.append(unpacked_path)
+                    delta_dbconn = self._entropy.open_generic_repository(
+                        unpacked_path, xcache = False,
+                        indexing_override = False, read_only = True)
+                    try:
+                        delta = EntropyRepositoryDelta(delta_dbconn)
+                        if not delta.isValid():
+                            return False
+                        if (delta.fromRevision(), delta.toRevision()) != \
+                                (from_revision, to_revision):
+                            return False
+                        delta.apply(dbconn, self._repository_id)
+                        expected_checksum = delta.expectedChecksum()
+                    finally:
+                        delta_dbconn.close()
+
+                dbconn.commit()
+                checksum = EntropyRepositoryDelta.checksum(dbconn)
+            finally:
+                dbconn.close()
+
+            if checksum != expected_checksum:
+                mytxt = "%s: %s" % (
+                    bold(_("Attention")),
+                    red(_("repository deltas checksum mismatch, "
+                          "downloading the whole repository")),
+                )
+                self._entropy.output(
+                    mytxt,
+                    importance = 1,
+                    level = "warning",
+                    header = "\t"
+                )
+                return False
+
+            os.rename(tmp_dbfile, dbfile)
+            return True
+
+        except (DatabaseError, IntegrityError, OperationalError,
+            SystemDatabaseError, KeyError, ValueError, EOFError,
+            IOError, OSError) as err:
+            const_debug_write(__name__,
+                "_delta_database_sync: error: %s" % (repr(err),))
+            return False
+
+        finally:
+            for path in files_to_remove:
+                try:
+                    os.remove(path)
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+
+    def _delta_repository_security(self):
+        """
+        Return a RepositorySecurity instance that can be used to verify
+        the signature of the repository deltas, or None if GPG or the
+        repository public key (installed by a previous update) are not
+        available.
+        """
+        try:
+            repo_sec = self._entropy.RepositorySecurity()
+        except RepositorySecurity.GPGError:
+            return None
+
+        try:
+            if not repo_sec.is_pubkey_available(self._repository_id):
+                return None
+        except RepositorySecurity.KeyExpired:
+            return None
+        return repo_sec
+
+    def _delta_verify_signature(self, repo_sec, path):
+        """
+        Verify the GPG signature of the given repository delta file,
+        which must be stored next to it. Return True if it is valid.
+        """
+        sign_path = path + etpConst['etpgpgextension']
+        is_valid, err_msg = repo_sec.verify_file(
+            self._repository_id, path, sign_path)
+        if not is_valid:
+            mytxt = "%s: %s, %s" % (
+                darkred(_("Error during GPG verification of")),
+                os.path.basename(path),
+                err_msg,
+            )
+            self._entropy.output(
+                mytxt,
+                importance = 1,
+                level = "warning",
+                header = "\t"
+            )
+        return is_valid
+
     def _webservice_database_sync(self):
         """
         Update the local repository database through the webservice
@@ -2046,6 +2254,7 @@ class AvailablePackagesRepositoryUpdater(object):
         cmethod = etpConst['etpdatabasecompressclasses'].get(
             cformat)
 
+        delta_synced = False
         while True:
 
             downloaded_db_item = None
@@ -2053,6 +2262,11 @@ class AvailablePackagesRepositoryUpdater(object):
             db_checksum_down_status = False
             if self._repo_eapi < 3:
 
+                delta_synced = self._delta_database_sync(
+                    uri, revision, dbfile)
+                if delta_synced:
+                    break
+
                 down_status, sig_down_status, downloaded_db_item = \
                     self.__database_download(uri, cmethod)
                 if not down_status:
@@ -2119,7 +2333,7 @@ class AvailablePackagesRepositoryUpdater(object):
 
         # Now we can unpack
         files_to_remove = []
-        if self._repo_eapi in (1, 2,):
+        if self._repo_eapi in (1, 2,) and not delta_synced:
 
             # if do_db_update_transfer == False and not None
             if (do_db_update_transfer is not None) and not \
@@ -2237,6 +2451,8 @@ class MaskableRepository(EntropyRepositoryBase):
 
     _real_client_settings = None
     _real_client_settings_lock = threading.Lock()
+    # EntropyCacher key prefix of the persistent mask bitmaps
+    _MASK_BITMAP_CACHE_KEY = "MaskableRepositoryFilter/bitmap"
 
     def __init__(self, *args, **kwargs):
         super(MaskableRepository, self).__init__(*args, **kwargs)
@@ -2263,25 +2479,12 @@ class MaskableRepository(EntropyRepositoryBase):
         from entropy.client.interfaces import Client
         return Client()._settings_client_plugin
 
-    def _mask_filter_fetch_cache(self, package_id):
-        if self._caching:
-            return loadobj(
-                "MaskableRepositoryFilter/%s_%s/%s" % (
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    package_id,
-                    )
-                )
-
-    def _mask_filter_store_cache(self, package_id, value):
-        if self._caching:
-            dumpobj(
-                "MaskableRepositoryFilter/%s_%s/%s" % (
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    package_id,
-                    ),
-                value)
+    def _maskFilter_validator_cache(self):
+        """
+        Return the in-memory masking validation cache.
+        """
+        return self._client_settings.get(
+            'masking_validation', {}).get('cache', {})
 
     def _maskFilter_live(self, package_id):
 
@@ -2297,8 +2500,10 @@ class MaskableRepository(EntropyRepositoryBase):
 
             return package_id, ref['user_live_unmask']
 
-    def _maskFilter_user_package_mask(self, package_id, live):
-
+    def _maskFilter_user_package_mask_ids(self):
+        """
+        Return the set of package identifiers masked by package.mask.
+        """
         with self._settings['mask']:
             # thread-safe in here
             cache_obj = self._settings['mask'].get()
@@ -2325,22 +2530,12 @@ class MaskableRepository(EntropyRepositoryBase):
 
             cache_obj[self.name] = user_package_mask_ids
 
-        if package_id in user_package_mask_ids:
-            # sorry, masked
-            ref = self._settings['pkg_masking_reference']
-            myr = ref['user_package_mask']
-
-            try:
-                clset = self._client_settings
-                validator_cache = clset['masking_validation']['cache']
-                validator_cache[(package_id, self.name, live)] = -1, myr
-            except KeyError: # system settings client plugin not found
-                pass
-
-            return -1, myr
-
-    def _maskFilter_user_package_unmask(self, package_id, live):
+        return user_package_mask_ids
 
+    def _maskFilter_user_package_unmask_ids(self):
+        """
+        Return the set of package identifiers unmasked by package.unmask.
+        """
         with self._settings['unmask']:
             # thread-safe in here
             cache_obj = self._settings['unmask'].get()
@@ -2366,22 +2561,13 @@ class MaskableRepository(EntropyRepositoryBase):
 
             cache_obj[self.name] = user_package_unmask_ids
 
-        if package_id in user_package_unmask_ids:
-
-            ref = self._settings['pkg_masking_reference']
-            myr = ref['user_package_unmask']
-            try:
-                clset = self._client_settings
-                validator_cache = clset['masking_validation']['cache']
-                validator_cache[(package_id, self.name, live)] = \
-                    package_id, myr
-            except KeyError: # system settings client plugin not found
-                pass
-
-            return package_id, myr
-
-    def _maskFilter_packages_db_mask(self, package_id, live):
+        return user_package_unmask_ids
 
+    def _maskFilter_packages_db_mask_ids(self):
+        """
+        Return the set of package identifiers masked by the repository
+        packages.db.mask file.
+        """
         # check if repository packages.db.mask needs it masked
         repos_mask = {}
         clset = self._client_settings
@@ -2389,67 +2575,77 @@ class MaskableRepository(EntropyRepositoryBase):
             repos_mask = clset['repositories']['mask']
 
         repomask = repos_mask.get(self.name)
-        if isinstance(repomask, (list, set, frozenset)):
+        if not isinstance(repomask, (list, set, frozenset)):
+            return frozenset()
 
-            # first, seek into generic masking, all branches
-            # (below) avoid issues with repository names
-            mask_repo_id = "%s_ids@@:of:%s" % (self.name, self.name,)
-            repomask_ids = repos_mask.get(mask_repo_id)
+        # first, seek into generic masking, all branches
+        # (below) avoid issues with repository names
+        mask_repo_id = "%s_ids@@:of:%s" % (self.name, self.name,)
+        repomask_ids = repos_mask.get(mask_repo_id)
 
-            if not isinstance(repomask_ids, set):
-                repomask_ids = set()
-                for atom in repomask:
-                    matches, r = self.atomMatch(atom, multiMatch = True,
-                        maskFilter = False)
-                    if r != 0:
-                        continue
-                    repomask_ids |= set(matches)
-                repos_mask[mask_repo_id] = repomask_ids
-
-            if package_id in repomask_ids:
+        if not isinstance(repomask_ids, set):
+            repomask_ids = set()
+            for atom in repomask:
+                matches, r = self.atomMatch(atom, multiMatch = True,
+                    maskFilter = False)
+                if r != 0:
+                    continue
+                repomask_ids |= set(matches)
+            repos_mask[mask_repo_id] = repomask_ids
 
-                ref = self._settings['pkg_masking_reference']
-                myr = ref['repository_packages_db_mask']
+        return repomask_ids
 
-                try:
-                    validator_cache = clset['masking_validation']['cache']
-                    validator_cache[(package_id, self.name, live)] = \
-                        -1, myr
-                except KeyError: # system settings client plugin not found
-                    pass
+    def _maskFilter_license_masked(self, licenses):
+        """
+        Return whether the given package license string is masked.
+        """
+        lic_mask = self._settings['license_mask']
+        for mylicense in licenses.strip().split():
+            if mylicense in lic_mask:
+                return True
+        return False
 
-                return -1, myr
+    def _maskFilter_user_package_mask(self, package_id):
 
-    def _maskFilter_package_license_mask(self, package_id, live):
+        if package_id in self._maskFilter_user_package_mask_ids():
+            # sorry, masked
+            ref = self._settings['pkg_masking_reference']
+            return -1, ref['user_package_mask']
 
-        if not self._settings['license_mask']:
-            return
+    def _maskFilter_user_package_unmask(self, package_id):
 
-        mylicenses = self.retrieveLicense(package_id)
-        mylicenses = mylicenses.strip().split()
-        lic_mask = self._settings['license_mask']
-        for mylicense in mylicenses:
+        if package_id in self._maskFilter_user_package_unmask_ids():
+            ref = self._settings['pkg_masking_reference']
+            return package_id, ref['user_package_unmask']
 
-            if mylicense not in lic_mask:
-                continue
+    def _maskFilter_packages_db_mask(self, package_id):
 
+        if package_id in self._maskFilter_packages_db_mask_ids():
             ref = self._settings['pkg_masking_reference']
-            myr = ref['user_license_mask']
-            try:
-                clset = self._client_settings
-                validator_cache = clset['masking_validation']['cache']
-                validator_cache[(package_id, self.name, live)] = -1, myr
-            except KeyError: # system settings client plugin not found
-                pass
+            return -1, ref['repository_packages_db_mask']
 
-            return -1, myr
+    def _maskFilter_package_license_mask(self, package_id):
 
-    def _maskFilter_keyword_mask(self, package_id, live):
+        if not self._settings['license_mask']:
+            return
 
+        licenses = self.retrieveLicense(package_id)
+        if licenses and self._maskFilter_license_masked(licenses):
+            ref = self._settings['pkg_masking_reference']
+            return -1, ref['user_license_mask']
+
+    def _maskFilter_keyword_mask(self, package_id):
+        return self._maskFilter_keyword_reason(
+            package_id, self.retrieveKeywords(package_id))
+
+    def _maskFilter_keyword_reason(self, package_id, mykeywords):
+        """
+        Return the keyword masking outcome of the given package, whose
+        keywords are mykeywords, or None if the package is keyword masked.
+        """
         # WORKAROUND for buggy entries
         # ** is fine then
         # TODO: remove this before 31-12-2011
-        mykeywords = self.retrieveKeywords(package_id)
         if mykeywords == set([""]):
             mykeywords = set(['**'])
 
@@ -2459,17 +2655,7 @@ class MaskableRepository(EntropyRepositoryBase):
         # (universal keywords have been merged from package.keywords)
         same_keywords = etpConst['keywords'] & mykeywords
         if same_keywords:
-            myr = mask_ref['system_keyword']
-            try:
-                clset = self._client_settings
-                validator_cache = clset['masking_validation']['cache']
-                validator_cache[(package_id, self.name, live)] = \
-                    package_id, myr
-
-            except KeyError: # system settings client plugin not found
-                pass
-
-            return package_id, myr
+            return package_id, mask_ref['system_keyword']
 
         # if we get here, it means we didn't find mykeywords
         # in etpConst['keywords']
@@ -2488,16 +2674,7 @@ class MaskableRepository(EntropyRepositoryBase):
 
             if "*" in keyword_data:
                 # all packages in this repo with keyword "keyword" are ok
-                myr = mask_ref['user_repo_package_keywords_all']
-                try:
-                    clset = self._client_settings
-                    validator_cache = clset['masking_validation']['cache']
-                    validator_cache[(package_id, self.name, live)] = \
-                        package_id, myr
-                except KeyError: # system settings client plugin not found
-                    pass
-
-                return package_id, myr
+                return package_id, mask_ref['user_repo_package_keywords_all']
 
             kwd_key = "%s_ids" % (keyword,)
             keyword_data_ids = keyword_repo[self.name].get(kwd_key)
@@ -2514,23 +2691,14 @@ class MaskableRepository(EntropyRepositoryBase):
                 keyword_repo[self.name][kwd_key] = keyword_data_ids
 
             if package_id in keyword_data_ids:
-
-                myr = mask_ref['user_repo_package_keywords']
-                try:
-                    clset = self._client_settings
-                    validator_cache = clset['masking_validation']['cache']
-                    validator_cache[(package_id, self.name, live)] = \
-                        package_id, myr
-                except KeyError: # system settings client plugin not found
-                    pass
-                return package_id, myr
+                return package_id, mask_ref['user_repo_package_keywords']
 
         keyword_pkg = self._settings['keywords']['packages']
 
         # if we get here, it means we didn't find a match in repositories
         # so we scan packages, last chance
-        for keyword in keyword_pkg.keys():
-            # use .keys() because keyword_pkg gets modified during iteration
+        for keyword in tuple(keyword_pkg.keys()):
+            # use a tuple because keyword_pkg gets modified during iteration
 
             # first of all check if keyword is in mykeywords
             if keyword not in mykeywords:
@@ -2556,18 +2724,8 @@ class MaskableRepository(EntropyRepositoryBase):
                 keyword_pkg[self.name+kwd_key] = keyword_data_ids
 
             if package_id in keyword_data_ids:
-
                 # valid!
-                myr = mask_ref['user_package_keywords']
-                try:
-                    clset = self._client_settings
-                    validator_cache = clset['masking_validation']['cache']
-                    validator_cache[(package_id, self.name, live)] = \
-                        package_id, myr
-                except KeyError: # system settings client plugin not found
-                    pass
-
-                return package_id, myr
+                return package_id, mask_ref['user_package_keywords']
 
 
         ## if we get here, it means that pkg it keyword masked
@@ -2591,11 +2749,7 @@ class MaskableRepository(EntropyRepositoryBase):
         same_keywords = repo_keywords.get('universal') & mykeywords
         if same_keywords:
             # universal keyword matches!
-            myr = mask_ref['repository_packages_db_keywords']
-            validator_cache = clset['masking_validation']['cache']
-            validator_cache[(package_id, self.name, live)] = \
-                package_id, myr
-            return package_id, myr
+            return package_id, mask_ref['repository_packages_db_keywords']
 
         ## if we get here, it means that even universal masking failed
         ## and we need to look at per-package settings
@@ -2628,68 +2782,222 @@ class MaskableRepository(EntropyRepositoryBase):
             same_keywords = pkg_keywords & etpConst['keywords']
         if same_keywords:
             # found! this pkg is not masked, yay!
-            myr = mask_ref['repository_packages_db_keywords']
-            validator_cache = clset['masking_validation']['cache']
-            validator_cache[(package_id, self.name, live)] = \
-                package_id, myr
-            return package_id, myr
+            return package_id, mask_ref['repository_packages_db_keywords']
 
-    def maskFilter(self, package_id, live = True):
+    def _maskFilter_stages(self, package_id):
         """
-        Reimplemented from EntropyRepositoryBase
+        Evaluate the (non-live) masking metadata of a single package.
         """
-        validator_cache = self._client_settings.get(
-            'masking_validation', {}).get('cache', {})
-
-        cached = validator_cache.get((package_id, self.name, live))
-        if cached is not None:
-            return cached
-
-        # use on-disk cache?
-        cached = self._mask_filter_fetch_cache(package_id)
-        if cached is not None:
-            return cached
-
-        # avoid memleaks
-        if len(validator_cache) > 100000:
-            validator_cache.clear()
-
-        if live:
-            data = self._maskFilter_live(package_id)
-            if data:
-                return data
-
-        data = self._maskFilter_user_package_mask(package_id, live)
+        data = self._maskFilter_user_package_mask(package_id)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
-        data = self._maskFilter_user_package_unmask(package_id, live)
+        data = self._maskFilter_user_package_unmask(package_id)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
-        data = self._maskFilter_packages_db_mask(package_id, live)
+        data = self._maskFilter_packages_db_mask(package_id)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
-        data = self._maskFilter_package_license_mask(package_id, live)
+        data = self._maskFilter_package_license_mask(package_id)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
-        data = self._maskFilter_keyword_mask(package_id, live)
+        data = self._maskFilter_keyword_mask(package_id)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
         # holy crap, can't validate
         myr = self._settings['pkg_masking_reference']['completely_masked']
-        validator_cache[(package_id, self.name, live)] = -1, myr
-        self._mask_filter_store_cache(package_id, data)
         return -1, myr
 
+    def _maskFilter_bitmap_compute(self):
+        """
+        Evaluate the (non-live) masking metadata of all the packages in
+        repository, in the same order used by _maskFilter_stages(), using
+        set-based passes over the whole repository.
+
+        @return: array of signed chars indexed by package identifier.
+            0 means that the package is not available, a positive value
+            means that the package is visible with reason (value - 1),
+            a negative value means that the package is masked with
+            reason (-value - 1).
+        @rtype: array.array
+        """
+        ref = self._settings['pkg_masking_reference']
+        package_ids = self.listAllPackageIds()
+        size = 0
+        if package_ids:
+            size = max(package_ids) + 1
+        bitmap = array.array('b', [0]) * size
+        pending = set(package_ids)
+
+        def _resolve(resolved_ids, masked, reason):
+            value = reason + 1
+            if masked:
+                value = -value
+            resolved_ids = pending.intersection(resolved_ids)
+            for package_id in resolved_ids:
+                bitmap[package_id] = value
+            pending.difference_update(resolved_ids)
+
+        _resolve(self._maskFilter_user_package_mask_ids(),
+                 True, ref['user_package_mask'])
+        _resolve(self._maskFilter_user_package_unmask_ids(),
+                 False, ref['user_package_unmask'])
+        _resolve(self._maskFilter_packages_db_mask_ids(),
+                 True, ref['repository_packages_db_mask'])
+
+        if self._settings['license_mask'] and pending:
+            _resolve(
+                [package_id for package_id, licenses in \
+                     self.listAllPackageLicenses() if licenses and \
+                     self._maskFilter_license_masked(licenses)],
+                True, ref['user_license_mask'])
+
+        if not pending:
+            return bitmap
+
+        keywords = {}
+        for package_id, keyword in self.listAllPackageKeywords():
+            if package_id in pending:
+                keywords.setdefault(package_id, set()).add(keyword)
+
+        masked_value = -(ref['completely_masked'] + 1)
+        for package_id in pending:
+            data = self._maskFilter_keyword_reason(
+                package_id, frozenset(keywords.get(package_id, ())))
+            if data:
+                bitmap[package_id] = data[1] + 1
+            else:
+                bitmap[package_id] = masked_value
+
+        return bitmap
+
+    def _maskFilter_bitmap_key(self):
+        """
+        Return the EntropyCacher key of the mask bitmap of this repository.
+        The key changes every time the repository content or the package
+        masking settings change.
+        """
+        sha = hashlib.sha1()
+        sha.update(const_convert_to_rawstring(self.atomMatchCacheKey()))
+        sha.update(const_convert_to_rawstring(
+                ",".join(sorted(etpConst['keywords']))))
+        return "%s/%s/%s_%s" % (
+            self._MASK_BITMAP_CACHE_KEY,
+            self.name,
+            sha.hexdigest(),
+            self.checksum(strict = False),
+            )
+
+    def _maskFilter_bitmap_evict(self, bitmap_key):
+        """
+        Remove from cache all the mask bitmaps of this repository that
+        have been generated against a different repository checksum.
+        """
+        self._cacher.remove_prefix(
+            "%s/%s/" % (self._MASK_BITMAP_CACHE_KEY, self.name),
+            keep_suffix = "_%s" % (bitmap_key.rsplit("_", 1)[-1],))
+
+    def _maskFilter_bitmap(self):
+        """
+        Return the mask bitmap of this repository (see
+        _maskFilter_bitmap_compute()), loading it from the on-disk cache
+        or computing it if needed. The in-memory copy is kept in the
+        masking validation cache, and thus dropped together with it.
+        """
+        validator_cache = self._maskFilter_validator_cache()
+        bitmap_key = self._maskFilter_bitmap_key()
+        cache_key = (self._MASK_BITMAP_CACHE_KEY, self.name)
+
+        cached = validator_cache.get(cache_key)
+        if cached is not None and cached[0] == bitmap_key:
+            return cached[1]
+
+        bitmap = None
+        if self._caching:
+            data = self._cacher.pop(bitmap_key)
+            if isinstance(data, bytes):
+                bitmap = array.array('b')
+                if const_is_python3():
+                    bitmap.frombytes(data)
+                else:
+                    bitmap.fromstring(data)
+
+        if bitmap is None:
+            bitmap = self._maskFilter_bitmap_compute()
+            if self._caching:
+                self._maskFilter_bitmap_evict(bitmap_key)
+                if const_is_python3():
+                    data = bitmap.tobytes()
+                else:
+                    data = bitmap.tostring()
+                self._cacher.push(bitmap_key, data)
+
+        validator_cache[cache_key] = (bitmap_key, bitmap)
+        return bitmap
+
+    def _maskFilter_bitmap_lookup(self, package_id, bitmap = None):
+        """
+        Return the maskFilter() outcome of package_id stored in the mask
+        bitmap, or None if package_id is not available.
+        """
+        if bitmap is None:
+            bitmap = self._maskFilter_bitmap()
+        if package_id < 0 or package_id >= len(bitmap):
+            return None
+        value = bitmap[package_id]
+        if value > 0:
+            return package_id, value - 1
+        elif value < 0:
+            return -1, -value - 1
+        return None
+
+    def maskFilter(self, package_id, live = True):
+        """
+        Reimplemented from EntropyRepositoryBase
+        """
+        validator_cache = self._maskFilter_validator_cache()
+
+        cached = validator_cache.get((package_id, self.name, live))
+        if cached is not None:
+            return cached
+
+        # avoid memleaks
+        if len(validator_cache) > 100000:
+            validator_cache.clear()
+
+        if live:
+            data = self._maskFilter_live(package_id)
+            if data:
+                return data
+
+        data = self._maskFilter_bitmap_lookup(package_id)
+        if data is None:
+            # package not in repository
+            data = self._maskFilter_stages(package_id)
+
+        validator_cache[(package_id, self.name, live)] = data
+        return data
+
+    def maskFilterAll(self, live = True):
+        """
+        Reimplemented from EntropyRepositoryBase
+        """
+        bitmap = self._maskFilter_bitmap()
+        outcome = {}
+        for package_id in self.listAllPackageIds():
+            data = None
+            if live:
+                data = self._maskFilter_live(package_id)
+            if not data:
+                data = self._maskFilter_bitmap_lookup(
+                    package_id, bitmap = bitmap)
+            outcome[package_id] = data
+        return outcome
+
     def atomMatchCacheKey(self):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -2835,3 +3143,13 @@ class GenericRepository(CachedRepository, MaskableRepository):
         if not enabled:
             return package_id, 0
         return MaskableRepository.maskFilter(self, package_id, live = live)
+
+    def maskFilterAll(self, live = True):
+        """
+        Reimplemented from EntropyRepository.
+        See maskFilter().
+        """
+        enabled = getattr(self, 'enable_mask_filter', False)
+        if not enabled:
+            return dict((x, (x, 0)) for x in self.listAllPackageIds())
+        return MaskableRepository.maskFilterAll(self, live = live)
@@ -25,6 +25,7 @@ from entropy.i18n import _
 from entropy.db.exceptions import IntegrityError, OperationalError, \
     DatabaseError, InterfaceError, Error as EntropyRepositoryError
 from entropy.db.skel import EntropyRepositoryBase
+from entropy.db.index import EntropyRepositoryIndex
 from entropy.client.interfaces.db import InstalledPackagesRepository
 from entropy.client.misc import sharedinstlock
 
@@ -342,6 +343,115 @@ class CalculatorsMixin:
 
         return dbpkginfo
 
+    def atom_match_many(self, atoms, mask_filter = True, match_repo = None,
+                        extended_results = False, use_cache = True):
+        """
+        Match a list of packages inside all the available repositories at
+        once. This is the batched version of atom_match() (without
+        multi_match and multi_repo support): every repository is queried
+        only once through EntropyRepositoryBase.atomMatchMany().
+
+        @param atoms: list of atoms or dependencies to match
+        @type atoms: iterable
+        @keyword mask_filter: enable package masking filter
+        @type mask_filter: bool
+        @keyword match_repo: list of repository identifiers to match
+            packages into
+        @type match_repo: list
+        @keyword extended_results: return extended results
+        @type extended_results: bool
+        @keyword use_cache: use on-disk cache
+        @type use_cache: bool
+        @return: dict composed by atom as key and atom_match() return
+            value as value
+        @rtype: dict
+        """
+        valid_repos = self._enabled_repos
+        if match_repo and (type(match_repo) in (list, tuple, set)):
+            valid_repos = list(match_repo)
+
+        results = {}
+        batch_atoms = []
+        for atom in atoms:
+            if atom in results:
+                continue
+            _atom, repos = entropy.dep.dep_get_match_in_repos(atom)
+            if (repos is not None) or \
+                    atom.endswith(etpConst['entropyordepquestion']):
+                # "or" dependencies and in-repository matching are
+                # dealt by atom_match()
+                results[atom] = self.atom_match(
+                    atom, mask_filter = mask_filter, match_repo = match_repo,
+                    extended_results = extended_results,
+                    use_cache = use_cache)
+                continue
+            results[atom] = None
+            batch_atoms.append(atom)
+
+        if not batch_atoms:
+            return results
+
+        repo_results = dict((atom, {}) for atom in batch_atoms)
+        for repo in valid_repos:
+
+            try:
+                dbconn = self.open_repository(repo)
+            except (RepositoryError, SystemDatabaseError):
+                # ouch, repository not available or corrupted !
+                continue
+
+            try:
+                matches = dbconn.atomMatchMany(
+                    batch_atoms,
+                    maskFilter = mask_filter,
+                    extendedResults = extended_results,
+                    useCache = use_cache)
+            except (OperationalError, DatabaseError):
+                # repository fooked, skip!
+                continue
+
+            for atom in batch_atoms:
+                try:
+                    query_data, query_rc = matches[atom]
+                except TypeError:
+                    if not use_cache:
+                        raise
+                    # broken cache item
+                    query_data, query_rc = dbconn.atomMatch(
+                        atom,
+                        maskFilter = mask_filter,
+                        extendedResults = extended_results,
+                        useCache = False)
+
+                if query_rc != 0:
+                    continue
+                if extended_results:
+                    repo_results[atom][repo] = (query_data[0],
+                        query_data[2], query_data[3], query_data[4])
+                else:
+                    repo_results[atom][repo] = query_data
+
+        for atom in batch_atoms:
+            atom_results = repo_results[atom]
+
+            dbpkginfo = (-1, 1)
+            if extended_results:
+                dbpkginfo = ((-1, None, None, None), 1)
+
+            if len(atom_results) == 1:
+                repo = list(atom_results.keys())[0]
+                dbpkginfo = (atom_results[repo], repo)
+
+            elif len(atom_results) > 1:
+                mypkginfo = self.__handle_multi_repo_matches(atom_results,
+                    extended_results, valid_repos)
+                if mypkginfo is not None:
+                    dbpkginfo = mypkginfo
+
+            results[atom] = dbpkginfo
+
+        return results
+
     def atom_search(self, keyword, description = False, repositories = None,
                     use_cache = True):
         """
@@ -707,6 +817,29 @@ class CalculatorsMixin:
                 return True
             return False
 
+        # match the whole dependency list against the installed packages
+        # repository and the available repositories in one go.
+        inst_conflicts = []
+        inst_dependencies = []
+        for dependency in dependencies:
+            if dependency in depcache:
+                continue
+            if dependency.startswith("!"):
+                inst_conflicts.append(dependency[1:])
+            else:
+                inst_dependencies.append(dependency)
+
+        inst_conflict_matches = inst_repo.atomMatchMany(inst_conflicts)
+        inst_matches = inst_repo.atomMatchMany(
+            inst_dependencies, multiMatch = True)
+
+        repo_dependencies = []
+        if deep_deps or not relaxed_deps:
+            repo_dependencies = [x for x in inst_dependencies if \
+                                     inst_matches[x][1] == 0]
+        repo_matches = self.atom_match_many(
+            repo_dependencies, match_repo = match_repo)
+
         unsatisfied = set()
         for dependency in dependencies:
 
@@ -724,8 +857,7 @@ class CalculatorsMixin:
 
             ### conflict
             if dependency.startswith("!"):
-                package_id, rc = inst_repo.atomMatch(
-                    dependency[1:])
+                package_id, rc = inst_conflict_matches[dependency[1:]]
                 if package_id != -1:
                     if const_debug_enabled():
                         const_debug_write(
@@ -742,8 +874,7 @@ class CalculatorsMixin:
                 push_to_cache(dependency, False)
                 continue
 
-            c_ids, c_rc = inst_repo.atomMatch(dependency,
-                multiMatch = True)
+            c_ids, c_rc = inst_matches[dependency]
             if c_rc != 0:
 
                 # check if dependency can be matched in available repos and
@@ -829,7 +960,10 @@ class CalculatorsMixin:
                 if provide_stop:
                     continue
 
-            r_id, r_repo = self.atom_match(dependency, match_repo = match_repo)
+            r_match = repo_matches.get(dependency)
+            if r_match is None:
+                r_match = self.atom_match(dependency, match_repo = match_repo)
+            r_id, r_repo = r_match
             if r_id == -1:
                 if const_debug_enabled():
                     const_debug_write(__name__,
@@ -1203,7 +1337,7 @@ class CalculatorsMixin:
     def __generate_dependency_tree_analyze_deplist(self, pkg_match, repo_db,
         stack, graph, deps_not_found, conflicts, unsat_cache, relaxed_deps,
         build_deps, deep_deps, empty_deps, recursive, selected_matches,
-        elements_cache, selected_matches_cache):
+        elements_cache, selected_matches_cache, package_index):
 
         pkg_id, repo_id = pkg_match
         # exclude build dependencies
@@ -1211,7 +1345,7 @@ class CalculatorsMixin:
         if not build_deps:
             excluded_deptypes += [etpConst['dependency_type_ids']['bdepend_id']]
 
-        myundeps = repo_db.retrieveDependenciesList(pkg_id,
+        myundeps = package_index.retrieveDependenciesList(pkg_id,
             exclude_deptypes = excluded_deptypes,
             resolve_conditional_deps = False)
 
@@ -1274,7 +1408,7 @@ class CalculatorsMixin:
         post_deps = []
         # PDEPENDs support
         myundeps, post_deps = self._lookup_post_dependencies(repo_db,
-            pkg_id, myundeps)
+            pkg_id, myundeps, package_index = package_index)
         if (not empty_deps) and post_deps:
             # validate post dependencies, make them not contain matches already
             # pulled in, this cuts potential circular dependencies:
@@ -1377,11 +1511,36 @@ class CalculatorsMixin:
 
         return conflicts
 
+    def _get_package_index(self, repository_id, package_indexes):
+        """
+        Return the EntropyRepositoryIndex snapshot of the given repository,
+        (re)loading it if it is missing or stale. Snapshots are validated
+        once per solver session, package_indexes is the dict holding the
+        ones already handed out during the current session.
+        """
+        package_index = package_indexes.get(repository_id)
+        if package_index is not None:
+            return package_index
+
+        repo_db = self.open_repository(repository_id)
+        with self._package_indexes_mutex:
+            package_index = self._package_indexes.get(repository_id)
+            if package_index is None or not package_index.isValid(repo_db):
+                package_index = EntropyRepositoryIndex(repo_db)
+                self._package_indexes[repository_id] = package_index
+            else:
+                # live masking may have changed in the meantime
+                package_index.clearMaskCache()
+
+        package_indexes[repository_id] = package_index
+        return package_index
+
     def _generate_dependency_tree(self, matched_atom, graph,
         empty_deps = False, relaxed_deps = False, build_deps = False,
         only_deps = False, deep_deps = False, unsatisfied_deps_cache = None,
         elements_cache = None, post_deps_cache = None, recursive = True,
-        selected_matches = None, selected_matches_cache = None):
+        selected_matches = None, selected_matches_cache = None,
+        package_indexes = None):
 
         pkg_id, pkg_repo = matched_atom
         if (pkg_id == -1) or (pkg_repo == 1):
@@ -1395,6 +1554,8 @@ class CalculatorsMixin:
             unsatisfied_deps_cache = {}
         if post_deps_cache is None:
             post_deps_cache = {}
+        if package_indexes is None:
+            package_indexes = {}
 
         if selected_matches is None:
             selected_matches = set()
@@ -1420,6 +1581,7 @@ class CalculatorsMixin:
 
             # now we are ready to open repository
             repo_db = self.open_repository(repo_id)
+            package_index = self._get_package_index(repo_id, package_indexes)
 
             ## first element checks
             add_to_graph = True
@@ -1431,7 +1593,7 @@ class CalculatorsMixin:
                 first_element = False
                 # we need to check if first element is masked because of
                 # course, we don't trust function caller.
-                mask_pkg_id, idreason = repo_db.maskFilter(pkg_id)
+                mask_pkg_id, idreason = package_index.maskFilter(pkg_id)
                 if mask_pkg_id == -1:
                     mask_atom = repo_db.retrieveAtom(pkg_id)
                     if mask_atom is None:
@@ -1442,7 +1604,7 @@ class CalculatorsMixin:
             # search inside installed packages repository if there's something
             # in the same slot, if so, do some extra checks first.
             try:
-                pkg_key, pkg_slot = repo_db.retrieveKeySlot(pkg_id)
+                pkg_key, pkg_slot = package_index.retrieveKeySlot(pkg_id)
             except TypeError:
                 deps_not_found.add("unknown_%s_%s" % (pkg_id, repo_id,))
                 continue
@@ -1489,7 +1651,8 @@ class CalculatorsMixin:
                     pkg_match, repo_db, stack, graph, deps_not_found,
                     conflicts, unsatisfied_deps_cache, relaxed_deps,
                     build_deps, deep_deps, empty_deps, recursive,
-                    selected_matches, elements_cache, selected_matches_cache)
+                    selected_matches, elements_cache, selected_matches_cache,
+                    package_index)
 
             if post_dep_matches:
                 obj = post_deps_cache.setdefault(pkg_match, set())
@@ -1527,9 +1690,13 @@ class CalculatorsMixin:
         return graph, conflicts
 
     def _lookup_post_dependencies(self, repo_db, repo_package_id,
-        unsatisfied_deps):
+        unsatisfied_deps, package_index = None):
 
-        post_deps = repo_db.retrievePostDependencies(repo_package_id)
+        if package_index is not None:
+            post_deps = package_index.retrievePostDependencies(
+                repo_package_id)
+        else:
+            post_deps = repo_db.retrievePostDependencies(repo_package_id)
 
         if const_debug_enabled():
             const_debug_write(__name__,
@@ -2216,6 +2383,7 @@ class CalculatorsMixin:
         selected_matches_cache = {}
         selected_matches_set = set(package_matches)
         post_deps_cache = {}
+        package_indexes = {}
         matchfilter = set()
         for matched_atom in package_matches:
 
@@ -2251,7 +2419,8 @@ class CalculatorsMixin:
                     post_deps_cache = post_deps_cache,
                     recursive = recursive,
                     selected_matches = selected_matches_set,
-                    selected_matches_cache = selected_matches_cache
+                    selected_matches_cache = selected_matches_cache,
+                    package_indexes = package_indexes
                 )
             except DependenciesNotFound as err:
                 deps_not_found |= err.value
@@ -2277,7 +2446,8 @@ class CalculatorsMixin:
         _dup_deps_collisions = {}
         for _level, _deps in deptree.items():
             for pkg_id, pkg_repo in _deps:
-                keyslot = self.open_repository(pkg_repo).retrieveKeySlot(pkg_id)
+                keyslot = self._get_package_index(
+                    pkg_repo, package_indexes).retrieveKeySlot(pkg_id)
                 ks_set = _dup_deps_collisions.setdefault(keyslot, set())
                 ks_set.add((pkg_id, pkg_repo))
         _colliding_deps = [x for x in _dup_deps_collisions.values() if \
@@ -2890,16 +3060,14 @@ class CalculatorsMixin:
             repo = self.open_repository(repository_id)
             try:
                 # db may be corrupted, we cannot deal with it here
-                package_ids = repo.listAllPackageIds()
+                mask_data = repo.maskFilterAll()
             except OperationalError:
                 continue
 
-            def fm(pkg_id):
-                pkg_id_filtered, reason_id = repo.maskFilter(pkg_id)
+            for pkg_id in sorted(mask_data):
+                pkg_id_filtered, reason_id = mask_data[pkg_id]
                 if pkg_id_filtered == -1:
-                    return ((pkg_id, repository_id,), reason_id)
-                return None
-            masked += [x for x in map(fm, package_ids) if x is not None]
+                    masked.append(((pkg_id, repository_id,), reason_id))
 
         # add live unmasked elements too
         unmasks = self._settings['live_packagemasking']['unmask_matches']
@@ -3166,6 +3334,46 @@ class CalculatorsMixin:
             # client db is broken!
             raise SystemDatabaseError("installed packages repository is broken")
 
+        # match all the installed packages against the available
+        # repositories in one go, see atom_match_many()
+        strict_data = {}
+        match_atoms = []
+        for package_id in package_ids:
+            data = self.installed_repository().getStrictData(package_id)
+            strict_data[package_id] = data
+            if data is None:
+                continue
+            cl_pkgkey, cl_slot, _ver, cl_tag, _rev, _atom = data
+            if cl_slot is None:
+                continue
+            cl_pkgkey_slot = cl_pkgkey + etpConst['entropyslotprefix'] + \
+                cl_slot
+            match_atoms.append(cl_pkgkey_slot)
+            if cl_tag:
+                match_atoms.append(cl_pkgkey_slot + \
+                    etpConst['entropytagprefix'] + cl_tag)
+        matches = self.atom_match_many(
+            match_atoms, extended_results = True,
+            use_cache = use_cache, match_repo = match_repos)
+
+        def _atom_match(pkgkey, slot, tag, use_match_cache):
+            if use_match_cache and slot is not None:
+                match_atom = pkgkey + etpConst['entropyslotprefix'] + slot
+                if tag is not None:
+                    match_atom += etpConst['entropytagprefix'] + tag
+                match = matches.get(match_atom)
+                if match is not None:
+                    return match
+            if tag is not None:
+                pkgkey += etpConst['entropytagprefix'] + tag
+            return self.atom_match(
+                pkgkey,
+                match_slot = slot,
+                extended_results = True,
+                use_cache = use_match_cache,
+                match_repo = match_repos
+            )
+
         count = 0
         total = len(package_ids)
         last_count = 0
@@ -3204,37 +3412,21 @@ class CalculatorsMixin:
             try:
                 cl_pkgkey, cl_slot, cl_version, \
                     cl_tag, cl_revision, \
-                    cl_atom = self.installed_repository().getStrictData(
-                        package_id)
+                    cl_atom = strict_data[package_id]
             except TypeError:
                 # check against broken entries, or removed during iteration
                 continue
             use_match_cache = True
             do_continue = False
 
-            # try to search inside package tag, if it's available,
-            # otherwise, do the usual duties.
-            cl_pkgkey_tag = None
-            if cl_tag:
-                cl_pkgkey_tag = "%s%s%s" % (
-                    cl_pkgkey,
-                    etpConst['entropytagprefix'],
-                    cl_tag)
-
             while True:
                 try:
                     match = None
-                    if cl_pkgkey_tag is not None:
-                        # search with tag first, if nothing
-                        # pops up, fallback
-                        # to usual search?
-                        match = self.atom_match(
-                            cl_pkgkey_tag,
-                            match_slot = cl_slot,
-                            extended_results = True,
-                            use_cache = use_match_cache,
-                            match_repo = match_repos
-                        )
+                    if cl_tag:
+                        # try to search inside package tag first, if
+                        # nothing pops up, fallback to usual search
+                        match = _atom_match(
+                            cl_pkgkey, cl_slot, cl_tag, use_match_cache)
                         try:
                             if const_isnumber(match[1]):
                                 match = None
@@ -3245,13 +3437,8 @@ class CalculatorsMixin:
                             continue
 
                     if match is None:
-                        match = self.atom_match(
-                            cl_pkgkey,
-                            match_slot = cl_slot,
-                            extended_results = True,
-                            use_cache = use_match_cache,
-                            match_repo = match_repos
-                        )
+                        match = _atom_match(
+                            cl_pkgkey, cl_slot, None, use_match_cache)
                 except OperationalError:
                     # ouch, but don't crash here
                     do_continue = True
@@ -15,9 +15,6 @@ from entropy.spm.plugins.factory import get_default_instance as get_spm, \
     get_default_class as get_spm_default_class
 
 from entropy.const import etpConst
-from entropy.qa import QAInterface
-from entropy.security import System
-from entropy.security import Repository as RepositorySecurity
 from entropy.client.interfaces.settings import ClientSystemSettingsPlugin
 
 class LoadersMixin:
@@ -58,6 +55,7 @@ class LoadersMixin:
         @return: Repository Security instance object
         @rtype: entropy.security.System
         """
+        from entropy.security import System
         return System(self, *args, **kwargs)
 
     def RepositorySecurity(self, keystore_dir = None):
@@ -69,6 +67,7 @@ class LoadersMixin:
         @raise RepositorySecurity.GPGError: GPGError based instances in case
             of problems.
         """
+        from entropy.security import Repository as RepositorySecurity
         if keystore_dir is None:
             keystore_dir = etpConst['etpclientgpgdir']
         return RepositorySecurity(keystore_dir = keystore_dir)
@@ -79,6 +78,7 @@ class LoadersMixin:
 
         @rtype: entropy.qa.QAInterface
         """
+        from entropy.qa import QAInterface
         qa_intf = QAInterface()
         qa_intf.output = self.output
         qa_intf.ask_question = self.ask_question
@@ -198,6 +198,9 @@ class RepositoryMixin:
                         err,))
             repo_cache.clear()
 
+        with self._package_indexes_mutex:
+            self._package_indexes.clear()
+
         # disable hooks during SystemSettings cleanup
         # otherwise it makes entropy.client.interfaces.repository crazy
         old_value = self._can_run_sys_set_hooks
@@ -1030,12 +1033,19 @@ class RepositoryMixin:
             entropy.tools.print_traceback(f = self.logger)
         else:
 
+            try:
+                content_blobs = self.ClientSettings()['misc']['content_blobs']
+            except KeyError:
+                # Entropy Client plugin already removed by destroy()
+                content_blobs = False
+
             try:
                 repo_class = self.get_repository(name)
                 conn = repo_class(readOnly = False,
                                   dbFile = db_path,
                                   xcache = self.xcache,
-                                  indexing = self._indexing)
+                                  indexing = self._indexing,
+                                  content_blobs = content_blobs)
                 conn.setCloseToken(name)
                 self._add_plugin_to_client_repository(conn)
                 # TODO: remove this in future, drop useless data from clientdb
@@ -38,7 +38,7 @@ from . import _content as Content
 from .actions.action import PackageAction
 from .actions.config import _PackageConfigAction
 from .actions.fetch import _PackageFetchAction
-from .actions.install import _PackageInstallAction
+from .actions.install import _PackageInstallAction, _PackageInstallPipeline
 from .actions.multifetch import _PackageMultiFetchAction
 from .actions.remove import _PackageRemoveAction
 from .actions.source import _PackageSourceAction
@@ -127,6 +127,29 @@ class PackageActionFactory(object):
                 "action does not exist")
         return action_class(self._entropy, package_match, opts = opts)
 
+    def get_install_pipeline(self, actions, depth = None):
+        """
+        Return an install pipeline object for the given install PackageAction
+        objects. The pipeline unpacks the package files of the next "depth"
+        actions in parallel while the current one is being executed.
+        Call its advance() method right before starting every action and its
+        close() method once done (or on error), before finalizing the
+        actions.
+
+        @param actions: ordered list of PackageAction objects returned
+            by get() with INSTALL_ACTION
+        @type actions: list
+        @keyword depth: number of packages to unpack in advance, if None,
+            the client.conf "install-pipeline" setting is used. 0 disables
+            the pipeline.
+        @type depth: int
+        @return: the install pipeline object
+        @rtype: _PackageInstallPipeline
+        """
+        if depth is None:
+            depth = self._entropy.ClientSettings()['misc']['install_pipeline']
+        return _PackageInstallPipeline(actions, depth)
+
 
 class PackageActionFactoryWrapper(PackageActionFactory):
     """
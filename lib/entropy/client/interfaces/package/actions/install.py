@@ -13,6 +13,7 @@ import errno
 import os
 import shutil
 import stat
+import threading
 import time
 
 from entropy.const import etpConst, const_convert_to_unicode, \
@@ -20,11 +21,17 @@ from entropy.const import etpConst, const_convert_to_unicode, \
     const_is_python3, const_debug_write
 from entropy.exceptions import EntropyException
 from entropy.i18n import _
+from entropy.misc import ParallelTask
 from entropy.output import darkred, red, purple, brown, blue, darkgreen, teal
 
 import entropy.dep
 import entropy.tools
 
+if const_is_python3():
+    import queue as Queue
+else:
+    import Queue
+
 from ._manage import _PackageInstallRemoveAction
 from ._triggers import Trigger
 
@@ -51,6 +58,10 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
         """
         super(_PackageInstallAction, self).__init__(
             entropy_client, package_match, opts = opts)
+        # set by _PackageInstallPipeline when package files are
+        # unpacked in advance
+        self._unpack_event = None
+        self._unpack_status = None
 
     def finalize(self):
         """
@@ -60,6 +71,12 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
         if self._meta is not None:
             meta = self._meta
             self._meta = None
+            if self._unpack_event is not None:
+                # files may have been unpacked in advance but the action
+                # never executed, the cleanup phase did not run then.
+                self._unpack_event.wait()
+                unpack_dir = const_convert_to_rawstring(meta['unpackdir'])
+                shutil.rmtree(unpack_dir, True)
             meta.clear()
 
     def _get_remove_package_id_unlocked(self, inst_repo):
@@ -135,6 +152,9 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
         metadata['slot'] = repo.retrieveSlot(self._package_id)
 
         metadata['extra_download'] = []
+        # package file path -> list of tarfile.TarInfo objects whose
+        # ownership must be applied again after the setup phase
+        metadata['tarball_ownership'] = {}
         metadata['splitdebug_pkgfile'] = True
         if not is_package_repo:
             metadata['splitdebug_pkgfile'] = False
@@ -336,20 +356,22 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
 
         return 0
 
-    def _unpack_package(self, package_path, image_dir, pkg_dbpath):
+    def _unpack_package(self, package_path, image_dir, pkg_dbpath,
+                        quiet = False):
         """
         Effectively unpack the package tarballs.
         """
-        txt = "%s: %s" % (
-            blue(_("Unpacking")),
-            red(os.path.basename(package_path)),
-        )
-        self._entropy.output(
-            txt,
-            importance = 1,
-            level = "info",
-            header = red("   ## ")
-        )
+        if not quiet:
+            txt = "%s: %s" % (
+                blue(_("Unpacking")),
+                red(os.path.basename(package_path)),
+            )
+            self._entropy.output(
+                txt,
+                importance = 1,
+                level = "info",
+                header = red("   ## ")
+            )
 
         self._entropy.logger.log(
             "[Package]",
@@ -380,18 +402,19 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                     "Unable to mkdir: %s, error: %s" % (
                         image_dir, repr(err),)
                 )
-                self._entropy.output(
-                    "%s: %s" % (brown(_("Unpack error")), err.errno,),
-                    importance = 1,
-                    level = "error",
-                    header = red("   ## ")
-                )
+                if not quiet:
+                    self._entropy.output(
+                        "%s: %s" % (brown(_("Unpack error")), err.errno,),
+                        importance = 1,
+                        level = "error",
+                        header = red("   ## ")
+                    )
                 return 1
 
         # pkg_dbpath is only non-None for the base package file
         # extra package files don't carry any other edb information
         if pkg_dbpath is not None:
-            # extract entropy database from package file
+            # the entropy database is extracted from package file
             # in order to avoid having to read content data
             # from the repository database, which, in future
             # is allowed to not provide such info.
@@ -401,10 +424,18 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
             except OSError as err:
                 if err.errno != errno.EEXIST:
                     raise
-            # extract edb
-            dump_exit_st = entropy.tools.dump_entropy_metadata(
-                package_path, pkg_dbpath)
-            if not dump_exit_st:
+
+        try:
+            # extract edb and package files reading the package
+            # file once, ownership of files whose user or group do not
+            # exist yet is fixed up by _tarball_ownership_fixup_phase()
+            exit_st, unresolved = entropy.tools.uncompress_entropy_package(
+                package_path,
+                image_dir,
+                metadata_path = pkg_dbpath,
+                catch_empty = True
+            )
+            if exit_st == 1 and pkg_dbpath is not None:
                 # error during entropy db extraction from package file
                 # might be because edb entry point is not found or
                 # because there is not enough space for it
@@ -412,20 +443,16 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                     "[Package]", etpConst['logging']['normal_loglevel_id'],
                     "Unable to dump edb for: " + pkg_dbpath
                 )
-                self._entropy.output(
-                    brown(_("Unable to find Entropy metadata in package")),
-                    importance = 1,
-                    level = "error",
-                    header = red("   ## ")
-                )
+                if not quiet:
+                    self._entropy.output(
+                        brown(_("Unable to find Entropy metadata in package")),
+                        importance = 1,
+                        level = "error",
+                        header = red("   ## ")
+                    )
                 return 1
-
-        try:
-            exit_st = entropy.tools.uncompress_tarball(
-                package_path,
-                extract_path = image_dir,
-                catch_empty = True
-            )
+            if exit_st == 0:
+                self._meta['tarball_ownership'][package_path] = unresolved
         except EOFError as err:
             self._entropy.logger.log(
                 "[Package]", etpConst['logging']['normal_loglevel_id'],
@@ -451,12 +478,13 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                 "[Package]", etpConst['logging']['normal_loglevel_id'],
                 "Unable to unpack: %s" % (package_path,)
             )
-            self._entropy.output(
-                brown(_("Unable to unpack package")),
-                importance = 1,
-                level = "error",
-                header = red("   ## ")
-            )
+            if not quiet:
+                self._entropy.output(
+                    brown(_("Unable to unpack package")),
+                    importance = 1,
+                    level = "error",
+                    header = red("   ## ")
+                )
 
         return exit_st
 
@@ -550,18 +578,14 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
         return spm_class.entropy_install_unpack_hook(self._entropy,
             self._meta)
 
-    def _unpack_phase(self):
+    def _unpack_files(self, quiet = False):
         """
-        Execute the unpack phase.
+        Unpack the package file and its extra download files into the
+        image directory. Return an exit status.
         """
-        xterm_title = "%s %s: %s" % (
-            self._xterm_header,
-            _("Unpacking"),
-            self._meta['download'],
-        )
-        self._entropy.set_title(xterm_title)
-
         def _unpack_error(exit_st):
+            if quiet:
+                return
             msg = _("An error occurred while trying to unpack the package")
             errormsg = "%s. %s. %s: %s" % (
                 red(msg),
@@ -587,7 +611,7 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                 if not self._stat_path(download_path):
                     const_debug_write(
                         __name__,
-                        "_unpack_phase: %s vanished" % (
+                        "_unpack_files: %s vanished" % (
                             download_path,))
                     _unpack_error(2)
                     return 2
@@ -595,12 +619,13 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                 exit_st = self._unpack_package(
                     download_path,
                     self._meta['imagedir'],
-                    self._meta['pkgdbpath'])
+                    self._meta['pkgdbpath'],
+                    quiet = quiet)
 
                 if exit_st != 0:
                     const_debug_write(
                         __name__,
-                        "_unpack_phase: %s unpack error: %s" % (
+                        "_unpack_files: %s unpack error: %s" % (
                             download_path, exit_st))
                     _unpack_error(exit_st)
                     return exit_st
@@ -615,7 +640,7 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                     if not self._stat_path(download_path):
                         const_debug_write(
                             __name__,
-                            "_unpack_phase: %s vanished" % (
+                            "_unpack_files: %s vanished" % (
                                 download_path,))
                         _unpack_error(2)
                         return 2
@@ -623,12 +648,13 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                     exit_st = self._unpack_package(
                         download_path,
                         self._meta['imagedir'],
-                        None)
+                        None,
+                        quiet = quiet)
 
                     if exit_st != 0:
                         const_debug_write(
                             __name__,
-                            "_unpack_phase: %s unpack error: %s" % (
+                            "_unpack_files: %s unpack error: %s" % (
                                 download_path, exit_st,))
                         _unpack_error(exit_st)
                         return exit_st
@@ -637,6 +663,86 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
             for l in locks:
                 l.close()
 
+        return 0
+
+    def _schedule_unpack(self):
+        """
+        Mark the package files as being unpacked in advance by
+        _PackageInstallPipeline. Return True if the action supports it.
+        """
+        self.setup()
+        if self._meta['merge_from']:
+            return False
+        self._unpack_event = threading.Event()
+        self._unpack_status = None
+        return True
+
+    def _prepare_unpack(self):
+        """
+        Unpack the package files in advance, this is called by
+        _PackageInstallPipeline worker threads.
+        """
+        try:
+            self._unpack_status = self._unpack_files(quiet = True)
+        except Exception as err:
+            self._entropy.logger.log(
+                "[Package]", etpConst['logging']['normal_loglevel_id'],
+                "Unable to unpack %s in advance: %s" % (
+                    self._meta['atom'], repr(err),)
+            )
+            self._unpack_status = 1
+        finally:
+            self._unpack_event.set()
+
+    def _cancel_unpack(self):
+        """
+        Cancel a scheduled unpack that did not start yet.
+        """
+        self._unpack_status = None
+        self._unpack_event.set()
+
+    def _unpack_phase(self):
+        """
+        Execute the unpack phase.
+        """
+        xterm_title = "%s %s: %s" % (
+            self._xterm_header,
+            _("Unpacking"),
+            self._meta['download'],
+        )
+        self._entropy.set_title(xterm_title)
+
+        exit_st = None
+        if self._unpack_event is not None:
+            self._unpack_event.wait()
+            exit_st = self._unpack_status
+
+        if exit_st == 0:
+            txt = "%s: %s" % (
+                blue(_("Unpacked")),
+                red(os.path.basename(self._meta['pkgpath'])),
+            )
+            self._entropy.output(
+                txt,
+                importance = 1,
+                level = "info",
+                header = red("   ## ")
+            )
+        else:
+            if exit_st is not None:
+                # unpack in advance failed, start from scratch and
+                # let the user know what is going wrong.
+                shutil.rmtree(
+                    const_convert_to_rawstring(self._meta['imagedir']), True)
+                try:
+                    os.remove(self._meta['pkgdbpath'])
+                except OSError:
+                    pass
+
+            exit_st = self._unpack_files()
+            if exit_st != 0:
+                return exit_st
+
         spm_class = self._entropy.Spm_class()
         # call Spm unpack hook
         return spm_class.entropy_install_unpack_hook(self._entropy,
@@ -737,8 +843,14 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                         return 1
 
                     try:
-                        entropy.tools.apply_tarball_ownership(
-                            package_path, self._meta['imagedir'])
+                        unresolved = self._meta['tarball_ownership'].get(
+                            package_path)
+                        if unresolved is None:
+                            entropy.tools.apply_tarball_ownership(
+                                package_path, self._meta['imagedir'])
+                        else:
+                            entropy.tools.apply_tarball_ownership_entries(
+                                unresolved, self._meta['imagedir'])
                     except IOError as err:
                         msg = "%s: %s" % (
                             brown(_("Error during package files "
@@ -1424,14 +1536,19 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
     def _handle_install_collision_protect_unlocked(self, inst_repo,
                                                    remove_package_id,
                                                    tofile,
-                                                   todbfile):
+                                                   todbfile,
+                                                   owners = None):
         """
         Handle files collition protection for the install phase.
+        If owners, the package identifiers owning todbfile, is None,
+        they are looked up in the installed packages repository.
         """
-
-        avail = inst_repo.isFileAvailable(
-            const_convert_to_unicode(todbfile),
-            get_id = True)
+        if owners is None:
+            avail = inst_repo.isFileAvailable(
+                const_convert_to_unicode(todbfile),
+                get_id = True)
+        else:
+            avail = owners
 
         if (remove_package_id not in avail) and avail:
             mytxt = darkred(_("Collision found during install for"))
@@ -1476,6 +1593,9 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
         splitdebug, splitdebug_dirs = metadata['splitdebug'], \
             metadata['splitdebug_dirs']
         info_dirs = self._get_info_directories()
+        # collision protection path owners of the files in the
+        # directory being merged, see below.
+        collision_owners = {}
 
         # setup image_dir properly
         image_dir = metadata['imagedir'][:]
@@ -1716,7 +1836,9 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
             if col_protect > 1:
                 todbfile = fromfile[len(image_dir):]
                 myrc = self._handle_install_collision_protect_unlocked(
-                    inst_repo, remove_package_id, tofile, todbfile)
+                    inst_repo, remove_package_id, tofile, todbfile,
+                    owners = collision_owners.get(
+                        const_convert_to_unicode(todbfile)))
                 if not myrc:
                     return 0
 
@@ -1937,9 +2059,141 @@ class _PackageInstallAction(_PackageInstallRemoveAction):
                 if exit_st != 0:
                     return exit_st
 
+            if col_protect > 1 and files:
+                # look up the owners of all the files at once
+                collision_owners = inst_repo.searchBelongsMany(
+                    [const_convert_to_unicode(
+                            os.path.join(currentdir, x)[len(image_dir):]) \
+                         for x in files])
+
             for item in files:
                 move_st = workout_file(currentdir, item)
                 if move_st != 0:
                     return move_st
 
         return 0
+
+
+class _PackageInstallPipeline(object):
+    """
+    Unpack the package files of upcoming install PackageAction objects on a
+    pool of worker threads, while the current one is being merged into the
+    live filesystem. Only the decompression and unpack of package files into
+    their private image directories is moved to the workers, all the other
+    phases (and thus the Installed Packages Repository access) stay
+    serialized.
+
+    Example code:
+
+    >>> pipeline = _PackageInstallPipeline(actions, 3)
+    >>> try:
+    ...     for action in actions:
+    ...         pipeline.advance(action)
+    ...         exit_st = action.start()
+    ... finally:
+    ...     pipeline.close()
+    ...     for action in actions:
+    ...         action.finalize()
+    """
+
+    def __init__(self, actions, depth):
+        """
+        Object constructor.
+
+        @param actions: ordered list of install PackageAction objects
+        @type actions: list
+        @param depth: number of packages to unpack in advance, which
+            is also the number of worker threads
+        @type depth: int
+        """
+        self._actions = list(actions)
+        self._positions = dict(
+            (id(action), idx) for idx, action in enumerate(self._actions))
+        self._depth = max(depth, 0)
+        self._queue = Queue.Queue()
+        self._scheduled = 0
+        self._workers = []
+
+    def _worker(self):
+        """
+        Worker thread body.
+        """
+        while True:
+            action = self._queue.get()
+            if action is None:
+                break
+            action._prepare_unpack()
+
+    def advance(self, action):
+        """
+        Signal that the given action is about to be executed and schedule
+        the unpack of the next ones.
+
+        @param action: the install PackageAction about to be executed
+        @type action: _PackageInstallAction
+        """
+        if not self._depth:
+            return
+
+        position = self._positions.get(id(action))
+        if position is None:
+            return
+
+        try:
+            self._advance(position)
+        except:
+            # do not leave the worker threads behind
+            self.close()
+            raise
+
+    def _advance(self, position):
+        """
+        Start the worker threads, if needed, and schedule the unpack
+        of the actions following the one at the given position.
+        """
+        if not self._workers:
+            for idx in range(min(self._depth, len(self._actions) - 1)):
+                worker = ParallelTask(self._worker)
+                worker.name = "PackageInstallPipeline-%d" % (idx,)
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+
+        # the current action unpacks its own files, if not done yet
+        self._scheduled = max(self._scheduled, position + 1)
+        end = min(position + 1 + self._depth, len(self._actions))
+        while self._scheduled < end:
+            next_action = self._actions[self._scheduled]
+            self._scheduled += 1
+            try:
+                if next_action._schedule_unpack():
+                    self._queue.put(next_action)
+            except Exception as err:
+                # the action will unpack its own files, errors
+                # (like InvalidArchitecture) are raised again by start()
+                const_debug_write(
+                    __name__,
+                    "_PackageInstallPipeline: cannot schedule %s: %s" % (
+                        next_action, repr(err),))
+                continue
+
+    def close(self):
+        """
+        Cancel the pending unpacks and stop the worker threads. Once
+        closed, advance() does not schedule anything anymore.
+        """
+        self._depth = 0
+        while True:
+            try:
+                action = self._queue.get_nowait()
+            except Queue.Empty:
+                break
+            if action is not None:
+                action._cancel_unpack()
+
+        for worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.join()
+        del self._workers[:]
@@ -382,9 +382,11 @@ class _PackageMultiFetchAction(_PackageFetchAction):
 
         return fetched_url_data, data_transfer, 0
 
-    def _download_files(self, url_data, resume = True):
+    def _download_files(self, url_data, resume = True, url_mirrors = None):
         """
-        Effectively fetch the package files.
+        Effectively fetch the package files. url_mirrors maps the URLs in
+        url_data to the same files on the other repository mirrors, used
+        by segmented downloads.
         """
         self._setup_url_directories(url_data)
 
@@ -474,7 +476,8 @@ class _PackageMultiFetchAction(_PackageFetchAction):
             url_fetcher_class = self._entropy._url_fetcher,
             download_context_func = download_context,
             pre_download_hook = pre_download_hook,
-            post_download_hook = post_download_hook)
+            post_download_hook = post_download_hook,
+            url_mirrors = url_mirrors)
         try:
             # make sure that we don't need to abort already
             # doing the check here avoids timeouts
@@ -719,6 +722,7 @@ class _PackageMultiFetchAction(_PackageFetchAction):
 
             while True:
                 fetch_files_list = []
+                url_mirrors = {}
 
                 for pkg_id, repository_id, fname, cksum, signs in d_list:
                     best_mirror = get_best_mirror(repository_id)
@@ -738,6 +742,9 @@ class _PackageMultiFetchAction(_PackageFetchAction):
                     fetch_files_list.append(
                         (pkg_id, repository_id, myuri, pkg_path, cksum, signs)
                     )
+                    url_mirrors[myuri] = [
+                        os.path.join(x, fname) for x in \
+                            remaining[repository_id][1:]]
 
                 show_download_summary(d_list)
 
@@ -755,7 +762,8 @@ class _PackageMultiFetchAction(_PackageFetchAction):
                         (exit_st, failed_downloads,
                          data_transfer) = self._download_files(
                              updated_fetch_files_list,
-                             resume = do_resume)
+                             resume = do_resume,
+                             url_mirrors = url_mirrors)
 
                 if exit_st == 0:
                     show_successful_download(
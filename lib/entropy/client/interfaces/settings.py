@@ -16,6 +16,7 @@ import os
 from entropy.const import etpConst, const_file_readable, \
     const_convert_to_unicode, const_convert_to_rawstring
 from entropy.core.settings.plugins.skel import SystemSettingsPlugin
+from entropy.cache import EntropyCacher
 
 from entropy.exceptions import SystemDatabaseError, RepositoryError
 
@@ -386,12 +387,16 @@ class ClientSystemSettingsPlugin(SystemSettingsPlugin):
             'splitdebug': etpConst['splitdebug'],
             'splitdebug_dirs': etpConst['splitdebug_dirs'],
             'multifetch': 1,
+            'install_pipeline': 0, # disabled by default
             'collisionprotect': etpConst['collisionprotect'],
             'configprotect': set(),
             'configprotectmask': set(),
             'configprotectskip': set(),
             'autoprune_days': None, # disabled by default
             'edelta_support': False, # disabled by default
+            'cache_backend': EntropyCacher.BACKEND_FILES,
+            'cache_store_size': EntropyCacher.STORE_MAX_SIZE,
+            'content_blobs': False, # disabled by default
         }
 
         cli_conf = ClientSystemSettingsPlugin.client_conf_path()
@@ -419,6 +424,23 @@ class ClientSystemSettingsPlugin(SystemSettingsPlugin):
             if bool_setting is not None:
                 data['edelta_support'] = bool_setting
 
+        def _cachebackend(setting):
+            setting = setting.strip().lower()
+            if setting in (EntropyCacher.BACKEND_FILES,
+                           EntropyCacher.BACKEND_STORE):
+                data['cache_backend'] = setting
+
+        def _cachestoresize(setting):
+            # MiB
+            int_setting = entropy.tools.setting_to_int(setting, 1, None)
+            if int_setting is not None:
+                data['cache_store_size'] = int_setting * 1024 * 1024
+
+        def _contentblobs(setting):
+            bool_setting = entropy.tools.setting_to_bool(setting)
+            if bool_setting is not None:
+                data['content_blobs'] = bool_setting
+
         def _packagehashes(setting):
             setting = setting.lower().split()
             hashes = set()
@@ -439,6 +461,19 @@ class ClientSystemSettingsPlugin(SystemSettingsPlugin):
                 if bool_setting:
                     data['multifetch'] = 3
 
+        def _installpipeline(setting):
+            int_setting = entropy.tools.setting_to_int(setting, None, None)
+            bool_setting = entropy.tools.setting_to_bool(setting)
+            if int_setting is not None:
+                if int_setting not in range(0, 11):
+                    int_setting = 10
+                data['install_pipeline'] = int_setting
+            elif bool_setting is not None:
+                if bool_setting:
+                    data['install_pipeline'] = 3
+                else:
+                    data['install_pipeline'] = 0
+
         def _gpg(setting):
             bool_setting = entropy.tools.setting_to_bool(setting)
             if bool_setting is not None:
@@ -481,10 +516,14 @@ class ClientSystemSettingsPlugin(SystemSettingsPlugin):
             'forced-updates': _forcedupdates,
             'packages-autoprune-days': _autoprune,
             'packages-delta': _packagesdelta,
+            'cache-backend': _cachebackend,
+            'cache-store-size': _cachestoresize,
+            'content-blobs': _contentblobs,
             # backward compatibility
             'packagehashes': _packagehashes,
             'package-hashes': _packagehashes,
             'multifetch': _multifetch,
+            'install-pipeline': _installpipeline,
             'gpg': _gpg,
             'ignore-spm-downgrades': _spm_downgrades,
             'splitdebug': _splitdebug,
@@ -348,6 +348,17 @@ def const_default_settings(rootdir):
         'etpdatabasemetafilesnotfound': default_etp_dbfile+".meta_notfound",
         # database file checksum
         'etpdatabasehashfile': default_etp_dbfile+".md5",
+        # repository deltas index file, each line describes an
+        # incremental update between two repository revisions
+        'etpdatabasedeltaindexfile': default_etp_dbfile+".deltas",
+        # repository delta file name prefix, followed by the slot number
+        # and the compression extension
+        'etpdatabasedeltafile': default_etp_dbfile+".delta",
+        # maximum amount of repository deltas kept on mirrors
+        'etpdatabasemaxdeltas': 16,
+        # server-side file describing the repository content as of
+        # the last upload, used to generate the next delta
+        'etpdatabasedeltastatefile': default_etp_dbfile+".delta_state",
 
         # the remote database lock file
         'etpdatabaselockfile': default_etp_dbfile+".lock",
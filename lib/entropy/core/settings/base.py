@@ -18,11 +18,13 @@
 
 """
 import codecs
+import copy
 import errno
 import hashlib
 import os
 import sys
 import threading
+import time
 import warnings
 
 from entropy.const import etpConst, etpSys, \
@@ -470,6 +472,9 @@ class SystemSettings(Singleton, EntropyPluginStore):
         self.__cacher = EntropyCacher()
         self.__data = {}
         self.__parsables = {}
+        self.__parsables_extensions = {}
+        self.__parsables_cache = {}
+        self.__parsables_timings = {}
         self.__is_destroyed = False
         self.__inside_with_stmt = 0
         self.__pkg_comment_tag = "##"
@@ -625,16 +630,111 @@ class SystemSettings(Singleton, EntropyPluginStore):
         Lazy load a dict item if it's in the parsable dict.
         """
         if key is None:
-            for item, func in self.__parsables.items():
-                const_debug_write(
-                    __name__, "%s was lazy loaded (slow path!!)" % (item,))
-                self.__data[item] = func()
+            for item in list(self.__parsables.keys()):
+                if item not in self.__data:
+                    const_debug_write(
+                        __name__, "%s was lazy loaded (slow path!!)" % (item,))
+                    self.__load_parsable(item)
             return
 
         if key in self.__parsables:
             if key not in self.__data:
                 const_debug_write(__name__, "%s was lazy loaded" % (key,))
-                self.__data[key] = self.__parsables[key]()
+                self.__load_parsable(key)
+
+    # parsers whose outcome does not only depend on their setting files,
+    # or that must always run because of their side effects on the
+    # global constants (keywords -> etpConst['keywords'], system ->
+    # process nice level).
+    _VOLATILE_PARSABLES = frozenset(['repositories', 'keywords', 'system'])
+
+    def __parsable_sources(self, item):
+        """
+        Return the list of files the given parsable item is generated from,
+        or None if unknown (and the outcome cannot be memoized).
+        """
+        if item in SystemSettings._VOLATILE_PARSABLES:
+            return None
+
+        setting_file = self.__setting_files.get(item)
+        if setting_file is None:
+            return None
+        if isinstance(setting_file, dict):
+            sources = sorted(setting_file.values())
+        else:
+            sources = [setting_file]
+
+        extension = self.__parsables_extensions.get(item)
+        if extension is not None:
+            sources.extend(x for x, _mtime in self.__setting_dirs[extension][1])
+        return sources
+
+    @staticmethod
+    def __sources_stamp(sources):
+        """
+        Return an object describing the current state of the given files.
+        """
+        stamp = []
+        for path in sources:
+            try:
+                st = os.stat(path)
+            except OSError:
+                stamp.append((path, None))
+                continue
+            stamp.append((path, st.st_ino, st.st_mtime, st.st_size))
+        return tuple(stamp)
+
+    @staticmethod
+    def __copy_parsed(data):
+        """
+        Return a copy of parsed metadata, CachingList objects are returned
+        without their cache.
+        """
+        if isinstance(data, SystemSettings.CachingList):
+            return SystemSettings.CachingList(data)
+        return copy.deepcopy(data)
+
+    def __load_parsable(self, item):
+        """
+        Load the given parsable item into the settings. The outcome of the
+        parsers is memoized and reused (even across clear() calls) until
+        their setting files change.
+        """
+        sources = self.__parsable_sources(item)
+        stamp = None
+        if sources is not None:
+            stamp = self.__sources_stamp(sources)
+            cached = self.__parsables_cache.get(item)
+            if cached is not None and cached[0] == stamp:
+                self.__data[item] = self.__copy_parsed(cached[1])
+                return
+
+        start_t = time.time()
+        self.__data[item] = self.__parsables[item]()
+        extension = self.__parsables_extensions.get(item)
+        if extension is not None:
+            # this appends the *.d files content to self.__data[item]
+            getattr(self, "_%s_parser" % (extension,))()
+        elapsed = time.time() - start_t
+
+        self.__parsables_timings[item] = elapsed
+        const_debug_write(__name__, "%s parsed in %.4f seconds" % (
+                item, elapsed))
+        if stamp is not None:
+            self.__parsables_cache[item] = (
+                stamp, self.__copy_parsed(self.__data[item]))
+
+    def get_parsers_timings(self):
+        """
+        Return the time spent by the settings parsers, useful to see
+        what the settings loading is spending on. Only parsers that
+        actually ran (and whose outcome was not memoized) are listed.
+
+        @return: dict composed by setting identifier as key and last parse
+            time (in seconds) as value
+        @rtype: dict
+        """
+        return self.__parsables_timings.copy()
 
     def __setup_const(self):
 
@@ -649,6 +749,7 @@ class SystemSettings(Singleton, EntropyPluginStore):
         del self.__setting_files_pre_run[:]
         self.__setting_files.clear()
         self.__setting_dirs.clear()
+        self.__parsables_extensions.clear()
 
         packages_dir = SystemSettings.packages_config_directory()
         self.__setting_files.update({
@@ -764,8 +865,10 @@ class SystemSettings(Singleton, EntropyPluginStore):
                 # this will make us call _<setting_id>_parser()
                 # and that must return None, becase the outcome
                 # has to be written into '<setting_id/_d>' metadata object
-                # thus, these have to always run AFTER their alter-egos
-                self.__setting_files_order.append(setting_id)
+                # thus, these always run right AFTER their alter-egos
+                # are loaded, see __load_parsable()
+                self.__parsables_extensions[setting_id[:-len("_d")]] = \
+                    setting_id
 
     def __scan(self):
 
@@ -1823,6 +1926,10 @@ class SystemSettings(Singleton, EntropyPluginStore):
             'security_advisories_url': etpConst['securityurl'],
             'developer_repo': False,
             'differential_update': True,
+            # maximum amount of mirrors a package is downloaded from
+            # concurrently, segmented downloads are disabled if < 2.
+            'segmented_download': 4,
+            'download_segment_size': 8 * 1024 * 1024,
         }
 
         enc = etpConst['conf_encoding']
@@ -1924,6 +2031,23 @@ class SystemSettings(Singleton, EntropyPluginStore):
             except ValueError:
                 return
 
+        def _segmented_download(line, setting):
+            int_setting = entropy.tools.setting_to_int(setting, 0, 16)
+            if int_setting is not None:
+                data['segmented_download'] = int_setting
+                return
+            bool_setting = entropy.tools.setting_to_bool(setting)
+            if bool_setting is not None:
+                data['segmented_download'] = 0
+                if bool_setting:
+                    data['segmented_download'] = 4
+
+        def _download_segment_size(line, setting):
+            int_setting = entropy.tools.setting_to_int(setting, 1, None)
+            if int_setting is not None:
+                # MiB
+                data['download_segment_size'] = int_setting * 1024 * 1024
+
         def _security_url(setting):
             data['security_advisories_url'] = setting
 
@@ -1943,6 +2067,8 @@ class SystemSettings(Singleton, EntropyPluginStore):
             # backward compatibility
             'downloadtimeout': _down_timeout,
             'download-timeout': _down_timeout,
+            'segmented-download': _segmented_download,
+            'download-segment-size': _download_segment_size,
             # backward compatibility
             'securityurl': _security_url,
             'security-url': _security_url,
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+
+    @author: Fabio Erculiani <lxnay@sabayon.org>
+    @contact: lxnay@sabayon.org
+    @copyright: Fabio Erculiani
+    @license: GPL-2
+
+    B{Entropy Framework repository delta module}.
+
+    A repository delta is a small Entropy repository containing the
+    packages added or modified between two revisions of a repository,
+    together with the list of removed package identifiers and the
+    repository-wide metadata (treeupdates, package sets) of the newer
+    revision.
+    Deltas are published on the repository mirrors by Entropy Server and
+    applied by Entropy Client instead of downloading the whole repository.
+
+"""
+import os
+import codecs
+import hashlib
+
+from entropy.const import etpConst, const_convert_to_unicode, \
+    const_convert_to_rawstring
+
+
+class EntropyRepositoryDelta(object):
+    """
+    Wrapper around an EntropyRepositoryBase instance holding a repository
+    delta, exposing methods to create and apply it.
+    """
+
+    VERSION = "2"
+
+    def __init__(self, delta_repository):
+        """
+        EntropyRepositoryDelta constructor.
+
+        @param delta_repository: the repository holding the delta data
+        @type delta_repository: entropy.db.skel.EntropyRepositoryBase
+        """
+        self._delta = delta_repository
+
+    @staticmethod
+    def checksum(repository):
+        """
+        Return the checksum used to validate a repository after the
+        application of deltas. It covers the whole package metadata
+        stored in the base tables, the package signatures and the
+        package dependencies.
+
+        @param repository: the repository
+        @type repository: entropy.db.skel.EntropyRepositoryBase
+        @return: the repository checksum
+        @rtype: string
+        """
+        return repository.checksum(
+            strict = True, include_signatures = True,
+            include_dependencies = True)
+
+    @staticmethod
+    def _getPackageData(repository, package_id):
+        return repository.getPackageData(
+            package_id, get_content = False,
+            content_insert_formatted = True, get_changelog = True,
+            get_content_safety = False)
+
+    @staticmethod
+    def _stableRepr(obj):
+        """
+        repr() replacement returning the same string for equal
+        dicts and sets, regardless of their iteration order.
+        """
+        stable = EntropyRepositoryDelta._stableRepr
+        if isinstance(obj, dict):
+            return "{%s}" % (", ".join(sorted(
+                "%s: %s" % (stable(k), stable(v)) for k, v in obj.items())),)
+        if isinstance(obj, (set, frozenset)):
+            return "set([%s])" % (", ".join(sorted(stable(x) for x in obj)),)
+        if isinstance(obj, (list, tuple)):
+            return "[%s]" % (", ".join(stable(x) for x in obj),)
+        return repr(obj)
+
+    @staticmethod
+    def fingerprints(repository):
+        """
+        Return the fingerprint of every package in repository, which
+        changes whenever any package metadata shipped by deltas changes.
+        Fingerprints are only meant to be compared on the same machine.
+
+        @param repository: the repository
+        @type repository: entropy.db.skel.EntropyRepositoryBase
+        @return: dict composed by package id as key and fingerprint as value
+        @rtype: dict
+        """
+        fingerprints = {}
+        for package_id in repository.listAllPackageIds():
+            pkg_data = EntropyRepositoryDelta._getPackageData(
+                repository, package_id)
+            fingerprints[package_id] = hashlib.sha1(
+                const_convert_to_rawstring(
+                    EntropyRepositoryDelta._stableRepr(pkg_data))
+                ).hexdigest()
+        return fingerprints
+
+    def _getSetting(self, name):
+        return self._delta.getSetting("delta_" + name)
+
+    def _setSetting(self, name, value):
+        self._delta._setSetting("delta_" + name, value)
+
+    def create(self, source_repository, repository_id, from_revision,
+               to_revision, base_fingerprints, fingerprints = None):
+        """
+        Fill the (empty) delta repository with the changes between
+        the packages available in source_repository at from_revision,
+        described by base_fingerprints, and the current content of
+        source_repository.
+
+        @param source_repository: the repository at to_revision
+        @type source_repository: entropy.db.skel.EntropyRepositoryBase
+        @param repository_id: repository identifier of source_repository
+        @type repository_id: string
+        @param from_revision: the old repository revision
+        @type from_revision: int
+        @param to_revision: the new repository revision
+        @type to_revision: int
+        @param base_fingerprints: package fingerprints at from_revision,
+            see fingerprints()
+        @type base_fingerprints: dict
+        @keyword fingerprints: package fingerprints of source_repository,
+            if already computed
+        @type fingerprints: dict
+        @return: tuple composed by the added, removed and modified
+            package ids
+        @rtype: tuple
+        """
+        if fingerprints is None:
+            fingerprints = self.fingerprints(source_repository)
+        package_ids = set(fingerprints)
+        base_package_ids = set(base_fingerprints)
+        added = sorted(package_ids - base_package_ids)
+        removed = sorted(base_package_ids - package_ids)
+        modified = sorted(
+            x for x in package_ids & base_package_ids
+            if fingerprints[x] != base_fingerprints[x])
+
+        self._delta.initializeRepository()
+        for package_id in sorted(added + modified):
+            pkg_data = self._getPackageData(source_repository, package_id)
+            self._delta.addPackage(
+                pkg_data, revision = pkg_data['revision'],
+                package_id = package_id, formatted_content = True)
+
+        self._delta.bumpTreeUpdatesActions(
+            source_repository.listAllTreeUpdatesActions())
+        self._delta.insertPackageSets(
+            source_repository.retrievePackageSets())
+
+        self._setSetting("version", self.VERSION)
+        self._setSetting("from_revision", from_revision)
+        self._setSetting("to_revision", to_revision)
+        self._setSetting("removed", " ".join(str(x) for x in removed))
+        self._setSetting("modified", " ".join(str(x) for x in modified))
+        self._setSetting("treeupdates_digest",
+            source_repository.retrieveRepositoryUpdatesDigest(repository_id))
+        self._setSetting("checksum", self.checksum(source_repository))
+        self._delta.commit()
+
+        return added, removed, modified
+
+    def isValid(self):
+        """
+        Return whether the delta repository contains a supported delta.
+
+        @return: True, if the delta is valid
+        @rtype: bool
+        """
+        try:
+            return self._getSetting("version") == self.VERSION
+        except KeyError:
+            return False
+
+    def fromRevision(self):
+        """
+        Return the repository revision this delta applies to.
+
+        @rtype: int
+        """
+        return int(self._getSetting("from_revision"))
+
+    def toRevision(self):
+        """
+        Return the repository revision this delta moves to.
+
+        @rtype: int
+        """
+        return int(self._getSetting("to_revision"))
+
+    def expectedChecksum(self):
+        """
+        Return the checksum (see checksum()) the repository must have
+        once this delta has been applied.
+
+        @rtype: string
+        """
+        return self._getSetting("checksum")
+
+    def listAddedPackageIds(self):
+        """
+        Return the identifiers of the packages added (or replaced, see
+        listModifiedPackageIds()) by this delta.
+
+        @rtype: tuple
+        """
+        return self._delta.listAllPackageIds(order_by = "idpackage")
+
+    def listModifiedPackageIds(self):
+        """
+        Return the identifiers of the packages whose metadata has been
+        changed in place (same package identifier) by this delta.
+
+        @rtype: list
+        """
+        return [int(x) for x in self._getSetting("modified").split()]
+
+    def listRemovedPackageIds(self):
+        """
+        Return the identifiers of the packages removed by this delta.
+
+        @rtype: list
+        """
+        return [int(x) for x in self._getSetting("removed").split()]
+
+    def apply(self, repository, repository_id, output_func = None):
+        """
+        Apply this delta to the given repository. The caller is in charge
+        of committing the changes and of validating the result against
+        expectedChecksum().
+
+        @param repository: the repository at fromRevision()
+        @type repository: entropy.db.skel.EntropyRepositoryBase
+        @param repository_id: repository identifier of repository
+        @type repository_id: string
+        @keyword output_func: if not None, function called with the
+            package atom and True if the package is being added or False
+            if it is being removed
+        @type output_func: callable
+        """
+        for package_id in self.listRemovedPackageIds():
+            if output_func is not None:
+                output_func(repository.retrieveAtom(package_id), False)
+            repository.removePackage(package_id)
+
+        # modified packages are replaced
+        for package_id in self.listModifiedPackageIds():
+            repository.removePackage(package_id)
+
+        for package_id in self.listAddedPackageIds():
+            pkg_data = self._getPackageData(self._delta, package_id)
+            if output_func is not None:
+                output_func(pkg_data['atom'], True)
+            repository.addPackage(
+                pkg_data, revision = pkg_data['revision'],
+                package_id = package_id, formatted_content = True)
+
+        digest = self._getSetting("treeupdates_digest")
+        if digest != "-1":
+            repository.setRepositoryUpdatesDigest(repository_id, digest)
+        repository.bumpTreeUpdatesActions(
+            self._delta.listAllTreeUpdatesActions())
+
+        repository.clearPackageSets()
+        repository.insertPackageSets(self._delta.retrievePackageSets())
+
+    @staticmethod
+    def readIndex(index_path):
+        """
+        Read a delta index file. Every line of the file describes a
+        delta: "<from revision> <to revision> <file name> <md5>".
+
+        @param index_path: path to the index file
+        @type index_path: string
+        @return: list of (from revision, to revision, file name, md5)
+        @rtype: list
+        @raise IOError: if the file cannot be read
+        """
+        entries = []
+        enc = etpConst['conf_encoding']
+        with codecs.open(index_path, "r", encoding=enc) as index_f:
+            for line in index_f.readlines():
+                items = line.strip().split()
+                if len(items) != 4:
+                    continue
+                try:
+                    from_revision, to_revision = int(items[0]), int(items[1])
+                except ValueError:
+                    continue
+                entries.append((from_revision, to_revision,
+                                items[2], items[3]))
+        return entries
+
+    @staticmethod
+    def writeIndex(index_path, entries):
+        """
+        Write a delta index file, see readIndex().
+
+        @param index_path: path to the index file
+        @type index_path: string
+        @param entries: list of (from revision, to revision, file name, md5)
+        @type entries: list
+        """
+        enc = etpConst['conf_encoding']
+        tmp_path = index_path + ".tmp"
+        with codecs.open(tmp_path, "w", encoding=enc) as index_f:
+            for entry in entries:
+                index_f.write(const_convert_to_unicode(
+                    "%s %s %s %s\n" % entry))
+        os.rename(tmp_path, index_path)
+
+    @staticmethod
+    def findChain(entries, from_revision, to_revision):
+        """
+        Return the list of index entries that, applied in order, move a
+        repository from from_revision to to_revision, or None if the
+        index does not provide such a chain.
+
+        @param entries: list of index entries, see readIndex()
+        @type entries: list
+        @param from_revision: the local repository revision
+        @type from_revision: int
+        @param to_revision: the remote repository revision
+        @type to_revision: int
+        @return: list of index entries or None
+        @rtype: list or None
+        """
+        by_revision = dict((x[0], x) for x in entries)
+        chain = []
+        revision = from_revision
+        while revision != to_revision:
+            entry = by_revision.get(revision)
+            if entry is None or entry[1] <= revision:
+                return None
+            chain.append(entry)
+            revision = entry[1]
+        return chain
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+
+    @author: Fabio Erculiani <lxnay@sabayon.org>
+    @contact: lxnay@sabayon.org
+    @copyright: Fabio Erculiani
+    @license: GPL-2
+
+    B{Entropy Framework repository in-memory package index}.
+
+    I{EntropyRepositoryIndex} is a read-only, array-backed snapshot of
+    the versioning and dependency metadata of a repository. It is loaded
+    with a handful of bulk queries and then used by the dependency solver
+    in place of per-package repository queries.
+
+    I{EntropyRepositoryPathIndex} is a read-only, sorted index of the
+    paths owned by the packages of a repository, used to answer pattern
+    and prefix file ownership queries.
+
+"""
+import array
+import bisect
+import fnmatch
+import re
+import threading
+import zlib
+
+from entropy.const import etpConst, const_isunicode, const_is_python3
+
+import entropy.dep
+
+
+class EntropyRepositoryIndex(object):
+    """
+    Read-only, in-memory snapshot of an EntropyRepositoryBase instance.
+    Package metadata is stored into columns (lists and arrays) ordered by
+    package identifier, dependencies are stored in compressed sparse row
+    format (per-package offsets into a flat array of dependency ids).
+
+    The snapshot is bound to the repository instance it has been loaded
+    from and becomes stale as soon as the repository mtime() or checksum()
+    change, see isValid().
+    """
+
+    # mask status not yet computed
+    _MASK_UNKNOWN = -2
+
+    def __init__(self, repository):
+        """
+        EntropyRepositoryIndex constructor.
+
+        @param repository: the repository to load
+        @type repository: entropy.db.skel.EntropyRepositoryBase
+        """
+        self._repository = repository
+        self._mtime = repository.mtime()
+        self._checksum = repository.checksum(strict = False)
+        self._mask_key = repository.atomMatchCacheKey()
+        self._mask_lock = threading.Lock()
+
+        versioning = sorted(repository.listAllVersioningData())
+        self._package_ids = array.array("l", (x[0] for x in versioning))
+        self._keys = ["%s/%s" % (x[1], x[2]) for x in versioning]
+        self._versions = [x[3] for x in versioning]
+        self._tags = [x[4] for x in versioning]
+        self._revisions = array.array("l", (x[5] for x in versioning))
+        self._slots = [x[6] for x in versioning]
+        del versioning
+
+        self._mask_ids = array.array(
+            "l", [self._MASK_UNKNOWN] * len(self._package_ids))
+        self._mask_reasons = array.array(
+            "l", [0] * len(self._package_ids))
+
+        self._dependencies = dict(repository.listAllDependencies())
+        dep_rows = sorted(repository.listAllPackageDependencies())
+        self._dep_ids = array.array("l", (x[1] for x in dep_rows))
+        self._dep_types = array.array("l", (x[2] for x in dep_rows))
+        # self._dep_offsets[i]:self._dep_offsets[i + 1] is the slice of
+        # self._dep_ids belonging to the i-th package
+        self._dep_offsets = array.array("l", [0])
+        dep_idx = 0
+        dep_count = len(dep_rows)
+        for package_id in self._package_ids:
+            while dep_idx < dep_count and dep_rows[dep_idx][0] < package_id:
+                dep_idx += 1
+            while dep_idx < dep_count and dep_rows[dep_idx][0] == package_id:
+                dep_idx += 1
+            self._dep_offsets.append(dep_idx)
+        del dep_rows
+
+        self._conflicts = {}
+        for package_id, conflict in repository.listAllPackageConflicts():
+            obj = self._conflicts.setdefault(package_id, set())
+            obj.add(conflict)
+
+    def _index(self, package_id):
+        """
+        Return the column index of the given package identifier or -1.
+        """
+        idx = bisect.bisect_left(self._package_ids, package_id)
+        if idx < len(self._package_ids) and \
+                self._package_ids[idx] == package_id:
+            return idx
+        return -1
+
+    def repository(self):
+        """
+        Return the repository instance this snapshot has been loaded from.
+
+        @return: the repository
+        @rtype: entropy.db.skel.EntropyRepositoryBase
+        """
+        return self._repository
+
+    def isValid(self, repository):
+        """
+        Return whether this snapshot still reflects the content of the
+        given repository.
+
+        @param repository: the repository to validate against
+        @type repository: entropy.db.skel.EntropyRepositoryBase
+        @return: True, if the snapshot is still valid
+        @rtype: bool
+        """
+        if repository is not self._repository:
+            return False
+        try:
+            if repository.mtime() != self._mtime:
+                return False
+        except (OSError, IOError):
+            return False
+        if repository.checksum(strict = False) != self._checksum:
+            return False
+        if repository.atomMatchCacheKey() != self._mask_key:
+            return False
+        return True
+
+    def clearMaskCache(self):
+        """
+        Forget the memoized package masking status, which is computed
+        lazily through the repository maskFilter().
+        """
+        with self._mask_lock:
+            for idx in range(len(self._mask_ids)):
+                self._mask_ids[idx] = self._MASK_UNKNOWN
+                self._mask_reasons[idx] = 0
+
+    def isPackageIdAvailable(self, package_id):
+        """
+        Same as EntropyRepositoryBase.isPackageIdAvailable().
+        """
+        return self._index(package_id) != -1
+
+    def maskFilter(self, package_id):
+        """
+        Same as EntropyRepositoryBase.maskFilter() (live masking enabled),
+        memoized.
+        """
+        idx = self._index(package_id)
+        if idx == -1:
+            return self._repository.maskFilter(package_id)
+
+        with self._mask_lock:
+            mask_id = self._mask_ids[idx]
+            if mask_id != self._MASK_UNKNOWN:
+                return mask_id, self._mask_reasons[idx]
+
+            mask_id, reason = self._repository.maskFilter(package_id)
+            self._mask_ids[idx] = mask_id
+            self._mask_reasons[idx] = reason
+            return mask_id, reason
+
+    def retrieveKeySlot(self, package_id):
+        """
+        Same as EntropyRepositoryBase.retrieveKeySlot().
+        """
+        idx = self._index(package_id)
+        if idx == -1:
+            return None
+        return self._keys[idx], self._slots[idx]
+
+    def getVersioningData(self, package_id):
+        """
+        Same as EntropyRepositoryBase.getVersioningData().
+        """
+        idx = self._index(package_id)
+        if idx == -1:
+            return None
+        return self._versions[idx], self._tags[idx], self._revisions[idx]
+
+    def retrieveDependencyIds(self, package_id):
+        """
+        Return the dependency identifiers and types of the given package.
+
+        @param package_id: package identifier
+        @type package_id: int
+        @return: tuple of (iddependency, dependency type) tuples
+        @rtype: tuple
+        """
+        idx = self._index(package_id)
+        if idx == -1:
+            return tuple()
+        start, end = self._dep_offsets[idx], self._dep_offsets[idx + 1]
+        return tuple(zip(self._dep_ids[start:end], self._dep_types[start:end]))
+
+    def retrieveDependenciesList(self, package_id, exclude_deptypes = None,
+                                 resolve_conditional_deps = True):
+        """
+        Same as EntropyRepositoryBase.retrieveDependenciesList().
+        """
+        if exclude_deptypes is None:
+            exclude_deptypes = ()
+        deps = set()
+        for dep_id, dep_type in self.retrieveDependencyIds(package_id):
+            if dep_type in exclude_deptypes:
+                continue
+            dependency = self._dependencies.get(dep_id)
+            if dependency is not None:
+                deps.add(dependency)
+        for conflict in self._conflicts.get(package_id, ()):
+            deps.add("!" + conflict)
+
+        if resolve_conditional_deps:
+            return frozenset(
+                entropy.dep.expand_dependencies(deps, [self._repository]))
+        return frozenset(deps)
+
+    def retrievePostDependencies(self, package_id,
+                                 resolve_conditional_deps = True):
+        """
+        Same as EntropyRepositoryBase.retrievePostDependencies().
+        """
+        pdepend_id = etpConst['dependency_type_ids']['pdepend_id']
+        deps = set()
+        for dep_id, dep_type in self.retrieveDependencyIds(package_id):
+            if dep_type != pdepend_id:
+                continue
+            dependency = self._dependencies.get(dep_id)
+            if dependency is not None:
+                deps.add(dependency)
+
+        if resolve_conditional_deps:
+            return frozenset(
+                entropy.dep.expand_dependencies(deps, [self._repository]))
+        return frozenset(deps)
+
+
+class EntropyRepositoryPathIndex(object):
+    """
+    Read-only, in-memory index of the paths owned by the packages of a
+    repository (package content metadata).
+
+    Paths are stored UTF-8 encoded, NUL separated, into a single string,
+    sorted by their ASCII lower case form (SQL LIKE is case insensitive
+    for ASCII characters). Exact and prefix ownership queries cost a
+    binary search, while pattern (SQL LIKE, shell glob) queries are
+    translated to regular expressions and matched in one go against the
+    part of the string holding the paths that start with the literal
+    prefix of the pattern.
+    """
+
+    # on-disk format version, see dump()
+    VERSION = 1
+
+    # a single UTF-8 encoded character
+    _UTF8_CHAR = b"(?:[\\x01-\\x7f]|[\\xc0-\\xff][\\x80-\\xbf]*)"
+    # upper bound of any UTF-8 encoded string suffix
+    _MAX_SUFFIX = b"\xff"
+
+    def __init__(self, owners):
+        """
+        EntropyRepositoryPathIndex constructor.
+
+        @param owners: iterable of (path, package identifier) tuples
+        @type owners: iterable
+        """
+        enc = etpConst['conf_encoding']
+        entries = []
+        for path, package_id in owners:
+            if const_isunicode(path):
+                path = path.encode(enc)
+            entries.append((path.lower(), package_id, path))
+        entries.sort()
+
+        self._package_ids = array.array("l", (x[1] for x in entries))
+        # self._data[self._offsets[i]:self._offsets[i + 1] - 1] is the
+        # i-th path, every path is preceded and followed by NUL.
+        self._offsets = array.array("l")
+        offset = 1
+        for _key, _package_id, path in entries:
+            self._offsets.append(offset)
+            offset += len(path) + 1
+        self._offsets.append(offset)
+        self._data = b"\0" + b"".join((x[2] + b"\0" for x in entries))
+        # repository file state this index has been written to disk for,
+        # managed by the repository.
+        self.file_stat = None
+
+    @classmethod
+    def load(cls, data):
+        """
+        Load an index from the data returned by dump().
+
+        @param data: dump() output
+        @type data: dict
+        @return: the index or None, if data is not valid
+        @rtype: EntropyRepositoryPathIndex or None
+        """
+        if not isinstance(data, dict):
+            return None
+        if data.get('version') != cls.VERSION:
+            return None
+        index = cls(())
+        try:
+            index._data = zlib.decompress(data['data'])
+            offsets = zlib.decompress(data['offsets'])
+            package_ids = zlib.decompress(data['package_ids'])
+        except (KeyError, zlib.error):
+            return None
+        try:
+            index._offsets = array.array("l")
+            index._package_ids = array.array("l")
+            if const_is_python3():
+                index._offsets.frombytes(offsets)
+                index._package_ids.frombytes(package_ids)
+            else:
+                index._offsets.fromstring(offsets)
+                index._package_ids.fromstring(package_ids)
+        except ValueError:
+            return None
+        if len(index._offsets) != len(index._package_ids) + 1:
+            return None
+        if index._offsets[-1] != len(index._data):
+            return None
+        return index
+
+    def dump(self):
+        """
+        Return the index in a serializable (and compact) form, that can be
+        loaded back through load().
+
+        @return: the index data
+        @rtype: dict
+        """
+        # arrays are stored as raw strings, their pickled form is
+        # way bigger and slower to load.
+        if const_is_python3():
+            offsets = self._offsets.tobytes()
+            package_ids = self._package_ids.tobytes()
+        else:
+            offsets = self._offsets.tostring()
+            package_ids = self._package_ids.tostring()
+        return {
+            'version': self.VERSION,
+            'data': zlib.compress(self._data),
+            'offsets': zlib.compress(offsets),
+            'package_ids': zlib.compress(package_ids),
+        }
+
+    def __len__(self):
+        return len(self._package_ids)
+
+    def _encode(self, path):
+        if const_isunicode(path):
+            return path.encode(etpConst['conf_encoding'])
+        return path
+
+    def _path(self, idx):
+        """
+        Return the UTF-8 encoded path at the given index.
+        """
+        return self._data[self._offsets[idx]:self._offsets[idx + 1] - 1]
+
+    def _bisect(self, key, right = False):
+        """
+        Same as bisect.bisect_left() (or bisect.bisect_right(), if right
+        is True) against the lower case paths.
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            m_key = self._path(middle).lower()
+            if m_key < key or (right and m_key == key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _searchPattern(self, prefix, regex):
+        """
+        Return the identifiers of the packages owning paths starting with
+        the given UTF-8 encoded prefix (compared case insensitively) and
+        fully matching the given (UTF-8 encoded) regular expression.
+        """
+        key = prefix.lower()
+        start = self._bisect(key)
+        end = self._bisect(key + self._MAX_SUFFIX)
+        if start >= end:
+            return frozenset()
+
+        # match NUL + path, the following NUL is not consumed
+        matcher = re.compile(b"\\0(?:" + regex + b")(?=\\0)")
+        package_ids = set()
+        for match in matcher.finditer(self._data, self._offsets[start] - 1,
+                                      self._offsets[end]):
+            idx = bisect.bisect_left(self._offsets, match.start() + 1)
+            package_ids.add(self._package_ids[idx])
+        return frozenset(package_ids)
+
+    def search(self, path):
+        """
+        Return the identifiers of the packages owning the given path.
+
+        @param path: the path
+        @type path: string
+        @return: package identifiers
+        @rtype: frozenset
+        """
+        path = self._encode(path)
+        key = path.lower()
+        start = self._bisect(key)
+        end = self._bisect(key, right = True)
+        return frozenset((self._package_ids[idx] for idx in range(
+                    start, end) if self._path(idx) == path))
+
+    def searchMany(self, paths):
+        """
+        Return the identifiers of the packages owning the given paths.
+
+        @param paths: list of paths
+        @type paths: iterable
+        @return: dict composed by path as key and frozenset of package
+            identifiers as value
+        @rtype: dict
+        """
+        return dict(((path, self.search(path)) for path in paths))
+
+    def searchPrefix(self, prefix):
+        """
+        Return the identifiers of the packages owning paths starting with
+        the given prefix (for instance, a directory path ending with "/").
+
+        @param prefix: the path prefix
+        @type prefix: string
+        @return: package identifiers
+        @rtype: frozenset
+        """
+        prefix = self._encode(prefix)
+        return self._searchPattern(prefix, re.escape(prefix) + b"[^\\0]*")
+
+    def searchLike(self, pattern):
+        """
+        Return the identifiers of the packages owning paths matching the
+        given SQL LIKE pattern, with the same semantics of
+        EntropyRepositoryBase.searchBelongs(like = True).
+
+        @param pattern: SQL LIKE pattern ("%" and "_" wildcards)
+        @type pattern: string
+        @return: package identifiers
+        @rtype: frozenset
+        """
+        if not const_isunicode(pattern):
+            pattern = pattern.decode(etpConst['conf_encoding'])
+        prefix = re.split("[%_]", pattern, 1)[0]
+
+        regex = []
+        for char in pattern:
+            if char == "%":
+                regex.append(b"[^\\0]*")
+            elif char == "_":
+                regex.append(self._UTF8_CHAR)
+            elif char.lower() != char.upper() and ord(char) < 128:
+                # ASCII case insensitive, like SQL LIKE. Not using
+                # re.IGNORECASE, which makes matching way slower.
+                regex.append(self._encode("[%s%s]" % (
+                            char.lower(), char.upper())))
+            else:
+                regex.append(re.escape(self._encode(char)))
+        return self._searchPattern(self._encode(prefix), b"".join(regex))
+
+    def searchGlob(self, pattern):
+        """
+        Return the identifiers of the packages owning paths matching the
+        given shell-style pattern (see the fnmatch module). Like fnmatch,
+        wildcards match "/" as well.
+
+        @param pattern: shell-style pattern ("*", "?" and "[]" wildcards)
+        @type pattern: string
+        @return: package identifiers
+        @rtype: frozenset
+        """
+        if not const_isunicode(pattern):
+            pattern = pattern.decode(etpConst['conf_encoding'])
+        prefix = re.split("[*?[]", pattern, 1)[0]
+
+        regex = []
+        idx, length = 0, len(pattern)
+        while idx < length:
+            char = pattern[idx]
+            idx += 1
+            if char == "*":
+                regex.append(b"[^\\0]*")
+            elif char == "?":
+                regex.append(self._UTF8_CHAR)
+            elif char == "[":
+                end = pattern.find("]", idx + 1)
+                if end == -1:
+                    regex.append(b"\\[")
+                    continue
+                chars = pattern[idx:end]
+                idx = end + 1
+                negate = chars.startswith("!")
+                if negate:
+                    chars = chars[1:]
+                chars = chars.replace("\\", "\\\\")
+                if chars.startswith("^"):
+                    chars = "\\" + chars
+                if [x for x in chars if ord(x) > 127]:
+                    # character classes are matched against single bytes
+                    return self._searchGlobUnicode(prefix, pattern)
+                chars = b"[" + self._encode(chars) + b"]"
+                if negate:
+                    chars = b"(?!" + chars + b")" + self._UTF8_CHAR
+                regex.append(chars)
+            else:
+                regex.append(re.escape(self._encode(char)))
+        return self._searchPattern(self._encode(prefix), b"".join(regex))
+
+    def _searchGlobUnicode(self, prefix, pattern):
+        """
+        Slower version of searchGlob() decoding the paths before matching
+        them against the given pattern.
+        """
+        enc = etpConst['conf_encoding']
+        matcher = re.compile(fnmatch.translate(pattern)).match
+        key = self._encode(prefix).lower()
+        start = self._bisect(key)
+        end = self._bisect(key + self._MAX_SUFFIX)
+        return frozenset((self._package_ids[idx] for idx in range(
+                    start, end) if matcher(self._path(idx).decode(enc))))
@@ -358,6 +358,75 @@ class EntropyRepositoryPluginStore(EntropyPluginStore):
         meta[key] = value
 
 
+class _AtomMatchLookup(object):
+    """
+    Read-only view of package versioning metadata prefetched through
+    EntropyRepositoryBase.getVersioningDataByNames(), used by
+    EntropyRepositoryBase.atomMatchMany(). Metadata that has not been
+    prefetched is read from the repository.
+    """
+
+    def __init__(self, repository, names, data):
+        self._repository = repository
+        self._names = frozenset(names)
+        self._data = data
+        self._name_map = {}
+        for package_id, item in data.items():
+            self._name_map.setdefault(item[1], set()).add(package_id)
+
+    def __getattr__(self, name):
+        return getattr(self._repository, name)
+
+    def searchName(self, keyword, sensitive = False, just_id = False):
+        if sensitive and just_id and keyword in self._names:
+            return tuple(self._name_map.get(keyword, ()))
+        return self._repository.searchName(keyword, sensitive = sensitive,
+            just_id = just_id)
+
+    def searchNameCategory(self, name, category, just_id = False):
+        if just_id and name in self._names:
+            return frozenset((x for x in self._name_map.get(name, ()) \
+                if self._data[x][0] == category))
+        return self._repository.searchNameCategory(name, category,
+            just_id = just_id)
+
+    def retrieveKeySplit(self, package_id):
+        item = self._data.get(package_id)
+        if item is None:
+            return self._repository.retrieveKeySplit(package_id)
+        return item[0], item[1]
+
+    def retrieveCategory(self, package_id):
+        item = self._data.get(package_id)
+        if item is None:
+            return self._repository.retrieveCategory(package_id)
+        return item[0]
+
+    def retrieveVersion(self, package_id):
+        item = self._data.get(package_id)
+        if item is None:
+            return self._repository.retrieveVersion(package_id)
+        return item[2]
+
+    def retrieveTag(self, package_id):
+        item = self._data.get(package_id)
+        if item is None:
+            return self._repository.retrieveTag(package_id)
+        return item[3]
+
+    def retrieveRevision(self, package_id):
+        item = self._data.get(package_id)
+        if item is None:
+            return self._repository.retrieveRevision(package_id)
+        return item[4]
+
+    def retrieveSlot(self, package_id):
+        item = self._data.get(package_id)
+        if item is None:
+            return self._repository.retrieveSlot(package_id)
+        return item[5]
+
+
 class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
     """
     EntropyRepository interface base class.
@@ -426,6 +495,10 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         self._settings = SystemSettings()
         self._cacher = EntropyCacher()
         self.__db_match_cache_key = "match/db"
+        self.__match_store_lock = threading.Lock()
+        # tuple composed by (store key, {hash: atomMatch() result})
+        self.__match_store = None
+        self.__match_store_dirty = 0
 
         EntropyRepositoryPluginStore.__init__(self)
 
@@ -791,6 +864,9 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         if not self._readonly:
             self.commit()
 
+        # queue the atomMatch() results collected so far to disk
+        self.__atomMatchDiscardStore(flush = True)
+
         plugins = self.get_plugins()
         for plugin_id in sorted(plugins):
             plug_inst = plugins[plugin_id]
@@ -2365,6 +2441,8 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         Attention: call this method from your subclass, otherwise
         EntropyRepositoryPlugins won't be notified.
         """
+        self.__atomMatchDiscardStore(flush = True)
+
         plugins = self.get_plugins()
         for plugin_id in sorted(plugins):
             plug_inst = plugins[plugin_id]
@@ -3964,6 +4042,23 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def searchBelongsMany(self, paths, like = False):
+        """
+        Search packages which the given file paths belong to at once.
+        This is the batched version of searchBelongs() and subclasses are
+        encouraged to reimplement it using bulk lookups.
+
+        @param paths: list of file paths to search
+        @type paths: iterable
+        @keyword like: do not match exact case
+        @type like: bool
+        @return: dict composed by path as key and list (frozenset) of
+            package identifiers owning it as value
+        @rtype: dict
+        """
+        return dict(((path, self.searchBelongs(path, like = like)) \
+                         for path in paths))
+
     def searchContentSafety(self, sfile):
         """
         Search content safety metadata (usually, sha256 and mtime) related to
@@ -4401,6 +4496,57 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def listAllVersioningData(self):
+        """
+        List the versioning metadata of all the packages in repository.
+
+        @return: tuple of tuples of length 7 containing (package_id,
+            category, name, version, versiontag, revision, slot)
+        @rtype: tuple
+        """
+        raise NotImplementedError()
+
+    def listAllPackageDependencies(self):
+        """
+        List all the package identifier and dependency identifier
+        associations in repository.
+
+        @return: tuple of tuples of length 3 containing (package_id,
+            iddependency, dependency type)
+        @rtype: tuple
+        """
+        raise NotImplementedError()
+
+    def listAllPackageKeywords(self):
+        """
+        List all the package keywords in repository.
+
+        @return: tuple of tuples of length 2 containing (package_id,
+            keyword)
+        @rtype: tuple
+        """
+        raise NotImplementedError()
+
+    def listAllPackageLicenses(self):
+        """
+        List the license string of all the packages in repository.
+
+        @return: tuple of tuples of length 2 containing (package_id,
+            license string)
+        @rtype: tuple
+        """
+        raise NotImplementedError()
+
+    def listAllPackageConflicts(self):
+        """
+        List all the package conflicts in repository.
+
+        @return: tuple of tuples of length 2 containing (package_id,
+            conflict)
+        @rtype: tuple
+        """
+        raise NotImplementedError()
+
     def listAllSpmUids(self):
         """
         List all Source Package Manager unique package identifiers bindings
@@ -4967,6 +5113,22 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         return package_id, 0
 
+    def maskFilterAll(self, live = True):
+        """
+        Return the masking status of all the packages in repository, as
+        returned by maskFilter(). Subclasses implementing maskFilter()
+        should reimplement this in order to evaluate the masking metadata
+        of the whole repository at once.
+
+        @keyword live: use live masking feature
+        @type live: bool
+        @return: dictionary composed by package identifier as key and
+            maskFilter() outcome as value
+        @rtype: dict
+        """
+        return dict((x, self.maskFilter(x, live = live)) for x in \
+                        self.listAllPackageIds())
+
     def atomMatchCacheKey(self):
         """
         Return a string that shall be used as part of the atomMatch cache key
@@ -5003,6 +5165,110 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             identifiers) and command status is returned.
         @rtype: tuple or set
         """
+        return self.__atomMatchCached(atom, matchSlot, multiMatch,
+            maskFilter, extendedResults, useCache, self)
+
+    def atomMatchMany(self, atoms, matchSlot = None, multiMatch = False,
+        maskFilter = True, extendedResults = False, useCache = True):
+        """
+        Match a list of atoms (or dependencies) in repository at once.
+        This is the batched version of atomMatch(): the versioning metadata
+        of every candidate package is retrieved upfront through
+        getVersioningDataByNames() instead of being queried once per atom
+        and per candidate package.
+
+        @param atoms: list of atoms or dependencies to match in repository
+        @type atoms: iterable
+        @keyword matchSlot: match packages with given slot
+        @type matchSlot: string
+        @keyword multiMatch: match all the available packages, not just the
+            best one
+        @type multiMatch: bool
+        @keyword maskFilter: enable package masking filter
+        @type maskFilter: bool
+        @keyword extendedResults: return extended results
+        @type extendedResults: bool
+        @keyword useCache: use on-disk cache
+        @type useCache: bool
+        @return: dict composed by atom as key and atomMatch() return value
+            as value
+        @rtype: dict
+        """
+        results = {}
+        pending = []
+        for atom in atoms:
+            if atom in results:
+                continue
+            if not atom:
+                results[atom] = (-1, 1)
+                continue
+            cached = None
+            if useCache:
+                cached = self.__atomMatchFetchCache(atom, matchSlot,
+                    multiMatch, maskFilter, extendedResults)
+            # mark as seen, will be replaced below if not cached
+            results[atom] = cached
+            if cached is None:
+                pending.append(atom)
+
+        if not pending:
+            return results
+
+        names = set()
+        for atom in pending:
+            if atom.endswith(etpConst['entropyordepquestion']):
+                sub_atoms = atom[:-1].split(etpConst['entropyordepsep'])
+            else:
+                sub_atoms = (atom,)
+            for sub_atom in sub_atoms:
+                key = entropy.dep.dep_getkey(
+                    entropy.dep.remove_entropy_revision(sub_atom))
+                if key:
+                    names.add(key.split("/")[-1])
+
+        try:
+            data = self.getVersioningDataByNames(names)
+        except OperationalError:
+            # same fault tolerance of atomMatch(), let the
+            # per-atom logic deal with the broken repository
+            names, data = (), {}
+
+        lookup = _AtomMatchLookup(self, names, data)
+        for atom in pending:
+            results[atom] = self.__atomMatchLookup(atom, matchSlot,
+                multiMatch, maskFilter, extendedResults, useCache, lookup)
+        return results
+
+    def getVersioningDataByNames(self, names):
+        """
+        Return the versioning metadata of all the packages whose name
+        (without category) is listed in names. This is used by
+        atomMatchMany() and subclasses are encouraged to reimplement it
+        using a single query.
+
+        @param names: list of package names
+        @type names: iterable
+        @return: dict composed by package identifier as key and
+            (category, name, version, versiontag, revision, slot) as value
+        @rtype: dict
+        """
+        data = {}
+        for name in set(names):
+            package_ids = self.searchName(name, sensitive = True,
+                just_id = True)
+            for package_id in package_ids:
+                category, pkg_name = self.retrieveKeySplit(package_id)
+                version, tag, revision = self.getVersioningData(package_id)
+                data[package_id] = (category, pkg_name, version, tag,
+                    revision, self.retrieveSlot(package_id))
+        return data
+
+    def __atomMatchCached(self, atom, matchSlot, multiMatch, maskFilter,
+        extendedResults, useCache, lookup):
+        """
+        atomMatch() backend, using the on-disk cache if allowed to and
+        reading package metadata through the given lookup object.
+        """
         if not atom:
             return -1, 1
 
@@ -5012,15 +5278,25 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             if cached is not None:
                 return cached
 
+        return self.__atomMatchLookup(atom, matchSlot, multiMatch,
+            maskFilter, extendedResults, useCache, lookup)
+
+    def __atomMatchLookup(self, atom, matchSlot, multiMatch, maskFilter,
+        extendedResults, useCache, lookup):
+        """
+        atomMatch() backend doing the actual work. Package metadata is read
+        through lookup, which is either this repository or an
+        _AtomMatchLookup object.
+        """
         # "or" dependency support
         # app-foo/foo-1.2.3;app-foo/bar-1.4.3?
         if atom.endswith(etpConst['entropyordepquestion']):
             # or dependency!
             atoms = atom[:-1].split(etpConst['entropyordepsep'])
             for s_atom in atoms:
-                data, rc = self.atomMatch(s_atom, matchSlot = matchSlot,
-                    multiMatch = multiMatch, maskFilter = maskFilter,
-                    extendedResults = extendedResults, useCache = useCache)
+                data, rc = self.__atomMatchCached(s_atom, matchSlot,
+                    multiMatch, maskFilter, extendedResults, useCache,
+                    lookup)
                 if rc == 0:
                     return data, rc
 
@@ -5093,7 +5369,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             # IDs found in the database that match our search
             try:
                 found_ids, default_package_ids = self.__generate_found_ids_match(
-                    pkgkey, pkgname, pkgcat, multiMatch)
+                    pkgkey, pkgname, pkgcat, multiMatch, lookup)
             except OperationalError:
                 # we are fault tolerant, cannot crash because
                 # tables are not available and validateDatabase()
@@ -5106,7 +5382,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         # filter slot and tag
         if found_ids:
             found_ids = self.__filterSlotTagUse(found_ids, matchSlot,
-                matchTag, matchUse, direction)
+                matchTag, matchUse, direction, lookup)
             if maskFilter:
                 def _filter(pkg_id):
                     pkg_id, pkg_reason = self.maskFilter(pkg_id)
@@ -5118,7 +5394,8 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         dbpkginfo = set()
         if found_ids:
             dbpkginfo = self.__handle_found_ids_match(found_ids, direction,
-                matchTag, matchRevision, justname, stripped_atom, pkgversion)
+                matchTag, matchRevision, justname, stripped_atom, pkgversion,
+                lookup)
 
         if not dbpkginfo:
             if extendedResults:
@@ -5146,8 +5423,8 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
         if multiMatch:
             if extendedResults:
-                x = set([(x[0], 0, x[1], self.retrieveTag(x[0]), \
-                    self.retrieveRevision(x[0])) for x in dbpkginfo])
+                x = set([(x[0], 0, x[1], lookup.retrieveTag(x[0]), \
+                    lookup.retrieveRevision(x[0])) for x in dbpkginfo])
                 self.__atomMatchStoreCache(
                     atom, matchSlot,
                     multiMatch, maskFilter,
@@ -5166,8 +5443,8 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         if len(dbpkginfo) == 1:
             x = dbpkginfo.pop()
             if extendedResults:
-                x = (x[0], 0, x[1], self.retrieveTag(x[0]),
-                    self.retrieveRevision(x[0]),)
+                x = (x[0], 0, x[1], lookup.retrieveTag(x[0]),
+                    lookup.retrieveRevision(x[0]),)
 
                 self.__atomMatchStoreCache(
                     atom, matchSlot,
@@ -5201,8 +5478,8 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         versions = set()
 
         for x in dbpkginfo:
-            info_tuple = (x[1], self.retrieveTag(x[0]), \
-                self.retrieveRevision(x[0]))
+            info_tuple = (x[1], lookup.retrieveTag(x[0]), \
+                lookup.retrieveRevision(x[0]))
             versions.add(info_tuple)
             pkgdata[info_tuple] = x[0]
 
@@ -5254,13 +5531,15 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             )
             return x, rc
 
-    def __generate_found_ids_match(self, pkgkey, pkgname, pkgcat, multiMatch):
+    def __generate_found_ids_match(self, pkgkey, pkgname, pkgcat, multiMatch,
+                                   lookup):
 
         if pkgcat == "null":
-            results = self.searchName(pkgname, sensitive = True,
+            results = lookup.searchName(pkgname, sensitive = True,
                 just_id = True)
         else:
-            results = self.searchNameCategory(pkgname, pkgcat, just_id = True)
+            results = lookup.searchNameCategory(pkgname, pkgcat,
+                just_id = True)
 
         old_style_virtuals = None
         # if it's a PROVIDE, search with searchProvide
@@ -5293,7 +5572,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             found_id = None
             cats = set()
             for package_id in results:
-                cat = self.retrieveCategory(package_id)
+                cat = lookup.retrieveCategory(package_id)
                 cats.add(cat)
                 if (cat == pkgcat) or \
                     ((pkgcat == self.VIRTUAL_META_PACKAGE_CATEGORY) and \
@@ -5318,7 +5597,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             # we need to search using the category
             if (not multiMatch) and (pkgcat == "null"):
                 # we searched by name, we need to search using category
-                results = self.searchNameCategory(
+                results = lookup.searchNameCategory(
                     pkgname, pkgcat, just_id = True)
 
             # if we get here, we have found the needed IDs
@@ -5334,11 +5613,11 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             (old_style_virtuals is not None):
             # in case of virtual packages only
             # (that they're not stored as provide)
-            pkgcat, pkgname = self.retrieveKeySplit(package_id)
+            pkgcat, pkgname = lookup.retrieveKeySplit(package_id)
 
         # check if category matches
         if pkgcat != "null":
-            found_cat = self.retrieveCategory(package_id)
+            found_cat = lookup.retrieveCategory(package_id)
             if pkgcat == found_cat:
                 return set([package_id]), old_style_virtuals
             del results
@@ -5350,7 +5629,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
 
     def __handle_found_ids_match(self, found_ids, direction, matchTag,
-            matchRevision, justname, stripped_atom, pkgversion):
+            matchRevision, justname, stripped_atom, pkgversion, lookup):
 
         dbpkginfo = set()
         # now we have to handle direction
@@ -5381,7 +5660,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
                 for package_id in found_ids:
 
-                    dbver = self.retrieveVersion(package_id)
+                    dbver = lookup.retrieveVersion(package_id)
                     if (direction == "~"):
                         myrev = entropy.dep.dep_get_spm_revision(
                             dbver)
@@ -5395,7 +5674,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
                             if dbver.startswith(pkgversion[:-1]):
                                 dbpkginfo.add((package_id, dbver))
                         elif (matchRevision is not None) and (pkgversion == dbver):
-                            dbrev = self.retrieveRevision(package_id)
+                            dbrev = lookup.retrieveRevision(package_id)
                             if dbrev == matchRevision:
                                 dbpkginfo.add((package_id, dbver))
                         elif (pkgversion == dbver) and (matchRevision is None):
@@ -5415,14 +5694,14 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
                         revcmp = 0
                         tagcmp = 0
                         if matchRevision is not None:
-                            dbrev = self.retrieveRevision(package_id)
+                            dbrev = lookup.retrieveRevision(package_id)
                             revcmp = const_cmp(matchRevision, dbrev)
 
                         if matchTag is not None:
-                            dbtag = self.retrieveTag(package_id)
+                            dbtag = lookup.retrieveTag(package_id)
                             tagcmp = const_cmp(matchTag, dbtag)
 
-                        dbver = self.retrieveVersion(package_id)
+                        dbver = lookup.retrieveVersion(package_id)
                         pkgcmp = entropy.dep.compare_versions(
                             pkgversion, dbver)
 
@@ -5483,24 +5762,98 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
         else: # just the key
 
-            dbpkginfo = set([(x, self.retrieveVersion(x),) for x in found_ids])
+            dbpkginfo = set([(x, lookup.retrieveVersion(x),) \
+                                 for x in found_ids])
 
         return dbpkginfo
 
+    def __atomMatchStoreKey(self):
+        """
+        Return the EntropyCacher key of the persistent atomMatch() result
+        store of this repository. The key changes every time the repository
+        content or the package masking settings change.
+        """
+        return "%s/%s/%s_%s" % (
+            self.__db_match_cache_key,
+            self.name,
+            self.atomMatchCacheKey(),
+            self.checksum(strict = False),
+            )
+
+    def __atomMatchEvictStores(self, store_key):
+        """
+        Remove from cache all the atomMatch() result stores of this
+        repository that have been generated against a different
+        repository checksum. Must be called with __match_store_lock held.
+        """
+        self._cacher.remove_prefix(
+            "%s/%s/" % (self.__db_match_cache_key, self.name),
+            keep_suffix = "_%s" % (store_key.rsplit("_", 1)[-1],))
+
+    def __atomMatchGetStore(self):
+        """
+        Return the in-memory copy of the persistent atomMatch() result store
+        bound to the current repository status, loading it from disk if
+        needed. Must be called with __match_store_lock held.
+        """
+        store_key = self.__atomMatchStoreKey()
+        match_store = self.__match_store
+        if match_store is not None and match_store[0] == store_key:
+            return match_store[1]
+
+        self.__atomMatchFlushStore()
+        store = self._cacher.pop(store_key)
+        if isinstance(store, dict):
+            # pop() may return the very same object EntropyCacher
+            # is pickling in its writer thread, never modify it.
+            store = store.copy()
+        else:
+            # repository changed or store never written, get rid
+            # of any stale data belonging to older revisions
+            self.__atomMatchEvictStores(store_key)
+            store = {}
+        self.__match_store = (store_key, store)
+        self.__match_store_dirty = 0
+        return store
+
+    def __atomMatchFlushStore(self):
+        """
+        Queue the in-memory atomMatch() result store to EntropyCacher,
+        if it contains new results. The store must not be modified
+        afterwards, since EntropyCacher pickles it asynchronously, so
+        this is only called when the store is being dropped.
+        Must be called with __match_store_lock held.
+        """
+        match_store = self.__match_store
+        if match_store is None or not self.__match_store_dirty:
+            return
+        self.__match_store_dirty = 0
+        store_key, store = match_store
+        self._cacher.push(store_key, store)
+
+    def __atomMatchDiscardStore(self, flush = False):
+        """
+        Drop the in-memory atomMatch() result store, eventually queueing
+        it to EntropyCacher first.
+        """
+        with self.__match_store_lock:
+            if flush:
+                self.__atomMatchFlushStore()
+            self.__match_store = None
+            self.__match_store_dirty = 0
+
     def __atomMatchFetchCache(self, *args):
         if self._caching:
-            ck_sum = self.checksum(strict = False)
             hash_str = self.__atomMatch_gen_hash_str(args)
-            cached = entropy.dump.loadobj(
-                "%s/%s/%s_%s_%s" % (
-                    self.__db_match_cache_key,
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    ck_sum,
-                    hash_str,
-                    )
-                )
-            return cached
+            with self.__match_store_lock:
+                cached = self.__atomMatchGetStore().get(hash_str)
+            if cached is None:
+                return None
+            result, status = cached
+            if isinstance(result, frozenset):
+                # multiMatch results are sets, callers may modify them
+                result = set(result)
+            return result, status
 
     def __atomMatch_gen_hash_str(self, args):
         data_str = repr(args)
@@ -5513,40 +5866,36 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
     def __atomMatchStoreCache(self, *args, **kwargs):
         if self._caching:
-            ck_sum = self.checksum(strict = False)
             hash_str = self.__atomMatch_gen_hash_str(args)
-            self._cacher.push(
-                "%s/%s/%s_%s_%s" % (
-                    self.__db_match_cache_key,
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    ck_sum,
-                    hash_str,
-                    ),
-                kwargs.get('result'),
-                async = False)
-
-    def __filterSlot(self, package_id, slot):
+            result, status = kwargs.get('result')
+            if isinstance(result, set):
+                result = frozenset(result)
+            with self.__match_store_lock:
+                store = self.__atomMatchGetStore()
+                store[hash_str] = (result, status)
+                self.__match_store_dirty += 1
+
+    def __filterSlot(self, package_id, slot, lookup):
         if slot is None:
             return package_id
-        dbslot = self.retrieveSlot(package_id)
+        dbslot = lookup.retrieveSlot(package_id)
         if dbslot == slot:
             return package_id
 
-    def __filterTag(self, package_id, tag, operators):
+    def __filterTag(self, package_id, tag, operators, lookup):
         if tag is None:
             return package_id
 
-        dbtag = self.retrieveTag(package_id)
+        dbtag = lookup.retrieveTag(package_id)
         compare = const_cmp(tag, dbtag)
         # cannot do operator compare because it breaks the tag concept
         if compare == 0:
             return package_id
 
-    def __filterUse(self, package_id, uses):
+    def __filterUse(self, package_id, uses, lookup):
         if not uses:
             return package_id
-        pkguse = set(self.retrieveUseflags(package_id))
+        pkguse = set(lookup.retrieveUseflags(package_id))
         enabled = set([x for x in uses if not x.startswith("-")])
         disabled = set(uses) - enabled
 
@@ -5613,19 +5962,20 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             return None
         return package_id
 
-    def __filterSlotTagUse(self, found_ids, slot, tag, use, operators):
+    def __filterSlotTagUse(self, found_ids, slot, tag, use, operators,
+                           lookup):
 
         def myfilter(package_id):
 
-            package_id = self.__filterSlot(package_id, slot)
+            package_id = self.__filterSlot(package_id, slot, lookup)
             if not package_id:
                 return False
 
-            package_id = self.__filterUse(package_id, use)
+            package_id = self.__filterUse(package_id, use, lookup)
             if not package_id:
                 return False
 
-            package_id = self.__filterTag(package_id, tag, operators)
+            package_id = self.__filterTag(package_id, tag, operators, lookup)
             if not package_id:
                 return False
 
@@ -11,10 +11,13 @@
 
 """
 import os
+import contextlib
 import hashlib
 import itertools
+import struct
 import time
 import threading
+import zlib
 
 from entropy.const import etpConst, const_debug_write, \
     const_debug_enabled, const_isunicode, const_convert_to_unicode, \
@@ -32,6 +35,7 @@ import entropy.tools
 
 from entropy.db.skel import EntropyRepositoryBase
 from entropy.db.cache import EntropyRepositoryCacher
+from entropy.db.index import EntropyRepositoryPathIndex
 from entropy.db.exceptions import Warning, Error, InterfaceError, \
     DatabaseError, DataError, OperationalError, IntegrityError, \
     InternalError, ProgrammingError, NotSupportedError
@@ -608,6 +612,16 @@ class EntropySQLRepository(EntropyRepositoryBase):
     # "UPDATE OR REPLACE" dialect
     _UPDATE_OR_REPLACE = None
 
+    # maximum amount of per-package content path sets kept
+    # in memory, used to validate path hash lookups when
+    # content metadata is stored in blobs (see _isContentBlobs()).
+    _CONTENT_BLOB_PATHS_CACHE = 16
+
+    # zlib compression level of content metadata blobs. Paths compress
+    # well at the lowest level already, higher levels mostly make
+    # package insertion slower.
+    _CONTENT_BLOB_COMPRESSION = 1
+
     _MAIN_THREAD = threading.current_thread()
 
     @classmethod
@@ -617,6 +631,43 @@ class EntropySQLRepository(EntropyRepositoryBase):
     # Generic repository name to use when none is given.
     GENERIC_NAME = "__generic__"
 
+    # EntropyCacher key prefix and on-disk format version of the
+    # reverse dependencies index, see _getReverseDependenciesIndex()
+    _REVERSE_DEPS_INDEX_CACHE_KEY = "db/reverse_dependencies"
+    _REVERSE_DEPS_INDEX_VERSION = 1
+
+    # EntropyCacher key prefix and on-disk format version of the
+    # incrementally maintained checksum() digests, see _getChecksumDigests()
+    _CHECKSUM_DIGESTS_CACHE_KEY = "db/checksum_digests"
+    _CHECKSUM_DIGESTS_VERSION = 1
+    _CHECKSUM_DIGESTS_MODULO = 2 ** 160
+
+    # EntropyCacher key prefix of the path index, see _getPathIndex()
+    _PATH_INDEX_CACHE_KEY = "db/path_index"
+
+    # checksum() digest components: strict package metadata, package
+    # metadata, package signatures and package dependencies. Every entry
+    # is a list of (query, single package condition) and the first
+    # column of every query must be the package identifier.
+    _CHECKSUM_QUERIES = (
+        (("SELECT * FROM baseinfo %s", "WHERE idpackage = ?"),
+         ("SELECT * FROM extrainfo %s", "WHERE idpackage = ?"),),
+        (("""SELECT idpackage, atom, name, version, versiontag, revision,
+            branch, slot, etpapi, `trigger` FROM baseinfo %s""",
+          "WHERE idpackage = ?"),
+         ("""SELECT idpackage, description, homepage, download, size,
+            digest, datecreation FROM extrainfo %s""",
+          "WHERE idpackage = ?"),),
+        (("SELECT idpackage, sha1, gpg FROM packagesignatures %s",
+          "WHERE idpackage = ?"),),
+        (("""SELECT dependencies.idpackage, dependencies.type,
+            dependenciesreference.dependency
+            FROM dependencies, dependenciesreference
+            WHERE dependencies.iddependency =
+                dependenciesreference.iddependency %s""",
+          "AND dependencies.idpackage = ?"),),
+    )
+
     def __init__(self, db, read_only, skip_checks, indexing,
                  xcache, temporary, name, direct=False, cache_policy=None):
         # connection and cursor automatic cleanup support
@@ -837,6 +888,147 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         return True
 
+    def _isContentBlobs(self):
+        """
+        Return whether package content and content safety metadata are
+        stored as per-package, compressed and path sorted blobs
+        (contentblobs table) plus a path hash index (contentpaths table),
+        rather than one row per file in the content and contentsafety
+        tables.
+        """
+        try:
+            return self.getSetting("content_blobs") == "1"
+        except KeyError:
+            return False
+
+    @staticmethod
+    def _contentPathHash(path):
+        """
+        Return the 64bit signed integer hash of the given path,
+        as stored in the contentpaths table.
+        """
+        if const_isunicode(path):
+            path = path.encode(etpConst['conf_encoding'])
+        digest = hashlib.md5(path).digest()
+        return struct.unpack("<q", digest[:8])[0]
+
+    @staticmethod
+    def _contentPathHashes(paths):
+        """
+        Return the list of 64bit signed integer hashes of the given
+        unicode paths, see _contentPathHash().
+        """
+        enc = etpConst['conf_encoding']
+        md5 = hashlib.md5
+        unpack = struct.Struct("<q").unpack
+        return [unpack(md5(x.encode(enc)).digest()[:8])[0] for x in paths]
+
+    @classmethod
+    def _packContentBlob(cls, entries):
+        """
+        Serialize and compress a list of content metadata tuples (strings
+        or None), the first element of each being the path.
+        The list is sorted by path.
+        """
+        data = const_convert_to_unicode("\0").join(
+            ["" if x is None else x for x in itertools.chain.from_iterable(
+                    sorted(entries))])
+        return const_get_buffer()(
+            zlib.compress(data.encode(etpConst['conf_encoding']),
+                          cls._CONTENT_BLOB_COMPRESSION))
+
+    @staticmethod
+    def _unpackContentBlob(blob, width):
+        """
+        Decompress and deserialize a blob generated by _packContentBlob()
+        returning the list of content metadata tuples of the given width.
+        Empty elements are returned as None.
+        """
+        if not blob:
+            return []
+        data = zlib.decompress(const_convert_to_rawstring(blob))
+        if not data:
+            return []
+        fields = [x or None for x in data.decode(
+                etpConst['conf_encoding']).split("\0")]
+        return list(zip(*[iter(fields)] * width))
+
+    def _retrieveContentBlob(self, package_id, safety = False):
+        """
+        Return the content metadata of the given package stored in the
+        contentblobs table, a list of (path, type) tuples or, if safety
+        is True, a list of (path, sha256, mtime) tuples sorted by path.
+        """
+        column, width = "content", 2
+        if safety:
+            column, width = "contentsafety", 3
+        cur = self._cursor().execute("""
+        SELECT %s FROM contentblobs WHERE idpackage = ? LIMIT 1
+        """ % (column,), (package_id,))
+        blob = cur.fetchone()
+        if blob is None:
+            return []
+        entries = self._unpackContentBlob(blob[0], width)
+        if safety:
+            entries = [(path, sha256, float(mtime) if mtime else None)
+                       for path, sha256, mtime in entries]
+        return entries
+
+    def _storeContentBlob(self, package_id, entries, safety = False):
+        """
+        Store the given content metadata (see _retrieveContentBlob())
+        of a package into the contentblobs table.
+        """
+        column = "content"
+        if safety:
+            column = "contentsafety"
+            entries = [(path, sha256, repr(mtime) if mtime is not None \
+                            else None) for path, sha256, mtime in entries]
+        self._cursor().execute("""
+        %s INTO contentblobs VALUES (?, NULL, NULL)
+        """ % (self._INSERT_OR_IGNORE,), (package_id,))
+        self._cursor().execute("""
+        UPDATE contentblobs SET %s = ? WHERE idpackage = ?
+        """ % (column,), (self._packContentBlob(entries), package_id))
+
+    def _contentBlobPaths(self, package_id):
+        """
+        Return the set of paths owned by the given package, reading them
+        from the contentblobs table. A few of them are kept in memory
+        because path hash lookups are usually done in bursts for the
+        same packages.
+        """
+        cache = self._getLiveCache("contentBlobPaths")
+        if cache is None:
+            cache = {}
+            self._setLiveCache("contentBlobPaths", cache)
+
+        paths = cache.get(package_id)
+        if paths is None:
+            if len(cache) >= self._CONTENT_BLOB_PATHS_CACHE:
+                cache.clear()
+            paths = frozenset(
+                (path for path, _ftype in self._retrieveContentBlob(
+                        package_id)))
+            cache[package_id] = paths
+        return paths
+
+    def _searchContentPath(self, path):
+        """
+        Return the package identifiers owning the given path through the
+        contentblobs and contentpaths tables.
+        """
+        path = const_convert_to_unicode(
+            path, enctype = etpConst['conf_encoding'])
+        cur = self._cursor().execute("""
+        SELECT contentpaths.idpackage FROM contentpaths, baseinfo
+        WHERE contentpaths.hash = ? AND
+        contentpaths.idpackage = baseinfo.idpackage
+        """, (self._contentPathHash(path),))
+        # rule out hash collisions
+        return frozenset((x for x in self._cur2frozenset(cur) \
+                              if path in self._contentBlobPaths(x)))
+
     def clearCache(self):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -982,6 +1174,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         Needs to call superclass method. This is a stub,
         please implement the SQL logic.
         """
+        self._flushReverseDependenciesIndex()
         super(EntropySQLRepository, self).close(safe=safe)
 
     def vacuum(self):
@@ -1025,6 +1218,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
         Reimplemented from EntropyRepositoryBase.
         """
         self._connection().rollback()
+        self._clearLiveCache("checksumDigests")
+        self._clearLiveCache("pathIndex")
 
     def initializeRepository(self):
         """
@@ -1394,6 +1589,11 @@ class EntropySQLRepository(EntropyRepositoryBase):
         Needs to call superclass method.
         """
         try:
+            # _addPackage() drops the in-memory cache, keep the
+            # checksum digests and the reverse dependencies index
+            # and record the package in them
+            digests = self._getLiveCache("checksumDigests")
+            rev_deps_index = self._getLiveCache("reverseDependenciesIndex")
             package_id = self._addPackage(pkg_data, revision = revision,
                 package_id = package_id,
                 formatted_content = formatted_content)
@@ -1401,8 +1601,17 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 pkg_data, revision = revision,
                 package_id = package_id,
                 formatted_content = formatted_content)
+            if digests is not None:
+                self._applyPackageChecksumDigests(
+                    digests, (package_id,), 1)
+                self._setLiveCache("checksumDigests", digests)
+            if rev_deps_index is not None:
+                self._touchReverseDependenciesIndex(
+                    rev_deps_index, package_id)
             return package_id
         except:
+            self._clearLiveCache("checksumDigests")
+            self._clearLiveCache("reverseDependenciesIndex")
             self._connection().rollback()
             raise
 
@@ -1412,14 +1621,28 @@ class EntropySQLRepository(EntropyRepositoryBase):
         Needs to call superclass method.
         """
         try:
-            self.clearCache()
-            super(EntropySQLRepository, self).removePackage(
-                package_id, from_add_package = from_add_package)
-            self.clearCache()
-
-            return self._removePackage(package_id,
-                from_add_package = from_add_package)
+            rev_deps_index = self._getLiveCache("reverseDependenciesIndex")
+            if rev_deps_index is not None:
+                rev_deps_names = self._reverseDependenciesIndexNames(
+                    package_id)
+
+            with self._updatingChecksumDigests((package_id,)):
+                self.clearCache()
+                super(EntropySQLRepository, self).removePackage(
+                    package_id, from_add_package = from_add_package)
+                self.clearCache()
+
+                outcome = self._removePackage(package_id,
+                    from_add_package = from_add_package)
+
+            if rev_deps_index is not None:
+                self._touchReverseDependenciesIndex(
+                    rev_deps_index, package_id,
+                    package_names = rev_deps_names)
+            return outcome
         except:
+            self._clearLiveCache("checksumDigests")
+            self._clearLiveCache("reverseDependenciesIndex")
             self._connection().rollback()
             raise
 
@@ -1573,26 +1796,29 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE extrainfo SET datecreation = ? WHERE idpackage = ?
-        """, (str(date), package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE extrainfo SET datecreation = ? WHERE idpackage = ?
+            """, (str(date), package_id,))
 
     def setDigest(self, package_id, digest):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE extrainfo SET digest = ? WHERE idpackage = ?
-        """, (digest, package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE extrainfo SET digest = ? WHERE idpackage = ?
+            """, (digest, package_id,))
 
     def setSignatures(self, package_id, sha1, sha256, sha512, gpg = None):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE packagesignatures SET sha1 = ?, sha256 = ?, sha512 = ?,
-        gpg = ? WHERE idpackage = ?
-        """, (sha1, sha256, sha512, gpg, package_id))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE packagesignatures SET sha1 = ?, sha256 = ?, sha512 = ?,
+            gpg = ? WHERE idpackage = ?
+            """, (sha1, sha256, sha512, gpg, package_id))
 
     def setDownloadURL(self, package_id, url):
         """
@@ -1603,17 +1829,19 @@ class EntropySQLRepository(EntropyRepositoryBase):
         @param url: URL prefix to set
         @type url: string
         """
-        self._cursor().execute("""
-        UPDATE extrainfo SET download = ? WHERE idpackage = ?
-        """, (url, package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE extrainfo SET download = ? WHERE idpackage = ?
+            """, (url, package_id,))
 
     def setCategory(self, package_id, category):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE baseinfo SET category = ? WHERE idpackage = ?
-        """, (category, package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE baseinfo SET category = ? WHERE idpackage = ?
+            """, (category, package_id,))
 
     def setCategoryDescription(self, category, description_data):
         """
@@ -1632,50 +1860,61 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE baseinfo SET name = ? WHERE idpackage = ?
-        """, (name, package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE baseinfo SET name = ? WHERE idpackage = ?
+            """, (name, package_id,))
 
     def setDependency(self, iddependency, dependency):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE dependenciesreference SET dependency = ?
-        WHERE iddependency = ?
-        """, (dependency, iddependency,))
+        cur = self._cursor().execute("""
+        SELECT DISTINCT idpackage FROM dependencies WHERE iddependency = ?
+        """, (iddependency,))
+        package_ids = self._cur2tuple(cur)
+        with self._updatingChecksumDigests(package_ids):
+            self._cursor().execute("""
+            UPDATE dependenciesreference SET dependency = ?
+            WHERE iddependency = ?
+            """, (dependency, iddependency,))
 
     def setAtom(self, package_id, atom):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE baseinfo SET atom = ? WHERE idpackage = ?
-        """, (atom, package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE baseinfo SET atom = ? WHERE idpackage = ?
+            """, (atom, package_id,))
 
     def setSlot(self, package_id, slot):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE baseinfo SET slot = ? WHERE idpackage = ?
-        """, (slot, package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE baseinfo SET slot = ? WHERE idpackage = ?
+            """, (slot, package_id,))
 
     def setRevision(self, package_id, revision):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE baseinfo SET revision = ? WHERE idpackage = ?
-        """, (revision, package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE baseinfo SET revision = ? WHERE idpackage = ?
+            """, (revision, package_id,))
 
     def removeDependencies(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        DELETE FROM dependencies WHERE idpackage = ?
-        """, (package_id,))
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            DELETE FROM dependencies WHERE idpackage = ?
+            """, (package_id,))
+        self._clearLiveCache("reverseDependenciesIndex")
 
     def insertDependencies(self, package_id, depdata):
         """
@@ -1701,9 +1940,11 @@ class EntropySQLRepository(EntropyRepositoryBase):
 
             return deps
 
-        self._cursor().executemany("""
-        INSERT INTO dependencies VALUES (?, ?, ?)
-        """, insert_list())
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().executemany("""
+            INSERT INTO dependencies VALUES (?, ?, ?)
+            """, insert_list())
+        self._clearLiveCache("reverseDependenciesIndex")
 
     def insertContent(self, package_id, content, already_formatted = False):
         """
@@ -1740,7 +1981,11 @@ class EntropySQLRepository(EntropyRepositoryBase):
                     x = self._iter.next()
                     return self._package_id, x, self._content[x]
 
-        if already_formatted:
+        if self._isContentBlobs():
+            self._insertContentBlob(package_id,
+                ((x, y) for _a, x, y in MyIter(
+                        package_id, content, already_formatted)))
+        elif already_formatted:
             self._cursor().executemany("""
             INSERT INTO content VALUES (?, ?, ?)
             """, MyIter(package_id, content, already_formatted))
@@ -1748,13 +1993,58 @@ class EntropySQLRepository(EntropyRepositoryBase):
             self._cursor().executemany("""
             INSERT INTO content VALUES (?, ?, ?)
             """, MyIter(package_id, content, already_formatted))
+        self._clearLiveCache("pathIndex")
+
+    def _insertContentBlob(self, package_id, content):
+        """
+        Insert content metadata, an iterable of (path, type) tuples,
+        into the contentblobs and contentpaths tables, merging it with
+        the already stored one.
+        """
+        enc = etpConst['conf_encoding']
+        current = self._retrieveContentBlob(package_id)
+        current_paths = frozenset((x for x, _y in current))
+        entries = dict(current)
+        # there are just a few file types
+        ftypes = {}
+        for path, ftype in content:
+            if not const_isunicode(path):
+                path = const_convert_to_unicode(path, enctype = enc)
+            u_ftype = ftypes.get(ftype)
+            if u_ftype is None:
+                u_ftype = const_convert_to_unicode(ftype, enctype = enc)
+                ftypes[ftype] = u_ftype
+            entries[path] = u_ftype
+
+        self._storeContentBlob(package_id, entries.items())
+        new_paths = [x for x in entries if x not in current_paths]
+        self._cursor().executemany("""
+        INSERT INTO contentpaths VALUES (?, ?)
+        """, [(package_id, x) for x in self._contentPathHashes(new_paths)])
+        self._clearLiveCache("contentBlobPaths")
 
     def _insertContentSafety(self, package_id, content_safety):
         """
         Currently supported: sha256, mtime.
         Insert into contentsafety table package files sha256sum and mtime.
         """
-        if isinstance(content_safety, dict):
+        if self._isContentBlobs():
+            if isinstance(content_safety, dict):
+                content_safety = ((k, v['sha256'], v['mtime']) for k, v in \
+                                      content_safety.items())
+            enc = etpConst['conf_encoding']
+            entries = dict(((path, (sha256, mtime)) for path, sha256, mtime \
+                                in self._retrieveContentBlob(
+                        package_id, safety = True)))
+            for path, sha256, mtime in content_safety:
+                if not const_isunicode(path):
+                    path = const_convert_to_unicode(path, enctype = enc)
+                entries[path] = (sha256, mtime)
+            self._storeContentBlob(package_id,
+                [(x, y, z) for x, (y, z) in entries.items()],
+                safety = True)
+
+        elif isinstance(content_safety, dict):
             self._cursor().executemany("""
             INSERT INTO contentsafety VALUES (?, ?, ?, ?)
             """, [(package_id, k, v['mtime'], v['sha256']) \
@@ -2329,9 +2619,15 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        DELETE FROM contentsafety where idpackage = ?
-        """, (package_id,))
+        if self._isContentBlobs():
+            self._cursor().execute("""
+            UPDATE contentblobs SET contentsafety = NULL
+            WHERE idpackage = ?
+            """, (package_id,))
+        else:
+            self._cursor().execute("""
+            DELETE FROM contentsafety where idpackage = ?
+            """, (package_id,))
         self._insertContentSafety(package_id, content_safety)
 
     def contentDiff(self, package_id, dbconn, dbconn_package_id,
@@ -2339,6 +2635,16 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        if self._isContentBlobs():
+            other_paths = frozenset((
+                    x for x, _y in dbconn.retrieveContentIter(
+                        dbconn_package_id)))
+            diff = [(x, y) for x, y in self._retrieveContentBlob(package_id) \
+                        if x not in other_paths]
+            if extended:
+                return tuple(diff)
+            return frozenset((x for x, _y in diff))
+
         # setup random table name
         random_str = "%svs%s_%s" % (package_id, id(dbconn),
             dbconn_package_id)
@@ -2531,6 +2837,26 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """, (package_id,))
         return cur.fetchone()
 
+    def getVersioningDataByNames(self, names):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        names = list(set(names))
+        data = {}
+        # keep the number of bound parameters below the
+        # SQLITE_MAX_VARIABLE_NUMBER default value (999)
+        chunk_size = 500
+        for idx in range(0, len(names), chunk_size):
+            chunk = names[idx:idx + chunk_size]
+            cur = self._cursor().execute("""
+            SELECT idpackage, category, name, version, versiontag,
+                revision, slot FROM baseinfo
+            WHERE name IN (%s)
+            """ % (", ".join(["?"] * len(chunk)),), chunk)
+            for row in cur:
+                data[row[0]] = tuple(row[1:])
+        return data
+
     def getStrictData(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -3383,6 +3709,22 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 order_by = "idpackage"
             order_by_string = ' order by %s' % (order_by,)
 
+        if self._isContentBlobs():
+            # already sorted by path
+            entries = self._retrieveContentBlob(package_id)
+            if order_by == "type":
+                entries.sort(key = lambda x: x[1])
+
+            if extended and insert_formatted:
+                return tuple(((package_id, x, y) for x, y in entries))
+            elif extended and formatted:
+                return dict(entries)
+            elif extended:
+                return tuple(entries)
+            elif order_by:
+                return tuple((x for x, _y in entries))
+            return frozenset((x for x, _y in entries))
+
         cur = self._cursor().execute("""
         SELECT %s file%s FROM content WHERE idpackage = ? %s""" % (
             extstring_package_id, extstring, order_by_string,),
@@ -3450,6 +3792,15 @@ class EntropySQLRepository(EntropyRepositoryBase):
             order_by_string = " order by %s %s" % (
                 order_by, ordering_term)
 
+        if self._isContentBlobs():
+            # already sorted by path
+            entries = self._retrieveContentBlob(package_id)
+            if order_by == "type":
+                entries.sort(key = lambda x: x[1], reverse = reverse)
+            elif order_by == "file" and reverse:
+                entries.reverse()
+            return tuple(entries)
+
         query = """
         SELECT file, type FROM content WHERE idpackage = ? %s""" % (
             order_by_string,)
@@ -3459,9 +3810,12 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        cur = self._cursor().execute("""
-        SELECT file, sha256, mtime from contentsafety WHERE idpackage = ?
-        """, (package_id,))
+        if self._isContentBlobs():
+            cur = self._retrieveContentBlob(package_id, safety = True)
+        else:
+            cur = self._cursor().execute("""
+            SELECT file, sha256, mtime from contentsafety WHERE idpackage = ?
+            """, (package_id,))
         return dict((path, {'sha256': sha256, 'mtime': mtime}) for path, \
             sha256, mtime in cur)
 
@@ -3492,6 +3846,9 @@ class EntropySQLRepository(EntropyRepositoryBase):
             def next(self):
                 return self._cur.next()
 
+        if self._isContentBlobs():
+            return tuple(self._retrieveContentBlob(package_id, safety = True))
+
         query = """
         SELECT file, sha256, mtime from contentsafety WHERE idpackage = ?
         """
@@ -3695,150 +4052,68 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        cached = self._getLiveCache("reverseDependenciesMetadata")
-        if cached is None:
-            cached = self._generateReverseDependenciesMetadata()
+        index = self._getReverseDependenciesIndex()
 
-        dep_ids = set((k for k, v in cached.items() if package_id in v))
+        dep_ids = index['provided'].get(package_id)
         if not dep_ids:
             # avoid python3.x memleak
-            del cached
+            del index
             if key_slot:
                 return tuple()
             return frozenset()
 
-        dep_ids_str = ', '.join((str(x) for x in dep_ids))
-        excluded_deptypes_query = ""
+        excluded_deptypes = frozenset()
         if exclude_deptypes is not None:
-            for dep_type in exclude_deptypes:
-                excluded_deptypes_query += " AND dependencies.type != %d" % (
-                    dep_type,)
+            excluded_deptypes = frozenset(exclude_deptypes)
+
+        # one (package_id, dependency) pair for every matching
+        # row of the dependencies table
+        owners = index['owners']
+        dependencies = index['dependencies']
+        rows = []
+        for dep_id in dep_ids:
+            dependency = dependencies[dep_id]
+            for owner_id, dep_type in owners.get(dep_id, ()):
+                if dep_type not in excluded_deptypes:
+                    rows.append((owner_id, dependency))
+        # avoid python3.x memleak
+        del index
 
         if atoms:
+            atom_map = dict((owner_id, self.retrieveAtom(owner_id)) for \
+                owner_id in set((x for x, y in rows)))
             if extended:
-                cur = self._cursor().execute("""
-                SELECT baseinfo.atom, dependenciesreference.dependency
-                FROM dependencies, baseinfo, dependenciesreference
-                WHERE baseinfo.idpackage = dependencies.idpackage %s AND
-                dependencies.iddependency =
-                    dependenciesreference.iddependency AND
-                dependencies.iddependency IN ( %s )""" % (
-                    excluded_deptypes_query, dep_ids_str,))
-                result = tuple(cur)
-            else:
-                cur = self._cursor().execute("""
-                SELECT baseinfo.atom FROM dependencies, baseinfo
-                WHERE baseinfo.idpackage = dependencies.idpackage %s AND
-                dependencies.iddependency IN ( %s )""" % (
-                    excluded_deptypes_query, dep_ids_str,))
-                result = self._cur2frozenset(cur)
-        elif key_slot:
-            if self._isBaseinfoExtrainfo2010():
-                concat = self._concatOperator(
-                    ("baseinfo.category", "'/'", "baseinfo.name"))
-                if extended:
-                    cur = self._cursor().execute("""
-                    SELECT %s,
-                        baseinfo.slot, dependenciesreference.dependency
-                    FROM baseinfo, dependencies, dependenciesreference
-                    WHERE baseinfo.idpackage = dependencies.idpackage %s AND
-                    dependencies.iddependency =
-                        dependenciesreference.iddependency AND
-                    dependencies.iddependency IN ( %s )""" % (
-                        concat, excluded_deptypes_query, dep_ids_str,))
-                else:
-                    cur = self._cursor().execute("""
-                    SELECT %s, baseinfo.slot
-                    FROM baseinfo, dependencies
-                    WHERE baseinfo.idpackage = dependencies.idpackage %s AND
-                    dependencies.iddependency IN ( %s )""" % (
-                        concat, excluded_deptypes_query, dep_ids_str,))
-            else:
-                concat = self._concatOperator(
-                    ("categories.category", "'/'", "baseinfo.name"))
-                if extended:
-                    cur = self._cursor().execute("""
-                    SELECT %s,
-                        baseinfo.slot, dependenciesreference.dependency
-                    FROM baseinfo, categories,
-                        dependencies, dependenciesreference
-                    WHERE baseinfo.idpackage = dependencies.idpackage AND
-                    dependencies.iddependency =
-                        dependenciesreference.iddependency AND
-                    categories.idcategory = baseinfo.idcategory %s AND
-                    dependencies.iddependency IN ( %s )""" % (
-                        concat, excluded_deptypes_query, dep_ids_str,))
-                else:
-                    cur = self._cursor().execute("""
-                    SELECT %s, baseinfo.slot
-                    FROM baseinfo, categories, dependencies
-                    WHERE baseinfo.idpackage = dependencies.idpackage AND
-                    categories.idcategory = baseinfo.idcategory %s AND
-                    dependencies.iddependency IN ( %s )""" % (
-                        concat, excluded_deptypes_query, dep_ids_str,))
-            result = tuple(cur)
-        elif excluded_deptypes_query:
-            if extended:
-                cur = self._cursor().execute("""
-                SELECT dependencies.idpackage, dependenciesreference.dependency
-                FROM dependencies, dependenciesreference
-                WHERE %s AND
-                dependencies.iddependency =
-                    dependenciesreference.iddependency AND
-                dependencies.iddependency IN ( %s )""" % (
-                    excluded_deptypes_query.lstrip("AND "), dep_ids_str,))
-                result = tuple(cur)
-            else:
-                cur = self._cursor().execute("""
-                SELECT dependencies.idpackage FROM dependencies
-                WHERE %s AND dependencies.iddependency IN ( %s )""" % (
-                    excluded_deptypes_query.lstrip("AND "), dep_ids_str,))
-                result = self._cur2frozenset(cur)
-        else:
+                return tuple(((atom_map[x], y) for x, y in rows))
+            return frozenset(atom_map.values())
+
+        if key_slot:
+            key_slot_map = dict(
+                (owner_id, self.retrieveKeySlot(owner_id)) for \
+                    owner_id in set((x for x, y in rows)))
             if extended:
-                cur = self._cursor().execute("""
-                SELECT dependencies.idpackage, dependenciesreference.dependency
-                FROM dependencies, dependenciesreference
-                WHERE
-                dependencies.iddependency =
-                    dependenciesreference.iddependency AND
-                dependencies.iddependency IN ( %s )""" % (dep_ids_str,))
-                result = tuple(cur)
-            else:
-                cur = self._cursor().execute("""
-                SELECT dependencies.idpackage FROM dependencies
-                WHERE dependencies.iddependency IN ( %s )""" % (dep_ids_str,))
-                result = self._cur2frozenset(cur)
+                return tuple(
+                    (key_slot_map[x][0], key_slot_map[x][1], y) for \
+                        x, y in rows)
+            return tuple((key_slot_map[x] for x, y in rows))
 
-        # avoid python3.x memleak
-        del cached
-        return result
+        if extended:
+            return tuple(rows)
+        return frozenset((x for x, y in rows))
 
     def retrieveUnusedPackageIds(self):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        cached = self._getLiveCache("reverseDependenciesMetadata")
-        if cached is None:
-            cached = self._generateReverseDependenciesMetadata()
-
-        pkg_ids = set()
-        for v in cached.values():
-            pkg_ids |= v
-        if not pkg_ids:
-            # avoid python3.x memleak
-            del cached
-            return tuple()
-        pkg_ids_str = ', '.join((str(x) for x in pkg_ids))
+        index = self._getReverseDependenciesIndex()
+        used_package_ids = frozenset(index['provided'])
+        # avoid python3.x memleak
+        del index
 
         cur = self._cursor().execute("""
-        SELECT idpackage FROM baseinfo
-        WHERE idpackage NOT IN ( %s )
-        ORDER BY atom
-        """ % (pkg_ids_str,))
-        # avoid python3.x memleak
-        del cached
-        return self._cur2tuple(cur)
+        SELECT idpackage FROM baseinfo ORDER BY atom
+        """)
+        return tuple((x for x in self._cur2tuple(cur) \
+                          if x not in used_package_ids))
 
     def arePackageIdsAvailable(self, package_ids):
         """
@@ -3890,9 +4165,12 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        cur = self._cursor().execute("""
-        SELECT idpackage FROM content WHERE file = ?""", (path,))
-        result = self._cur2frozenset(cur)
+        if self._isContentBlobs():
+            result = self._searchContentPath(path)
+        else:
+            cur = self._cursor().execute("""
+            SELECT idpackage FROM content WHERE file = ?""", (path,))
+            result = self._cur2frozenset(cur)
         if get_id:
             return result
         elif result:
@@ -4083,18 +4361,153 @@ class EntropySQLRepository(EntropyRepositoryBase):
         Reimplemented from EntropyRepositoryBase.
         """
         if like:
-            cur = self._cursor().execute("""
-            SELECT content.idpackage FROM content,baseinfo
-            WHERE file LIKE ? AND
-            content.idpackage = baseinfo.idpackage""", (bfile,))
-        else:
-            cur = self._cursor().execute("""
-            SELECT content.idpackage
-            FROM content, baseinfo WHERE file = ?
-            AND content.idpackage = baseinfo.idpackage""", (bfile,))
+            # avoid a full content scan
+            return self._getPathIndex().searchLike(bfile)
+
+        if self._isContentBlobs():
+            return self._searchContentPath(bfile)
 
+        cur = self._cursor().execute("""
+        SELECT content.idpackage
+        FROM content, baseinfo WHERE file = ?
+        AND content.idpackage = baseinfo.idpackage""", (bfile,))
         return self._cur2frozenset(cur)
 
+    def searchBelongsMany(self, paths, like = False):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        paths = list(set(paths))
+        if like:
+            index = self._getPathIndex()
+            return dict(((x, index.searchLike(x)) for x in paths))
+
+        index = self._getLiveCache("pathIndex")
+        if index is not None:
+            return index.searchMany(paths)
+
+        # content metadata paths are unicode
+        enc = etpConst['conf_encoding']
+        u_paths = {}
+        for path in paths:
+            obj = u_paths.setdefault(
+                const_convert_to_unicode(path, enctype = enc), [])
+            obj.append(path)
+
+        owners = dict(((x, set()) for x in u_paths))
+        if self._isContentBlobs():
+            hashes = {}
+            for u_path in u_paths:
+                obj = hashes.setdefault(self._contentPathHash(u_path), [])
+                obj.append(u_path)
+            query = """
+            SELECT contentpaths.hash, contentpaths.idpackage
+            FROM contentpaths, baseinfo
+            WHERE contentpaths.idpackage = baseinfo.idpackage AND
+            contentpaths.hash IN (%s)
+            """
+            keys = list(hashes.keys())
+        else:
+            hashes = None
+            query = """
+            SELECT content.file, content.idpackage FROM content, baseinfo
+            WHERE content.idpackage = baseinfo.idpackage AND
+            content.file IN (%s)
+            """
+            keys = list(u_paths.keys())
+
+        candidates = {}
+        # keep the number of bound parameters below the
+        # SQLITE_MAX_VARIABLE_NUMBER default value (999)
+        chunk_size = 500
+        for idx in range(0, len(keys), chunk_size):
+            chunk = keys[idx:idx + chunk_size]
+            cur = self._cursor().execute(
+                query % (", ".join(["?"] * len(chunk)),), chunk)
+            for key, package_id in cur.fetchall():
+                if hashes is None:
+                    owners[key].add(package_id)
+                    continue
+                obj = candidates.setdefault(package_id, set())
+                obj.update(hashes[key])
+
+        # rule out hash collisions, reading every package content once
+        for package_id, c_paths in candidates.items():
+            if len(c_paths) > 1:
+                package_paths = frozenset((
+                        x for x, _y in self._retrieveContentBlob(package_id)))
+            else:
+                package_paths = self._contentBlobPaths(package_id)
+            for u_path in c_paths:
+                if u_path in package_paths:
+                    owners[u_path].add(package_id)
+
+        results = {}
+        for u_path, package_ids in owners.items():
+            for path in u_paths[u_path]:
+                results[path] = frozenset(package_ids)
+        return results
+
+    def _getPathIndex(self):
+        """
+        Return the EntropyRepositoryPathIndex of the paths owned by the
+        packages in this repository, loading it from the in-memory cache,
+        from disk (see _loadPathIndex()) or generating it with a single
+        pass over the package content metadata. Any change to the
+        package content metadata drops it.
+
+        @return: the path index
+        @rtype: entropy.db.index.EntropyRepositoryPathIndex
+        """
+        index = self._getLiveCache("pathIndex")
+        if index is not None:
+            return index
+
+        index = self._loadPathIndex()
+        if index is None:
+            if self._isContentBlobs():
+                cur = self._cursor().execute("""
+                SELECT contentblobs.idpackage, contentblobs.content
+                FROM contentblobs, baseinfo
+                WHERE contentblobs.idpackage = baseinfo.idpackage
+                """)
+                owners = [(path, package_id) for package_id, blob in cur \
+                              for path, _ftype in self._unpackContentBlob(
+                        blob, 2)]
+            else:
+                cur = self._cursor().execute("""
+                SELECT content.file, content.idpackage FROM content, baseinfo
+                WHERE content.idpackage = baseinfo.idpackage
+                """)
+                owners = cur.fetchall()
+            index = EntropyRepositoryPathIndex(owners)
+            del owners
+
+        self._setLiveCache("pathIndex", index)
+        return index
+
+    def _loadPathIndex(self):
+        """
+        Load the path index of this repository from disk, if available
+        and still valid. Subclasses can implement this method together
+        with _storePathIndex().
+
+        @return: the path index or None
+        @rtype: entropy.db.index.EntropyRepositoryPathIndex or None
+        """
+        return None
+
+    def _storePathIndex(self, index):
+        """
+        Write the path index of this repository to disk. This is called
+        when the repository content is known to be committed.
+        Subclasses can implement this method together with
+        _loadPathIndex().
+
+        @param index: the path index
+        @type index: entropy.db.index.EntropyRepositoryPathIndex
+        """
+
     def searchContentSafety(self, sfile):
         """
         Search content safety metadata (usually, sha256 and mtime) related to
@@ -4106,9 +4519,20 @@ class EntropySQLRepository(EntropyRepositoryBase):
         @return: content safety metadata list
         @rtype: tuple
         """
-        cur = self._cursor().execute("""
-        SELECT idpackage, file, sha256, mtime
-        FROM contentsafety WHERE file = ?""", (sfile,))
+        if self._isContentBlobs():
+            sfile = const_convert_to_unicode(
+                sfile, enctype = etpConst['conf_encoding'])
+            cur = []
+            for package_id in sorted(self._searchContentPath(sfile)):
+                cur.extend(((package_id, path, sha256, mtime) for \
+                                path, sha256, mtime in \
+                                self._retrieveContentBlob(
+                                package_id, safety = True) \
+                                if path == sfile))
+        else:
+            cur = self._cursor().execute("""
+            SELECT idpackage, file, sha256, mtime
+            FROM contentsafety WHERE file = ?""", (sfile,))
         return tuple(({'package_id': x, 'path': y, 'sha256': z, 'mtime': m} for
             x, y, z, m in cur))
 
@@ -4687,6 +5111,54 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """)
         return tuple(cur)
 
+    def listAllVersioningData(self):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        cur = self._cursor().execute("""
+        SELECT idpackage, category, name, version, versiontag,
+            revision, slot FROM baseinfo
+        """)
+        return tuple(cur)
+
+    def listAllPackageDependencies(self):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        cur = self._cursor().execute("""
+        SELECT idpackage, iddependency, type FROM dependencies
+        """)
+        return tuple(cur)
+
+    def listAllPackageKeywords(self):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        cur = self._cursor().execute("""
+        SELECT keywords.idpackage, keywordsreference.keywordname
+        FROM keywords, keywordsreference
+        WHERE keywords.idkeyword = keywordsreference.idkeyword
+        """)
+        return tuple(cur)
+
+    def listAllPackageLicenses(self):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        cur = self._cursor().execute("""
+        SELECT idpackage, license FROM baseinfo
+        """)
+        return tuple(cur)
+
+    def listAllPackageConflicts(self):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        cur = self._cursor().execute("""
+        SELECT idpackage, conflict FROM conflicts
+        """)
+        return tuple(cur)
+
     def listAllDownloads(self, do_sort = True, full_path = False):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -4733,6 +5205,21 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         self._connection().unicode()
 
+        if self._isContentBlobs():
+            if count:
+                cur = self._cursor().execute("""
+                SELECT count(hash) FROM contentpaths LIMIT 1
+                """)
+                return cur.fetchone()[0]
+            cur = self._cursor().execute("""
+            SELECT content FROM contentblobs
+            """)
+            files = [x for blob, in cur.fetchall() for x, _y in \
+                         self._unpackContentBlob(blob, 2)]
+            if clean:
+                return frozenset(files)
+            return tuple(files)
+
         if count:
             cur = self._cursor().execute("""
             SELECT count(file) FROM content LIMIT 1
@@ -4787,10 +5274,11 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        self._cursor().execute("""
-        UPDATE baseinfo SET branch = ?
-        WHERE idpackage = ?""", (tobranch, package_id,))
-        self.clearCache()
+        with self._updatingChecksumDigests((package_id,)):
+            self._cursor().execute("""
+            UPDATE baseinfo SET branch = ?
+            WHERE idpackage = ?""", (tobranch, package_id,))
+            self.clearCache()
 
     def getSetting(self, setting_name):
         """
@@ -4874,9 +5362,9 @@ class EntropySQLRepository(EntropyRepositoryBase):
                     self._doesTableExist("keywords")):
             raise SystemDatabaseError(mytxt)
 
-        # execute checksum
+        # execute checksum, hashing all the metadata
         try:
-            self.checksum()
+            self.checksum(do_order = True)
         except (OperationalError, DatabaseError,) as err:
             mytxt = "Repository is corrupted, checksum error"
             raise SystemDatabaseError("%s: %s" % (mytxt, err,))
@@ -4911,7 +5399,25 @@ class EntropySQLRepository(EntropyRepositoryBase):
                  include_dependencies = False):
         """
         Reimplemented from EntropyRepositoryBase.
+        Unordered checksums are computed from the incrementally maintained
+        package digests (see _getChecksumDigests()), ordered ones, which
+        can be compared across machines, by hashing the whole repository
+        metadata.
         """
+        if not do_order and self._doesTableExist("baseinfo"):
+            sums = self._getChecksumDigests()['sums']
+            if strict:
+                components = [sums[0]]
+            else:
+                components = [sums[1]]
+            if include_signatures:
+                components.append(sums[2])
+            if include_dependencies:
+                components.append(sums[3])
+            digest_str = "|".join(("%040x" % (x,) for x in components))
+            return hashlib.sha1(
+                const_convert_to_rawstring(digest_str)).hexdigest()
+
         cache_key = "checksum_%s_%s_True_%s_%s" % (
             do_order, strict, include_signatures, include_dependencies)
         cached = self._getLiveCache(cache_key)
@@ -5082,13 +5588,22 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        if self._isContentBlobs():
+            self._cursor().execute('DELETE FROM contentpaths')
+            self._cursor().execute('DELETE FROM contentblobs')
+            self._clearLiveCache("contentBlobPaths")
         self._cursor().execute('DELETE FROM content')
+        self._clearLiveCache("pathIndex")
         self.dropContentSafety()
 
     def dropContentSafety(self):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        if self._isContentBlobs():
+            self._cursor().execute("""
+            UPDATE contentblobs SET contentsafety = NULL
+            """)
         self._cursor().execute('DELETE FROM contentsafety')
 
     def dropChangelog(self):
@@ -5102,6 +5617,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         Reimplemented from EntropyRepositoryBase.
         """
         self._cursor().execute('UPDATE packagesignatures set gpg = NULL')
+        self._clearLiveCache("checksumDigests")
 
     def dropAllIndexes(self):
         """
@@ -5518,64 +6034,420 @@ class EntropySQLRepository(EntropyRepositoryBase):
         UPDATE treeupdates SET digest = '-1'
         """)
 
-    def _generateReverseDependenciesMetadata(self):
+    def _getChecksumDigests(self):
+        """
+        Return the incrementally maintained checksum() digests of this
+        repository, loading them from the in-memory cache, from disk
+        (see _loadChecksumDigests()) or generating them.
+
+        For every _CHECKSUM_QUERIES component, the digest is the sum
+        (modulo 2^160) of the SHA1 of the metadata of every package, which
+        makes it independent of the package order and lets addPackage(),
+        removePackage() and the set*() methods update it without
+        rehashing the whole repository.
+
+        @return: the checksum digests metadata
+        @rtype: dict
+        """
+        digests = self._getLiveCache("checksumDigests")
+        if digests is not None:
+            return digests
+
+        digests = self._loadChecksumDigests()
+        if digests is None:
+            sums = []
+            modulo = EntropySQLRepository._CHECKSUM_DIGESTS_MODULO
+            for queries in EntropySQLRepository._CHECKSUM_QUERIES:
+                package_rows = {}
+                for query, condition in queries:
+                    cur = self._cursor().execute(query % ("",))
+                    for row in cur.fetchall():
+                        obj = package_rows.setdefault(row[0], [])
+                        obj.append(repr(row))
+                total = 0
+                for rows in package_rows.values():
+                    total += self._checksumDigest(rows)
+                sums.append(total % modulo)
+
+            digests = {
+                'version': EntropySQLRepository._CHECKSUM_DIGESTS_VERSION,
+                'sums': sums,
+            }
+
+        self._setLiveCache("checksumDigests", digests)
+        return digests
+
+    def _loadChecksumDigests(self):
+        """
+        Load the checksum() digests of this repository from disk, if
+        available and still valid. Subclasses can implement this method
+        together with _storeChecksumDigests().
+
+        @return: the checksum digests metadata or None
+        @rtype: dict or None
+        """
+        return None
+
+    def _storeChecksumDigests(self, digests):
         """
-        Reverse dependencies dynamic metadata generation.
+        Write the checksum() digests of this repository to disk. This is
+        called when the repository content is known to be committed.
+        Subclasses can implement this method together with
+        _loadChecksumDigests().
+
+        @param digests: the checksum digests metadata
+        @type digests: dict
         """
-        checksum = self.checksum()
+
+    @staticmethod
+    def _checksumDigest(rows):
+        """
+        Return the digest (as integer) of the given package metadata rows
+        (repr() strings).
+        """
+        if not rows:
+            return 0
+        data = "\n".join(sorted(rows))
+        if const_is_python3():
+            data = data.encode("utf-8")
+        return int(hashlib.sha1(data).hexdigest(), 16)
+
+    def _packageChecksumDigests(self, package_id):
+        """
+        Return the list of checksum() digests of the given package, one
+        for every _CHECKSUM_QUERIES component. Digests of packages not
+        available are 0.
+        """
+        digests = []
+        for queries in EntropySQLRepository._CHECKSUM_QUERIES:
+            rows = []
+            for query, condition in queries:
+                cur = self._cursor().execute(
+                    query % (condition,), (package_id,))
+                rows.extend((repr(x) for x in cur))
+            digests.append(self._checksumDigest(rows))
+        return digests
+
+    def _applyPackageChecksumDigests(self, digests, package_ids, sign):
+        """
+        Add (sign = 1) or subtract (sign = -1) the checksum() digests of
+        the given packages to/from the repository ones.
+        """
+        sums = digests['sums']
+        modulo = EntropySQLRepository._CHECKSUM_DIGESTS_MODULO
+        for package_id in package_ids:
+            package_digests = self._packageChecksumDigests(package_id)
+            for idx, digest in enumerate(package_digests):
+                sums[idx] = (sums[idx] + sign * digest) % modulo
+
+    @contextlib.contextmanager
+    def _updatingChecksumDigests(self, package_ids):
+        """
+        Keep the in-memory checksum() digests up-to-date while the
+        metadata of the given packages is being changed inside the
+        "with" statement.
+        """
+        digests = self._getLiveCache("checksumDigests")
+        if digests is None:
+            yield
+            return
+
+        self._applyPackageChecksumDigests(digests, package_ids, -1)
         try:
-            mtime = repr(self.mtime())
-        except (OSError, IOError):
-            mtime = "0.0"
-        hash_str = "%s|%s|%s|%s|%s" % (
+            yield
+        except:
+            self._clearLiveCache("checksumDigests")
+            raise
+        self._applyPackageChecksumDigests(digests, package_ids, 1)
+        # the wrapped code may have cleared the in-memory cache
+        self._setLiveCache("checksumDigests", digests)
+
+    def _getReverseDependenciesIndex(self):
+        """
+        Return the reverse dependencies index of this repository, loading
+        it from the in-memory cache, from disk or generating it.
+
+        The index is a dictionary composed by the following maps:
+        'dependencies': iddependency -> dependency string,
+        'matches': iddependency -> set of package ids satisfying it,
+        'provided': package id -> set of iddependencies it satisfies,
+        'owners': iddependency -> set of (package id, dependency type)
+            of the packages requiring it,
+        'requires': package id -> set of (iddependency, dependency type)
+            required by the package,
+        'names': package name -> set of iddependencies whose
+            resolution depends on packages with the given name.
+
+        Only dependencies required by at least one package are indexed.
+        addPackage() and removePackage() record the packages they touch
+        in the index, which is then incrementally updated here and written
+        back to disk by close(). Any other change to the repository
+        drops it.
+
+        @return: the reverse dependencies index
+        @rtype: dict
+        """
+        index = self._getLiveCache("reverseDependenciesIndex")
+        if index is not None:
+            if index['pending_packages']:
+                self._updateReverseDependenciesIndex(index)
+            return index
+
+        cache_key = self._reverseDependenciesIndexCacheKey()
+        index = self._cacher.pop(cache_key)
+        if isinstance(index, dict) and index.get('version') == \
+                EntropySQLRepository._REVERSE_DEPS_INDEX_VERSION:
+            self._setLiveCache("reverseDependenciesIndex", index)
+            return index
+
+        index = {
+            'version': EntropySQLRepository._REVERSE_DEPS_INDEX_VERSION,
+            'dependencies': {},
+            'matches': {},
+            'provided': {},
+            'owners': {},
+            'requires': {},
+            'names': {},
+            'pending_packages': set(),
+            'pending_names': set(),
+            'dirty': False,
+        }
+        cur = self._cursor().execute("""
+        SELECT dependencies.idpackage, dependencies.iddependency,
+            dependencies.type, dependenciesreference.dependency
+        FROM dependencies, dependenciesreference
+        WHERE dependencies.iddependency = dependenciesreference.iddependency
+        """)
+        owners = index['owners']
+        requires = index['requires']
+        dependencies = index['dependencies']
+        for package_id, dep_id, dep_type, dependency in cur:
+            obj = owners.setdefault(dep_id, set())
+            obj.add((package_id, dep_type))
+            obj = requires.setdefault(package_id, set())
+            obj.add((dep_id, dep_type))
+            dependencies[dep_id] = dependency
+
+        for dep_id, dependency in dependencies.items():
+            self._indexReverseDependency(index, dep_id, dependency)
+
+        self._setLiveCache("reverseDependenciesIndex", index)
+        self._saveReverseDependenciesIndex(index, cache_key = cache_key)
+        return index
+
+    def _reverseDependenciesIndexCacheKey(self):
+        """
+        Return the EntropyCacher key of the on-disk reverse dependencies
+        index of this repository. The key changes every time the packages
+        or their dependencies change.
+        """
+        repo_str = "%s|%s|%s" % (
             repr(self._db),
             repr(etpConst['systemroot']),
             repr(self.name),
-            repr(checksum),
-            mtime,
         )
+        checksum = self.checksum(include_dependencies = True)
         if const_is_python3():
-            hash_str = hash_str.encode("utf-8")
-        sha = hashlib.sha1()
-        sha.update(hash_str)
-        cache_key = "__generateReverseDependenciesMetadata2_" + \
-            sha.hexdigest()
-        rev_deps_data = self._cacher.pop(cache_key)
-        if rev_deps_data is not None:
-            self._setLiveCache("reverseDependenciesMetadata",
-                rev_deps_data)
-            return rev_deps_data
-
-        dep_data = {}
-        for iddep, atom in self.listAllDependencies():
-
-            if iddep == -1:
-                continue
+            repo_str = repo_str.encode("utf-8")
+        return "%s/%s/%s" % (
+            EntropySQLRepository._REVERSE_DEPS_INDEX_CACHE_KEY,
+            hashlib.sha1(repo_str).hexdigest(),
+            checksum,
+        )
+
+    def _saveReverseDependenciesIndex(self, index, cache_key = None):
+        """
+        Write the given reverse dependencies index to disk, removing the
+        ones generated against older revisions of this repository.
+        """
+        if cache_key is None:
+            cache_key = self._reverseDependenciesIndexCacheKey()
+
+        self._cacher.remove_prefix(
+            os.path.dirname(cache_key) + "/", keep_suffix = cache_key)
 
-            if atom.endswith(etpConst['entropyordepquestion']):
-                or_atoms = atom[:-1].split(etpConst['entropyordepsep'])
-                for or_atom in or_atoms:
-                    # not safe to use cache here, people messing with multiple
-                    # instances can make this crash
-                    package_id, rc = self.atomMatch(or_atom, useCache = False)
-                    if package_id != -1:
-                        obj = dep_data.setdefault(iddep, set())
-                        obj.add(package_id)
-            else:
-                # not safe to use cache here, people messing with multiple
-                # instances can make this crash
-                package_id, rc = self.atomMatch(atom, useCache = False)
-                if package_id != -1:
-                    obj = dep_data.setdefault(iddep, set())
-                    obj.add(package_id)
-
-        self._setLiveCache("reverseDependenciesMetadata", dep_data)
         try:
-            self._cacher.save(cache_key, dep_data)
+            self._cacher.save(cache_key, index)
         except IOError:
             # race condition, ignore
             pass
-        return dep_data
+
+    def _flushReverseDependenciesIndex(self):
+        """
+        Write the reverse dependencies index to disk, if it has been
+        incrementally updated since it was loaded or generated.
+        """
+        index = self._getLiveCache("reverseDependenciesIndex")
+        if index is None:
+            return
+        if index['pending_packages']:
+            self._updateReverseDependenciesIndex(index)
+        if index['dirty']:
+            index['dirty'] = False
+            self._saveReverseDependenciesIndex(index)
+
+    def _reverseDependencyNames(self, dependency):
+        """
+        Return the package names the resolution of the given dependency
+        string depends on.
+        """
+        if dependency.endswith(etpConst['entropyordepquestion']):
+            dep_atoms = entropy.dep.dep_split_or_deps(dependency)
+        else:
+            dep_atoms = [dependency]
+        return set((entropy.dep.remove_cat(entropy.dep.dep_getkey(x)) \
+                        for x in dep_atoms))
+
+    def _reverseDependenciesIndexNames(self, package_id):
+        """
+        Return the package names whose dependencies can be satisfied by
+        the given package (its own name and the old-style virtuals it
+        provides).
+        """
+        package_names = set()
+        name = self.retrieveName(package_id)
+        if name is not None:
+            package_names.add(name)
+        for provide, is_default in self.retrieveProvide(package_id):
+            package_names.add(
+                entropy.dep.remove_cat(entropy.dep.dep_getkey(provide)))
+        return package_names
+
+    def _indexReverseDependency(self, index, dep_id, dependency):
+        """
+        Resolve the given dependency and add it to the reverse
+        dependencies index.
+        """
+        if dependency.endswith(etpConst['entropyordepquestion']):
+            dep_atoms = entropy.dep.dep_split_or_deps(dependency)
+        else:
+            dep_atoms = [dependency]
+
+        matches = set()
+        for dep_atom in dep_atoms:
+            # not safe to use cache here, people messing with multiple
+            # instances can make this crash
+            package_id, rc = self.atomMatch(dep_atom, useCache = False)
+            if package_id != -1:
+                matches.add(package_id)
+
+        index['dependencies'][dep_id] = dependency
+        index['matches'][dep_id] = matches
+        provided = index['provided']
+        for package_id in matches:
+            obj = provided.setdefault(package_id, set())
+            obj.add(dep_id)
+        names = index['names']
+        for name in self._reverseDependencyNames(dependency):
+            obj = names.setdefault(name, set())
+            obj.add(dep_id)
+
+    def _unindexReverseDependency(self, index, dep_id):
+        """
+        Remove the given dependency from the reverse dependencies index.
+        Return the dependency string, if it was indexed.
+        """
+        dependency = index['dependencies'].pop(dep_id, None)
+        if dependency is None:
+            return None
+
+        provided = index['provided']
+        for package_id in index['matches'].pop(dep_id, ()):
+            obj = provided.get(package_id)
+            if obj is not None:
+                obj.discard(dep_id)
+                if not obj:
+                    del provided[package_id]
+
+        names = index['names']
+        for name in self._reverseDependencyNames(dependency):
+            obj = names.get(name)
+            if obj is not None:
+                obj.discard(dep_id)
+                if not obj:
+                    del names[name]
+        return dependency
+
+    def _touchReverseDependenciesIndex(self, index, package_id,
+                                       package_names = None):
+        """
+        Record in the reverse dependencies index that the given package
+        has been added, replaced or removed. package_names are the names
+        returned by _reverseDependenciesIndexNames() for a package that
+        is going to be removed.
+        """
+        index['pending_packages'].add(package_id)
+        if package_names:
+            index['pending_names'].update(package_names)
+        self._setLiveCache("reverseDependenciesIndex", index)
+
+    def _updateReverseDependenciesIndex(self, index):
+        """
+        Bring the reverse dependencies index up-to-date with the packages
+        recorded by _touchReverseDependenciesIndex().
+        """
+        package_ids = index['pending_packages']
+        package_names = index['pending_names']
+        index['pending_packages'] = set()
+        index['pending_names'] = set()
+        index['dirty'] = True
+
+        dependencies = index['dependencies']
+        owners = index['owners']
+        requires = index['requires']
+        unowned_deps = set()
+        new_deps = {}
+
+        for package_id in package_ids:
+            for dep_id, dep_type in requires.pop(package_id, ()):
+                obj = owners.get(dep_id)
+                if obj is None:
+                    continue
+                obj.discard((package_id, dep_type))
+                if not obj:
+                    del owners[dep_id]
+                    unowned_deps.add(dep_id)
+
+            cur = self._cursor().execute("""
+            SELECT dependencies.iddependency, dependencies.type,
+                dependenciesreference.dependency
+            FROM dependencies, dependenciesreference
+            WHERE dependencies.idpackage = ? AND
+            dependencies.iddependency = dependenciesreference.iddependency
+            """, (package_id,))
+            for dep_id, dep_type, dependency in cur.fetchall():
+                obj = owners.setdefault(dep_id, set())
+                obj.add((package_id, dep_type))
+                obj = requires.setdefault(package_id, set())
+                obj.add((dep_id, dep_type))
+                if dep_id not in dependencies:
+                    new_deps[dep_id] = dependency
+
+            # the package may now satisfy (or better satisfy) indexed
+            # dependencies, or the ones it satisfied must be resolved
+            # against the remaining packages
+            package_names.update(self._reverseDependenciesIndexNames(
+                    package_id))
+            for dep_id in index['provided'].get(package_id, ()):
+                package_names.update(self._reverseDependencyNames(
+                        dependencies[dep_id]))
+
+        for dep_id in unowned_deps:
+            if dep_id not in owners:
+                self._unindexReverseDependency(index, dep_id)
+
+        dep_ids = set()
+        names = index['names']
+        for name in package_names:
+            dep_ids.update(names.get(name, ()))
+        for dep_id in dep_ids:
+            dependency = self._unindexReverseDependency(index, dep_id)
+            if dependency is not None:
+                self._indexReverseDependency(index, dep_id, dependency)
+
+        for dep_id, dependency in new_deps.items():
+            if dep_id in owners:
+                self._indexReverseDependency(index, dep_id, dependency)
 
     def moveSpmUidsToBranch(self, to_branch):
         """
@@ -35,6 +35,7 @@ from entropy.db.exceptions import Warning, Error, InterfaceError, \
     InternalError, ProgrammingError, NotSupportedError, LockAcquireError
 from entropy.db.sql import EntropySQLRepository, SQLConnectionWrapper, \
     SQLCursorWrapper
+from entropy.db.index import EntropyRepositoryPathIndex
 
 from entropy.i18n import _
 
@@ -133,7 +134,7 @@ class EntropySQLiteRepository(EntropySQLRepository):
 
     # bump this every time schema changes and databaseStructureUpdate
     # should be triggered
-    _SCHEMA_REVISION = 5
+    _SCHEMA_REVISION = 6
 
     _INSERT_OR_REPLACE = "INSERT OR REPLACE"
     _INSERT_OR_IGNORE = "INSERT OR IGNORE"
@@ -141,7 +142,17 @@ class EntropySQLiteRepository(EntropySQLRepository):
     _CACHE_SIZE = 8192
 
     SETTING_KEYS = ("arch", "on_delete_cascade", "schema_revision",
-        "_baseinfo_extrainfo_2010")
+        "_baseinfo_extrainfo_2010", "content_blobs")
+
+    # if True, package content and content safety metadata are stored
+    # as compressed per-package blobs instead of one row per file, see
+    # EntropySQLRepository._isContentBlobs(). If False, repositories
+    # using the blobs layout are migrated back to the content and
+    # contentsafety tables. If None, the current layout is kept.
+    # Migrations are executed at schema update time. Keep it disabled
+    # for repositories that are distributed to clients, since older
+    # Entropy versions cannot read the new layout.
+    _CONTENT_BLOBS = None
 
     class SQLiteProxy(object):
 
@@ -681,6 +692,16 @@ class EntropySQLiteRepository(EntropySQLRepository):
         Reimplemented from EntropySQLRepository.
         Needs to call superclass method.
         """
+        if self._readonly:
+            # read-only repositories are not committed on close,
+            # store the checksum digests here
+            digests = self._getLiveCache("checksumDigests")
+            if digests is not None:
+                self._storeChecksumDigests(digests)
+            path_index = self._getLiveCache("pathIndex")
+            if path_index is not None:
+                self._storePathIndex(path_index)
+
         super(EntropySQLiteRepository, self).close(safe=safe)
 
         self._cleanup_all(_cleanup_main_thread=not safe)
@@ -702,6 +723,160 @@ class EntropySQLiteRepository(EntropySQLRepository):
         """
         self._cursor().execute("vacuum")
 
+    def commit(self, force = False, no_plugins = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        Needs to call superclass method.
+        """
+        # committing changes the repository file mtime, which makes
+        # _getLiveCache() discard the whole in-memory cache. The checksum
+        # digests, the reverse dependencies index and the path index
+        # already account for the changes done through this instance,
+        # so carry them over.
+        carried = []
+        for key in ("checksumDigests", "reverseDependenciesIndex",
+                    "pathIndex"):
+            value = self._getLiveCache(key)
+            if value is not None:
+                carried.append((key, value))
+
+        super(EntropySQLiteRepository, self).commit(
+            force = force, no_plugins = no_plugins)
+
+        for key, value in carried:
+            if self._getLiveCache(key) is None:
+                self._setLiveCache(key, value)
+            if key == "checksumDigests":
+                self._storeChecksumDigests(value)
+            elif key == "pathIndex":
+                self._storePathIndex(value)
+
+    def _checksumDigestsCacheKey(self):
+        """
+        Return the EntropyCacher key of the on-disk checksum digests
+        of this repository.
+        """
+        repo_str = "%s|%s|%s|%s" % (
+            repr(self._db),
+            repr(etpConst['systemroot']),
+            repr(self.name),
+            const_is_python3(),
+        )
+        if const_is_python3():
+            repo_str = repo_str.encode("utf-8")
+        return "%s/%s" % (
+            EntropySQLRepository._CHECKSUM_DIGESTS_CACHE_KEY,
+            hashlib.sha1(repo_str).hexdigest(),
+        )
+
+    def _cacheFileStat(self):
+        """
+        Return the repository file (mtime, size) pair the on-disk checksum
+        digests and path index are bound to, or None if they cannot be
+        stored.
+        """
+        if self._db is None or self._is_memory() or self._temporary:
+            return None
+        try:
+            st = os.stat(self._db)
+        except (OSError, IOError):
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def _loadChecksumDigests(self):
+        """
+        Reimplemented from EntropySQLRepository.
+        The on-disk digests are valid as long as the repository file
+        has not been touched since they were stored.
+        """
+        file_stat = self._cacheFileStat()
+        if file_stat is None:
+            return None
+        digests = self._cacher.pop(self._checksumDigestsCacheKey())
+        if not isinstance(digests, dict):
+            return None
+        if digests.get('version') != \
+                EntropySQLRepository._CHECKSUM_DIGESTS_VERSION:
+            return None
+        if digests.get('file_stat') != file_stat:
+            return None
+        return digests
+
+    def _storeChecksumDigests(self, digests):
+        """
+        Reimplemented from EntropySQLRepository.
+        """
+        file_stat = self._cacheFileStat()
+        if file_stat is None:
+            return
+        if digests.get('file_stat') == file_stat:
+            # already stored
+            return
+        digests['file_stat'] = file_stat
+        try:
+            self._cacher.save(self._checksumDigestsCacheKey(), digests)
+        except IOError:
+            # race condition, ignore
+            pass
+
+    def _pathIndexCacheKey(self):
+        """
+        Return the EntropyCacher key of the on-disk path index of this
+        repository.
+        """
+        repo_str = "%s|%s|%s|%s" % (
+            repr(self._db),
+            repr(etpConst['systemroot']),
+            repr(self.name),
+            const_is_python3(),
+        )
+        if const_is_python3():
+            repo_str = repo_str.encode("utf-8")
+        return "%s/%s" % (
+            EntropySQLRepository._PATH_INDEX_CACHE_KEY,
+            hashlib.sha1(repo_str).hexdigest(),
+        )
+
+    def _loadPathIndex(self):
+        """
+        Reimplemented from EntropySQLRepository.
+        The on-disk index is valid as long as the repository file
+        has not been touched since it was stored.
+        """
+        file_stat = self._cacheFileStat()
+        if file_stat is None:
+            return None
+        data = self._cacher.pop(self._pathIndexCacheKey())
+        if not isinstance(data, dict):
+            return None
+        if data.get('file_stat') != file_stat:
+            return None
+        index = EntropyRepositoryPathIndex.load(data.get('index'))
+        if index is not None:
+            index.file_stat = file_stat
+        return index
+
+    def _storePathIndex(self, index):
+        """
+        Reimplemented from EntropySQLRepository.
+        """
+        file_stat = self._cacheFileStat()
+        if file_stat is None:
+            return
+        if index.file_stat == file_stat:
+            # already stored
+            return
+        index.file_stat = file_stat
+        data = {
+            'file_stat': file_stat,
+            'index': index.dump(),
+        }
+        try:
+            self._cacher.save(self._pathIndexCacheKey(), data)
+        except IOError:
+            # race condition, ignore
+            pass
+
     def initializeRepository(self):
         """
         Reimplemented from EntropySQLRepository.
@@ -779,6 +954,13 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 self._cursor().execute("""
                 DELETE FROM packagedownloads WHERE idpackage = (?)""",
                 (package_id,))
+            if self._doesTableExist("contentblobs"):
+                self._cursor().execute("""
+                DELETE FROM contentblobs WHERE idpackage = (?)""",
+                (package_id,))
+                self._cursor().execute("""
+                DELETE FROM contentpaths WHERE idpackage = (?)""",
+                (package_id,))
 
     def _addDependency(self, dependency):
         """
@@ -808,9 +990,10 @@ class EntropySQLiteRepository(EntropySQLRepository):
         We must handle _baseinfo_extrainfo_2010 and live cache.
         """
         if self._isBaseinfoExtrainfo2010():
-            self._cursor().execute("""
-            UPDATE baseinfo SET category = (?) WHERE idpackage = (?)
-            """, (category, package_id,))
+            with self._updatingChecksumDigests((package_id,)):
+                self._cursor().execute("""
+                UPDATE baseinfo SET category = (?) WHERE idpackage = (?)
+                """, (category, package_id,))
         else:
             # create new category if it doesn't exist
             catid = self._isCategoryAvailable(category)
@@ -1022,6 +1205,52 @@ class EntropySQLiteRepository(EntropySQLRepository):
         del cached
         return obj
 
+    def getVersioningDataByNames(self, names):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle _baseinfo_extrainfo_2010.
+        """
+        if self._isBaseinfoExtrainfo2010():
+            return super(EntropySQLiteRepository,
+                         self).getVersioningDataByNames(names)
+
+        # we must guarantee backward compatibility
+        names = list(set(names))
+        data = {}
+        chunk_size = 500
+        for idx in range(0, len(names), chunk_size):
+            chunk = names[idx:idx + chunk_size]
+            cur = self._cursor().execute("""
+            SELECT baseinfo.idpackage, categories.category, baseinfo.name,
+                baseinfo.version, baseinfo.versiontag, baseinfo.revision,
+                baseinfo.slot
+            FROM baseinfo, categories
+            WHERE baseinfo.idcategory = categories.idcategory
+            AND baseinfo.name IN (%s)
+            """ % (", ".join(["?"] * len(chunk)),), chunk)
+            for row in cur:
+                data[row[0]] = tuple(row[1:])
+        return data
+
+    def listAllVersioningData(self):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle _baseinfo_extrainfo_2010.
+        """
+        if self._isBaseinfoExtrainfo2010():
+            return super(EntropySQLiteRepository,
+                         self).listAllVersioningData()
+
+        # we must guarantee backward compatibility
+        cur = self._cursor().execute("""
+        SELECT baseinfo.idpackage, categories.category, baseinfo.name,
+            baseinfo.version, baseinfo.versiontag, baseinfo.revision,
+            baseinfo.slot
+        FROM baseinfo, categories
+        WHERE baseinfo.idcategory = categories.idcategory
+        """)
+        return tuple(cur)
+
     def getStrictData(self, package_id):
         """
         Reimplemented from EntropySQLRepository.
@@ -1895,7 +2124,10 @@ class EntropySQLiteRepository(EntropySQLRepository):
 
             if current_schema_rev == EntropySQLiteRepository._SCHEMA_REVISION \
                     and not os.getenv("ETP_REPO_SCHEMA_UPDATE"):
-                return False
+                # repositories created from scratch (like the installed
+                # packages one generated by "equo rescue") or whose
+                # content layout setting changed still need migration.
+                return self._isContentLayoutMigrationNeeded()
             return True
 
         if not must_run():
@@ -1980,6 +2212,12 @@ class EntropySQLiteRepository(EntropySQLRepository):
 
         self._foreignKeySupport()
 
+        if self._isContentLayoutMigrationNeeded():
+            if self._CONTENT_BLOBS:
+                self._migrateContentBlobs()
+            else:
+                self._migrateContentTables()
+
         self._readonly = old_readonly
         self._connection().commit()
 
@@ -2128,7 +2366,8 @@ class EntropySQLiteRepository(EntropySQLRepository):
                          self).checksum(
                 do_order = do_order,
                 strict = strict,
-                include_signatures = include_signatures)
+                include_signatures = include_signatures,
+                include_dependencies = include_dependencies)
 
         # backward compatibility
         # !!! keep aligned !!!
@@ -2377,6 +2616,16 @@ class EntropySQLiteRepository(EntropySQLRepository):
             self.__createLicensesIndex()
             self.__createCategoriesIndex()
             self.__createCompileFlagsIndex()
+        if self._isContentBlobs():
+            self._createContentPathsIndex()
+
+    def _createContentPathsIndex(self):
+        self._cursor().executescript("""
+        CREATE INDEX IF NOT EXISTS contentpathsindex_hash
+            ON contentpaths ( hash );
+        CREATE INDEX IF NOT EXISTS contentpathsindex_idpackage
+            ON contentpaths ( idpackage );
+        """)
 
     def __createCompileFlagsIndex(self):
         try:
@@ -2602,6 +2851,117 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 self._setSetting("on_delete_cascade", "1")
                 self._connection().commit()
 
+    def _isContentLayoutMigrationNeeded(self):
+        """
+        Return whether the content metadata layout of the repository
+        differs from the one requested through _CONTENT_BLOBS.
+        """
+        if self._CONTENT_BLOBS is None:
+            return False
+        return bool(self._CONTENT_BLOBS) != self._isContentBlobs()
+
+    def _migrateContentBlobs(self):
+        """
+        Move package content and content safety metadata from the
+        content and contentsafety tables to the contentblobs and
+        contentpaths ones. See EntropySQLRepository._isContentBlobs().
+        """
+        # entropy.qa uses this name, must skip migration
+        if self.name in ("qa_testing", "mem_repo"):
+            return
+
+        self._createContentBlobsTables()
+
+        cur = self._cursor().execute("""
+        SELECT idpackage FROM baseinfo
+        """)
+        package_ids = self._cur2tuple(cur)
+        if package_ids:
+            mytxt = "%s: [%s] %s" % (
+                bold(_("ATTENTION")),
+                purple(self.name),
+                red(_("updating repository metadata layout, please wait!")),
+            )
+            self.output(
+                mytxt,
+                importance = 1,
+                level = "warning"
+            )
+
+        has_safety = self._doesTableExist("contentsafety")
+        for package_id in package_ids:
+            # content_blobs is not set yet, data comes from the old tables
+            content = tuple(self.retrieveContentIter(package_id))
+            self._insertContentBlob(package_id, content)
+            if has_safety:
+                safety = tuple(self.retrieveContentSafetyIter(package_id))
+                if safety:
+                    self._storeContentBlob(package_id, safety,
+                                           safety = True)
+
+        self._cursor().execute("DELETE FROM content")
+        if has_safety:
+            self._cursor().execute("DELETE FROM contentsafety")
+
+        self._setSetting("content_blobs", "1")
+        self._createContentPathsIndex()
+        self._clearLiveCache("contentBlobPaths")
+        self._connection().commit()
+        if package_ids:
+            # give the space back
+            self.vacuum()
+
+    def _migrateContentTables(self):
+        """
+        Move package content and content safety metadata from the
+        contentblobs and contentpaths tables back to the content and
+        contentsafety ones, reverting _migrateContentBlobs(). This makes
+        the repository readable by older Entropy versions again.
+        """
+        package_ids = ()
+        if self._doesTableExist("contentblobs"):
+            cur = self._cursor().execute("""
+            SELECT idpackage FROM contentblobs
+            """)
+            package_ids = self._cur2tuple(cur)
+        if package_ids:
+            mytxt = "%s: [%s] %s" % (
+                bold(_("ATTENTION")),
+                purple(self.name),
+                red(_("updating repository metadata layout, please wait!")),
+            )
+            self.output(
+                mytxt,
+                importance = 1,
+                level = "warning"
+            )
+
+        if not self._doesTableExist("contentsafety"):
+            self._createContentSafetyTable()
+        for package_id in package_ids:
+            self._cursor().executemany("""
+            INSERT INTO content VALUES (?, ?, ?)
+            """, [(package_id, path, ftype) for path, ftype in \
+                      self._retrieveContentBlob(package_id)])
+            self._cursor().executemany("""
+            INSERT INTO contentsafety VALUES (?, ?, ?, ?)
+            """, [(package_id, path, mtime, sha256) for path, sha256, mtime \
+                      in self._retrieveContentBlob(package_id, safety = True)])
+
+        self._cursor().executescript("""
+        DROP TABLE IF EXISTS contentpaths;
+        DROP TABLE IF EXISTS contentblobs;
+        """)
+        self._clearLiveCache("_doesTableExist")
+        self._clearLiveCache("_doesColumnInTableExist")
+        self._setSetting("content_blobs", "0")
+        self._clearLiveCache("contentBlobPaths")
+        self._clearLiveCache("pathIndex")
+        self._connection().commit()
+        if package_ids:
+            # give the space back
+            self.vacuum()
+
     def _moveContent(self, from_table, to_table):
         self._cursor().execute("""
             INSERT INTO %s SELECT * FROM %s
@@ -2925,6 +3285,25 @@ class EntropySQLiteRepository(EntropySQLRepository):
         self._clearLiveCache("_doesTableExist")
         self._clearLiveCache("_doesColumnInTableExist")
 
+    def _createContentBlobsTables(self):
+        self._cursor().executescript("""
+        CREATE TABLE IF NOT EXISTS contentblobs (
+            idpackage INTEGER PRIMARY KEY,
+            content BLOB,
+            contentsafety BLOB,
+            FOREIGN KEY(idpackage)
+                REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+        );
+        CREATE TABLE IF NOT EXISTS contentpaths (
+            idpackage INTEGER,
+            hash INTEGER,
+            FOREIGN KEY(idpackage)
+                REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+        );
+        """)
+        self._clearLiveCache("_doesTableExist")
+        self._clearLiveCache("_doesColumnInTableExist")
+
     def _createContentSafetyTable(self):
         self._cursor().execute("""
         CREATE TABLE contentsafety (
@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+"""
+
+    @author: Fabio Erculiani <lxnay@sabayon.org>
+    @contact: lxnay@sabayon.org
+    @copyright: Fabio Erculiani
+    @license: GPL-2
+
+    B{Entropy ELF objects reader module}.
+
+    Read the dynamic linking metadata of ELF objects (NEEDED, SONAME,
+    RPATH, RUNPATH and dynamic symbols) in-process, using mmap and struct,
+    and resolve their shared library dependencies like the dynamic
+    linker does.
+
+"""
+import collections
+import errno
+import mmap
+import os
+import struct
+import threading
+
+from entropy.const import const_is_python3, const_convert_to_unicode
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+
+_ELF_MAGIC = b"\x7fELF"
+_ELFDATA2LSB = 1
+_ELFDATA2MSB = 2
+
+_SHT_DYNAMIC = 6
+_SHT_DYNSYM = 11
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_HASH = 4
+_DT_STRTAB = 5
+_DT_SYMTAB = 6
+_DT_STRSZ = 10
+_DT_SONAME = 14
+_DT_RPATH = 15
+_DT_RUNPATH = 29
+
+_SHN_UNDEF = 0
+_STB_GLOBAL = 1
+_STB_WEAK = 2
+_STB_GNU_UNIQUE = 10
+_STV_HIDDEN = 2
+_STV_INTERNAL = 1
+
+# struct formats, without byte order, per ELF class:
+# (ELF header, section header, program header, dynamic entry, symbol)
+_FORMATS = {
+    ELFCLASS32: ("HHIIIIIHHHHHH", "IIIIIIIIII", "IIIIIIII", "iI",
+                 "IIIBBH"),
+    ELFCLASS64: ("HHIQQQIHHHHHH", "IIQQQQIIQQ", "IIQQQQQQ", "qQ",
+                 "IBBHQQ"),
+}
+
+
+class ElfObject(object):
+    """
+    Dynamic linking metadata of an ELF object.
+
+    @ivar path: path to the ELF object
+    @ivar elf_class: ELF class (ELFCLASS32 or ELFCLASS64)
+    @ivar machine: ELF machine identifier
+    @ivar needed: NEEDED entries, in order
+    @ivar soname: SONAME, or None
+    @ivar rpath: RPATH entries, in order
+    @ivar runpath: RUNPATH entries, in order
+    @ivar undefined: undefined (not weak) dynamic symbols, frozenset
+    @ivar defined: dynamic symbols exported by the object, frozenset
+    """
+
+    def __init__(self, path, elf_class, machine):
+        self.path = path
+        self.elf_class = elf_class
+        self.machine = machine
+        self.needed = []
+        self.soname = None
+        self.rpath = []
+        self.runpath = []
+        self.undefined = frozenset()
+        self.defined = frozenset()
+
+    def linker_paths(self):
+        """
+        Return the RPATH and RUNPATH entries of the object, with $ORIGIN
+        expanded to the directory containing it.
+
+        @return: list of linker paths
+        @rtype: list
+        """
+        elf_dir = os.path.dirname(self.path)
+        paths = []
+        for path in self.rpath + self.runpath:
+            path = path.replace("${ORIGIN}", elf_dir)
+            path = path.replace("$ORIGIN", elf_dir)
+            if path not in paths:
+                paths.append(path)
+        return paths
+
+
+class _ElfReader(object):
+    """
+    Parse the ELF object mapped in memory.
+    """
+
+    def __init__(self, path, data):
+        self._path = path
+        self._data = data
+        if data[:4] != _ELF_MAGIC:
+            raise ValueError("not an ELF object")
+
+        ident = struct.unpack("BB", data[4:6])
+        elf_class, byte_order = ident
+        if elf_class not in _FORMATS:
+            raise ValueError("unsupported ELF class %s" % (elf_class,))
+        if byte_order == _ELFDATA2LSB:
+            prefix = "<"
+        elif byte_order == _ELFDATA2MSB:
+            prefix = ">"
+        else:
+            raise ValueError("unsupported ELF data encoding")
+
+        self._elf_class = elf_class
+        (ehdr, shdr, phdr, dyn, sym) = _FORMATS[elf_class]
+        self._ehdr = struct.Struct(prefix + ehdr)
+        self._shdr = struct.Struct(prefix + shdr)
+        self._phdr = struct.Struct(prefix + phdr)
+        self._dyn = struct.Struct(prefix + dyn)
+        self._sym = struct.Struct(prefix + sym)
+
+        (self._type, self._machine, _version, _entry, self._phoff,
+         self._shoff, _flags, _ehsize, self._phentsize, self._phnum,
+         self._shentsize, self._shnum, _shstrndx) = self._unpack(
+             self._ehdr, 16)
+
+    def _unpack(self, st, offset):
+        end = offset + st.size
+        if offset < 0 or end > len(self._data):
+            raise ValueError("truncated ELF object")
+        return st.unpack(self._data[offset:end])
+
+    def _string(self, strtab, index):
+        """
+        Return the NUL terminated string at index of the string table
+        located at the given (offset, size).
+        """
+        offset, size = strtab
+        start = offset + index
+        end = self._data.find(b"\0", start, offset + size)
+        if end == -1:
+            raise ValueError("invalid ELF string table")
+        value = self._data[start:end]
+        if const_is_python3():
+            value = const_convert_to_unicode(value)
+        return value
+
+    def _sections(self):
+        sections = []
+        if not self._shoff or self._shentsize < self._shdr.size:
+            return sections
+        for idx in range(self._shnum):
+            sections.append(self._unpack(
+                self._shdr, self._shoff + idx * self._shentsize))
+        return sections
+
+    def _segments(self):
+        segments = []
+        if not self._phoff or self._phentsize < self._phdr.size:
+            return segments
+        for idx in range(self._phnum):
+            segments.append(self._unpack(
+                self._phdr, self._phoff + idx * self._phentsize))
+        return segments
+
+    def _segment_fields(self, segment):
+        # Elf32_Phdr and Elf64_Phdr have different fields order
+        if self._elf_class == ELFCLASS32:
+            (p_type, p_offset, p_vaddr, _paddr, p_filesz, _memsz,
+             _flags, _align) = segment
+        else:
+            (p_type, _flags, p_offset, p_vaddr, _paddr, p_filesz,
+             _memsz, _align) = segment
+        return p_type, p_offset, p_vaddr, p_filesz
+
+    def _dynamic_entries(self, offset, size):
+        entries = []
+        for entry_offset in range(offset, offset + size, self._dyn.size):
+            tag, value = self._unpack(self._dyn, entry_offset)
+            if tag == _DT_NULL:
+                break
+            entries.append((tag, value))
+        return entries
+
+    def read(self, symbols = True):
+        """
+        Return the ElfObject describing the mapped ELF object.
+        """
+        elf_obj = ElfObject(self._path, self._elf_class, self._machine)
+        sections = self._sections()
+
+        dynamic = None
+        dynsym = None
+        for section in sections:
+            sh_type, sh_offset, sh_size, sh_link, sh_entsize = \
+                section[1], section[4], section[5], section[6], section[9]
+            if sh_type == _SHT_DYNAMIC and dynamic is None:
+                dynamic = (sh_offset, sh_size, sh_link)
+            elif sh_type == _SHT_DYNSYM and dynsym is None:
+                dynsym = (sh_offset, sh_size, sh_link, sh_entsize)
+
+        strtab = None
+        if dynamic is not None:
+            offset, size, link = dynamic
+            entries = self._dynamic_entries(offset, size)
+            if link < len(sections):
+                strtab = (sections[link][4], sections[link][5])
+        else:
+            # no section headers (sstrip), use the program headers
+            entries, strtab = self._segment_dynamic()
+            if entries is None:
+                # statically linked
+                return elf_obj
+
+        if strtab is None:
+            raise ValueError("ELF string table not found")
+
+        for tag, value in entries:
+            if tag == _DT_NEEDED:
+                elf_obj.needed.append(self._string(strtab, value))
+            elif tag == _DT_SONAME:
+                elf_obj.soname = self._string(strtab, value)
+            elif tag == _DT_RPATH:
+                elf_obj.rpath.extend(
+                    [x for x in self._string(strtab, value).split(":") if x])
+            elif tag == _DT_RUNPATH:
+                elf_obj.runpath.extend(
+                    [x for x in self._string(strtab, value).split(":") if x])
+
+        if symbols and dynsym is not None:
+            offset, size, link, entsize = dynsym
+            sym_strtab = strtab
+            if link < len(sections):
+                sym_strtab = (sections[link][4], sections[link][5])
+            self._read_symbols(elf_obj, offset, size, entsize, sym_strtab)
+
+        return elf_obj
+
+    def _segment_dynamic(self):
+        """
+        Read the dynamic section through the PT_DYNAMIC segment, return
+        its entries and the (offset, size) of its string table.
+        """
+        loads = []
+        dynamic = None
+        for segment in self._segments():
+            p_type, p_offset, p_vaddr, p_filesz = \
+                self._segment_fields(segment)
+            if p_type == _PT_LOAD:
+                loads.append((p_vaddr, p_offset, p_filesz))
+            elif p_type == _PT_DYNAMIC:
+                dynamic = (p_offset, p_filesz)
+        if dynamic is None:
+            return None, None
+
+        entries = self._dynamic_entries(*dynamic)
+        values = dict(entries)
+        str_vaddr = values.get(_DT_STRTAB)
+        str_size = values.get(_DT_STRSZ)
+        if str_vaddr is None or str_size is None:
+            return entries, None
+        for p_vaddr, p_offset, p_filesz in loads:
+            if p_vaddr <= str_vaddr < p_vaddr + p_filesz:
+                return entries, (str_vaddr - p_vaddr + p_offset, str_size)
+        return entries, None
+
+    def _read_symbols(self, elf_obj, offset, size, entsize, strtab):
+        if entsize < self._sym.size:
+            entsize = self._sym.size
+        undefined = set()
+        defined = set()
+        class32 = self._elf_class == ELFCLASS32
+
+        # the first symbol is always the undefined, empty, one
+        for sym_offset in range(offset + entsize, offset + size, entsize):
+            fields = self._unpack(self._sym, sym_offset)
+            if class32:
+                st_name, _value, _size, st_info, st_other, st_shndx = fields
+            else:
+                st_name, st_info, st_other, st_shndx, _value, _size = fields
+            if not st_name:
+                continue
+
+            binding = st_info >> 4
+            if st_shndx == _SHN_UNDEF:
+                if binding == _STB_GLOBAL:
+                    undefined.add(self._string(strtab, st_name))
+                continue
+
+            if binding not in (_STB_GLOBAL, _STB_WEAK, _STB_GNU_UNIQUE):
+                continue
+            if (st_other & 0x3) in (_STV_HIDDEN, _STV_INTERNAL):
+                continue
+            defined.add(self._string(strtab, st_name))
+
+        elf_obj.undefined = frozenset(undefined)
+        elf_obj.defined = frozenset(defined)
+
+
+def read_elf(elf_file, symbols = True):
+    """
+    Read the dynamic linking metadata of the given ELF object.
+
+    @param elf_file: path to ELF object
+    @type elf_file: string
+    @keyword symbols: also read the dynamic symbols
+    @type symbols: bool
+    @return: the ELF object metadata
+    @rtype: ElfObject
+    @raise ValueError: if the file is not a valid ELF object
+    @raise IOError: if the file cannot be read
+    """
+    with open(elf_file, "rb") as elf_f:
+        try:
+            data = mmap.mmap(elf_f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (mmap.error, ValueError, OverflowError):
+            # empty file, or not mmap-able
+            raise ValueError("not an ELF object")
+        try:
+            return _ElfReader(elf_file, data).read(symbols = symbols)
+        except struct.error:
+            raise ValueError("truncated ELF object")
+        finally:
+            data.close()
+
+
+def read_elfs(elf_files, symbols = True):
+    """
+    Read the dynamic linking metadata of many ELF objects at once.
+    Files that are not ELF objects or cannot be read are mapped to None.
+
+    @param elf_files: list of paths to ELF objects
+    @type elf_files: iterable
+    @keyword symbols: also read the dynamic symbols
+    @type symbols: bool
+    @return: dict composed by path as key and ElfObject (or None) as value
+    @rtype: dict
+    """
+    elf_objs = {}
+    for elf_file in elf_files:
+        try:
+            elf_objs[elf_file] = read_elf(elf_file, symbols = symbols)
+        except ValueError:
+            elf_objs[elf_file] = None
+        except (IOError, OSError) as err:
+            if err.errno not in (errno.ENOENT, errno.EACCES, errno.EISDIR,
+                                 errno.ENOTDIR):
+                raise
+            elf_objs[elf_file] = None
+    return elf_objs
+
+
+class ElfLinker(object):
+    """
+    Resolve the shared library dependencies of ELF objects using the
+    given dynamic linker paths, like ld.so does, without running it.
+    Parsed libraries are cached (by path, size and mtime) and shared
+    among instances, because the same libraries (libc, ...) are required
+    by almost every ELF object.
+    """
+
+    _CACHE = {}
+    _CACHE_LOCK = threading.Lock()
+    _CACHE_MAX = 4096
+
+    def __init__(self, ld_paths):
+        """
+        ElfLinker constructor.
+
+        @param ld_paths: dynamic linker paths (ld.so.conf and builtins)
+        @type ld_paths: list
+        """
+        self._ld_paths = list(ld_paths)
+
+    @classmethod
+    def _library(cls, path):
+        """
+        Return the (cached) ElfObject of the library at path, or None.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (path, st.st_size, st.st_mtime, st.st_ino)
+        with cls._CACHE_LOCK:
+            if key in cls._CACHE:
+                return cls._CACHE[key]
+
+        elf_obj = read_elfs([path]).get(path)
+        with cls._CACHE_LOCK:
+            if len(cls._CACHE) >= cls._CACHE_MAX:
+                cls._CACHE.clear()
+            cls._CACHE[key] = elf_obj
+        return elf_obj
+
+    def resolve(self, library, requiring, loader = None):
+        """
+        Resolve the given NEEDED entry of the requiring ELF object.
+
+        @param library: NEEDED entry
+        @type library: string
+        @param requiring: ElfObject requiring the library
+        @type requiring: ElfObject
+        @keyword loader: ElfObject of the executable loading requiring,
+            if any, its RPATH is also considered.
+        @type loader: ElfObject
+        @return: the resolved library ElfObject, or None
+        @rtype: ElfObject
+        """
+        if "/" in library:
+            candidates = [library]
+        else:
+            search_paths = []
+            if not requiring.runpath:
+                search_paths += requiring.linker_paths()
+                if loader is not None and loader is not requiring \
+                        and not loader.runpath:
+                    search_paths += loader.linker_paths()
+            else:
+                search_paths += requiring.linker_paths()
+            search_paths += self._ld_paths
+            candidates = [os.path.join(x, library) for x in search_paths]
+
+        for candidate in candidates:
+            elf_obj = self._library(candidate)
+            if elf_obj is None:
+                continue
+            if elf_obj.elf_class != requiring.elf_class:
+                continue
+            if elf_obj.machine != requiring.machine:
+                continue
+            return elf_obj
+        return None
+
+    def dependencies(self, elf_obj):
+        """
+        Return the shared library dependencies graph of the given ELF
+        object, in breadth-first order, as list of (NEEDED entry,
+        resolved ElfObject or None) tuples, each NEEDED entry listed once.
+
+        @param elf_obj: ELF object
+        @type elf_obj: ElfObject
+        @return: list of (library, ElfObject) tuples
+        @rtype: list
+        """
+        outcome = []
+        seen = set()
+        queue = collections.deque([elf_obj])
+        while queue:
+            requiring = queue.popleft()
+            for library in requiring.needed:
+                if library in seen:
+                    continue
+                seen.add(library)
+                resolved = self.resolve(library, requiring, loader = elf_obj)
+                outcome.append((library, resolved))
+                if resolved is not None:
+                    queue.append(resolved)
+        return outcome
+
+    def broken_symbols(self, elf_obj):
+        """
+        Return the undefined symbols of the given ELF object, and of its
+        dependencies, that no object in the dependencies graph provides.
+
+        @param elf_obj: ELF object, read with symbols
+        @type elf_obj: ElfObject
+        @return: set of unresolved symbols
+        @rtype: set
+        """
+        objs = [elf_obj]
+        objs += [x for _lib, x in self.dependencies(elf_obj) if x is not None]
+
+        broken = set()
+        for obj in objs:
+            for symbol in obj.undefined:
+                for provider in objs:
+                    if symbol in provider.defined:
+                        break
+                else:
+                    broken.add(symbol)
+        return broken
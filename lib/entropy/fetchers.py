@@ -19,11 +19,13 @@ except ImportError:
     # python 3.x
     import http.client as httplib
 import hashlib
+import io
 import socket
 import pty
 import subprocess
 import threading
 import contextlib
+from collections import deque
 
 from entropy.const import const_is_python3, const_file_readable
 
@@ -37,16 +39,304 @@ else:
 from entropy.exceptions import InterruptError
 from entropy.tools import print_traceback, \
     convert_seconds_to_fancy_output, bytes_into_human, spliturl, \
-    add_proxy_opener, md5sum
+    build_proxy_opener, md5sum
 from entropy.const import etpConst, const_isfileobj, const_debug_write
 from entropy.output import TextInterface, darkblue, darkred, purple, blue, \
     brown, darkgreen, red
 
 from entropy.i18n import _, ngettext
 from entropy.misc import ParallelTask
+from entropy.core import Singleton
 from entropy.core.settings.base import SystemSettings
 
 
+class _PooledResponseFile(object):
+
+    """
+    File object wrapping a httplib.HTTPResponse read from a pooled
+    connection. The connection is handed back to UrlConnectionPool as
+    soon as the response body has been entirely consumed, or discarded
+    if the response is closed before that.
+    """
+
+    def __init__(self, pool, key, connection, response):
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self._buf = b""
+
+    def _check_done(self):
+        response = self._response
+        if response is not None and response.isclosed():
+            self._response = None
+            self._pool.release(self._key, self._connection,
+                               reusable = not response.will_close)
+            self._connection = None
+
+    def read(self, amt = None):
+        data = self._buf
+        if amt is None:
+            self._buf = b""
+            if self._response is not None:
+                data += self._response.read()
+        elif len(data) >= amt:
+            self._buf = data[amt:]
+            return data[:amt]
+        else:
+            self._buf = b""
+            if self._response is not None:
+                data += self._response.read(amt - len(data))
+        self._check_done()
+        return data
+
+    def readline(self, limit = -1):
+        while (b"\n" not in self._buf) and (self._response is not None):
+            if limit >= 0 and len(self._buf) >= limit:
+                break
+            chunk = self._response.read(8192)
+            self._check_done()
+            if not chunk:
+                break
+            self._buf += chunk
+
+        idx = self._buf.find(b"\n") + 1
+        if idx == 0:
+            idx = len(self._buf)
+        if limit >= 0:
+            idx = min(idx, limit)
+        line, self._buf = self._buf[:idx], self._buf[idx:]
+        return line
+
+    def readlines(self):
+        lines = []
+        line = self.readline()
+        while line:
+            lines.append(line)
+            line = self.readline()
+        return lines
+
+    def fileno(self):
+        # the socket is shared with the buffered response,
+        # reading from it directly would lose data.
+        raise io.UnsupportedOperation("fileno")
+
+    def close(self):
+        self._buf = b""
+        response = self._response
+        if response is None:
+            return
+        # the response has not been entirely read, the connection
+        # cannot be used for other requests.
+        self._response = None
+        try:
+            response.close()
+        finally:
+            self._pool.release(self._key, self._connection,
+                               reusable = False)
+            self._connection = None
+
+
+class UrlConnectionPool(Singleton):
+
+    """
+    Process-wide pool of persistent (keep-alive) HTTP and HTTPS
+    connections, shared by all the UrlFetcher instances through the
+    urllib handlers returned by handlers(). Connections are bound to the
+    (protocol, host, proxy tunnel) tuple and handed out to one request
+    at a time.
+    """
+
+    # maximum amount of idle connections kept per host.
+    MAX_IDLE_CONNECTIONS = 4
+    # seconds after which an idle connection is closed, most HTTP
+    # servers drop keep-alive connections after a few seconds.
+    IDLE_TIMEOUT = 15.0
+
+    def init_singleton(self):
+        """
+        Singleton overloaded method. Equals to __init__.
+        """
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def handlers(self):
+        """
+        Return the urllib handlers that route HTTP and HTTPS requests
+        through this pool.
+
+        @return: list of urllib handler instances
+        @rtype: list
+        """
+        handlers = [_KeepAliveHTTPHandler()]
+        if _KeepAliveHTTPSHandler is not None:
+            handlers.append(_KeepAliveHTTPSHandler())
+        return handlers
+
+    def acquire(self, key):
+        """
+        Return an idle connection bound to the given key, if any.
+
+        @param key: connection key
+        @type key: tuple
+        @return: a httplib connection or None
+        @rtype: httplib.HTTPConnection or None
+        """
+        expired = []
+        connection = None
+        cur_t = time.time()
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                conn, release_t = connections.pop()
+                if cur_t - release_t > self.IDLE_TIMEOUT:
+                    expired.append(conn)
+                    continue
+                connection = conn
+                break
+
+        for conn in expired:
+            conn.close()
+        return connection
+
+    def release(self, key, connection, reusable = True):
+        """
+        Hand the given connection back to the pool.
+
+        @param key: connection key
+        @type key: tuple
+        @param connection: the connection
+        @type connection: httplib.HTTPConnection
+        @keyword reusable: if False, the connection is closed
+        @type reusable: bool
+        """
+        if reusable:
+            with self._lock:
+                connections = self._idle.setdefault(key, [])
+                if len(connections) < self.MAX_IDLE_CONNECTIONS:
+                    connections.append((connection, time.time()))
+                    return
+        connection.close()
+
+    def clear(self):
+        """
+        Close all the idle connections.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for conn, _release_t in connections:
+                conn.close()
+
+    def open(self, http_class, req, **http_conn_args):
+        """
+        Execute the given urllib request using a pooled connection, this
+        is the pooled version of urllib AbstractHTTPHandler.do_open().
+
+        @param http_class: httplib connection class
+        @type http_class: httplib.HTTPConnection subclass
+        @param req: urllib request
+        @type req: urllib Request
+        @return: urllib response object
+        @rtype: addinfourl
+        """
+        if const_is_python3():
+            host, selector = req.host, req.selector
+        else:
+            host, selector = req.get_host(), req.get_selector()
+        if not host:
+            raise urlmod_error.URLError("no host given")
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers["Connection"] = "keep-alive"
+        headers = dict(
+            (name.title(), val) for name, val in headers.items())
+
+        tunnel_host = getattr(req, "_tunnel_host", None)
+        tunnel_headers = {}
+        if tunnel_host:
+            proxy_auth_hdr = "Proxy-Authorization"
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers[proxy_auth_hdr]
+                # Proxy-Authorization should not be sent to origin
+                # server.
+                del headers[proxy_auth_hdr]
+
+        key = (http_class, host, tunnel_host)
+        connection = self.acquire(key)
+        reused = connection is not None
+
+        while True:
+            if connection is None:
+                connection = http_class(
+                    host, timeout = req.timeout, **http_conn_args)
+                if tunnel_host:
+                    connection.set_tunnel(tunnel_host,
+                                          headers = tunnel_headers)
+            elif req.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                connection.timeout = req.timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(req.timeout)
+
+            try:
+                connection.request(req.get_method(), selector,
+                                   req.data, headers)
+                try:
+                    response = connection.getresponse(buffering = True)
+                except TypeError: # buffering kw not supported
+                    response = connection.getresponse()
+
+            except socket.timeout:
+                connection.close()
+                raise
+
+            except (socket.error, httplib.HTTPException) as err:
+                connection.close()
+                if reused:
+                    # keep-alive connection closed by the remote end
+                    # in the meantime, retry with a new one.
+                    connection = None
+                    reused = False
+                    continue
+                if isinstance(err, socket.error):
+                    raise urlmod_error.URLError(err)
+                raise
+
+            break
+
+        fp = _PooledResponseFile(self, key, connection, response)
+        resp = urlmod.addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+
+class _KeepAliveHTTPHandler(urlmod.HTTPHandler):
+
+    def http_open(self, req):
+        return UrlConnectionPool().open(httplib.HTTPConnection, req)
+
+
+if hasattr(urlmod, "HTTPSHandler"):
+
+    class _KeepAliveHTTPSHandler(urlmod.HTTPSHandler):
+
+        def https_open(self, req):
+            http_conn_args = {}
+            context = getattr(self, "_context", None)
+            if context is not None:
+                http_conn_args['context'] = context
+            return UrlConnectionPool().open(
+                httplib.HTTPSConnection, req, **http_conn_args)
+
+else:
+    # Python built without SSL support
+    _KeepAliveHTTPSHandler = None
+
+
 class UrlFetcher(TextInterface):
 
     """
@@ -231,7 +521,8 @@ class UrlFetcher(TextInterface):
         else:
             self.__resumed = False
 
-    def __encode_url(self, url):
+    @staticmethod
+    def _encode_url(url):
         if const_is_python3():
             import urllib.parse as encurl
         else:
@@ -240,6 +531,18 @@ class UrlFetcher(TextInterface):
             encurl.quote(os.path.basename(url)))
         return url
 
+    @staticmethod
+    def _user_agent(url):
+        uname = os.uname()
+        return "Entropy/%s (compatible; %s; %s: %s %s %s)" % (
+            etpConst['entropyversion'],
+            "Entropy",
+            os.path.basename(url),
+            uname[0],
+            uname[4],
+            uname[2],
+        )
+
     def __prepare_return(self):
         if self.__checksum:
             if self.__use_md5_checksum:
@@ -544,9 +847,15 @@ class UrlFetcher(TextInterface):
             except OSError:
                 pass
 
-    def _setup_urllib_proxy(self):
+    def _build_urllib_opener(self):
         """
-        Setup urllib proxy data
+        Build the urllib opener used by this fetcher. It applies the proxy
+        settings and routes HTTP(S) requests through the persistent
+        connections of UrlConnectionPool. The opener is not installed
+        into the urllib module, so it does not affect other urllib users.
+
+        @return: the urllib opener
+        @rtype: urllib OpenerDirector
         """
         mydict = {}
         proxy_data = self.__system_settings['system']['proxy']
@@ -557,30 +866,20 @@ class UrlFetcher(TextInterface):
         if mydict:
             mydict['username'] = proxy_data['username']
             mydict['password'] = proxy_data['password']
-            add_proxy_opener(urlmod, mydict)
-        else:
-            # unset
-            urlmod._opener = None
+        return build_proxy_opener(urlmod, mydict,
+            handlers = UrlConnectionPool().handlers())
 
     def _urllib_download(self):
         """
         urrlib2 based downloader. This is the default for HTTP and FTP urls.
         """
-        self._setup_urllib_proxy()
+        opener = self._build_urllib_opener()
         self.__setup_urllib_resume_support()
         # we're going to feed the md5 digestor on the way.
         self.__use_md5_checksum = True
-        url = self.__encode_url(self.__url)
+        url = UrlFetcher._encode_url(self.__url)
         url_protocol = UrlFetcher._get_url_protocol(self.__url)
-        uname = os.uname()
-        user_agent = "Entropy/%s (compatible; %s; %s: %s %s %s)" % (
-            etpConst['entropyversion'],
-            "Entropy",
-            os.path.basename(url),
-            uname[0],
-            uname[4],
-            uname[2],
-        )
+        user_agent = UrlFetcher._user_agent(url)
 
         if url_protocol in ("http", "https"):
             headers = {'User-Agent': user_agent,}
@@ -594,7 +893,7 @@ class UrlFetcher(TextInterface):
 
             # get file size if available
             try:
-                self.__remotefile = urlmod.urlopen(req, None, self.__timeout)
+                self.__remotefile = opener.open(req, None, self.__timeout)
             except KeyboardInterrupt:
                 self.__urllib_close(False)
                 raise
@@ -690,7 +989,7 @@ class UrlFetcher(TextInterface):
                     self.__remotefile.close()
                 except:
                     pass
-                self.__remotefile = urlmod.urlopen(
+                self.__remotefile = opener.open(
                     request, None, self.__timeout)
 
             elif self.__startingposition == self.__remotesize:
@@ -969,6 +1268,719 @@ class UrlFetcher(TextInterface):
             self._push_progress_to_output()
 
 
+class _SegmentMirror(object):
+
+    """
+    Per-mirror state of a SegmentedUrlFetcher download.
+    """
+
+    ACTIVE = "active"
+    DEMOTED = "demoted"
+    FAILED = "failed"
+
+    def __init__(self, url):
+        self.url = url
+        self.status = _SegmentMirror.ACTIVE
+        self.error = None
+        self.downloaded = 0
+        self.rate = 0.0
+        self.started = None
+        self._last_update_time = None
+        self._last_downloaded = 0
+        self.last_demotion_check = 0.0
+
+    def account(self, size):
+        """
+        Account the given amount of bytes as received from this mirror
+        and refresh the throughput estimation (bytes/sec).
+        """
+        cur_time = time.time()
+        if self.started is None:
+            self.started = cur_time
+            self._last_update_time = cur_time
+        self.downloaded += size
+
+        last_elapsed = cur_time - self._last_update_time
+        if last_elapsed >= 1.0:
+            delta = self.downloaded - self._last_downloaded
+            self.rate = 0.5 * self.rate + 0.5 * (delta / last_elapsed)
+            self._last_update_time = cur_time
+            self._last_downloaded = self.downloaded
+
+    def elapsed(self):
+        """
+        Return the amount of seconds this mirror has been transferring data.
+        """
+        if self.started is None:
+            return 0.0
+        return time.time() - self.started
+
+
+class SegmentedUrlFetcher(TextInterface):
+
+    """
+    Entropy multi-mirror URL fetcher. The file is split into byte ranges
+    that are fetched concurrently, through HTTP Range requests, from
+    several mirrors carrying the very same file. The throughput of every
+    mirror is tracked while data flows and mirrors that turn out to be
+    much slower than the fastest one are demoted mid-transfer: the byte
+    range they were working on is handed back to the remaining mirrors.
+    Whenever the file is too small to be split or the primary mirror does
+    not support byte ranges, the download falls back to a plain UrlFetcher
+    against the primary mirror.
+    """
+
+    _supported_protocols = ("http", "https")
+
+    # a mirror is demoted when its throughput is lower than this
+    # fraction of the fastest mirror one.
+    DEMOTION_RATIO = 0.25
+    # seconds a mirror must have been transferring data for before
+    # being considered for demotion.
+    DEMOTION_GRACE_TIME = 5.0
+
+    def __init__(self, urls, path_to_save, checksum = True,
+                 show_speed = True, resume = True,
+                 abort_check_func = None, disallow_redirect = False,
+                 thread_stop_func = None, speed_limit = None,
+                 timeout = None, download_context_func = None,
+                 pre_download_hook = None, post_download_hook = None,
+                 segment_size = None, max_connections = None,
+                 url_fetcher_class = None):
+        """
+        Entropy multi-mirror URL downloader constructor.
+
+        @param urls: list of download URLs pointing to the same file,
+            the first one is the primary mirror (do not URL-encode them!)
+        @type urls: list
+        @param path_to_save: file path where to save downloaded data
+        @type path_to_save: string
+        @keyword segment_size: size of the byte ranges, in bytes, if None
+            the value is read from Entropy configuration files.
+        @type segment_size: int
+        @keyword max_connections: maximum number of mirrors used
+            concurrently, if None the value is read from Entropy
+            configuration files.
+        @type max_connections: int
+        @keyword url_fetcher_class: UrlFetcher based class to use when
+            the download cannot be segmented
+        @type url_fetcher_class: subclass of UrlFetcher
+
+        See UrlFetcher constructor for the other arguments.
+        """
+        self.__system_settings = SystemSettings()
+        if speed_limit == None:
+            speed_limit = \
+                self.__system_settings['repositories']['transfer_limit']
+        if timeout is None:
+            timeout = self.__system_settings['repositories']['timeout']
+        if segment_size is None:
+            segment_size = self.__system_settings['repositories'][
+                'download_segment_size']
+        if max_connections is None:
+            max_connections = self.__system_settings['repositories'][
+                'segmented_download']
+        if url_fetcher_class is None:
+            url_fetcher_class = UrlFetcher
+
+        if download_context_func is None:
+            @contextlib.contextmanager
+            def download_context_func(path):
+                yield
+
+        self.__th_id = 0
+        self.__urls = list(urls)
+        self.__path_to_save = path_to_save
+        self.__checksum = checksum
+        self.__show_speed = show_speed
+        self.__resume = resume
+        self.__abort_check_func = abort_check_func
+        self.__thread_stop_func = thread_stop_func
+        self.__disallow_redirect = disallow_redirect
+        self.__speedlimit = speed_limit # kbytes/sec
+        self.__timeout = timeout
+        self.__download_context_func = download_context_func
+        self.__pre_download_hook = pre_download_hook
+        self.__post_download_hook = post_download_hook
+        self.__segment_size = max(segment_size, 1)
+        self.__max_connections = max(max_connections, 1)
+        self.__opener = None
+
+        class FallbackFetcher(url_fetcher_class):
+
+            def __init__(self, segmented, *args, **kwargs):
+                url_fetcher_class.__init__(self, *args, **kwargs)
+                self.__segmented_fetcher = segmented
+
+            def update(self):
+                return self.__segmented_fetcher.update()
+
+            def _push_progress_to_output(self, *args):
+                return
+
+            def handle_statistics(self, *args, **kwargs):
+                return self.__segmented_fetcher.handle_statistics(
+                    *args, **kwargs)
+
+        # the download context and hooks are handled by download()
+        self.__fallback = FallbackFetcher(
+            self, self.__urls[0], path_to_save, checksum = checksum,
+            show_speed = show_speed, resume = resume,
+            abort_check_func = abort_check_func,
+            disallow_redirect = disallow_redirect,
+            thread_stop_func = thread_stop_func,
+            speed_limit = speed_limit, timeout = timeout)
+        self.__fallback_used = False
+
+        self._init_vars()
+
+    def _init_vars(self):
+        self.__lock = threading.Lock()
+        self.__pending = deque()
+        self.__inflight = 0
+        self.__written = []
+        self.__stop = False
+        self.__mirrors = []
+        self.__localfile = None
+        self.__remotesize = 0
+        self.__startingposition = 0
+        self.__downloadedsize = 0
+        self.__average = 0
+        self.__oldaverage = 0.0
+        self.__datatransfer = 0
+        self.__time_remaining = "(infinite)"
+        self.__time_remaining_secs = 0
+        self.__updatestep = 0.2
+        self.__starttime = time.time()
+        self.__last_output_time = self.__starttime
+        self.__resumed = False
+        self.__fallback_used = False
+        self.__existed_before = os.path.lexists(self.__path_to_save)
+
+    @classmethod
+    def supports_segmented_download(cls, url):
+        """
+        Return whether the given URL can be part of a segmented download.
+
+        @param url: download URL
+        @type url: string
+        @return: segmented download support status
+        @rtype: bool
+        """
+        protocol = UrlFetcher._get_url_protocol(url)
+        return protocol in cls._supported_protocols
+
+    def set_id(self, th_id):
+        """
+        Set instance id (usually the thread identifier).
+        @param th_id: id to set
+        @type th_id: int
+        """
+        self.__th_id = th_id
+        self.__fallback.set_id(th_id)
+
+    def download(self):
+        """
+        Start downloading the URLs given at construction time.
+
+        @return: download status, see UrlFetcher.download()
+        @rtype: string
+        """
+        const_debug_write(
+            __name__,
+            "SegmentedUrlFetcher.download(%s), save: %s, checksum: %s, "
+            "resume: %s, segment size: %s, max connections: %s" % (
+                self.__urls, self.__path_to_save, self.__checksum,
+                self.__resume, self.__segment_size, self.__max_connections)
+        )
+
+        self._init_vars()
+        with self.__download_context_func(self.__path_to_save):
+
+            if self.__pre_download_hook:
+                status = self.__pre_download_hook(
+                    self.__path_to_save, self.__th_id)
+                if status is not None:
+                    return status
+
+            status = self._segmented_download()
+            if self.__show_speed:
+                self.update()
+
+            if self.__post_download_hook:
+                self.__post_download_hook(
+                    self.__path_to_save, status, self.__th_id)
+
+            return status
+
+    def __open(self, url, start, end):
+        """
+        Open a HTTP Range request for the [start, end) byte range of the
+        given URL. Return the remote file object and the whole remote
+        file size (as advertised by the Content-Range header).
+        Raise IOError if the mirror does not honour the request.
+        """
+        url = UrlFetcher._encode_url(url)
+        headers = {
+            'User-Agent': UrlFetcher._user_agent(url),
+            'Range': "bytes=%d-%d" % (start, end - 1),
+        }
+        request = urlmod.Request(url, headers = headers)
+        remotefile = self.__opener.open(request, None, self.__timeout)
+
+        try:
+            if remotefile.getcode() != 206:
+                raise IOError("byte ranges not supported")
+            if self.__disallow_redirect and (url != remotefile.geturl()):
+                raise IOError("redirect not allowed")
+
+            # Content-Range: bytes <start>-<end>/<size>
+            content_range = remotefile.headers.get("content-range", "")
+            try:
+                unit, content_range = content_range.split(" ", 1)
+                byte_range, size = content_range.split("/", 1)
+                range_start = int(byte_range.split("-", 1)[0])
+                size = int(size)
+            except ValueError:
+                raise IOError("invalid Content-Range header")
+            if unit != "bytes" or range_start != start:
+                raise IOError("unexpected Content-Range header")
+        except:
+            remotefile.close()
+            raise
+
+        return remotefile, size
+
+    def __probe(self):
+        """
+        Return the size of the remote file if the primary mirror supports
+        byte ranges, None otherwise.
+        """
+        try:
+            remotefile, size = self.__open(self.__urls[0], 0, 1)
+        except KeyboardInterrupt:
+            raise
+        except (IOError, OSError, ValueError, httplib.HTTPException,
+                socket.error, urlmod_error.URLError):
+            return None
+        try:
+            remotefile.close()
+        except socket.error:
+            pass
+        return size
+
+    def __fallback_download(self):
+        self.__fallback_used = True
+        return self.__fallback.download()
+
+    def _segmented_download(self):
+        """
+        Multi-mirror, segmented downloader.
+        """
+        self.__opener = self.__fallback._build_urllib_opener()
+
+        urls = [x for x in self.__urls if \
+                    self.supports_segmented_download(x)]
+        if (len(urls) < 2) or (urls[0] != self.__urls[0]):
+            return self.__fallback_download()
+
+        remotesize = self.__probe()
+        if remotesize is None or remotesize < self.__segment_size * 2:
+            return self.__fallback_download()
+        self.__remotesize = remotesize
+
+        tmp_path = self.__path_to_save + ".segments"
+        try:
+            starting_position = 0
+            if self.__resume and os.path.isfile(self.__path_to_save):
+                starting_position = os.path.getsize(self.__path_to_save)
+
+            if starting_position == remotesize:
+                # all fine then!
+                return self.__prepare_return(self.__path_to_save)
+
+            if 0 < starting_position < remotesize:
+                os.rename(self.__path_to_save, tmp_path)
+                self.__localfile = open(tmp_path, "r+b")
+                self.__resumed = True
+                self.__written.append((0, starting_position))
+            else:
+                starting_position = 0
+                self.__localfile = open(tmp_path, "wb")
+            self.__localfile.truncate(remotesize)
+
+        except (IOError, OSError) as err:
+            const_debug_write(
+                __name__,
+                "SegmentedUrlFetcher: cannot setup %s: %s" % (
+                    tmp_path, err))
+            self.__close_localfile()
+            return UrlFetcher.GENERIC_FETCH_ERROR
+
+        self.__startingposition = starting_position
+        self.__downloadedsize = starting_position
+        for start in range(starting_position, remotesize,
+                           self.__segment_size):
+            end = min(start + self.__segment_size, remotesize)
+            self.__pending.append((start, end))
+
+        self.__mirrors = [_SegmentMirror(x) for x in \
+                              urls[:self.__max_connections]]
+        workers = []
+        for mirror in self.__mirrors:
+            t = ParallelTask(self.__mirror_worker, mirror)
+            t.name = "SegmentedUrlFetcher{%s}" % (mirror.url,)
+            t.daemon = True
+            workers.append(t)
+            t.start()
+
+        # wait until all the workers are done,
+        # checking for abort requests in the meantime.
+        try:
+            while workers:
+                workers[0].join(0.3)
+                workers = [x for x in workers if x.is_alive()]
+
+                if self.__abort_check_func != None:
+                    self.__abort_check_func()
+                if self.__thread_stop_func != None:
+                    self.__thread_stop_func()
+
+                self.__update_progress()
+        except:
+            with self.__lock:
+                self.__stop = True
+            for t in workers:
+                t.join()
+            self.__segmented_close(tmp_path, True)
+            raise
+
+        self.__update_progress()
+        if self.__pending:
+            # all the mirrors failed or have been demoted
+            self.__segmented_close(tmp_path, True)
+            errors = [x.error for x in self.__mirrors]
+            if errors and all(isinstance(x, socket.timeout) for x in errors):
+                return UrlFetcher.TIMEOUT_FETCH_ERROR
+            return UrlFetcher.GENERIC_FETCH_ERROR
+
+        if not self.__segmented_close(tmp_path, False):
+            return UrlFetcher.GENERIC_FETCH_ERROR
+        return self.__prepare_return(self.__path_to_save)
+
+    def __prepare_return(self, path):
+        if self.__checksum:
+            # segments arrive out of order, the md5 cannot be
+            # calculated on the way.
+            return md5sum(path)
+        return UrlFetcher.GENERIC_FETCH_WARN
+
+    def __close_localfile(self):
+        if const_isfileobj(self.__localfile):
+            try:
+                self.__localfile.flush()
+                self.__localfile.close()
+            except (IOError, OSError):
+                pass
+        self.__localfile = None
+
+    def __segmented_close(self, tmp_path, errored):
+        """
+        Close the temporary file and move it to the final location.
+        On error, only the contiguous amount of data written from the
+        beginning of the file is kept (if resume is enabled), so that
+        the download can be resumed later.
+        Return True if the file has been moved successfully.
+        """
+        self.__close_localfile()
+
+        keep_size = self.__remotesize
+        if errored:
+            keep_size = 0
+            if self.__resume:
+                for start, end in sorted(self.__written):
+                    if start > keep_size:
+                        break
+                    keep_size = max(keep_size, end)
+
+        try:
+            if keep_size > 0:
+                if errored:
+                    with open(tmp_path, "r+b") as tmp_f:
+                        tmp_f.truncate(keep_size)
+                os.rename(tmp_path, self.__path_to_save)
+                return True
+            os.remove(tmp_path)
+        except (IOError, OSError) as err:
+            const_debug_write(
+                __name__,
+                "SegmentedUrlFetcher: cannot finalize %s: %s" % (
+                    tmp_path, err))
+        return False
+
+    def __next_segment(self, mirror):
+        """
+        Return the next byte range the given mirror should fetch,
+        or None if the mirror should quit. Idle mirrors wait while
+        other mirrors are busy, because byte ranges of demoted and
+        failed mirrors are pushed back to the queue. Demoted mirrors
+        wait as well and are used again if all the other mirrors fail.
+        """
+        while True:
+            with self.__lock:
+                if self.__stop or (mirror.status == _SegmentMirror.FAILED):
+                    return None
+                if not (self.__pending or self.__inflight):
+                    return None
+
+                if mirror.status == _SegmentMirror.DEMOTED:
+                    active = [x for x in self.__mirrors if \
+                                  x.status == _SegmentMirror.ACTIVE]
+                    if not active:
+                        # slow is better than nothing
+                        const_debug_write(
+                            __name__,
+                            "SegmentedUrlFetcher: promoting mirror %s "
+                            "back, no other mirrors left" % (mirror.url,))
+                        mirror.status = _SegmentMirror.ACTIVE
+
+                if mirror.status == _SegmentMirror.ACTIVE and \
+                        self.__pending:
+                    self.__inflight += 1
+                    return self.__pending.popleft()
+            time.sleep(0.1)
+
+    def __mirror_worker(self, mirror):
+        while True:
+            segment = self.__next_segment(mirror)
+            if segment is None:
+                break
+
+            start, end = segment
+            position = start
+            try:
+                position = self.__fetch_segment(mirror, start, end)
+            finally:
+                with self.__lock:
+                    self.__inflight -= 1
+                    if position > start:
+                        self.__written.append((start, position))
+                    if position < end:
+                        # hand the rest of the range back to
+                        # the other mirrors.
+                        self.__pending.appendleft((position, end))
+
+    def __fetch_segment(self, mirror, start, end):
+        """
+        Fetch the [start, end) byte range from the given mirror and
+        write it into the local file. Return the position reached.
+        """
+        position = start
+        remotefile = None
+        try:
+            remotefile, size = self.__open(mirror.url, start, end)
+            if size != self.__remotesize:
+                # stale mirror
+                raise IOError("remote size mismatch: %s != %s" % (
+                        size, self.__remotesize))
+
+            while position < end:
+                if self.__stop:
+                    break
+                data = remotefile.read(min(8192, end - position))
+                if not data:
+                    raise IOError("short read")
+
+                with self.__lock:
+                    self.__localfile.seek(position)
+                    self.__localfile.write(data)
+                    position += len(data)
+                    self.__downloadedsize += len(data)
+                    mirror.account(len(data))
+
+                cur_t = time.time()
+                if cur_t > mirror.last_demotion_check + 1.0:
+                    mirror.last_demotion_check = cur_t
+                    if self.__demote_check(mirror):
+                        break
+
+                if self.__speedlimit:
+                    while self.__datatransfer > self.__speedlimit*1000:
+                        if self.__stop:
+                            break
+                        time.sleep(0.1)
+
+        except KeyboardInterrupt:
+            raise
+        except (IOError, OSError, ValueError, httplib.HTTPException,
+                socket.error, urlmod_error.URLError) as err:
+            const_debug_write(
+                __name__,
+                "SegmentedUrlFetcher: mirror %s failed: %s" % (
+                    mirror.url, repr(err)))
+            with self.__lock:
+                mirror.status = _SegmentMirror.FAILED
+                mirror.error = err
+        finally:
+            if remotefile is not None:
+                try:
+                    remotefile.close()
+                except socket.error:
+                    pass
+
+        return position
+
+    def __demote_check(self, mirror):
+        """
+        Demote the given mirror if its throughput is considerably lower
+        than the fastest mirror one. The fastest mirror is never demoted.
+        Return True if the mirror has been demoted.
+        """
+        if mirror.elapsed() < self.DEMOTION_GRACE_TIME:
+            return False
+
+        with self.__lock:
+            active = [x for x in self.__mirrors if \
+                          x.status == _SegmentMirror.ACTIVE and \
+                          x.elapsed() >= self.DEMOTION_GRACE_TIME]
+            if len(active) < 2:
+                return False
+
+            best_rate = max(x.rate for x in active)
+            if mirror.rate >= best_rate * self.DEMOTION_RATIO:
+                return False
+
+            mirror.status = _SegmentMirror.DEMOTED
+
+        const_debug_write(
+            __name__,
+            "SegmentedUrlFetcher: demoting mirror %s, %s/sec vs %s/sec" % (
+                mirror.url, bytes_into_human(mirror.rate),
+                bytes_into_human(best_rate)))
+        return True
+
+    def __update_progress(self):
+        with self.__lock:
+            downloaded_size = self.__downloadedsize
+        elapsed = time.time() - self.__starttime
+
+        remotesize = float(self.__remotesize) / 1000
+        try:
+            average = int((float(downloaded_size) / 1000 / remotesize) * 100)
+        except ZeroDivisionError:
+            average = 0
+        self.__average = min(average, 100)
+
+        if elapsed > 0:
+            self.__datatransfer = \
+                (downloaded_size - self.__startingposition) / elapsed
+        if self.__datatransfer > 0:
+            self.__time_remaining_secs = int(round(
+                (self.__remotesize - downloaded_size) / \
+                    self.__datatransfer, 0))
+        self.__time_remaining = \
+            convert_seconds_to_fancy_output(self.__time_remaining_secs)
+
+        if self.__show_speed:
+            self.handle_statistics(self.__th_id, downloaded_size,
+                remotesize, self.__average, self.__oldaverage,
+                self.__updatestep, self.__show_speed, self.__datatransfer,
+                self.__time_remaining, self.__time_remaining_secs
+            )
+            self.update()
+            self.__oldaverage = self.__average
+
+    def get_mirror_statistics(self):
+        """
+        Return the per-mirror statistics of the last segmented download.
+
+        @return: list of dicts containing the "url", "status" ("active",
+            "demoted" or "failed"), "downloaded" (bytes) and "rate"
+            (bytes/sec) keys
+        @rtype: list
+        """
+        with self.__lock:
+            return [{
+                    'url': x.url,
+                    'status': x.status,
+                    'downloaded': x.downloaded,
+                    'rate': x.rate,
+                    } for x in self.__mirrors]
+
+    def get_transfer_rate(self):
+        """
+        Return transfer rate, in kb/sec.
+
+        @return: transfer rate
+        @rtype: int
+        """
+        if self.__fallback_used:
+            return self.__fallback.get_transfer_rate()
+        return self.__datatransfer
+
+    def get_average(self):
+        """
+        Get current download percentage.
+
+        @return: download percentage
+        @rtype: float
+        """
+        if self.__fallback_used:
+            return self.__fallback.get_average()
+        return self.__average
+
+    def get_seconds_remaining(self):
+        """
+        Return remaining seconds to download completion.
+
+        @return: remaining download seconds
+        @rtype: int
+        """
+        if self.__fallback_used:
+            return self.__fallback.get_seconds_remaining()
+        return self.__time_remaining_secs
+
+    def is_resumed(self):
+        """
+        Return whether given download has been resumed.
+        """
+        if self.__fallback_used:
+            return self.__fallback.is_resumed()
+        return self.__resumed
+
+    def handle_statistics(self, th_id, downloaded_size, total_size,
+            average, old_average, update_step, show_speed, data_transfer,
+            time_remaining, time_remaining_secs):
+        """
+        Reimplement this callback to gather information about data currently
+        downloaded. See UrlFetcher.handle_statistics().
+        """
+        return
+
+    def _push_progress_to_output(self):
+        TextInterface.output(
+            "    %s: %s/%s kB <-> %s%% => %s/%s" % (
+                darkred(_("[F]")),
+                darkgreen(str(round(float(self.__downloadedsize)/1000, 1))),
+                red(str(round(float(self.__remotesize)/1000, 1))),
+                self.__average,
+                bytes_into_human(self.__datatransfer),
+                _("sec"),
+            ),
+            back = True)
+
+    def update(self):
+        """
+        Main fetch progress callback. You can reimplement this to refresh
+        your output devices.
+        """
+        update_time_delta = 0.5
+        cur_t = time.time()
+        if cur_t > (self.__last_output_time + update_time_delta):
+            self.__last_output_time = cur_t
+            self._push_progress_to_output()
+
+
 class MultipleUrlFetcher(TextInterface):
 
     def __init__(self, url_path_list, checksum = True,
@@ -976,7 +1988,8 @@ class MultipleUrlFetcher(TextInterface):
                  abort_check_func = None, disallow_redirect = False,
                  url_fetcher_class = None, timeout = None,
                  download_context_func = None,
-                 pre_download_hook = None, post_download_hook = None):
+                 pre_download_hook = None, post_download_hook = None,
+                 url_mirrors = None):
         """
         @param url_path_list: list of tuples composed by url and
             path to save, for eg. [(url,path_to_save,),...]
@@ -1020,9 +2033,18 @@ class MultipleUrlFetcher(TextInterface):
             The function takes a path (the download path) and the download
             status and the download id as arguments.
         @type post_download_hook: callable
+        @keyword url_mirrors: map of url (as found in url_path_list) and
+            list of alternative URLs pointing to the same file on other
+            mirrors. If segmented downloads are enabled, large files are
+            split into byte ranges and fetched from all of them
+            concurrently, see SegmentedUrlFetcher.
+        @type url_mirrors: dict
         """
         self._progress_data = {}
         self._url_path_list = url_path_list
+        if url_mirrors is None:
+            url_mirrors = {}
+        self._url_mirrors = url_mirrors
 
         self.__system_settings = SystemSettings()
         self.__resume = resume
@@ -1079,6 +2101,32 @@ class MultipleUrlFetcher(TextInterface):
         """
         return UrlFetcher.supports_differential_download(url)
 
+    def _get_segment_urls(self, url):
+        """
+        Return the list of URLs (primary first) the given url should be
+        fetched from through SegmentedUrlFetcher, or None if segmented
+        download is disabled or not possible.
+        """
+        max_connections = self.__system_settings['repositories'][
+            'segmented_download']
+        if max_connections < 2:
+            return None
+        if not SegmentedUrlFetcher.supports_segmented_download(url):
+            return None
+
+        urls = [url]
+        for mirror_url in self._url_mirrors.get(url, []):
+            if mirror_url in urls:
+                continue
+            if not SegmentedUrlFetcher.supports_segmented_download(
+                    mirror_url):
+                continue
+            urls.append(mirror_url)
+
+        if len(urls) < 2:
+            return None
+        return urls
+
     def download(self):
         """
         Start downloading URL given at construction time.
@@ -1114,22 +2162,49 @@ class MultipleUrlFetcher(TextInterface):
                 return self.__multiple_fetcher.handle_statistics(*args,
                     **kwargs)
 
+        class MySegmentedFetcher(SegmentedUrlFetcher):
+
+            def __init__(self, multiple, *args, **kwargs):
+                SegmentedUrlFetcher.__init__(self, *args, **kwargs)
+                self.__multiple_fetcher = multiple
+
+            def update(self):
+                return self.__multiple_fetcher.update()
+
+            def _push_progress_to_output(self, *args):
+                return
+
+            def handle_statistics(self, *args, **kwargs):
+                return self.__multiple_fetcher.handle_statistics(*args,
+                    **kwargs)
+
         th_id = 0
         for url, path_to_save in self._url_path_list:
             th_id += 1
-            downloader = MyFetcher(
-                self.__url_fetcher, self, url, path_to_save,
-                checksum = self.__checksum, show_speed = self.__show_speed,
-                resume = self.__resume,
-                abort_check_func = self.__abort_check_func,
-                disallow_redirect = self.__disallow_redirect,
-                thread_stop_func = self.__handle_threads_stop,
-                speed_limit = speed_limit,
-                timeout = self.__timeout,
-                download_context_func = self.__download_context_func,
-                pre_download_hook = self.__pre_download_hook,
-                post_download_hook = self.__post_download_hook
-            )
+            fetcher_kwargs = {
+                'checksum': self.__checksum,
+                'show_speed': self.__show_speed,
+                'resume': self.__resume,
+                'abort_check_func': self.__abort_check_func,
+                'disallow_redirect': self.__disallow_redirect,
+                'thread_stop_func': self.__handle_threads_stop,
+                'speed_limit': speed_limit,
+                'timeout': self.__timeout,
+                'download_context_func': self.__download_context_func,
+                'pre_download_hook': self.__pre_download_hook,
+                'post_download_hook': self.__post_download_hook,
+            }
+
+            mirror_urls = self._get_segment_urls(url)
+            if mirror_urls:
+                downloader = MySegmentedFetcher(
+                    self, mirror_urls, path_to_save,
+                    url_fetcher_class = self.__url_fetcher,
+                    **fetcher_kwargs)
+            else:
+                downloader = MyFetcher(
+                    self.__url_fetcher, self, url, path_to_save,
+                    **fetcher_kwargs)
             downloader.set_id(th_id)
 
             def do_download(ds, dth_id, downloader):
@@ -20,17 +20,19 @@
 """
 import collections
 import errno
+import json
 import os
 import sys
 import subprocess
 import stat
 import codecs
+import threading
 
 from entropy.output import TextInterface
-from entropy.misc import Lifo
+from entropy.misc import Lifo, ParallelTask
 from entropy.const import etpConst, etpSys, const_debug_write, const_mkdtemp, \
     const_mkstemp, const_debug_write, const_convert_to_rawstring, \
-    const_is_python3, const_file_readable
+    const_is_python3, const_file_readable, const_convert_to_unicode
 from entropy.output import blue, darkgreen, red, darkred, bold, purple, brown, \
     teal
 from entropy.exceptions import PermissionDenied, SystemDatabaseError
@@ -39,6 +41,8 @@ from entropy.core import EntropyPluginStore
 from entropy.core.settings.base import SystemSettings
 from entropy.db.skel import EntropyRepositoryPlugin, EntropyRepositoryBase
 
+import entropy.dump
+import entropy.elf
 import entropy.tools
 
 class QAEntropyRepositoryPlugin(EntropyRepositoryPlugin):
@@ -122,6 +126,10 @@ class QAInterface(TextInterface, EntropyPluginStore):
 
     """
 
+    _LIBTEST_CACHE_NAME = "qa_libtest_elf_cache"
+    _LIBTEST_CACHE_VERSION = 1
+    _LIBTEST_REPORT_VERSION = 1
+
     def __init__(self):
         """
         QAInterface constructor.
@@ -647,7 +655,8 @@ class QAInterface(TextInterface, EntropyPluginStore):
 
     def test_shared_objects(self, entropy_repository, broken_symbols = False,
         task_bombing_func = None, self_dir_check = True,
-        dump_results_to_file = False, silent = False):
+        dump_results_to_file = False, silent = False, jobs = 1,
+        use_cache = False, report_file = None):
 
         """
         Scan system looking for broken shared object ELF library dependencies.
@@ -666,6 +675,15 @@ class QAInterface(TextInterface, EntropyPluginStore):
         @type dump_results_to_file: bool
         @keyword silent: do not print anything to stdout
         @type silent: bool
+        @keyword jobs: amount of threads used to scan the ELF objects
+        @type jobs: int
+        @keyword use_cache: use the persistent ELF metadata cache, so that
+            only the ELF objects changed since the last run (according to
+            their inode, mtime and size) are read again.
+        @type use_cache: bool
+        @keyword report_file: file object the machine readable (JSON)
+            results are written to, see _libtest_report() for the format.
+        @type report_file: file object
         @return: tuple of length 3, composed by (1) a dict of matched packages,
             (2) a list (set) of broken ELF objects and (3) the execution status
             (int, 0 means success).
@@ -682,15 +700,18 @@ class QAInterface(TextInterface, EntropyPluginStore):
 
         syms_list_path = None
         files_list_path = None
+        report_path = None
         if dump_results_to_file:
 
             tmp_dir = const_mkdtemp(prefix="qa.libtest")
             syms_list_path = os.path.join(tmp_dir, "libtest_syms.txt")
             files_list_path = os.path.join(tmp_dir, "libtest_files.txt")
+            report_path = os.path.join(tmp_dir, "libtest_results.json")
 
             dmp_data = [
                 (_("Broken symbols packages list"), syms_list_path,),
                 (_("Broken executables list"), files_list_path,),
+                (_("Machine readable results"), report_path,),
             ]
             mytxt = "%s:" % (purple(_("Dumping results into these files")),)
             if not silent:
@@ -783,29 +804,35 @@ class QAInterface(TextInterface, EntropyPluginStore):
                         )
                     break
 
-        executables = set()
-        total = len(ldpaths)
-        count = 0
         sys_root_len = len(etpConst['systemroot'])
+        # directories walked and ELF objects checked by the worker pool,
+        # ELF metadata is read once per object and cached on disk
+        scan_cache = {}
+        if use_cache:
+            scan_cache = self._load_libtest_cache()
+        new_scan_cache = {}
+        executables = {}
+
+        def _scan_ldpath(ldpath):
+            try:
+                ldpath = ldpath.encode('utf-8')
+            except (UnicodeEncodeError,):
+                ldpath = ldpath.encode(sys.getfilesystemencoding())
 
-        def _are_elfs(dt):
-            currentdir, subdirs, files = dt
-
-            def _is_elf(item):
-                filepath = os.path.join(currentdir, item)
-                if self._is_elf_executable_or_library(filepath):
-                    return filepath[sys_root_len:]
-
-            return (x for x in map(_is_elf, files) if x is not None)
-
-        for ldpath in sorted(ldpaths):
-
-            if hasattr(task_bombing_func, '__call__'):
-                task_bombing_func()
-            count += 1
+            mywalk_iter = os.walk(etpConst['systemroot'] + ldpath)
+            for currentdir, subdirs, files in mywalk_iter:
+                for item in files:
+                    filepath = os.path.join(currentdir, item)
+                    metadata = self._read_libtest_metadata(
+                        filepath, scan_cache, new_scan_cache)
+                    if metadata is not None:
+                        executables[filepath[sys_root_len:]] = metadata
+
+        tree_txt = blue("%s ..." % (_("Scanning directories"),))
+        def _scan_progress(count, total):
             if not silent:
                 self.output(
-                    blue("Tree: ")+red(etpConst['systemroot'] + ldpath),
+                    tree_txt,
                     importance = 0,
                     level = "info",
                     count = (count, total),
@@ -813,14 +840,12 @@ class QAInterface(TextInterface, EntropyPluginStore):
                     percent = True,
                     header = "  "
                 )
-            try:
-                ldpath = ldpath.encode('utf-8')
-            except (UnicodeEncodeError,):
-                ldpath = ldpath.encode(sys.getfilesystemencoding())
-            mywalk_iter = os.walk(etpConst['systemroot'] + ldpath)
 
-            for x in map(_are_elfs, mywalk_iter):
-                executables.update(x)
+        self._run_libtest_workers(_scan_ldpath, sorted(ldpaths), jobs,
+            task_bombing_func, _scan_progress)
+
+        if use_cache:
+            self._save_libtest_cache(new_scan_cache)
 
         if not silent:
             self.output(
@@ -848,50 +873,36 @@ class QAInterface(TextInterface, EntropyPluginStore):
         if files_list_path:
             files_list_f = codecs.open(files_list_path, "w", encoding=enc)
 
-        plain_brokenexecs = set()
-        total = len(executables)
-        count = 0
-        scan_txt = blue("%s ..." % (_("Scanning libraries"),))
-        for executable in executables:
+        linker_paths = entropy.tools.collect_linker_paths()
+        resolved_libraries = {}
 
-            # task bombing hook
-            if hasattr(task_bombing_func, '__call__'):
-                task_bombing_func()
+        def _is_resolvable(library, elf_class, elf_linker_paths):
+            key = (library, elf_class, elf_linker_paths)
+            found = resolved_libraries.get(key)
+            if found is None:
+                found = bool(self._resolve_libtest_library(
+                    library, elf_class, linker_paths) or \
+                    self._resolve_libtest_library(
+                        library, elf_class, elf_linker_paths))
+                resolved_libraries[key] = found
+            return found
 
-            count += 1
-            if (count % 10 == 0) or (count == total) or (count == 1):
-                if not silent:
-                    self.output(
-                        scan_txt,
-                        importance = 0,
-                        level = "info",
-                        count = (count, total),
-                        back = True,
-                        percent = True,
-                        header = "  "
-                    )
+        broken_executables = {}
 
+        def _check_executable(executable):
             # filter broken paths
             # there are paths known to be broken and must be
             # excluded to avoid noisy false positives
-            exec_match = False
             for reg_path in broken_libs_paths_mask_regexp:
                 if reg_path.match(executable):
-                    exec_match = True
-                    break
-            if exec_match:
-                continue
+                    return
 
             real_exec_path = etpConst['systemroot'] + executable
-
-            myelfs = entropy.tools.read_elf_dynamic_libraries(
-                real_exec_path)
+            elf_class, myelfs, elf_linker_paths = executables[executable]
 
             mylibs = set()
             for mylib in myelfs:
-                lib_path = entropy.tools.resolve_dynamic_library(mylib,
-                    executable)
-                if not lib_path:
+                if not _is_resolvable(mylib, elf_class, elf_linker_paths):
                     mylibs.add(mylib)
 
             # filter broken libraries
@@ -938,8 +949,32 @@ class QAInterface(TextInterface, EntropyPluginStore):
                             break
                 broken_sym_found.update(my_broken_syms)
 
-            if not (mylibs or broken_sym_found):
-                continue
+            if mylibs or broken_sym_found:
+                broken_executables[executable] = (mylibs, broken_sym_found)
+
+        scan_txt = blue("%s ..." % (_("Scanning libraries"),))
+        def _check_progress(count, total):
+            if not silent:
+                self.output(
+                    scan_txt,
+                    importance = 0,
+                    level = "info",
+                    count = (count, total),
+                    back = True,
+                    percent = True,
+                    header = "  "
+                )
+
+        self._run_libtest_workers(_check_executable, sorted(executables),
+            jobs, task_bombing_func, _check_progress)
+
+        plain_brokenexecs = set()
+        total = len(executables)
+        count = 0
+        for executable in sorted(broken_executables):
+            mylibs, broken_sym_found = broken_executables[executable]
+            real_exec_path = etpConst['systemroot'] + executable
+            count += 1
 
             if mylibs:
 
@@ -985,8 +1020,10 @@ class QAInterface(TextInterface, EntropyPluginStore):
         if files_list_f:
             files_list_f.close()
 
-        del executables
+        scanned_count = len(executables)
+        executables.clear()
         pkgs_matched = {}
+        client = None
 
         if not etpSys['serverside']:
 
@@ -1006,15 +1043,20 @@ class QAInterface(TextInterface, EntropyPluginStore):
                     header = red(" @@ ")
                 )
             matched = set()
+            # test with /usr/lib
+            owners = entropy_repository.searchBelongsMany(plain_brokenexecs)
+            # try with realpath
+            # on multilib systems this resolves to /usr/lib64
+            # which makes searchBelongs() happy
+            real_paths = dict(((x, os.path.realpath(x)) for x, y in \
+                                   owners.items() if not y))
+            real_owners = entropy_repository.searchBelongsMany(
+                real_paths.values())
+
             for brokenlib in plain_brokenexecs:
-                # test with /usr/lib
-                idpackages = entropy_repository.searchBelongs(brokenlib)
+                idpackages = owners[brokenlib]
                 if not idpackages:
-                    # try with realpath
-                    # on multilib systems this resolves to /usr/lib64
-                    # which makes searchBelongs() happy
-                    idpackages = entropy_repository.searchBelongs(
-                        os.path.realpath(brokenlib))
+                    idpackages = real_owners[real_paths[brokenlib]]
 
                 for idpackage in idpackages:
 
@@ -1031,8 +1073,263 @@ class QAInterface(TextInterface, EntropyPluginStore):
 
             plain_brokenexecs -= matched
 
+        if report_path or report_file is not None:
+            report = self._libtest_report(broken_executables, pkgs_matched,
+                scanned_count, client = client)
+            if report_path:
+                with codecs.open(report_path, "w", encoding=enc) as rep_f:
+                    self._write_libtest_report(report, rep_f)
+            if report_file is not None:
+                self._write_libtest_report(report, report_file)
+
         return pkgs_matched, plain_brokenexecs, 0
 
+    def _load_libtest_cache(self):
+        """
+        Load the test_shared_objects() ELF metadata cache from disk.
+
+        @return: dict composed by path as key and ((inode, mtime, size),
+            metadata) as value
+        @rtype: dict
+        """
+        cache = entropy.dump.loadobj(self._LIBTEST_CACHE_NAME)
+        valid = isinstance(cache, dict) \
+            and cache.get('version') == self._LIBTEST_CACHE_VERSION \
+            and cache.get('root') == etpConst['systemroot']
+        if not valid:
+            return {}
+        return cache['objects']
+
+    def _save_libtest_cache(self, objects):
+        """
+        Store the test_shared_objects() ELF metadata cache to disk.
+
+        @param objects: dict composed by path as key and
+            ((inode, mtime, size), metadata) as value
+        @type objects: dict
+        """
+        cache = {
+            'version': self._LIBTEST_CACHE_VERSION,
+            'root': etpConst['systemroot'],
+            'objects': objects,
+        }
+        entropy.dump.dumpobj(self._LIBTEST_CACHE_NAME, cache)
+
+    def _read_libtest_metadata(self, path, cache, new_cache):
+        """
+        Return the dynamic linking metadata of the ELF executable or
+        library at path, as a (ELF class, NEEDED tuple, linker paths tuple)
+        tuple, or None if path is not an ELF executable or library.
+        The metadata is taken from cache if the object did not change
+        (same inode, mtime and size) and it is always stored into new_cache.
+
+        @param path: path to ELF object
+        @type path: string
+        @param cache: metadata cache of the previous run
+        @type cache: dict
+        @param new_cache: metadata cache of this run
+        @type new_cache: dict
+        @return: ELF metadata tuple or None
+        @rtype: tuple or None
+        """
+        st = self._elf_candidate_stat(path)
+        if st is None:
+            return None
+
+        key = (st.st_ino, st.st_mtime, st.st_size)
+        cached = cache.get(path)
+        if cached is not None and cached[0] == key:
+            metadata = cached[1]
+        else:
+            try:
+                elf_obj = entropy.elf.read_elf(path, symbols = False)
+            except ValueError:
+                # not an ELF object
+                elf_obj = None
+            except (OSError, IOError) as err:
+                if err.errno not in (errno.ENOENT, errno.EACCES):
+                    raise
+                return None
+
+            metadata = None
+            if elf_obj is not None:
+                metadata = (elf_obj.elf_class, tuple(elf_obj.needed),
+                            tuple(elf_obj.linker_paths()))
+
+        new_cache[path] = (key, metadata)
+        return metadata
+
+    def _resolve_libtest_library(self, library, elf_class, ld_paths):
+        """
+        Resolve the given library name (as contained into ELF metadata)
+        to a library path, looking into the given linker paths.
+
+        @param library: library name (as contained into ELF metadata)
+        @type library: string
+        @param elf_class: ELF class of the requiring ELF object
+        @type elf_class: int
+        @param ld_paths: linker paths
+        @type ld_paths: iterable
+        @return: resolved library path or None
+        @rtype: string or None
+        """
+        for ld_dir in ld_paths:
+            mypath = os.path.join(ld_dir, library)
+            if os.path.isdir(mypath):
+                continue
+            if not const_file_readable(mypath):
+                continue
+            try:
+                if not entropy.tools.is_elf_file(mypath):
+                    continue
+                if entropy.tools.read_elf_class(mypath) != elf_class:
+                    continue
+            except (OSError, IOError):
+                continue
+            return mypath
+        return None
+
+    def _run_libtest_workers(self, func, items, jobs, task_bombing_func,
+                             progress_func):
+        """
+        Call func for every item using a pool of threads, the given
+        task_bombing_func and progress_func(count, total) callables are
+        called from the calling thread, while waiting for the workers.
+        If jobs is lower than 2, func is called in the calling thread.
+        The first exception raised by func is re-raised.
+        """
+        total = len(items)
+        if jobs < 2:
+            count = 0
+            for item in items:
+                if hasattr(task_bombing_func, '__call__'):
+                    task_bombing_func()
+                count += 1
+                if (count % 10 == 0) or (count == total) or (count == 1):
+                    progress_func(count, total)
+                func(item)
+            return
+
+        queue = collections.deque(items)
+        lock = threading.Lock()
+        state = {
+            'count': 0,
+            'stop': False,
+            'exception': None,
+        }
+
+        def _worker():
+            while True:
+                with lock:
+                    if state['stop'] or not queue:
+                        break
+                    item = queue.popleft()
+                try:
+                    func(item)
+                except Exception as err:
+                    entropy.tools.print_traceback()
+                    with lock:
+                        state['stop'] = True
+                        if state['exception'] is None:
+                            state['exception'] = err
+                    break
+                with lock:
+                    state['count'] += 1
+
+        threads = []
+        for idx in range(min(jobs, max(1, total))):
+            th = ParallelTask(_worker)
+            th.name = "QAInterfaceLibtest-%d" % (idx,)
+            th.daemon = True
+            th.start()
+            threads.append(th)
+
+        try:
+            while threads:
+                if hasattr(task_bombing_func, '__call__'):
+                    task_bombing_func()
+                progress_func(state['count'], total)
+                threads[0].join(0.3)
+                threads = [x for x in threads if x.is_alive()]
+        except:
+            with lock:
+                state['stop'] = True
+            for th in threads:
+                th.join()
+            raise
+
+        if state['exception'] is not None:
+            raise state['exception']
+        progress_func(state['count'], total)
+
+    def _libtest_report(self, broken_executables, pkgs_matched,
+                        scanned_count, client = None):
+        """
+        Build the test_shared_objects() machine readable report, a dict
+        (JSON serializable) composed by:
+            - "version": report format version
+            - "root": the system root directory
+            - "scanned": amount of ELF objects scanned
+            - "broken": list of broken ELF objects, each one a dict
+              composed by "path", "libraries" (missing libraries),
+              "symbols" (broken symbols) and "packages" (list of dicts
+              composed by "package_id", "repository" and, if available,
+              "atom", containing the packages providing a fix).
+
+        @param broken_executables: dict composed by path as key and
+            (missing libraries, broken symbols) as value
+        @type broken_executables: dict
+        @param pkgs_matched: dict composed by path as key and set of
+            package matches as value
+        @type pkgs_matched: dict
+        @param scanned_count: amount of ELF objects scanned
+        @type scanned_count: int
+        @keyword client: Entropy Client instance, used to retrieve atoms
+        @type client: entropy.client.interfaces.Client
+        @return: the report
+        @rtype: dict
+        """
+        broken = []
+        for executable in sorted(broken_executables):
+            mylibs, broken_sym_found = broken_executables[executable]
+
+            packages = []
+            for package_id, repository_id in sorted(
+                    pkgs_matched.get(executable, [])):
+                package = {
+                    'package_id': package_id,
+                    'repository': repository_id,
+                }
+                if client is not None:
+                    repo = client.open_repository(repository_id)
+                    package['atom'] = repo.retrieveAtom(package_id)
+                packages.append(package)
+
+            broken.append({
+                'path': const_convert_to_unicode(executable),
+                'libraries': [const_convert_to_unicode(x) for x in \
+                                  sorted(mylibs)],
+                'symbols': [const_convert_to_unicode(x) for x in \
+                                sorted(broken_sym_found)],
+                'packages': packages,
+            })
+
+        return {
+            'version': self._LIBTEST_REPORT_VERSION,
+            'root': const_convert_to_unicode(etpConst['systemroot']),
+            'scanned': scanned_count,
+            'broken': broken,
+        }
+
+    def _write_libtest_report(self, report, report_f):
+        """
+        Write the test_shared_objects() report to the given file object
+        in JSON format.
+        """
+        report_f.write(json.dumps(report, indent = 4, sort_keys = True))
+        report_f.write("\n")
+        report_f.flush()
+
     def _content_test(self, mycontent):
         """
         Test whether the given list of files contain files
@@ -1089,35 +1386,53 @@ class QAInterface(TextInterface, EntropyPluginStore):
         if not const_is_python3():
             path = const_convert_to_rawstring(path)
 
+        if self._elf_candidate_stat(path, allow_symlink = allow_symlink) \
+                is None:
+            return False
+
+        # is this really an ELF object file?
+        if not entropy.tools.is_elf_file(path):
+            return False
+
+        return True
+
+    def _elf_candidate_stat(self, path, allow_symlink = True):
+        """
+        Determine whether a path can be an ELF executable or ELF library
+        without reading it, looking at its stat() metadata only.
+
+        @param path: path to test
+        @type path: string
+        @keyword allow_symlink: True, if you accept symlinks
+        @type allow_symlink: bool
+        @return: the stat() result of path if it is a candidate, or None
+        @rtype: os.stat_result or None
+        """
         try:
             st = os.stat(path)
         except (OSError, IOError):
-            return False
+            return None
 
         # is it a regular file?
         if not stat.S_ISREG(st.st_mode):
-            return False
+            return None
 
         if not allow_symlink:
             if stat.S_ISLNK(st.st_mode):
-                return False
+                return None
 
         # shared libraries must be always executable
         if not (stat.S_IMODE(st.st_mode) & stat.S_IXUSR):
-            return False
+            return None
 
         # is it a debug file? skip them.
         t_path = path
         while t_path != os.path.sep:
             if t_path in etpConst['splitdebug_dirs']:
-                return False
+                return None
             t_path = os.path.dirname(t_path)
 
-        # is this really an ELF object file?
-        if not entropy.tools.is_elf_file(path):
-            return False
-
-        return True
+        return st
 
     def _get_unresolved_sonames(self, entropy_client, package_match,
         content_root = None):
@@ -34,6 +34,7 @@ from entropy.core.settings.base import SystemSettings
 from entropy.fetchers import UrlFetcher
 from entropy.locks import ResourceLock
 
+import entropy.dump
 import entropy.tools
 
 
@@ -123,6 +124,9 @@ class System(object):
     class UpdateError(EntropyException):
         """Raised when security advisories couldn't be updated correctly"""
 
+    _INDEX_FILE = "advisories.index"
+    _INDEX_VERSION = 1
+
     @classmethod
     def _get_xml_metadata(cls, xmlfile):
         """
@@ -323,6 +327,8 @@ class System(object):
         self._entropy = entropy_client
         self.__cacher = None
         self.__settings = None
+        self.__index = None
+        self.__affected_map = None
 
         self._gpg_enabled = os.getenv("ETP_DISABLE_GPG") is None
         self._gpg_keystore_dir = os.path.join(
@@ -669,6 +675,113 @@ class System(object):
         ids = [x[:-len(".xml")] for x in xmls]
         return ids
 
+    def _index_path(self):
+        """
+        Return the path to the compiled advisories index file.
+        """
+        return os.path.join(self._cache_dir, self._INDEX_FILE)
+
+    def _index_mtime(self):
+        """
+        Return the mtime of the advisories directory, which is updated
+        by _fetch() and invalidates the compiled advisories index.
+        """
+        try:
+            return os.path.getmtime(self._dir)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return None
+
+    def _build_index(self, _quiet=True):
+        """
+        Parse all the available XML advisories and compile them into the
+        advisories index, which is then written to disk.
+
+        The index contains the advisory id -> metadata map as well as,
+        for every advisory, the list of (key, vulnerable atoms, unaffected
+        atoms) tuples used to determine whether the system is affected.
+
+        @return: the advisories index
+        @rtype: dict
+        """
+        mtime = self._index_mtime()
+        advisories = {}
+        affected = {}
+        for xml_path in self._xml_list():
+
+            xml_path = os.path.join(self._dir, xml_path)
+            metadata = None
+            try:
+                metadata = self._get_xml_metadata(xml_path)
+            except Exception as err:
+                if not _quiet:
+                    txt = "%s, %s, %s: %s" % (
+                        blue(_("Warning")),
+                        bold(xml_path),
+                        blue(_("broken advisory")),
+                        err,
+                    )
+                    self._entropy.output(
+                        txt,
+                        importance=1,
+                        level="warning",
+                        header=red(" !!! ")
+                    )
+            if metadata is None:
+                continue
+
+            advisory_id = self._xml_to_id(xml_path)
+            advisories[advisory_id] = metadata
+
+            affections = []
+            for key in sorted(metadata['affected']):
+                affection = metadata['affected'][key][0]
+                affections.append((key, tuple(affection['vul_atoms']),
+                                   tuple(affection['unaff_atoms'])))
+            affected[advisory_id] = affections
+
+        index = {
+            'version': self._INDEX_VERSION,
+            'directory': self._dir,
+            'mtime': mtime,
+            'advisories': advisories,
+            'affected': affected,
+        }
+        if mtime is not None:
+            # if not writable, the index is kept in memory only
+            entropy.dump.dumpobj(self._index_path(), index,
+                complete_path=True)
+        self.__index = index
+        self.__affected_map = None
+        return index
+
+    def _index(self):
+        """
+        Return the compiled advisories index, loading it from disk or
+        building it if missing or out of date.
+
+        @return: the advisories index
+        @rtype: dict
+        """
+        mtime = self._index_mtime()
+        index = self.__index
+        if index is None:
+            index = entropy.dump.loadobj(self._index_path(),
+                complete_path=True)
+
+        valid = isinstance(index, dict) \
+            and index.get('version') == self._INDEX_VERSION \
+            and index.get('directory') == self._dir \
+            and index.get('mtime') == mtime
+        if not valid:
+            return self._build_index(_quiet=False)
+
+        if index is not self.__index:
+            self.__index = index
+            self.__affected_map = None
+        return index
+
     @systemshared
     def advisories(self):
         """
@@ -681,20 +794,18 @@ class System(object):
         metadata = self._get_cache("all")
         if metadata is None:
 
-            metadata = {}
-            for xml_path in self._xml_list():
+            index = self._index()
+            metadata = dict((x['__id__'], x) for x in
+                            index['advisories'].values())
 
-                adv_id = self._xml_to_id(xml_path)
-                xml_metadata = self.advisory(adv_id, _quiet=False)
-                if xml_metadata is None:
-                    continue
-
-                metadata.update(
-                    {xml_metadata['__id__']: xml_metadata}
-                )
+            # match all the advisory keys at once
+            keys = set()
+            for xml_metadata in metadata.values():
+                keys.update(xml_metadata['affected'].keys())
+            matches = self._entropy.atom_match_many(sorted(keys))
 
             metadata = dict((x, y) for x, y in
-                            metadata.items() if self._applicable(y))
+                            metadata.items() if self._applicable(y, matches))
             self._set_cache("all", metadata)
 
         return metadata
@@ -708,34 +819,9 @@ class System(object):
         @return: the advisory metadata dictionary
         @rtype: dict or None
         """
-        metadata = self._get_cache(advisory_id)
-        if metadata is not None:
-            return metadata
+        return self._index()['advisories'].get(advisory_id)
 
-        xml_path = self._id_to_xml(advisory_id)
-        metadata = None
-        try:
-            metadata = self._get_xml_metadata(xml_path)
-        except Exception as err:
-            if not _quiet:
-                txt = "%s, %s, %s: %s" % (
-                    blue(_("Warning")),
-                    bold(xml_path),
-                    blue(_("broken advisory")),
-                    err,
-                )
-                self._entropy.output(
-                    txt,
-                    importance=1,
-                    level="warning",
-                    header=red(" !!! ")
-                )
-
-        if metadata is not None:
-            self._set_cache(advisory_id, metadata)
-        return metadata
-
-    def _applicable(self, metadata):
+    def _applicable(self, metadata, matches=None):
         """
         Return whether the given GLSA advisory is applicable on this system.
         Basically, determine if any of the packages listed in the advisory
@@ -743,19 +829,100 @@ class System(object):
 
         @param metadata: a single advisory metadata dictionary
         @type metadata: dict
+        @keyword matches: atom_match_many() results of the advisory keys,
+            if available
+        @type matches: dict
         """
         if not metadata['affected']:
             return False
 
         valid = False
         for dep in metadata['affected'].keys():
-            package_id, _repository_id = self._entropy.atom_match(dep)
+            match = None
+            if matches is not None:
+                match = matches.get(dep)
+            if match is None:
+                match = self._entropy.atom_match(dep)
+            package_id, _repository_id = match
             if package_id != -1:
                 valid = True
                 break
 
         return valid
 
+    def _affected(self, affections, inst_repo):
+        """
+        Return a dict composed by the given advisory identifiers as key and
+        the set of their currently affected dependencies as value.
+        All the atoms are matched against the installed packages repository
+        at once.
+
+        @param affections: dict composed by advisory identifiers as key and
+            lists of (key, vulnerable atoms, unaffected atoms) tuples as
+            value
+        @type affections: dict
+        @param inst_repo: the installed packages repository
+        @type inst_repo: EntropyRepositoryBase
+        @return: dict composed by advisory identifier as key and set of
+            affected dependencies as value
+        @rtype: dict
+        """
+        vul_deps = set()
+        unaff_deps = set()
+        for affection_list in affections.values():
+            for _key, vul_atoms, unaff_atoms in affection_list:
+                if vul_atoms:
+                    vul_deps.update(vul_atoms)
+                    unaff_deps.update(unaff_atoms)
+
+        with inst_repo.direct():
+            unaff_matches = inst_repo.atomMatchMany(
+                sorted(unaff_deps), multiMatch=True)
+            vul_matches = inst_repo.atomMatchMany(sorted(vul_deps))
+
+        affected_map = {}
+        for advisory_id, affection_list in affections.items():
+            affected = set()
+            for _key, vul_atoms, unaff_atoms in affection_list:
+                if not vul_atoms:
+                    continue
+
+                unaffected = set()
+                for dep in unaff_atoms:
+                    package_ids, _inst_rc = unaff_matches[dep]
+                    unaffected.update(package_ids)
+
+                for dep in vul_atoms:
+                    package_id, _rc = vul_matches[dep]
+                    if package_id != -1 and package_id not in unaffected:
+                        affected.add(dep)
+
+            affected_map[advisory_id] = affected
+
+        return affected_map
+
+    def _affected_map(self):
+        """
+        Return a dict composed by advisory identifier as key and the set of
+        its currently affected dependencies as value, for all the available
+        advisories. The result is kept in memory until the advisories or the
+        installed packages change.
+        """
+        index = self._index()
+        inst_repo = self._entropy.installed_repository()
+        with inst_repo.direct():
+            inst_pkgs_cksum = inst_repo.checksum(strict=False)
+
+        cached = self.__affected_map
+        if cached is not None:
+            cached_index, cached_cksum, affected_map = cached
+            if cached_index is index and cached_cksum == inst_pkgs_cksum:
+                return affected_map
+
+        affected_map = self._affected(index['affected'], inst_repo)
+        self.__affected_map = (index, inst_pkgs_cksum, affected_map)
+        return affected_map
+
     @systemshared
     def affected(self, metadata):
         """
@@ -768,35 +935,19 @@ class System(object):
             in the installed packages repository
         @rtype: set
         """
-        affected = set()
-        inst_repo = self._entropy.installed_repository()
-
         if not metadata['affected']:
-            return affected
+            return set()
 
+        affections = []
         for key in metadata['affected']:
-
             affection = metadata['affected'][key][0]
+            affections.append((key, affection['vul_atoms'],
+                               affection['unaff_atoms']))
 
-            vul_atoms = affection['vul_atoms']
-            if not vul_atoms:
-                continue
-
-            unaffected = set()
-
-            with inst_repo.direct():
-                for dep in affection['unaff_atoms']:
-                    package_ids, _inst_rc = inst_repo.atomMatch(
-                        dep, multiMatch=True)
-                    unaffected.update(package_ids)
-
-                for dep in vul_atoms:
-                    package_id, _rc = inst_repo.atomMatch(dep)
-                    if package_id != -1 and package_id not in unaffected:
-                        affected.add(dep)
-
-        return affected
+        inst_repo = self._entropy.installed_repository()
+        return self._affected({None: affections}, inst_repo)[None]
 
+    @systemshared
     def affected_id(self, advisory_id):
         """
         Return a list (set) of dependencies that are currently
@@ -808,10 +959,10 @@ class System(object):
             in the installed packages repository
         @rtype: set
         """
-        metadata = self.advisory(advisory_id)
-        if metadata is None:
+        affected = self._affected_map().get(advisory_id)
+        if affected is None:
             return set()
-        return self.affected(metadata)
+        return affected.copy()
 
     @systemshared
     def vulnerabilities(self):
@@ -846,9 +997,10 @@ class System(object):
         @rtype: set
         """
         advisory_ids = set()
+        affected_map = self._affected_map()
 
         for advisory_id in self.list():
-            affected = self.affected_id(advisory_id)
+            affected = affected_map.get(advisory_id)
             if affected and not applied:
                 advisory_ids.add(advisory_id)
             elif not affected and applied:
@@ -910,6 +1062,11 @@ class System(object):
             if workdir is not None:
                 shutil.rmtree(workdir, True)
 
+        if rc_lock == 0:
+            # compile the advisories once, here, instead of parsing
+            # them at every query
+            self._index()
+
         if rc_lock == 0:
             if updated:
                 advtext = "%s: %s" % (
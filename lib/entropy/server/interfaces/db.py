@@ -29,6 +29,7 @@ from entropy.const import etpConst, const_setup_file, const_mkdtemp, \
     const_mkstemp, const_convert_to_unicode, const_file_readable
 from entropy.core import Singleton
 from entropy.db import EntropyRepository
+from entropy.db.delta import EntropyRepositoryDelta
 from entropy.transceivers import EntropyTransceiver
 from entropy.output import red, darkgreen, bold, brown, blue, darkred, teal, \
     purple
@@ -1445,6 +1446,151 @@ Name:    %s
 
         entropy.tools.compress_files(compressed_dest_path, found_file_list)
 
+    _DELTA_STATE_HEADER = "delta-state 2"
+
+    def _read_repository_delta_state(self, state_path):
+        """
+        Read the repository delta state file, returning a tuple composed
+        by the repository revision and the package fingerprints (see
+        EntropyRepositoryDelta.fingerprints()) at the time of the last
+        upload, or None.
+        """
+        enc = etpConst['conf_encoding']
+        try:
+            with codecs.open(state_path, "r", encoding=enc) as f_state:
+                if f_state.readline().strip() != self._DELTA_STATE_HEADER:
+                    return None
+                revision = int(f_state.readline().strip())
+                fingerprints = {}
+                for line in f_state.readlines():
+                    package_id, fingerprint = line.strip().split()
+                    fingerprints[int(package_id)] = fingerprint
+        except (OSError, IOError) as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return None
+        except ValueError:
+            return None
+        return revision, fingerprints
+
+    def _write_repository_delta_state(self, state_path, revision,
+                                      fingerprints):
+        """
+        Write the repository delta state file, see
+        _read_repository_delta_state().
+        """
+        enc = etpConst['conf_encoding']
+        tmp_path = state_path + ".tmp"
+        with codecs.open(tmp_path, "w", encoding=enc) as f_state:
+            f_state.write("%s\n" % (self._DELTA_STATE_HEADER,))
+            f_state.write("%d\n" % (revision,))
+            for package_id in sorted(fingerprints):
+                f_state.write("%d %s\n" % (
+                        package_id, fingerprints[package_id]))
+        os.rename(tmp_path, state_path)
+
+    def _create_repository_delta(self, upload_data, critical,
+                                 gpg_to_sign_files):
+        """
+        Generate the incremental update (delta) between the repository
+        revision uploaded last time and the current one, then add the
+        delta files and their index to upload_data. Entropy Client uses
+        them to update its repository without downloading it entirely.
+        Deltas and their index are GPG signed like the repository itself.
+        upload_data, critical and gpg_to_sign_files directly come from
+        _upload().
+        """
+        repository_id = self._repository_id
+        revision = self._entropy.local_repository_revision(repository_id)
+        database_path = self._entropy._get_local_repository_file(
+            repository_id)
+        state_path = self._entropy._get_local_repository_delta_state_file(
+            repository_id)
+        index_path = self._entropy._get_local_repository_delta_index_file(
+            repository_id)
+        max_deltas = etpConst['etpdatabasemaxdeltas']
+
+        try:
+            entries = EntropyRepositoryDelta.readIndex(index_path)
+        except (OSError, IOError) as err:
+            if err.errno != errno.ENOENT:
+                raise
+            entries = []
+
+        dbconn = self._entropy.open_generic_repository(database_path,
+            indexing_override = False, xcache = False, read_only = True)
+        try:
+            fingerprints = EntropyRepositoryDelta.fingerprints(dbconn)
+            state = self._read_repository_delta_state(state_path)
+
+            if state is not None and state[0] < revision:
+                from_revision, base_fingerprints = state
+                slot = revision % max_deltas
+                delta_path = \
+                    self._entropy._get_local_repository_delta_file(
+                        repository_id, slot, "bz2")
+                tmp_fd, tmp_delta_path = const_mkstemp(
+                    prefix = "entropy.server._create_repository_delta")
+                os.close(tmp_fd)
+                try:
+                    delta_dbconn = self._entropy.open_generic_repository(
+                        tmp_delta_path, indexing_override = False,
+                        xcache = False, skip_checks = True)
+                    try:
+                        added, removed, modified = EntropyRepositoryDelta(
+                            delta_dbconn).create(
+                                dbconn, repository_id, from_revision,
+                                revision, base_fingerprints,
+                                fingerprints = fingerprints)
+                    finally:
+                        delta_dbconn.close()
+                    self._compress_file(tmp_delta_path, delta_path,
+                                        bz2.BZ2File)
+                finally:
+                    os.remove(tmp_delta_path)
+
+                delta_name = os.path.basename(delta_path)
+                # slots are recycled, drop deltas pointing to
+                # the overwritten file.
+                entries = [x for x in entries if x[2] != delta_name]
+                entries.append((from_revision, revision, delta_name,
+                                entropy.tools.md5sum(delta_path)))
+                entries = entries[-max_deltas:]
+                EntropyRepositoryDelta.writeIndex(index_path, entries)
+
+                self._entropy.output(
+                    "[repo:%s|%s] %s: %s -> %s (+%d, -%d, ~%d)" % (
+                        blue(repository_id),
+                        darkgreen(_("upload")),
+                        blue(_("repository delta")),
+                        bold(str(from_revision)),
+                        bold(str(revision)),
+                        len(added), len(removed), len(modified),
+                    ),
+                    importance = 0,
+                    level = "info",
+                    header = darkgreen(" * ")
+                )
+
+            if state is None or state[0] != revision:
+                self._write_repository_delta_state(
+                    state_path, revision, fingerprints)
+        finally:
+            dbconn.close()
+
+        if not entries:
+            return
+
+        for from_revision, to_revision, delta_name, delta_md5 in entries:
+            delta_path = os.path.join(os.path.dirname(index_path), delta_name)
+            item_id = "database_delta_%s" % (delta_name,)
+            upload_data[item_id] = delta_path
+            critical.append(delta_path)
+            gpg_to_sign_files.append(delta_path)
+        upload_data['database_delta_index'] = index_path
+        critical.append(index_path)
+        gpg_to_sign_files.append(index_path)
+
     def _upload(self, uris):
         """
         Upload repository metadata to given repository URIs.
@@ -1527,6 +1673,8 @@ Name:    %s
             copy_back = False
 
         self._shrink_and_close(dbconn)
+        self._create_repository_delta(upload_data, critical,
+                                      gpg_to_sign_files)
 
         if 2 not in disabled_eapis:
             self._show_eapi2_upload_messages("~all~", database_path,
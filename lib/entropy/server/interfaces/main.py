@@ -1092,6 +1092,8 @@ class ServerSystemSettingsPlugin(SystemSettingsPlugin):
             # disabled by default for now
             'nonfree_packages_dir_support': False,
             'sync_speed_limit': None,
+            'sync_parallel_mirrors': 4,
+            'sync_parallel_transfers': 2,
             'weak_package_files': False,
             'changelog': True,
             'rss': {
@@ -1202,6 +1204,22 @@ class ServerSystemSettingsPlugin(SystemSettingsPlugin):
                 speed_limit = None
             data['sync_speed_limit'] = speed_limit
 
+        def _sync_parallel_mirrors(line, setting):
+            try:
+                mirrors = int(setting)
+            except ValueError:
+                return
+            if mirrors > 0:
+                data['sync_parallel_mirrors'] = mirrors
+
+        def _sync_parallel_transfers(line, setting):
+            try:
+                transfers = int(setting)
+            except ValueError:
+                return
+            if transfers > 0:
+                data['sync_parallel_transfers'] = transfers
+
         def _weak_package_files(line, setting):
             opt = entropy.tools.setting_to_bool(setting)
             if opt is not None:
@@ -1266,6 +1284,8 @@ class ServerSystemSettingsPlugin(SystemSettingsPlugin):
             # backward compatibility
             'sync-speed-limit': _syncspeedlimit,
             'syncspeedlimit': _syncspeedlimit,
+            'sync-parallel-mirrors': _sync_parallel_mirrors,
+            'sync-parallel-transfers': _sync_parallel_transfers,
             'weak-package-files': _weak_package_files,
             'changelog': _changelog,
             'rss-feed': _rss_feed,
@@ -1905,6 +1925,22 @@ class Server(Client):
             self._get_local_repository_dir(repository_id, branch = branch),
                 etpConst['etpdatabaserevisionfile'])
 
+    def _get_local_repository_delta_index_file(self, repository_id,
+        branch = None):
+        return os.path.join(self._get_local_repository_dir(repository_id,
+            branch = branch), etpConst['etpdatabasedeltaindexfile'])
+
+    def _get_local_repository_delta_file(self, repository_id, slot,
+        cmethod, branch = None):
+        return os.path.join(self._get_local_repository_dir(repository_id,
+            branch = branch), "%s.%d.%s" % (
+                etpConst['etpdatabasedeltafile'], slot, cmethod))
+
+    def _get_local_repository_delta_state_file(self, repository_id,
+        branch = None):
+        return os.path.join(self._get_local_repository_dir(repository_id,
+            branch = branch), etpConst['etpdatabasedeltastatefile'])
+
     def _get_local_repository_timestamp_file(self, repository_id,
         branch = None):
         return os.path.join(self._get_local_repository_dir(repository_id,
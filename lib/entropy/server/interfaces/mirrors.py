@@ -9,6 +9,7 @@
     B{Entropy Package Manager Server Mirrors Interfaces}.
 
 """
+import collections
 import os
 import shutil
 import time
@@ -1479,6 +1480,7 @@ class Server(object):
             obj = queue_map.setdefault(rel_dir, [])
             obj.append(upload_path)
 
+        srv_set = self._settings[Server.SYSTEM_SETTINGS_PLG_ID]['server']
         errors = False
         m_fine_uris = set()
         m_broken_uris = set()
@@ -1494,7 +1496,8 @@ class Server(object):
             uploader = self.TransceiverServerHandler(self._entropy, [uri],
                 myqueue, critical_files = myqueue,
                 txc_basedir = remote_dir, copy_herustic_support = True,
-                handlers_data = handlers_data, repo = repository_id)
+                handlers_data = handlers_data, repo = repository_id,
+                parallel_transfers = srv_set['sync_parallel_transfers'])
 
             xerrors, xm_fine_uris, xm_broken_uris = uploader.go()
             if xerrors:
@@ -1534,6 +1537,69 @@ class Server(object):
         return errors, m_fine_uris, m_broken_uris
 
 
+    def _sync_run_upload_queues(self, repository_id, upload_queues):
+        """
+        Run the upload queue of every given mirror, pushing packages to
+        at most "sync-parallel-mirrors" mirrors at the same time.
+
+        @param repository_id: repository identifier
+        @type repository_id: string
+        @param upload_queues: list of (uri, upload queue) tuples
+        @type upload_queues: list
+        @return: dict composed by mirror uri as key and
+            _sync_run_upload_queue() return value (or the exception raised)
+            as value. Mirrors not processed because of an interruption are
+            not returned.
+        @rtype: dict
+        """
+        srv_set = self._settings[Server.SYSTEM_SETTINGS_PLG_ID]['server']
+        workers = min(srv_set['sync_parallel_mirrors'], len(upload_queues))
+        pending = collections.deque(upload_queues)
+        results = {}
+        lock = threading.Lock()
+
+        def _pusher():
+            while True:
+                with lock:
+                    if not pending:
+                        break
+                    uri, upload = pending.popleft()
+                try:
+                    outcome = self._sync_run_upload_queue(
+                        repository_id, uri, upload)
+                except Exception as err:
+                    entropy.tools.print_traceback()
+                    outcome = err
+                with lock:
+                    results[uri] = outcome
+
+        if workers < 2:
+            try:
+                _pusher()
+            except KeyboardInterrupt:
+                pass
+            return results
+
+        threads = []
+        for idx in range(workers):
+            th = ParallelTask(_pusher)
+            th.name = "MirrorsUploader-%d" % (idx,)
+            th.daemon = True
+            th.start()
+            threads.append(th)
+
+        try:
+            while threads:
+                threads[0].join(0.3)
+                threads = [x for x in threads if x.is_alive()]
+        except KeyboardInterrupt:
+            with lock:
+                pending.clear()
+            for th in threads:
+                th.join()
+
+        return results
+
     def _sync_run_download_queue(self, repository_id, uri, download_queue):
 
         branch = self._settings['repositories']['branch']
@@ -1545,6 +1611,7 @@ class Server(object):
             obj = queue_map.setdefault(rel_dir, [])
             obj.append(download_path)
 
+        srv_set = self._settings[Server.SYSTEM_SETTINGS_PLG_ID]['server']
         errors = False
         m_fine_uris = set()
         m_broken_uris = set()
@@ -1567,7 +1634,8 @@ class Server(object):
                 critical_files = myqueue,
                 txc_basedir = remote_dir, local_basedir = local_basedir,
                 handlers_data = handlers_data, download = True,
-                repo = repository_id)
+                repo = repository_id,
+                parallel_transfers = srv_set['sync_parallel_transfers'])
 
             xerrors, xm_fine_uris, xm_broken_uris = downloader.go()
             if xerrors:
@@ -1713,6 +1781,7 @@ class Server(object):
         mirrors_tainted = False
         mirror_errors = False
         mirrors_errors = False
+        upload_queues = []
 
         for uri in self._entropy.remote_packages_mirrors(repository_id):
 
@@ -1830,17 +1899,10 @@ class Server(object):
                 if copy_q:
                     self._sync_run_copy_queue(repository_id, copy_q)
 
-                if upload:
-                    mirrors_tainted = True
-
-                if upload:
-                    d_errors, m_fine_uris, \
-                        m_broken_uris = self._sync_run_upload_queue(
-                            repository_id, uri, upload)
-
-                    if d_errors:
-                        mirror_errors = True
-
+                # downloads change the local packages directory, which
+                # the next mirrors are compared against, while uploads
+                # only read from it and are pushed to all the mirrors
+                # at the same time, once every queue is known.
                 if download:
                     d_errors, m_fine_uris, \
                         m_broken_uris = self._sync_run_download_queue(
@@ -1848,7 +1910,11 @@ class Server(object):
 
                     if d_errors:
                         mirror_errors = True
-                if not mirror_errors:
+
+                if upload:
+                    mirrors_tainted = True
+                    upload_queues.append((uri, upload, mirror_errors))
+                elif not mirror_errors:
                     successfull_mirrors.add(uri)
                 else:
                     mirrors_errors = True
@@ -1935,6 +2001,50 @@ class Server(object):
                     )
                 continue
 
+        upload_results = self._sync_run_upload_queues(repository_id,
+            [(uri, upload) for uri, upload, _errors in upload_queues])
+        for uri, upload, mirror_errors in upload_queues:
+
+            outcome = upload_results.get(uri)
+            if outcome is None:
+                self._entropy.output(
+                    "[%s|%s|%s] %s" % (
+                        repository_id,
+                        red(_("sync")),
+                        self._settings['repositories']['branch'],
+                        darkgreen(_("keyboard interrupt !")),
+                    ),
+                    importance = 1,
+                    level = "info",
+                    header = darkgreen(" * ")
+                )
+                continue
+
+            if isinstance(outcome, Exception):
+                mirrors_errors = True
+                broken_mirrors.add(uri)
+                self._entropy.output(
+                    "[%s|%s|%s] %s: %s, %s: %s" % (
+                        repository_id,
+                        red(_("sync")),
+                        self._settings['repositories']['branch'],
+                        darkred(_("exception caught")),
+                        EntropyTransceiver.get_uri_name(uri),
+                        _("error"),
+                        outcome,
+                    ),
+                    importance = 1,
+                    level = "error",
+                    header = darkred(" !!! ")
+                )
+                continue
+
+            d_errors, m_fine_uris, m_broken_uris = outcome
+            if d_errors or mirror_errors:
+                mirrors_errors = True
+            else:
+                successfull_mirrors.add(uri)
+
         # if at least one server has been synced successfully, move files
         if (len(successfull_mirrors) > 0) and not pretend:
             self._move_files_over_from_upload(repository_id)
@@ -2604,6 +2714,7 @@ class Server(object):
             self._entropy._get_remote_repository_relative_path(repository_id),
                 self._settings['repositories']['branch'])
 
+        srv_set = self._settings[Server.SYSTEM_SETTINGS_PLG_ID]['server']
         destroyer = self.TransceiverServerHandler(
             self._entropy,
             mirrors,
@@ -2611,7 +2722,8 @@ class Server(object):
             critical_files = [rss_file],
             remove = True,
             txc_basedir = remote_dir,
-            repo = repository_id
+            repo = repository_id,
+            parallel_mirrors = srv_set['sync_parallel_mirrors']
         )
         errors, m_fine_uris, m_broken_uris = destroyer.go()
         if errors:
@@ -2669,12 +2781,14 @@ class Server(object):
             self._entropy._get_remote_repository_relative_path(repository_id),
                 self._settings['repositories']['branch'])
 
+        srv_set = self._settings[Server.SYSTEM_SETTINGS_PLG_ID]['server']
         uploader = self.TransceiverServerHandler(
             self._entropy,
             mirrors,
             [rss_path],
             critical_files = [rss_path],
-            txc_basedir = remote_dir, repo = repository_id
+            txc_basedir = remote_dir, repo = repository_id,
+            parallel_mirrors = srv_set['sync_parallel_mirrors']
         )
         errors, m_fine_uris, m_broken_uris = uploader.go()
         if errors:
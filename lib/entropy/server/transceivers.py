@@ -9,7 +9,9 @@
     B{Entropy Server transceivers module}.
 
 """
+import collections
 import os
+import threading
 
 from entropy.const import const_isstring, const_isnumber, etpConst
 from entropy.output import darkred, blue, brown, darkgreen, red, bold
@@ -17,15 +19,67 @@ from entropy.transceivers.exceptions import TransceiverConnectionError
 from entropy.i18n import _
 from entropy.client.interfaces.db import InstalledPackagesRepository
 from entropy.core.settings.base import SystemSettings
+from entropy.misc import ParallelTask
 from entropy.transceivers import EntropyTransceiver
-from entropy.tools import print_traceback, is_valid_md5, compare_md5, md5sum
+from entropy.tools import print_traceback, is_valid_md5, md5sum
+
+_LOCAL_DIGESTS = {}
+_LOCAL_DIGESTS_LOCK = threading.Lock()
+_LOCAL_DIGESTS_MAX = 20000
+
+def _local_md5(path):
+    """
+    Return the MD5 checksum of the given local file, caching it by path,
+    mtime and size, since the same files are verified on every mirror.
+    """
+    st = os.stat(path)
+    key = (path, st.st_mtime, st.st_size)
+    with _LOCAL_DIGESTS_LOCK:
+        digest = _LOCAL_DIGESTS.get(key)
+    if digest is None:
+        digest = md5sum(path)
+        with _LOCAL_DIGESTS_LOCK:
+            if len(_LOCAL_DIGESTS) >= _LOCAL_DIGESTS_MAX:
+                _LOCAL_DIGESTS.clear()
+            _LOCAL_DIGESTS[key] = digest
+    return digest
+
+
+class _MirrorSession(object):
+    """
+    State shared by the transfer workers of a single mirror.
+    """
+
+    def __init__(self, uri, items):
+        self.uri = uri
+        self.maxcount = len(items)
+        self.pending = collections.deque(
+            ((counter, item) for counter, item in enumerate(items, 1)))
+        self.lock = threading.Lock()
+        self.directories = set()
+        self.fine = set()
+        self.broken = set()
+        self.fail = False
+        self.stop = False
+        self.connection_error = None
+        self.exception = None
+        # non critical uploads are verified all at once, once the
+        # queue is complete
+        self.verify_deferred = False
+        self.uploaded = []
+
 
 class TransceiverServerHandler:
 
+    # amount of times the connections to a mirror are reestablished
+    # when they drop before the transfer queue is completed
+    _RECONNECT_TRIES = 3
+
     def __init__(self, entropy_interface, uris, files_to_upload,
         download = False, remove = False, txc_basedir = None,
         local_basedir = None, critical_files = None,
-        handlers_data = None, repo = None, copy_herustic_support = False):
+        handlers_data = None, repo = None, copy_herustic_support = False,
+        parallel_mirrors = 1, parallel_transfers = 1):
 
         if critical_files is None:
             critical_files = []
@@ -77,6 +131,11 @@ class TransceiverServerHandler:
         self.critical_files = critical_files
         self.handlers_data = handlers_data.copy()
 
+        # amount of mirrors handled at the same time and amount of
+        # concurrent connections (and transfers) to every mirror
+        self._parallel_mirrors = max(1, parallel_mirrors)
+        self._parallel_transfers = max(1, parallel_transfers)
+
     def handler_verify_upload(self, local_filepath, uri, counter, maxcount,
         tries, remote_md5 = None):
 
@@ -103,7 +162,7 @@ class TransceiverServerHandler:
             valid_md5 = is_valid_md5(remote_md5)
             ckres = False
             if valid_md5: # seems valid
-                ckres = compare_md5(local_filepath, remote_md5)
+                ckres = _local_md5(local_filepath) == remote_md5
             if ckres:
                 self._entropy.output(
                     "[%s|#%s|(%s/%s)] %s: %s: %s" % (
@@ -156,180 +215,383 @@ class TransceiverServerHandler:
 
         return valid_remote_md5 # always valid
 
-    def _transceive(self, uri):
-
-        fine = set()
-        broken = set()
-        fail = False
-        crippled_uri = EntropyTransceiver.get_uri_name(uri)
-        action = 'push'
+    def _action(self):
+        """
+        Return the name of the action executed by this handler.
+        """
         if self.download:
-            action = 'pull'
+            return 'pull'
         elif self.remove:
-            action = 'remove'
+            return 'remove'
+        return 'push'
+
+    def _run_workers(self, name, worker_func, workers, stop_func):
+        """
+        Run worker_func in the given amount of threads and wait for them.
+        If only one worker is requested, worker_func is executed in the
+        calling thread. stop_func is called if the wait is interrupted
+        (KeyboardInterrupt).
+        """
+        if workers < 2:
+            worker_func()
+            return
+
+        threads = []
+        for idx in range(workers):
+            th = ParallelTask(worker_func)
+            th.name = "%s-%d" % (name, idx)
+            th.daemon = True
+            th.start()
+            threads.append(th)
 
         try:
-            txc = EntropyTransceiver(uri)
-            if const_isnumber(self.speed_limit):
-                txc.set_speed_limit(self.speed_limit)
-            txc.set_output_interface(self._entropy)
-        except TransceiverConnectionError:
-            print_traceback()
-            return True, fine, broken # issues
+            while threads:
+                threads[0].join(0.3)
+                threads = [x for x in threads if x.is_alive()]
+        except:
+            stop_func()
+            for th in threads:
+                th.join()
+            raise
+
+    def _transceive(self, uri):
 
-        maxcount = len(self.myfiles)
-        counter = 0
+        items = []
+        for mypath in self.myfiles:
+            if isinstance(mypath, tuple) and len(mypath) < 2:
+                continue
+            items.append(mypath)
 
-        with txc as handler:
+        session = _MirrorSession(uri, items)
+        workers = max(1, min(self._parallel_transfers, len(items)))
+
+        # sync-speed-limit caps the whole mirror, not every connection
+        speed_limit = self.speed_limit
+        if const_isnumber(speed_limit) and speed_limit > 0:
+            speed_limit = max(1, speed_limit // workers)
+
+        session.verify_deferred = not (self.download or self.remove)
+        self._transceive_queue(session, workers, speed_limit)
+
+        if session.uploaded and not session.fail:
+            failed = self._verify_uploads(session)
+            if failed:
+                # upload them again, verifying every single transfer
+                session.verify_deferred = False
+                session.pending.extend(failed)
+                self._transceive_queue(session,
+                    min(workers, len(failed)), speed_limit)
+
+        return session.fail, session.fine, session.broken
+
+    def _transceive_queue(self, session, workers, speed_limit):
+        """
+        Process the _MirrorSession queue using the given amount of
+        connections, reconnecting if they drop before its completion.
+        """
+        def _stop():
+            with session.lock:
+                session.stop = True
+
+        for attempt in range(self._RECONNECT_TRIES):
+            self._run_workers("TransceiverServerHandler{%s}" % (
+                    EntropyTransceiver.get_uri_name(session.uri),),
+                lambda: self._transceive_worker(session, speed_limit),
+                workers, _stop)
+
+            if session.exception is not None:
+                raise session.exception
+            if session.fail or not session.pending:
+                break
+            if session.connection_error is None:
+                break
+            # connections dropped before the queue was completed,
+            # reconnect and push the rest
+            workers = max(1, min(workers, len(session.pending)))
+
+        if session.pending and not session.fail:
+            # unable to reach the mirror
+            session.fail = True
+            session.broken.add(
+                (session.uri, str(session.connection_error)))
+
+    def _verify_uploads(self, session):
+        """
+        Verify the files uploaded by the _MirrorSession workers, fetching
+        all the remote checksums at once. Return the list of queue items
+        whose verification failed.
+        """
+        uploaded = session.uploaded
+        session.uploaded = []
+        crippled_uri = EntropyTransceiver.get_uri_name(session.uri)
+
+        self._entropy.output(
+            "[%s|%s] %s: %s" % (
+                blue(crippled_uri),
+                brown(self._action()),
+                blue(_("verifying uploaded files")),
+                bold(str(len(uploaded))),
+            ),
+            importance = 0,
+            level = "info",
+            header = blue(" @@ ")
+        )
 
-            for mypath in self.myfiles:
+        remote_md5s = None
+        for attempt in range(self._RECONNECT_TRIES):
+            try:
+                txc = EntropyTransceiver(session.uri)
+                txc.set_output_interface(self._entropy)
+                with txc as handler:
+                    remote_md5s = handler.get_md5_many(
+                        [remote_path for _counter, _item, remote_path \
+                             in uploaded])
+                break
+            except TransceiverConnectionError as err:
+                print_traceback()
+                session.connection_error = err
+
+        if remote_md5s is None:
+            # unable to reach the mirror
+            session.fail = True
+            session.broken.add(
+                (session.uri, str(session.connection_error)))
+            return []
+
+        failed = []
+        for counter, item, remote_path in uploaded:
+            local_path = item
+            if isinstance(item, tuple):
+                _base_dir, local_path = item
+            valid = self.handler_verify_upload(local_path, session.uri,
+                counter, session.maxcount, 1,
+                remote_md5 = remote_md5s.get(remote_path))
+            if not valid:
+                failed.append((counter, item))
+        return failed
+
+    def _transceive_worker(self, session, speed_limit):
+        """
+        Transfer worker, pulling files from the _MirrorSession queue
+        through its own connection to the mirror.
+        """
+        try:
+            txc = EntropyTransceiver(session.uri)
+            if const_isnumber(speed_limit):
+                txc.set_speed_limit(speed_limit)
+            txc.set_output_interface(self._entropy)
 
-                base_dir = self.txc_basedir
+            with txc as handler:
+                while True:
+                    with session.lock:
+                        if session.stop or session.fail:
+                            break
+                        if not session.pending:
+                            break
+                        counter, mypath = session.pending.popleft()
+
+                    try:
+                        done, lastrc = self._transceive_file(
+                            session, handler, counter, mypath)
+                    except TransceiverConnectionError:
+                        # hand the file over to the other connections
+                        with session.lock:
+                            session.pending.appendleft((counter, mypath))
+                        raise
+
+                    if done:
+                        with session.lock:
+                            session.fine.add(session.uri)
+                        continue
 
-                if isinstance(mypath, tuple):
-                    if len(mypath) < 2:
+                    if not self._transceive_failed(
+                        session, counter, mypath, lastrc):
                         continue
-                    base_dir, mypath = mypath
 
+                    with session.lock:
+                        session.fail = True
+                        session.broken.add((session.uri, lastrc))
+                    # next mirror
+                    break
+
+        except TransceiverConnectionError as err:
+            print_traceback()
+            with session.lock:
+                session.connection_error = err
+        except Exception as err:
+            print_traceback()
+            with session.lock:
+                session.exception = err
+                session.stop = True
+
+    def _transceive_file(self, session, handler, counter, mypath):
+        """
+        Transfer a single file, retrying in case of failures.
+        Return a tuple composed by the transfer status (bool) and the
+        last error code.
+        """
+        uri = session.uri
+        crippled_uri = EntropyTransceiver.get_uri_name(uri)
+        maxcount = session.maxcount
+        action = self._action()
+        base_dir = self.txc_basedir
+        item = mypath
+
+        if isinstance(mypath, tuple):
+            base_dir, mypath = mypath
+
+        if base_dir not in session.directories:
+            # serialize directories creation
+            with session.lock:
                 if not handler.is_dir(base_dir):
                     handler.makedirs(base_dir)
+                session.directories.add(base_dir)
 
-                mypath_fn = os.path.basename(mypath)
-                remote_path = os.path.join(base_dir, mypath_fn)
-
-                syncer = handler.upload
-                myargs = (mypath, remote_path)
-                if self.download:
-                    syncer = handler.download
-                    local_path = os.path.join(self.local_basedir, mypath_fn)
-                    myargs = (remote_path, local_path)
-                elif self.remove:
-                    syncer = handler.delete
-                    myargs = (remote_path,)
-
-                fallback_syncer, fallback_args = None, None
-                # upload -> remote copy herustic support
-                # if a package file might have been already uploaded
-                # to remote mirror, try to look in other repositories'
-                # package directories if a file, with the same md5 and name
-                # is already available. In this case, use remote copy instead
-                # of upload to save bandwidth.
-                if self._copy_herustic and (syncer == handler.upload):
-                    # copy herustic support enabled
-                    # we are uploading
-                    new_syncer, new_args = self._copy_herustic_support(
-                        handler, mypath, base_dir, remote_path)
-                    if new_syncer is not None:
-                        fallback_syncer, fallback_args = syncer, myargs
-                        syncer, myargs = new_syncer, new_args
-                        action = "copy"
-
-                counter += 1
-                tries = 0
-                done = False
-                lastrc = None
-
-                while tries < 5:
-                    tries += 1
-                    self._entropy.output(
-                        "[%s|#%s|(%s/%s)] %s: %s" % (
-                            blue(crippled_uri),
-                            darkgreen(str(tries)),
-                            blue(str(counter)),
-                            bold(str(maxcount)),
-                            blue(action),
-                            red(os.path.basename(mypath)),
-                        ),
-                        importance = 0,
-                        level = "info",
-                        header = red(" @@ ")
-                    )
-                    rc = syncer(*myargs)
-                    if (not rc) and (fallback_syncer is not None):
-                        # if we have a fallback syncer, try it first
-                        # before giving up.
-                        rc = fallback_syncer(*myargs)
-
-                    if rc and not (self.download or self.remove):
-                        remote_md5 = handler.get_md5(remote_path)
-                        rc = self.handler_verify_upload(mypath, uri,
-                            counter, maxcount, tries, remote_md5 = remote_md5)
-                    if rc:
-                        self._entropy.output(
-                            "[%s|#%s|(%s/%s)] %s %s: %s" % (
-                                        blue(crippled_uri),
-                                        darkgreen(str(tries)),
-                                        blue(str(counter)),
-                                        bold(str(maxcount)),
-                                        blue(action),
-                                        _("successful"),
-                                        red(os.path.basename(mypath)),
-                            ),
-                            importance = 0,
-                            level = "info",
-                            header = darkgreen(" @@ ")
-                        )
-                        done = True
-                        fine.add(uri)
-                        break
-                    else:
-                        self._entropy.output(
-                            "[%s|#%s|(%s/%s)] %s %s: %s" % (
-                                        blue(crippled_uri),
-                                        darkgreen(str(tries)),
-                                        blue(str(counter)),
-                                        bold(str(maxcount)),
-                                        blue(action),
-                                        brown(_("failed, retrying")),
-                                        red(os.path.basename(mypath)),
-                                ),
-                            importance = 0,
-                            level = "warning",
-                            header = brown(" @@ ")
-                        )
-                        lastrc = rc
-                        continue
-
-                if not done:
+        mypath_fn = os.path.basename(mypath)
+        remote_path = os.path.join(base_dir, mypath_fn)
 
-                    self._entropy.output(
-                        "[%s|(%s/%s)] %s %s: %s - %s: %s" % (
+        syncer = handler.upload
+        myargs = (mypath, remote_path)
+        if self.download:
+            syncer = handler.download
+            local_path = os.path.join(self.local_basedir, mypath_fn)
+            myargs = (remote_path, local_path)
+        elif self.remove:
+            syncer = handler.delete
+            myargs = (remote_path,)
+
+        fallback_syncer, fallback_args = None, None
+        # upload -> remote copy herustic support
+        # if a package file might have been already uploaded
+        # to remote mirror, try to look in other repositories'
+        # package directories if a file, with the same md5 and name
+        # is already available. In this case, use remote copy instead
+        # of upload to save bandwidth.
+        if self._copy_herustic and (syncer == handler.upload):
+            # copy herustic support enabled
+            # we are uploading
+            new_syncer, new_args = self._copy_herustic_support(
+                handler, mypath, base_dir, remote_path)
+            if new_syncer is not None:
+                fallback_syncer, fallback_args = syncer, myargs
+                syncer, myargs = new_syncer, new_args
+                action = "copy"
+
+        tries = 0
+        lastrc = None
+
+        while tries < 5:
+            tries += 1
+            self._entropy.output(
+                "[%s|#%s|(%s/%s)] %s: %s" % (
+                    blue(crippled_uri),
+                    darkgreen(str(tries)),
+                    blue(str(counter)),
+                    bold(str(maxcount)),
+                    blue(action),
+                    red(os.path.basename(mypath)),
+                ),
+                importance = 0,
+                level = "info",
+                header = red(" @@ ")
+            )
+            rc = syncer(*myargs)
+            if (not rc) and (fallback_syncer is not None):
+                # if we have a fallback syncer, try it first
+                # before giving up.
+                rc = fallback_syncer(*fallback_args)
+
+            # critical files are verified right away, so that a broken
+            # upload stops the mirror before the rest of the queue
+            deferred = session.verify_deferred and \
+                mypath not in self.critical_files
+            if rc and deferred:
+                with session.lock:
+                    session.uploaded.append((counter, item, remote_path))
+            elif rc and not (self.download or self.remove):
+                remote_md5 = handler.get_md5(remote_path)
+                rc = self.handler_verify_upload(mypath, uri,
+                    counter, maxcount, tries, remote_md5 = remote_md5)
+            if rc:
+                self._entropy.output(
+                    "[%s|#%s|(%s/%s)] %s %s: %s" % (
                                 blue(crippled_uri),
+                                darkgreen(str(tries)),
                                 blue(str(counter)),
                                 bold(str(maxcount)),
                                 blue(action),
-                                darkred("failed, giving up"),
+                                _("successful"),
                                 red(os.path.basename(mypath)),
-                                _("error"),
-                                lastrc,
-                        ),
-                        importance = 1,
-                        level = "error",
-                        header = darkred(" !!! ")
-                    )
-
-                    if mypath not in self.critical_files:
-                        self._entropy.output(
-                            "[%s|(%s/%s)] %s: %s, %s..." % (
+                    ),
+                    importance = 0,
+                    level = "info",
+                    header = darkgreen(" @@ ")
+                )
+                return True, rc
+            else:
+                self._entropy.output(
+                    "[%s|#%s|(%s/%s)] %s %s: %s" % (
                                 blue(crippled_uri),
+                                darkgreen(str(tries)),
                                 blue(str(counter)),
                                 bold(str(maxcount)),
-                                blue(_("not critical")),
-                                os.path.basename(mypath),
-                                blue(_("continuing")),
-                            ),
-                            importance = 1,
-                            level = "warning",
-                            header = brown(" @@ ")
-                        )
-                        continue
+                                blue(action),
+                                brown(_("failed, retrying")),
+                                red(os.path.basename(mypath)),
+                        ),
+                    importance = 0,
+                    level = "warning",
+                    header = brown(" @@ ")
+                )
+                lastrc = rc
+                continue
 
-                    fail = True
-                    broken.add((uri, lastrc))
-                    # next mirror
-                    break
+        return False, lastrc
 
-        return fail, fine, broken
+    def _transceive_failed(self, session, counter, mypath, lastrc):
+        """
+        Report a file transfer failure. Return True if the failed file
+        is critical and the mirror must be considered broken.
+        """
+        crippled_uri = EntropyTransceiver.get_uri_name(session.uri)
+        maxcount = session.maxcount
+        action = self._action()
+        if isinstance(mypath, tuple):
+            _base_dir, mypath = mypath
+
+        self._entropy.output(
+            "[%s|(%s/%s)] %s %s: %s - %s: %s" % (
+                    blue(crippled_uri),
+                    blue(str(counter)),
+                    bold(str(maxcount)),
+                    blue(action),
+                    darkred("failed, giving up"),
+                    red(os.path.basename(mypath)),
+                    _("error"),
+                    lastrc,
+            ),
+            importance = 1,
+            level = "error",
+            header = darkred(" !!! ")
+        )
+
+        if mypath not in self.critical_files:
+            self._entropy.output(
+                "[%s|(%s/%s)] %s: %s, %s..." % (
+                    blue(crippled_uri),
+                    blue(str(counter)),
+                    bold(str(maxcount)),
+                    blue(_("not critical")),
+                    os.path.basename(mypath),
+                    blue(_("continuing")),
+                ),
+                importance = 1,
+                level = "warning",
+                header = brown(" @@ ")
+            )
+            return False
+
+        return True
 
     def _copy_herustic_support(self, handler, local_path,
             txc_basedir, remote_path):
@@ -398,40 +660,68 @@ class TransceiverServerHandler:
 
         broken_uris = set()
         fine_uris = set()
-        errors = False
-        action = 'push'
-        if self.download:
-            action = 'pull'
-        elif self.remove:
-            action = 'remove'
+        action = self._action()
+        pending = collections.deque(self.uris)
+        workers = min(self._parallel_mirrors, len(self.uris))
+        results = []
+        exceptions = []
+        lock = threading.Lock()
+
+        def _stop():
+            with lock:
+                pending.clear()
+
+        def _mirror_worker():
+            while True:
+                with lock:
+                    if not pending:
+                        break
+                    uri = pending.popleft()
 
-        for uri in self.uris:
+                crippled_uri = EntropyTransceiver.get_uri_name(uri)
+                self._entropy.output(
+                    "[%s|%s] %s..." % (
+                        blue(crippled_uri),
+                        brown(action),
+                        blue(_("connecting to mirror")),
+                    ),
+                    importance = 0,
+                    level = "info",
+                    header = blue(" @@ ")
+                )
 
-            crippled_uri = EntropyTransceiver.get_uri_name(uri)
-            self._entropy.output(
-                "[%s|%s] %s..." % (
-                    blue(crippled_uri),
-                    brown(action),
-                    blue(_("connecting to mirror")),
-                ),
-                importance = 0,
-                level = "info",
-                header = blue(" @@ ")
-            )
+                self._entropy.output(
+                    "[%s|%s] %s %s..." % (
+                        blue(crippled_uri),
+                        brown(action),
+                        blue(_("setting directory to")),
+                        darkgreen(self.txc_basedir),
+                    ),
+                    importance = 0,
+                    level = "info",
+                    header = blue(" @@ ")
+                )
 
-            self._entropy.output(
-                "[%s|%s] %s %s..." % (
-                    blue(crippled_uri),
-                    brown(action),
-                    blue(_("setting directory to")),
-                    darkgreen(self.txc_basedir),
-                ),
-                importance = 0,
-                level = "info",
-                header = blue(" @@ ")
-            )
+                try:
+                    outcome = self._transceive(uri)
+                except Exception as err:
+                    # stop the other mirrors and raise it
+                    print_traceback()
+                    with lock:
+                        exceptions.append(err)
+                        pending.clear()
+                    break
+                with lock:
+                    results.append(outcome)
 
-            fail, fine, broken = self._transceive(uri)
+        self._run_workers("TransceiverServerHandler",
+            _mirror_worker, workers, _stop)
+
+        if exceptions:
+            raise exceptions[0]
+
+        errors = False
+        for fail, fine, broken in results:
             fine_uris |= fine
             broken_uris |= broken
             if fail:
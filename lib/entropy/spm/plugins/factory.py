@@ -14,11 +14,7 @@ from entropy.core.settings.base import SystemSettings
 from entropy.spm.plugins.skel import SpmPlugin
 import entropy.spm.plugins.interfaces as plugs
 
-_settings = SystemSettings()
-_USER_PLUG = _settings['system'].get('spm_backend')
-
-FACTORY = EntropyPluginFactory(SpmPlugin, plugs,
-    default_plugin_name = _USER_PLUG)
+FACTORY = EntropyPluginFactory(SpmPlugin, plugs)
 
 get_available_plugins = FACTORY.get_available_plugins
 
@@ -32,8 +28,11 @@ def get_default_class():
     """
     fallback_used = False
     myplugs = get_available_plugins()
-    if _USER_PLUG is not None:
-        user_plugin = myplugs.get(_USER_PLUG)
+    # read at call time, this module is imported by the whole
+    # Entropy stack and SystemSettings parsing is not cheap.
+    user_plug = SystemSettings()['system'].get('spm_backend')
+    if user_plug is not None:
+        user_plugin = myplugs.get(user_plug)
         if user_plugin is not None:
             return user_plugin
         fallback_used = True
@@ -39,6 +39,7 @@ from entropy.core.settings.base import SystemSettings
 from entropy.misc import LogFile, ParallelTask
 from entropy.spm.plugins.skel import SpmPlugin
 import entropy.dep
+import entropy.elf
 import entropy.tools
 from entropy.spm.plugins.interfaces.portage_plugin import xpak
 from entropy.spm.plugins.interfaces.portage_plugin import xpaktools
@@ -4679,19 +4680,18 @@ class PortagePlugin(SpmPlugin):
                 continue
 
             try:
-                if not entropy.tools.is_elf_file(unpack_obj):
-                    continue
-                elf_class = entropy.tools.read_elf_class(unpack_obj)
+                elf_obj = entropy.elf.read_elf(unpack_obj, symbols = False)
+            except ValueError:
+                # not an ELF object
+                continue
             except IOError as err:
                 self.__output.output("%s: %s => %s" % (
                     _("IOError while reading"), unpack_obj, repr(err),),
                     level = "warning")
                 continue
 
-            needed_libs = entropy.tools.read_elf_dynamic_libraries(
-                unpack_obj)
-            for lib in needed_libs:
-                pkg_needed.add((lib, elf_class))
+            for lib in elf_obj.needed:
+                pkg_needed.add((lib, elf_obj.elf_class))
 
         return tuple(sorted(pkg_needed))
 
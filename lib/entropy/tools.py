@@ -32,6 +32,7 @@ import bz2
 import mmap
 import codecs
 import struct
+import binascii
 
 from entropy.output import print_generic
 from entropy.const import etpConst, const_kill_threads, const_islive, \
@@ -403,20 +404,27 @@ def is_st_valentine():
         return True
     return False
 
-def add_proxy_opener(module, data):
+def build_proxy_opener(module, data, handlers = None):
     """
-    Add proxy opener to urllib module.
+    Build a urllib opener using the given proxy settings, without
+    installing it into the urllib module.
 
     @param module: urllib module
     @type module: Python module
-    @param data: proxy settings
+    @param data: proxy settings, if empty, no proxy is used
     @type data: dict
+    @keyword handlers: additional urllib handlers
+    @type handlers: list
+    @return: the urllib opener
+    @rtype: urllib OpenerDirector
     """
     import types
     if not isinstance(module, types.ModuleType):
         AttributeError("not a module")
+    if handlers is None:
+        handlers = []
     if not data:
-        return
+        return module.build_opener(*handlers)
 
     username = None
     password = None
@@ -438,10 +446,21 @@ def add_proxy_opener(module, data):
 
     proxy_support = module.ProxyHandler(data)
     if authinfo:
-        opener = module.build_opener(proxy_support, authinfo)
-    else:
-        opener = module.build_opener(proxy_support)
-    module.install_opener(opener)
+        return module.build_opener(proxy_support, authinfo, *handlers)
+    return module.build_opener(proxy_support, *handlers)
+
+def add_proxy_opener(module, data):
+    """
+    Add proxy opener to urllib module.
+
+    @param module: urllib module
+    @type module: Python module
+    @param data: proxy settings
+    @type data: dict
+    """
+    if not data:
+        return
+    module.install_opener(build_proxy_opener(module, data))
 
 def is_valid_ascii(string):
     """
@@ -1257,6 +1276,7 @@ _DELTA_DECOMPRESSION_MAP = {
 }
 _DELTA_COMPRESSION_MAP = {
     "bz2": "bz2.BZ2File",
+    "gz": "gzip.GzipFile",
     "gzip": "gzip.GzipFile",
 }
 _DEFAULT_PKG_COMPRESSION = "bz2"
@@ -1363,12 +1383,308 @@ def generate_entropy_delta(pkg_path_a, pkg_path_b, hash_tag,
 
     return delta_file
 
+class _DeltaFallback(Exception):
+    """
+    Raised when an Entropy package delta cannot be applied in memory and the
+    external bspatch executable must be used.
+    """
+
+_DELTA_MAGIC = const_convert_to_rawstring("BSDIFF40")
+_DELTA_HEADER_SIZE = 32
+# maximum uncompressed size of the package a delta is applied to in memory
+_DELTA_MEMORY_LIMIT = 512 * 1024000
+_DELTA_OPENER_MAP = {
+    "bz2": bz2.BZ2File,
+    "gz": gzip.GzipFile,
+}
+
+def _delta_offset(data):
+    """
+    Decode a bsdiff (sign and magnitude, little endian) 64bit offset.
+    """
+    value = struct.unpack("<Q", data)[0]
+    if value & (1 << 63):
+        return -(value & ~(1 << 63))
+    return value
+
+def _delta_add(old_data, diff_data):
+    """
+    Return the bytewise sum (modulo 256) of two equally sized raw strings.
+    The sum is computed on big integers, eight bits lanes at a time, which
+    is much faster than iterating over every byte.
+    """
+    size = len(diff_data)
+    if not diff_data.strip(const_convert_to_rawstring("\x00")):
+        # bsdiff diff blocks are mostly zeroes
+        return old_data
+
+    if const_is_python3():
+        old_int = int.from_bytes(old_data, "big")
+        diff_int = int.from_bytes(diff_data, "big")
+    else:
+        old_int = int(binascii.hexlify(old_data), 16)
+        diff_int = int(binascii.hexlify(diff_data), 16)
+    high = int("80" * size, 16)
+    low = int("7f" * size, 16)
+    new_int = ((old_int & low) + (diff_int & low)) ^ \
+        ((old_int ^ diff_int) & high)
+    if const_is_python3():
+        return new_int.to_bytes(size, "big")
+    return binascii.unhexlify("%0*x" % (size * 2, new_int))
+
+
+class _DeltaBlockReader(object):
+    """
+    Stream reader of a bzip2 compressed bsdiff block.
+    """
+
+    def __init__(self, delta_path, offset, length = None):
+        """
+        @param delta_path: path to Entropy package delta
+        @type delta_path: string
+        @param offset: offset of the block in the file
+        @type offset: int
+        @keyword length: length of the block, if None, the block ends
+            with the bzip2 stream
+        @type length: int
+        """
+        self._file = open(delta_path, "rb")
+        self._file.seek(offset)
+        self._left = length
+        self._decompressor = bz2.BZ2Decompressor()
+        self._buffer = const_convert_to_rawstring("")
+        self._eof = False
+
+    def read(self, size):
+        """
+        Read exactly size bytes from the uncompressed block.
+
+        @raise IOError: if the block is shorter than expected
+        """
+        while len(self._buffer) < size and not self._eof:
+            read_size = _READ_SIZE
+            if self._left is not None:
+                read_size = min(read_size, self._left)
+            data = None
+            if read_size:
+                data = self._file.read(read_size)
+            if not data:
+                self._eof = True
+                break
+            if self._left is not None:
+                self._left -= len(data)
+            try:
+                self._buffer += self._decompressor.decompress(data)
+            except EOFError:
+                self._eof = True
+                break
+            if self._decompressor.unused_data:
+                # end of the bzip2 stream, trailing metadata follows
+                self._eof = True
+
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        if len(data) != size:
+            raise IOError("corrupted delta, block too short")
+        return data
+
+    def close(self):
+        """
+        Close the underlying file.
+        """
+        self._file.close()
+
+
+def _bspatch(old_data, delta_path, write_func):
+    """
+    Apply the bsdiff (BSDIFF40 format) patch contained in delta_path to
+    old_data. The new data is passed, chunk by chunk, to write_func.
+
+    @raise _DeltaFallback: if the patch format is not supported
+    @raise IOError: if the patch is corrupted
+    """
+    with open(delta_path, "rb") as delta_f:
+        header = delta_f.read(_DELTA_HEADER_SIZE)
+        if len(header) != _DELTA_HEADER_SIZE or \
+                header[:8] != _DELTA_MAGIC:
+            raise _DeltaFallback("unsupported delta format")
+        ctrl_len = _delta_offset(header[8:16])
+        diff_len = _delta_offset(header[16:24])
+        new_size = _delta_offset(header[24:32])
+        if ctrl_len < 0 or diff_len < 0 or new_size < 0:
+            raise IOError("corrupted delta, invalid header")
+        try:
+            ctrl_data = bz2.decompress(delta_f.read(ctrl_len))
+        except (IOError, EOFError, ValueError) as err:
+            raise IOError("corrupted delta, invalid control block: %s" % (
+                err,))
+
+    diff_reader = _DeltaBlockReader(delta_path,
+        _DELTA_HEADER_SIZE + ctrl_len, length = diff_len)
+    extra_reader = _DeltaBlockReader(delta_path,
+        _DELTA_HEADER_SIZE + ctrl_len + diff_len)
+    try:
+        old_size = len(old_data)
+        zero = const_convert_to_rawstring("\x00")
+        old_pos, new_pos, ctrl_pos = 0, 0, 0
+        while new_pos < new_size:
+            ctrl = ctrl_data[ctrl_pos:ctrl_pos + 24]
+            if len(ctrl) != 24:
+                raise IOError("corrupted delta, control block too short")
+            ctrl_pos += 24
+            diff_size = _delta_offset(ctrl[0:8])
+            extra_size = _delta_offset(ctrl[8:16])
+            seek = _delta_offset(ctrl[16:24])
+            if diff_size < 0 or extra_size < 0 or \
+                    new_pos + diff_size + extra_size > new_size:
+                raise IOError("corrupted delta, invalid control data")
+
+            # add the diff block to the old data
+            done = 0
+            while done < diff_size:
+                size = min(_READ_SIZE, diff_size - done)
+                diff_data = diff_reader.read(size)
+                start = old_pos + done
+                end = start + size
+                old_chunk = old_data[max(start, 0):max(min(end, old_size), 0)]
+                if len(old_chunk) != size:
+                    # out of the old data boundaries, missing bytes are 0
+                    head = min(max(-start, 0), size)
+                    old_chunk = zero * head + old_chunk
+                    old_chunk += zero * (size - len(old_chunk))
+                write_func(_delta_add(old_chunk, diff_data))
+                done += size
+            new_pos += diff_size
+            old_pos += diff_size
+
+            # copy the extra block
+            done = 0
+            while done < extra_size:
+                size = min(_READ_SIZE, extra_size - done)
+                write_func(extra_reader.read(size))
+                done += size
+            new_pos += extra_size
+            old_pos += seek
+    finally:
+        diff_reader.close()
+        extra_reader.close()
+
+def _append_entropy_metadata(entropy_package_file, dest_f):
+    """
+    Append the Entropy metadata of the given Entropy package file (including
+    the start tag) to the given file object.
+
+    @raise IOError: if the Entropy metadata cannot be found
+    """
+    with open(entropy_package_file, "rb") as pkg_f:
+        start_position = _locate_edb(pkg_f)
+        if start_position is None:
+            raise IOError("Entropy metadata not found in %s" % (
+                entropy_package_file,))
+        dest_f.write(const_convert_to_rawstring(etpConst['databasestarttag']))
+        pkg_f.seek(start_position)
+        data = pkg_f.read(_READ_SIZE)
+        while data:
+            dest_f.write(data)
+            data = pkg_f.read(_READ_SIZE)
+
+def _apply_entropy_delta_memory(pkg_path_a, delta_path, new_pkg_path_b,
+    pkg_compression):
+    """
+    Apply Entropy package delta file in memory, see apply_entropy_delta().
+    The package A is decompressed in memory, the patched data is streamed to
+    the compressor and the package metadata is appended right after,
+    without any intermediate uncompressed file.
+
+    @raise _DeltaFallback: if the delta cannot be applied in memory
+    @raise IOError: if delta cannot be applied
+    """
+    from entropy.spm.plugins.factory import get_default_class as get_spm_class
+
+    if pkg_compression is None:
+        pkg_compression = _DEFAULT_PKG_COMPRESSION
+    opener = _DELTA_OPENER_MAP[pkg_compression]
+    used_compression = _DELTA_COMPRESSION_MAP[pkg_compression]
+
+    chunks = []
+    old_size = 0
+    pkg_f = opener(pkg_path_a, "rb")
+    try:
+        chunk = pkg_f.read(_READ_SIZE)
+        while chunk:
+            old_size += len(chunk)
+            if old_size > _DELTA_MEMORY_LIMIT:
+                raise _DeltaFallback("package too big")
+            chunks.append(chunk)
+            chunk = pkg_f.read(_READ_SIZE)
+    finally:
+        pkg_f.close()
+    old_data = const_convert_to_rawstring("").join(chunks)
+    del chunks
+
+    tmp_spm_fd, tmp_spm_path = const_mkstemp(dir=os.path.dirname(delta_path))
+    os.close(tmp_spm_fd)
+    new_pkg_path_b_tmp_compressed = new_pkg_path_b + ".edelta_work.compress"
+    try:
+        f_out = eval(used_compression)(new_pkg_path_b_tmp_compressed, "wb",
+            compresslevel = 9)
+        try:
+            _bspatch(old_data, delta_path, f_out.write)
+        finally:
+            f_out.close()
+        del old_data
+
+        # add spm metadata
+        get_spm_class().dump_package_metadata(delta_path, tmp_spm_path)
+        get_spm_class().aggregate_package_metadata(
+            new_pkg_path_b_tmp_compressed, tmp_spm_path)
+        # add entropy metadata
+        with open(new_pkg_path_b_tmp_compressed, "ab") as f_out:
+            _append_entropy_metadata(delta_path, f_out)
+        os.rename(new_pkg_path_b_tmp_compressed, new_pkg_path_b)
+
+    finally:
+        for path in (tmp_spm_path, new_pkg_path_b_tmp_compressed):
+            try:
+                os.remove(path)
+            except (IOError, OSError):
+                pass
+
 def apply_entropy_delta(pkg_path_a, delta_path, new_pkg_path_b,
     pkg_compression = None):
     """
     Apply Entropy package delta file to pkg_path_a generating pkg_path_b (which
     is returned in case of success). If delta cannot be generated, IOError is
     raised.
+    Deltas are applied in memory, the external bspatch executable is used
+    if that is not possible (unsupported delta format, huge packages).
+
+    @param pkg_path_a: path to package A
+    @type pkg_path_a: string
+    @param delta_path: path to entropy package delta
+    @type delta_path: string
+    @param new_pkg_path_b: path where to store newly created package B
+    @type new_pkg_path_b: string
+    @keyword pkg_compression: default package compression, can be "bz2" or "gz".
+        if None, "bz2" is selected.
+    @type: string
+    @raise IOError: if delta cannot be generated.
+    """
+    try:
+        _apply_entropy_delta_memory(pkg_path_a, delta_path, new_pkg_path_b,
+            pkg_compression)
+    except _DeltaFallback:
+        _apply_entropy_delta_external(pkg_path_a, delta_path,
+            new_pkg_path_b, pkg_compression)
+    except (OSError, EOFError, ValueError) as err:
+        raise IOError("cannot apply delta: %s" % (err,))
+
+def _apply_entropy_delta_external(pkg_path_a, delta_path, new_pkg_path_b,
+    pkg_compression = None):
+    """
+    Apply Entropy package delta file to pkg_path_a generating pkg_path_b (which
+    is returned in case of success) using the external bspatch executable.
+    If delta cannot be generated, IOError is raised.
 
     @param pkg_path_a: path to package A
     @type pkg_path_a: string
@@ -2040,26 +2356,95 @@ def apply_tarball_ownership(filepath, prefix_path):
             tar.close()
 
 
-def uncompress_tarball(filepath, extract_path = None, catch_empty = False):
+def _apply_tarinfo_ownership(tarinfo, epath):
     """
-    Unpack tarball file (supported compression algorithm is given by tarfile
-    module) respecting directory structure, mtime and permissions.
+    Apply ownership and mode of the given tarfile.TarInfo object to epath,
+    resolving user and group names against the current system, like
+    tarfile.TarFile.chown() and tarfile.TarFile.chmod() do.
+    """
+    try:
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            gid = get_gid_from_group(tarinfo.gname)
+            if gid == -1:
+                gid = tarinfo.gid
+            uid = get_uid_from_user(tarinfo.uname)
+            if uid == -1:
+                uid = tarinfo.uid
+            if tarinfo.issym() and hasattr(os, "lchown"):
+                os.lchown(epath, uid, gid)
+            else:
+                os.chown(epath, uid, gid)
+        _fix_uid_gid(tarinfo, epath)
+        if not os.path.islink(epath):
+            # chown() drops setuid/setgid bits, restore them
+            os.chmod(epath, tarinfo.mode)
+    except EnvironmentError as err:
+        raise IOError(err)
+
+def apply_tarball_ownership_entries(entries, prefix_path):
+    """
+    Same as apply_tarball_ownership(), but instead of reading the tarball
+    again, use the tarfile.TarInfo objects returned by
+    uncompress_entropy_package().
+
+    @param entries: list of tarfile.TarInfo objects
+    @type entries: list
+    @param prefix_path: path where the tarball has been extracted
+    @type prefix_path: string
+    @raise IOError: if ownership cannot be applied
+    """
+    encoded_path = prefix_path
+    if not const_is_python3():
+        encoded_path = encoded_path.encode('utf-8')
+    for tarinfo in entries:
+        epath = os.path.join(encoded_path, tarinfo.name)
+        _apply_tarinfo_ownership(tarinfo, epath)
+
+
+class _FileSlice(object):
+    """
+    Read-only, seekable view of the first "size" bytes of a file object.
+    """
+
+    def __init__(self, fileobj, size):
+        self.name = getattr(fileobj, "name", None)
+        self._fileobj = fileobj
+        self._size = size
+        self._fileobj.seek(0)
+
+    def tell(self):
+        return min(self._fileobj.tell(), self._size)
+
+    def seek(self, offset, whence = os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence == os.SEEK_END:
+            offset += self._size
+        offset = max(0, min(offset, self._size))
+        self._fileobj.seek(offset)
+
+    def read(self, size = -1):
+        left = self._size - self.tell()
+        if size is None or size < 0 or size > left:
+            size = left
+        if size <= 0:
+            return const_convert_to_rawstring("")
+        return self._fileobj.read(size)
+
+    def close(self):
+        pass
 
-    @param filepath: path to tarball file
-    @type filepath: string
-    @keyword extract_path: path where to extract tarball
-    @type extract_path: string
-    @keyword catch_empty: do not raise exceptions when trying to unpack empty
-        file
-    @type catch_empty: bool
-    @return: exit status
-    @rtype: int
+
+def _uncompress_tarfile(tar, extract_path, unresolved = None):
     """
-    if extract_path is None:
-        extract_path = os.path.dirname(filepath)
-    if not os.path.isfile(filepath):
-        raise FileNotFound('FileNotFound: archive does not exist')
+    Extract the given tarfile.TarFile object into extract_path, see
+    uncompress_tarball(). If unresolved is a list, the TarInfo objects
+    whose user or group cannot be resolved on the current system are
+    appended to it.
 
+    @return: True, if something has been extracted
+    @rtype: bool
+    """
     def _setup_file_metadata(tarinfo, epath):
         try:
             tar.chown(tarinfo, epath)
@@ -2084,7 +2469,102 @@ def uncompress_tarball(filepath, extract_path = None, catch_empty = False):
             if tar.errorlevel > 1:
                 raise
 
+    owners_cache = {}
+    def _owner_resolved(tarinfo):
+        owner = (tarinfo.uname, tarinfo.gname)
+        resolved = owners_cache.get(owner)
+        if resolved is None:
+            resolved = get_uid_from_user(tarinfo.uname) != -1 and \
+                get_gid_from_group(tarinfo.gname) != -1
+            owners_cache[owner] = resolved
+        return resolved
+
     is_python_3 = const_is_python3()
+    extracted_something = False
+
+    encoded_path = extract_path
+    if not is_python_3:
+        encoded_path = encoded_path.encode('utf-8')
+    entries = []
+
+    deleter_counter = 3
+    for tarinfo in tar:
+        epath = os.path.join(encoded_path, tarinfo.name)
+
+        if tarinfo.isdir():
+            # Extract directory with a safe mode, so that
+            # all files below can be extracted as well.
+            try:
+                os.makedirs(epath, 0o777)
+            except EnvironmentError:
+                pass
+
+        if is_python_3:
+            tar.extract(tarinfo, encoded_path,
+                set_attrs=not tarinfo.isdir())
+        else:
+            tar.extract(tarinfo, encoded_path)
+
+        if tarinfo.isreg():
+            # apply metadata to files instantly
+            # not wasting RAM growing entries.
+            _setup_file_metadata(tarinfo, epath)
+        else:
+            # delay file metadata setup for dirs
+            # or syms that might be dirs or other
+            # things. This because entries can grow
+            # big and use a lot of RAM.
+            entries.append((tarinfo, epath))
+
+        if unresolved is not None and not _owner_resolved(tarinfo):
+            # users and groups can be created later on,
+            # ownership must be applied again then.
+            unresolved.append(tarinfo)
+
+        extracted_something = True
+
+        if not is_python_3:
+            # this does work only with Python 2.x
+            # doing that in Python 3.x will result in
+            # partial extraction
+            deleter_counter -= 1
+            if deleter_counter == 0:
+                del tar.members[:]
+                deleter_counter = 3
+
+    if not is_python_3:
+        del tar.members[:]
+
+    entries.sort(key = lambda x: x[0].name)
+    entries.reverse()
+    # set correct owner, mtime and filemode on files
+    # we need to check both files and directories because
+    #  we have to fix uid and gid from broken archives
+    for tarinfo, epath in entries:
+        _setup_file_metadata(tarinfo, epath)
+
+    return extracted_something
+
+def uncompress_tarball(filepath, extract_path = None, catch_empty = False):
+    """
+    Unpack tarball file (supported compression algorithm is given by tarfile
+    module) respecting directory structure, mtime and permissions.
+
+    @param filepath: path to tarball file
+    @type filepath: string
+    @keyword extract_path: path where to extract tarball
+    @type extract_path: string
+    @keyword catch_empty: do not raise exceptions when trying to unpack empty
+        file
+    @type catch_empty: bool
+    @return: exit status
+    @rtype: int
+    """
+    if extract_path is None:
+        extract_path = os.path.dirname(filepath)
+    if not os.path.isfile(filepath):
+        raise FileNotFound('FileNotFound: archive does not exist')
+
     tar = None
     extracted_something = False
     try:
@@ -2098,61 +2578,7 @@ def uncompress_tarball(filepath, extract_path = None, catch_empty = False):
         except EOFError:
             return -1
 
-        encoded_path = extract_path
-        if not is_python_3:
-            encoded_path = encoded_path.encode('utf-8')
-        entries = []
-
-        deleter_counter = 3
-        for tarinfo in tar:
-            epath = os.path.join(encoded_path, tarinfo.name)
-
-            if tarinfo.isdir():
-                # Extract directory with a safe mode, so that
-                # all files below can be extracted as well.
-                try:
-                    os.makedirs(epath, 0o777)
-                except EnvironmentError:
-                    pass
-
-            if is_python_3:
-                tar.extract(tarinfo, encoded_path,
-                    set_attrs=not tarinfo.isdir())
-            else:
-                tar.extract(tarinfo, encoded_path)
-
-            if tarinfo.isreg():
-                # apply metadata to files instantly
-                # not wasting RAM growing entries.
-                _setup_file_metadata(tarinfo, epath)
-            else:
-                # delay file metadata setup for dirs
-                # or syms that might be dirs or other
-                # things. This because entries can grow
-                # big and use a lot of RAM.
-                entries.append((tarinfo, epath))
-
-            extracted_something = True
-
-            if not is_python_3:
-                # this does work only with Python 2.x
-                # doing that in Python 3.x will result in
-                # partial extraction
-                deleter_counter -= 1
-                if deleter_counter == 0:
-                    del tar.members[:]
-                    deleter_counter = 3
-
-        if not is_python_3:
-            del tar.members[:]
-
-        entries.sort(key = lambda x: x[0].name)
-        entries.reverse()
-        # set correct owner, mtime and filemode on files
-        # we need to check both files and directories because
-        #  we have to fix uid and gid from broken archives
-        for tarinfo, epath in entries:
-            _setup_file_metadata(tarinfo, epath)
+        extracted_something = _uncompress_tarfile(tar, extract_path)
 
     except EOFError:
         return -1
@@ -2167,6 +2593,83 @@ def uncompress_tarball(filepath, extract_path = None, catch_empty = False):
         return 0
     return -1
 
+def uncompress_entropy_package(filepath, extract_path, metadata_path = None,
+                               catch_empty = False):
+    """
+    Unpack an Entropy package file into extract_path reading it only once.
+    If metadata_path is given, the Entropy metadata appended to the package
+    file (see dump_entropy_metadata()) is written there and the tarball
+    extraction stops where the metadata begins.
+    Files ownership and mode are applied while extracting, the tarfile.TarInfo
+    objects whose user or group are not available on the system yet are
+    returned, so that ownership can be fixed up later on through
+    apply_tarball_ownership_entries() without reading the package again.
+
+    @param filepath: path to Entropy package file
+    @type filepath: string
+    @param extract_path: path where to extract the package file
+    @type extract_path: string
+    @keyword metadata_path: path where to store Entropy metadata
+    @type metadata_path: string
+    @keyword catch_empty: do not raise exceptions when trying to unpack empty
+        file
+    @type catch_empty: bool
+    @return: tuple composed by exit status (0 on success, 1 if Entropy
+        metadata has been requested but it is not available, -1 on
+        extraction error) and the list of tarfile.TarInfo objects whose
+        ownership could not be resolved.
+    @rtype: tuple
+    """
+    if not os.path.isfile(filepath):
+        raise FileNotFound('FileNotFound: archive does not exist')
+
+    unresolved = []
+    with open(filepath, "rb") as pkg_f:
+
+        tar_f = pkg_f
+        if metadata_path is not None:
+            start_position = _locate_edb(pkg_f)
+            if start_position is None:
+                return 1, unresolved
+
+            with open(metadata_path, "wb") as db:
+                pkg_f.seek(start_position)
+                while True:
+                    data = pkg_f.read(_READ_SIZE)
+                    if not data:
+                        break
+                    db.write(data)
+
+            db_tag = const_convert_to_rawstring(etpConst['databasestarttag'])
+            tar_f = _FileSlice(pkg_f, start_position - len(db_tag))
+
+        tar = None
+        extracted_something = False
+        try:
+
+            try:
+                tar = tarfile.open(filepath, "r", fileobj = tar_f)
+            except tarfile.ReadError:
+                if catch_empty:
+                    return 0, unresolved
+                raise
+            except EOFError:
+                return -1, unresolved
+
+            extracted_something = _uncompress_tarfile(
+                tar, extract_path, unresolved = unresolved)
+
+        except EOFError:
+            return -1, unresolved
+        finally:
+            if tar is not None:
+                tar.close()
+                del tar.members[:]
+
+    if extracted_something or catch_empty:
+        return 0, unresolved
+    return -1, unresolved
+
 def bytes_into_human(xbytes):
     """
     Convert byte size into human readable format.
@@ -2629,6 +3132,21 @@ def resolve_dynamic_library(library, requiring_executable):
 
     return found_path
 
+def _read_elf(elf_file, symbols = False):
+    """
+    Read the dynamic linking metadata of the given ELF file through
+    entropy.elf. Return None if the file is not a valid ELF object.
+    """
+    from entropy.elf import read_elf
+    try:
+        return read_elf(elf_file, symbols = symbols)
+    except ValueError:
+        return None
+    except (OSError, IOError) as err:
+        if err.errno != errno.ENOENT:
+            raise
+        raise FileNotFound(elf_file)
+
 def read_elf_dynamic_libraries(elf_file):
     """
     Extract NEEDED metadatum from ELF file at path.
@@ -2637,47 +3155,20 @@ def read_elf_dynamic_libraries(elf_file):
     @type elf_file: string
     @return: list (set) of strings in NEEDED metadatum
     @rtype: set
+    @raise FileNotFound: if elf_file does not exist
     """
-    proc = None
-    args = ("/usr/bin/scanelf", "-qF", "%n", elf_file)
-
-    out = None
-    try:
-        proc = subprocess.Popen(args, stdout = subprocess.PIPE)
-        exit_st = proc.wait()
-        if exit_st != 0:
-            raise FileNotFound("scanelf failure")
-        out = proc.stdout.read()
-
-    except (OSError, IOError) as err:
-        if err.errno != errno.ENOENT:
-            raise
-        raise FileNotFound("/usr/bin/scanelf not found")
-
-    finally:
-        if proc is not None:
-            try:
-                proc.stdout.close()
-            except (OSError, IOError):
-                pass
-
-    outcome = set()
-    if out is not None:
-        if const_is_python3():
-            out = const_convert_to_unicode(out)
-        for line in out.split("\n"):
-            if line:
-                libs = line.strip().split(" ", -1)[0].split(",")
-                outcome.update(libs)
-    return outcome
+    elf_obj = _read_elf(elf_file)
+    if elf_obj is None:
+        return set()
+    return set(elf_obj.needed)
 
 def read_elf_real_dynamic_libraries(elf_file):
     """
-    This function is similar to read_elf_dynamic_libraries but uses ldd to
-    retrieve a list of "real" .so library dependencies used by the ELF file.
+    This function is similar to read_elf_dynamic_libraries but resolves
+    the whole .so dependency graph, like the dynamic linker does, and
+    returns the "real" .so library dependencies used by the ELF file.
     This is useful to ensure that there are no .so libraries missing in the
-    dependencies, because ldd expands and resolves the .so dependency graph.
-    This is anyway dangerous because the output returned by ldd is somehow
+    dependencies. This is anyway dangerous because the outcome is
     environment-dependent, so make sure this function is only used for
     informative purposes, and not for adding real dependencies to a package.
 
@@ -2685,93 +3176,37 @@ def read_elf_real_dynamic_libraries(elf_file):
     @type elf_file: string
     @return: list (set) of strings in NEEDED metadatum
     @rtype: set
-    @raise FileNotFound: if ldd is not found
+    @raise FileNotFound: if elf_file does not exist
     """
-    # use the real path, so that it can be dropped from the resulting set
-    elf_file = os.path.realpath(elf_file)
-
-    proc = None
-    out = None
-    args = ("/usr/bin/lddtree", "-l", elf_file)
-
-    try:
-        proc = subprocess.Popen(args, stdout = subprocess.PIPE)
-        exit_st = proc.wait()
-        if exit_st != 0:
-            raise FileNotFound("lddtree returned error")
-        out = proc.stdout.read()
-
-    except (OSError, IOError) as err:
-        if err.errno != errno.ENOENT:
-            raise
-        raise FileNotFound("/usr/bin/lddtree not found")
-
-    finally:
-        if proc is not None:
-            proc.stdout.close()
+    from entropy.elf import ElfLinker
+    elf_obj = _read_elf(elf_file)
+    if elf_obj is None:
+        return set()
 
+    linker = ElfLinker(collect_linker_paths())
     outcome = set()
-    if out is not None:
-        if const_is_python3():
-            out = const_convert_to_unicode(out)
-        for line in out.split("\n"):
-            if line == elf_file:
-                continue
-            if line:
-                outcome.add(os.path.basename(line))
-
+    for library, _lib_obj in linker.dependencies(elf_obj):
+        outcome.add(os.path.basename(library))
     return outcome
 
 def read_elf_broken_symbols(elf_file):
     """
-    Extract broken symbols from ELF file.
+    Extract broken symbols from ELF file, that is, the undefined symbols
+    that are not provided by any library in its dependency graph.
 
     @param elf_file: path to ELF file
     @type elf_file: string
     @return: list of broken symbols in ELF file.
     @rtype: set
+    @raise FileNotFound: if elf_file does not exist
     """
-    proc = None
-    args = ("/usr/bin/ldd", "-r", elf_file)
-    out = None
+    from entropy.elf import ElfLinker
+    elf_obj = _read_elf(elf_file, symbols = True)
+    if elf_obj is None:
+        return set()
 
-    try:
-        proc = subprocess.Popen(
-            args, stdout = subprocess.PIPE,
-            stderr = subprocess.PIPE)
-        exit_st = proc.wait()
-        if exit_st != 0:
-            raise FileNotFound("ldd error")
-
-        out = const_convert_to_unicode("")
-        while True:
-            # make sure that stdout is flushed and won't block
-            proc.stdout.read()
-            tout = proc.stderr.read()
-            if const_is_python3():
-                tout = const_convert_to_unicode(tout)
-            out += tout
-            if not tout:
-                break
-
-    except (OSError, IOError) as err:
-        if err.errno != errno.ENOENT:
-            raise
-        raise FileNotFound("/usr/bin/ldd not found")
-
-    finally:
-        if proc is not None:
-            proc.stderr.close()
-            proc.stdout.close()
-
-    outcome = set()
-    if out is not None:
-        for line in out.split("\n"):
-            if line.startswith("undefined symbol: "):
-                symbol = line.split("\t")[0].split()[-1]
-                outcome.add(symbol)
-
-    return outcome
+    linker = ElfLinker(collect_linker_paths())
+    return linker.broken_symbols(elf_obj)
 
 def read_elf_linker_paths(elf_file):
     """
@@ -2781,43 +3216,12 @@ def read_elf_linker_paths(elf_file):
     @type elf_file: string
     @return: list of extracted built-in linker paths.
     @rtype: list
+    @raise FileNotFound: if elf_file does not exist
     """
-    proc = None
-    args = ("/usr/bin/scanelf", "-qF", "%r", elf_file)
-    out = None
-
-    try:
-        proc = subprocess.Popen(args, stdout = subprocess.PIPE)
-        exit_st = proc.wait()
-        if exit_st != 0:
-            raise FileNotFound("scanelf error")
-
-        out = proc.stdout.read()
-
-    except (OSError, IOError) as err:
-        if err.errno != errno.ENOENT:
-            raise
-        raise FileNotFound("/usr/bin/scanelf not found")
-
-    finally:
-        if proc is not None:
-            proc.stdout.close()
-
-    outcome = []
-    if out is not None:
-
-        elf_dir = os.path.dirname(elf_file)
-        if const_is_python3():
-            out = const_convert_to_unicode(out)
-        for line in out.split("\n"):
-            if line:
-                paths = line.strip().split(" ", -1)[0].split(",")
-                for path in paths:
-                    path = path.replace("$ORIGIN", elf_dir)
-                    path = path.replace("${ORIGIN}", elf_dir)
-                    outcome.append(path)
-
-    return outcome
+    elf_obj = _read_elf(elf_file)
+    if elf_obj is None:
+        return []
+    return elf_obj.linker_paths()
 
 def xml_from_dict_extended(dictionary):
     """
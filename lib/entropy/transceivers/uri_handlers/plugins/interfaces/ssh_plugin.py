@@ -12,9 +12,7 @@
 import re
 import os
 import errno
-import time
 import shutil
-import codecs
 
 from entropy.const import const_isnumber, const_debug_write, \
     const_mkdtemp, const_mkstemp, etpConst
@@ -35,6 +33,11 @@ class EntropySshUriHandler(EntropyUriHandler):
     _DEFAULT_PORT = 22
     _TXC_CMD = "/usr/bin/scp"
     _SSH_CMD = "/usr/bin/ssh"
+    # share a single (ControlMaster) SSH connection among all the
+    # scp and ssh commands executed by the handler instance
+    _MULTIPLEX = True
+    # amount of files checksummed by a single md5sum execution
+    _MD5_CHUNK_SIZE = 256
 
     @staticmethod
     def approve_uri(uri):
@@ -62,6 +65,9 @@ class EntropySshUriHandler(EntropyUriHandler):
         self.__host = EntropySshUriHandler.get_uri_name(self._uri)
         self.__user, self.__port, self.__dir = self.__extract_scp_data(
             self._uri)
+        self.__multiplex = EntropySshUriHandler._MULTIPLEX
+        self.__control_dir = None
+        self.__control_path = None
 
     def __enter__(self):
         pass
@@ -118,20 +124,24 @@ class EntropySshUriHandler(EntropyUriHandler):
         self.output(current_txt, back = True, header = "    ")
 
     def _update_progress(self, std_r):
-        if self._silent:
-            # stfu !
-            return
+        # read until the child process closes the terminal, the
+        # output must be consumed even when silent, or the child
+        # blocks once the terminal buffer is full.
         read_buf = ""
         try:
             char = std_r.read(1)
             while char:
-                if (char == "\r") and read_buf:
+                if self._silent:
+                    # stfu !
+                    pass
+                elif (char == "\r") and read_buf:
                     self._parse_progress_line(read_buf)
                     read_buf = ""
                 elif (char != "\r"):
                     read_buf += char
                 char = std_r.read(1)
         except IOError:
+            # EIO, the child process is gone
             return
 
     def _fork_cmd(self, args):
@@ -144,59 +154,103 @@ class EntropySshUriHandler(EntropyUriHandler):
         elif pid == -1:
             raise TransceiverConnectionError("cannot forkpty()")
         else:
-            dead = False
-            return_code = 1
             std_r = os.fdopen(fd, "r")
-            while not dead:
+            try:
+                self._update_progress(std_r)
+            finally:
+                std_r.close()
 
+            while True:
                 try:
-                    dead, return_code = os.waitpid(pid, os.WNOHANG)
+                    _pid, status = os.waitpid(pid, 0)
                 except OSError as e:
+                    if e.errno == errno.EINTR:
+                        continue
                     if e.errno != errno.ECHILD:
                         raise
-                    dead = True
-
-                time.sleep(0.5)
-                self._update_progress(std_r)
-            std_r.close()
+                    return 1
+                break
 
-            return return_code
+            if os.WIFEXITED(status):
+                return os.WEXITSTATUS(status)
+            return 1
 
     def _exec_cmd(self, args):
 
-        fd, tmp_path = const_mkstemp(prefix="entropy.transceivers.ssh_plug")
-        fd_err, tmp_path_err = const_mkstemp(
-            prefix="entropy.transceivers.ssh_plug")
-        try:
-            with os.fdopen(fd, "wb") as std_f:
-                with os.fdopen(fd_err, "wb") as std_f_err:
-                    proc = self._subprocess.Popen(args, stdout = std_f,
-                        stderr = std_f_err)
-                    exec_rc = proc.wait()
-            enc = etpConst['conf_encoding']
-            with codecs.open(tmp_path, "r", encoding=enc) as std_f:
-                output = std_f.read()
-            with codecs.open(tmp_path_err, "r", encoding=enc) as std_f:
-                error = std_f.read()
-        finally:
-            os.remove(tmp_path)
-            os.remove(tmp_path_err)
+        proc = self._subprocess.Popen(args,
+            stdout = self._subprocess.PIPE, stderr = self._subprocess.PIPE)
+        output, error = proc.communicate()
+        exec_rc = proc.returncode
+
+        enc = etpConst['conf_encoding']
+        output = output.decode(enc, "replace")
+        error = error.decode(enc, "replace")
 
         return exec_rc, output, error
 
-    def _setup_common_args(self, remote_path):
+    def _remote_host(self):
+        remote_str = ""
+        if self.__user:
+            remote_str += self.__user + "@"
+        remote_str += self.__host
+        return remote_str
+
+    def _setup_timeout_args(self):
         args = []
         if const_isnumber(self._timeout):
             args += ["-o", "ConnectTimeout=%s" % (self._timeout,),
                 "-o", "ServerAliveCountMax=4", # hardcoded
                 "-o", "ServerAliveInterval=15"] # hardcoded
+        return args
+
+    def _setup_control_args(self):
+        """
+        Return the ssh (and scp) arguments that make commands reuse the
+        connection shared by this handler, establishing it if needed.
+        If the shared connection cannot be established, commands open
+        their own connection, as usual.
+        """
+        if not self.__multiplex:
+            return []
+
+        if self.__control_path is None:
+            # ControlPath is an AF_UNIX socket, keep it short
+            control_dir = const_mkdtemp(prefix="entropy.ssh")
+            control_path = os.path.join(control_dir, "master")
+            args = [EntropySshUriHandler._SSH_CMD, "-p", str(self.__port)]
+            args += self._setup_timeout_args()
+            args += ["-o", "ControlMaster=yes",
+                "-o", "ControlPath=%s" % (control_path,),
+                "-o", "BatchMode=yes",
+                "-N", "-f", self._remote_host()]
+
+            # -f forks the master in background once connected, which
+            # keeps stdout and stderr open, so don't read them.
+            with open(os.devnull, "wb") as null_f:
+                exec_rc = self._subprocess.Popen(args, stdout = null_f,
+                    stderr = null_f).wait()
+
+            const_debug_write(__name__,
+                "_setup_control_args: master %s, rc: %s" % (
+                    control_path, exec_rc,))
+            if exec_rc != os.EX_OK:
+                shutil.rmtree(control_dir, True)
+                self.__multiplex = False
+                return []
+
+            self.__control_dir = control_dir
+            self.__control_path = control_path
+
+        return ["-o", "ControlMaster=no",
+            "-o", "ControlPath=%s" % (self.__control_path,)]
+
+    def _setup_common_args(self, remote_path):
+        args = self._setup_timeout_args()
+        args += self._setup_control_args()
         if self._speed_limit:
             args += ["-l", str(self._speed_limit*8)] # scp wants kbits/sec
         remote_ptr = os.path.join(self.__dir, remote_path)
-        remote_str = ""
-        if self.__user:
-            remote_str += self.__user + "@"
-        remote_str += self.__host + ":" + remote_ptr
+        remote_str = self._remote_host() + ":" + remote_ptr
 
         return args, remote_str
 
@@ -361,11 +415,8 @@ class EntropySshUriHandler(EntropyUriHandler):
 
     def _setup_fs_args(self):
         args = [EntropySshUriHandler._SSH_CMD, "-p", str(self.__port)]
-        remote_str = ""
-        if self.__user:
-            remote_str += self.__user + "@"
-        remote_str += self.__host
-        return args, remote_str
+        args += self._setup_control_args()
+        return args, self._remote_host()
 
     def rename(self, remote_path_old, remote_path_new):
         args, remote_str = self._setup_fs_args()
@@ -414,6 +465,32 @@ class EntropySshUriHandler(EntropyUriHandler):
             return None
         return output.strip().split()[0]
 
+    def get_md5_many(self, remote_paths):
+        data = {}
+        remote_paths = list(remote_paths)
+        chunk_size = EntropySshUriHandler._MD5_CHUNK_SIZE
+        for idx in range(0, len(remote_paths), chunk_size):
+            remote_ptrs = {}
+            for remote_path in remote_paths[idx:idx + chunk_size]:
+                remote_ptr = os.path.join(self.__dir, remote_path)
+                remote_ptrs[remote_ptr] = remote_path
+                data[remote_path] = None
+
+            args, remote_str = self._setup_fs_args()
+            args += [remote_str, "md5sum"] + sorted(remote_ptrs)
+            # md5sum exits with error if any file is missing, but
+            # still prints the checksums of the other ones.
+            exec_rc, output, error = self._exec_cmd(args)
+            for line in output.split("\n"):
+                line = line.strip().split(None, 1)
+                if len(line) != 2:
+                    continue
+                checksum, remote_ptr = line
+                remote_path = remote_ptrs.get(remote_ptr.lstrip("*"))
+                if remote_path is not None:
+                    data[remote_path] = checksum
+        return data
+
     def list_content(self, remote_path):
         args, remote_str = self._setup_fs_args()
         remote_ptr = os.path.join(self.__dir, remote_path)
@@ -473,4 +550,19 @@ class EntropySshUriHandler(EntropyUriHandler):
         return
 
     def close(self):
-        return
+        control_dir = self.__control_dir
+        if control_dir is None:
+            return
+
+        # shut down the shared connection
+        args = [EntropySshUriHandler._SSH_CMD, "-p", str(self.__port),
+            "-o", "ControlPath=%s" % (self.__control_path,),
+            "-O", "exit", self._remote_host()]
+        self.__control_dir = None
+        self.__control_path = None
+        try:
+            exec_rc, output, error = self._exec_cmd(args)
+            const_debug_write(__name__,
+                "close: master exit, rc: %s, err: %s" % (exec_rc, error,))
+        finally:
+            shutil.rmtree(control_dir, True)
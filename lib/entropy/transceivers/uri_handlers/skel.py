@@ -301,6 +301,20 @@ class EntropyUriHandler(TextInterface):
         """
         raise NotImplementedError()
 
+    def get_md5_many(self, remote_paths):
+        """
+        Return MD5 checksums of many files at once, taken from remote_paths.
+        URI handlers able to compute them in a single request should
+        override this method.
+
+        @param remote_paths: list of remote paths to handle
+        @type remote_paths: list
+        @return: dict composed by remote path as key and MD5 checksum in
+            hexdigest form (or None, if not supported) as value
+        @rtype: dict
+        """
+        return dict((x, self.get_md5(x)) for x in remote_paths)
+
     def list_content(self, remote_path):
         """
         List content of directory referenced at URI.
@@ -8,11 +8,14 @@ import unittest
 import os
 import shutil
 import signal
+import threading
 import time
 
 from entropy.client.interfaces import Client
 from entropy.client.interfaces.db import InstalledPackagesRepository
 from entropy.client.interfaces.package.actions._triggers import Trigger
+from entropy.client.interfaces.package.actions.install import \
+    _PackageInstallAction, _PackageInstallPipeline
 from entropy.cache import EntropyCacher
 from entropy.const import etpConst, const_mkdtemp
 from entropy.output import set_mute
@@ -193,6 +196,70 @@ class EntropyClientTest(unittest.TestCase):
             set_mute(False)
         self.assertRaises(RepositoryError, test_load)
 
+    def test_atom_match_many(self):
+        dbconn = self.Client._init_generic_temp_repository(
+            self.mem_repoid, self.mem_repo_desc, temp_file = ":memory:")
+        # GenericRepository supports package masking if this property is set
+        dbconn.enable_mask_filter = True
+        # package files have been produced on amd64
+        original_keywords = etpConst['keywords'].copy()
+        etpConst['keywords'].add("~amd64")
+        etpConst['keywords'].add("amd64")
+        for test_pkg in (_misc.get_test_package(),
+                         _misc.get_test_package2()):
+            data = self.Spm.extract_package_metadata(test_pkg)
+            dbconn.addPackage(data)
+
+        pkg_name = _misc.get_test_package_name()
+        pkg_atom = _misc.get_test_package_atom()
+        atoms = [pkg_name, pkg_atom, _misc.get_test_package_atom2(),
+                 "slib", "app-foo/notavailable",
+                 "app-foo/notavailable;%s?" % (pkg_atom,),
+                 "%s@%s" % (pkg_name, self.mem_repoid),
+                 "%s@notavailable" % (pkg_name,), pkg_name]
+        repos = [self.mem_repoid]
+
+        def _compare():
+            for kwargs in ({}, {'mask_filter': False},
+                           {'extended_results': True}):
+                results = self.Client.atom_match_many(atoms,
+                    match_repo = repos, use_cache = False, **kwargs)
+                self.assertEqual(sorted(results.keys()), sorted(set(atoms)))
+                for atom in atoms:
+                    self.assertEqual(results[atom],
+                        self.Client.atom_match(atom, match_repo = repos,
+                            use_cache = False, **kwargs))
+
+        try:
+            _compare()
+            self.assertEqual(
+                self.Client.atom_match_many(
+                    ["slib"], match_repo = repos)["slib"],
+                (-1, 1))
+
+            # test package masking
+            package_id, repository_id = self.Client.atom_match(
+                pkg_name, match_repo = repos)
+            self.assertEqual(repository_id, self.mem_repoid)
+            mask_matches = self._settings['live_packagemasking'][
+                'mask_matches']
+            masking_validation = \
+                self.Client.ClientSettings()['masking_validation']['cache']
+            mask_matches.add((package_id, repository_id))
+            masking_validation.clear()
+            try:
+                self.assertEqual(
+                    self.Client.atom_match_many(
+                        [pkg_name], match_repo = repos)[pkg_name],
+                    (-1, 1))
+                _compare()
+            finally:
+                mask_matches.discard((package_id, repository_id))
+                masking_validation.clear()
+        finally:
+            self.Client.remove_repository(self.mem_repoid)
+            etpConst['keywords'] = original_keywords
+
     def test_package_repository(self):
         test_pkg = _misc.get_test_entropy_package()
         # this might fail on 32bit arches
@@ -308,6 +375,20 @@ else:
 
         self.assertEqual(exit_st, 42)
 
+    def test_solo_commands_map(self):
+        # equo only imports the module implementing the requested
+        # command, make sure that every command can be found that way
+        import solo.commands
+        from solo.commands.descriptor import SoloCommandDescriptor
+
+        for descriptor in SoloCommandDescriptor.obtain():
+            klass = descriptor.get_class()
+            module = klass.__module__.split(".")[-1]
+            for name in [klass.NAME] + klass.ALIASES:
+                self.assertEqual(solo.commands.COMMANDS.get(name), module)
+                self.assertTrue(solo.commands.load(name) is klass)
+        self.assertEqual(solo.commands.load("notacommand"), None)
+
     def _do_pkg_test(self, pkg_path, pkg_atom):
 
         # this test might be considered controversial, for now, let's keep it
@@ -438,6 +519,168 @@ else:
         etpConst['entropyunpackdir'] = old_unpackdir
 
 
+class _FakeInstallAction(_PackageInstallAction):
+    """
+    Install action that only records the unpack calls, the
+    _PackageInstallPipeline hooks are the real ones.
+    """
+
+    class _Logger(object):
+        def log(self, *args):
+            pass
+
+    class _Entropy(object):
+        pass
+
+    def __init__(self, name, unpacked, merge_from = None,
+                 setup_error = None, unpack_error = None, unpack_event = None):
+        self._name = name
+        self._unpacked = unpacked
+        self._merge_from = merge_from
+        self._setup_error = setup_error
+        self._unpack_error = unpack_error
+        self._wait_event = unpack_event
+        self._meta = None
+        self._unpack_event = None
+        self._unpack_status = None
+        self._entropy = self._Entropy()
+        self._entropy.logger = self._Logger()
+
+    def setup(self):
+        if self._setup_error is not None:
+            raise self._setup_error
+        self._meta = {'atom': self._name, 'merge_from': self._merge_from}
+
+    def _unpack_files(self, quiet = False):
+        if self._wait_event is not None:
+            self._wait_event.wait()
+        self._unpacked.append(self._name)
+        if self._unpack_error is not None:
+            raise self._unpack_error
+        return 0
+
+    def wait_unpack(self):
+        if self._unpack_event is None:
+            return None
+        self._unpack_event.wait()
+        return self._unpack_status
+
+
+class PackageInstallPipelineTest(unittest.TestCase):
+
+    def _pipeline_threads(self):
+        return [x for x in threading.enumerate() if \
+                    x.name.startswith("PackageInstallPipeline-")]
+
+    def test_install_pipeline_ordering(self):
+        unpacked = []
+        actions = [_FakeInstallAction("pkg-%d" % (x,), unpacked) \
+                       for x in range(6)]
+        pipeline = _PackageInstallPipeline(actions, 1)
+        try:
+            for idx, action in enumerate(actions):
+                pipeline.advance(action)
+                # the first one unpacks its own files
+                if idx == 0:
+                    self.assertEqual(action.wait_unpack(), None)
+                else:
+                    self.assertEqual(action.wait_unpack(), 0)
+                # never more than depth actions in advance
+                self.assertTrue(pipeline._scheduled <= idx + 2)
+        finally:
+            pipeline.close()
+
+        # a single worker unpacks in the install order
+        self.assertEqual(unpacked, [x._name for x in actions[1:]])
+        self.assertEqual(self._pipeline_threads(), [])
+
+    def test_install_pipeline_disabled(self):
+        unpacked = []
+        actions = [_FakeInstallAction("pkg-%d" % (x,), unpacked) \
+                       for x in range(3)]
+        pipeline = _PackageInstallPipeline(actions, 0)
+        try:
+            for action in actions:
+                pipeline.advance(action)
+                self.assertEqual(action.wait_unpack(), None)
+            self.assertEqual(self._pipeline_threads(), [])
+        finally:
+            pipeline.close()
+        self.assertEqual(unpacked, [])
+
+    def test_install_pipeline_fallback(self):
+        unpacked = []
+        actions = [
+            _FakeInstallAction("pkg-0", unpacked),
+            _FakeInstallAction("pkg-1", unpacked,
+                setup_error = _PackageInstallAction.InvalidArchitecture(
+                    "invalid architecture")),
+            _FakeInstallAction("pkg-2", unpacked,
+                setup_error = KeyError("pkg-2")),
+            _FakeInstallAction("pkg-3", unpacked,
+                unpack_error = IOError("pkg-3")),
+            _FakeInstallAction("pkg-4", unpacked,
+                merge_from = "/path/to/image"),
+            _FakeInstallAction("pkg-5", unpacked),
+        ]
+        statuses = []
+        pipeline = _PackageInstallPipeline(actions, 3)
+        try:
+            for action in actions:
+                pipeline.advance(action)
+                # as start() would do
+                statuses.append(action.wait_unpack())
+        finally:
+            pipeline.close()
+
+        # setup() failures are raised again when the action is started,
+        # failed unpacks are redone by the action itself and actions
+        # merging from a directory have nothing to unpack
+        self.assertEqual(statuses, [None, None, None, 1, None, 0])
+        self.assertEqual(sorted(unpacked), ["pkg-3", "pkg-5"])
+        self.assertEqual(self._pipeline_threads(), [])
+
+    def test_install_pipeline_close(self):
+        unpacked = []
+        wait_event = threading.Event()
+        actions = [_FakeInstallAction("pkg-%d" % (x,), unpacked,
+                                      unpack_event = wait_event) \
+                       for x in range(6)]
+        pipeline = _PackageInstallPipeline(actions, 1)
+        try:
+            pipeline.advance(actions[0])
+            pipeline.advance(actions[1])
+        finally:
+            wait_event.set()
+            pipeline.close()
+
+        # the pending unpacks are cancelled, the threads are gone
+        self.assertTrue(actions[1].wait_unpack() in (0, None))
+        self.assertTrue(actions[2].wait_unpack() in (0, None))
+        self.assertEqual(self._pipeline_threads(), [])
+
+        # a closed pipeline does not schedule anything
+        pipeline.advance(actions[3])
+        self.assertEqual(actions[4].wait_unpack(), None)
+        self.assertEqual(self._pipeline_threads(), [])
+
+    def test_install_pipeline_interrupted(self):
+        unpacked = []
+        actions = [
+            _FakeInstallAction("pkg-0", unpacked),
+            _FakeInstallAction("pkg-1", unpacked),
+            _FakeInstallAction("pkg-2", unpacked,
+                setup_error = KeyboardInterrupt()),
+            _FakeInstallAction("pkg-3", unpacked),
+        ]
+        pipeline = _PackageInstallPipeline(actions, 3)
+        self.assertRaises(KeyboardInterrupt, pipeline.advance, actions[0])
+        # the worker threads are stopped right away
+        self.assertEqual(self._pipeline_threads(), [])
+        self.assertTrue(actions[1].wait_unpack() in (0, None))
+        pipeline.close()
+
+
 if __name__ == '__main__':
     unittest.main()
     raise SystemExit(0)
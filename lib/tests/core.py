@@ -6,6 +6,7 @@ sys.path.insert(0, '.')
 sys.path.insert(0, '../')
 import unittest
 from entropy.core import EntropyPluginStore, Singleton
+from entropy.const import etpConst
 from entropy.core.settings.base import SystemSettings
 import tests._misc as _misc
 
@@ -34,6 +35,33 @@ class CoreTest(unittest.TestCase):
         self.assertTrue(isinstance(files, set))
         self.assertTrue(files) # not empty
 
+    def test_settings_parsers_memoization(self):
+        sys_set = SystemSettings()
+        mask = sys_set['mask']
+        timings = sys_set.get_parsers_timings()
+        self.assertTrue("mask" in timings)
+
+        sys_set.clear()
+        # setting files did not change, parsers outcome is reused
+        self.assertEqual(list(sys_set['mask']), list(mask))
+        self.assertTrue(sys_set['mask'] is not mask)
+        self.assertEqual(sys_set['mask'].get(), None)
+        self.assertEqual(sys_set.get_parsers_timings()['mask'],
+            timings['mask'])
+
+    def test_settings_parsers_side_effects(self):
+        sys_set = SystemSettings()
+        keywords = sys_set['keywords']
+        expected = set(etpConst['keywords'])
+        self.assertTrue(expected)
+
+        # as initconfig_entropy_constants() would do
+        etpConst['keywords'].clear()
+        sys_set.clear()
+        self.assertEqual(sys_set['keywords'], keywords)
+        # parser side effects must be replayed
+        self.assertEqual(etpConst['keywords'], expected)
+
     def test_core_singleton(self):
         class myself(Singleton):
             def init_singleton(self):
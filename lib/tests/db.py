@@ -4,6 +4,8 @@ sys.path.insert(0, '.')
 sys.path.insert(0, '../')
 import unittest
 import os
+import shutil
+import tempfile
 import time
 import threading
 
@@ -14,6 +16,9 @@ from entropy.output import set_mute
 from entropy.core.settings.base import SystemSettings
 from entropy.misc import ParallelTask
 from entropy.db import EntropyRepository
+from entropy.db.index import EntropyRepositoryIndex, \
+    EntropyRepositoryPathIndex
+from entropy.db.delta import EntropyRepositoryDelta
 import tests._misc as _misc
 
 import entropy.dep
@@ -243,6 +248,64 @@ class EntropyRepositoryTest(unittest.TestCase):
             content,
             tuple(sorted(orig_content, key = lambda x: x[0])))
 
+    def test_content_blobs(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg3 = _misc.get_test_package3()
+        data3 = self.Spm.extract_package_metadata(test_pkg3)
+        idpackage = self.test_db.addPackage(data)
+        idpackage3 = self.test_db.addPackage(data3)
+
+        def _content_metadata():
+            path = "/usr/include/zconf.h"
+            return (
+                self.test_db.retrieveContent(idpackage3),
+                self.test_db.retrieveContent(
+                    idpackage3, extended = True, order_by = "file"),
+                self.test_db.retrieveContent(
+                    idpackage, extended = True, formatted = True),
+                tuple(self.test_db.retrieveContentIter(
+                        idpackage3, order_by = "file", reverse = True)),
+                self.test_db.retrieveContentSafety(idpackage),
+                self.test_db.searchContentSafety(path),
+                self.test_db.isFileAvailable(path, get_id = True),
+                self.test_db.isFileAvailable("/usr/sbin/ab2"),
+                self.test_db.isFileAvailable("/usr/sbin/ab3"),
+                self.test_db.searchBelongs("/usr/sbin/htdbm"),
+                self.test_db.searchBelongs("/usr/%/zlib%", like = True),
+                self.test_db.listAllFiles(clean = True),
+                self.test_db.listAllFiles(count = True),
+            )
+
+        self.assertFalse(self.test_db._isContentBlobs())
+        metadata = _content_metadata()
+
+        self.test_db._migrateContentBlobs()
+        self.assertTrue(self.test_db._isContentBlobs())
+        self.assertEqual(metadata, _content_metadata())
+
+        # back and forth
+        self.test_db._migrateContentTables()
+        self.assertFalse(self.test_db._isContentBlobs())
+        self.assertFalse(self.test_db._doesTableExist("contentblobs"))
+        self.assertEqual(metadata, _content_metadata())
+        self.test_db._migrateContentBlobs()
+        self.assertTrue(self.test_db._isContentBlobs())
+        self.assertEqual(metadata, _content_metadata())
+
+        # removing and adding packages back keeps the same metadata
+        self.test_db.removePackage(idpackage3)
+        self.assertFalse(self.test_db.isFileAvailable("/usr/sbin/ab2"))
+        self.test_db.addPackage(data3, revision = data3['revision'],
+            package_id = idpackage3)
+        self.assertEqual(metadata, _content_metadata())
+
+        self.test_db.setContentSafety(idpackage, {})
+        self.assertEqual(self.test_db.retrieveContentSafety(idpackage), {})
+        self.test_db.dropContent()
+        self.assertEqual(self.test_db.listAllFiles(count = True), 0)
+        self.assertEqual(self.test_db.retrieveContent(idpackage), frozenset())
+
     def test_db_creation(self):
         self.assertTrue(isinstance(self.test_db, EntropyRepository))
         self.assertEqual(self.test_db_name, self.test_db.repository_id())
@@ -374,6 +437,76 @@ class EntropyRepositoryTest(unittest.TestCase):
         if not started:
             cacher.stop()
 
+    def test_db_match_store(self):
+        import entropy.dump
+        from entropy.cache import EntropyCacher
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        pkg_name = _misc.get_test_package_name()
+        args = (pkg_name, True, False, False, None, None, False, False, True)
+
+        cacher = EntropyCacher()
+        started = cacher.is_started()
+        cacher.start()
+        old_backend = EntropyCacher.backend()
+        old_dump_dir = entropy.dump.D_DIR
+        tmp_dir = tempfile.mkdtemp()
+        self.test_db._caching = True
+
+        def _fetch():
+            return self.test_db._EntropyRepositoryBase__atomMatchFetchCache(
+                *args)
+
+        def _store_key():
+            return self.test_db._EntropyRepositoryBase__atomMatchStoreKey()
+
+        try:
+            for backend in (EntropyCacher.BACKEND_FILES,
+                            EntropyCacher.BACKEND_STORE):
+                EntropyCacher.set_backend(backend)
+                entropy.dump.D_DIR = os.path.join(tmp_dir, backend)
+                os.makedirs(entropy.dump.D_DIR)
+
+                package_id = self.test_db.addPackage(data)
+                self.assertEqual(_fetch(), None)
+                self.test_db._EntropyRepositoryBase__atomMatchStoreCache(
+                    *args, result = (123, 0))
+                old_key = _store_key()
+
+                # clearCache() writes the results out, they are then
+                # loaded back from the cache
+                self.test_db.clearCache()
+                cacher.sync()
+                self.assertTrue(cacher.pop(old_key))
+                self.assertEqual(_fetch(), (123, 0))
+
+                # repository changes invalidate the results
+                package_id2 = self.test_db.addPackage(data2)
+                self.assertNotEqual(_store_key(), old_key)
+                self.assertEqual(_fetch(), None)
+                self.assertEqual(self.test_db.atomMatch(pkg_name),
+                    (package_id, 0))
+
+                # and the old results are evicted
+                self.test_db.clearCache()
+                cacher.sync()
+                self.assertEqual(cacher.pop(old_key), None)
+                self.assertTrue(cacher.pop(_store_key()))
+
+                self.test_db.removePackage(package_id2)
+                self.test_db.removePackage(package_id)
+                EntropyCacher._close_stores()
+        finally:
+            self.test_db._caching = False
+            EntropyCacher._close_stores()
+            EntropyCacher.set_backend(old_backend)
+            entropy.dump.D_DIR = old_dump_dir
+            shutil.rmtree(tmp_dir, True)
+            if not started:
+                cacher.stop()
+
     def test_db_insert_compare_match(self):
 
         # insert/compare
@@ -424,6 +557,133 @@ class EntropyRepositoryTest(unittest.TestCase):
         self.assertTrue(isinstance(results, set))
         self.assertTrue(rc == 1)
 
+    def test_db_atom_match_many(self):
+        for test_pkg in (_misc.get_test_package(),
+                         _misc.get_test_package2()):
+            data = self.Spm.extract_package_metadata(test_pkg)
+            self.test_db.addPackage(data)
+
+        pkg_name = _misc.get_test_package_name()
+        pkg_key = entropy.dep.dep_getkey(_misc.get_test_package_atom())
+        atoms = [pkg_name, _misc.get_test_package_atom(),
+                 _misc.get_test_package_atom2(), ">=%s-1" % (pkg_key,),
+                 "<%s-1" % (pkg_key,), "%s:0" % (pkg_key,),
+                 "%s:123" % (pkg_name,), "slib", "app-foo/notavailable",
+                 "app-foo/notavailable;%s?" % (pkg_key,), "", pkg_name]
+        options = [{}, {'multiMatch': True}, {'maskFilter': False},
+                   {'extendedResults': True}, {'matchSlot': "0"},
+                   {'multiMatch': True, 'extendedResults': True}]
+
+        def _compare():
+            for kwargs in options:
+                results = self.test_db.atomMatchMany(atoms,
+                    useCache = False, **kwargs)
+                self.assertEqual(sorted(results.keys()), sorted(set(atoms)))
+                for atom in atoms:
+                    self.assertEqual(results[atom],
+                        self.test_db.atomMatch(atom, useCache = False,
+                            **kwargs))
+
+        _compare()
+        self.assertEqual(self.test_db.atomMatchMany(["slib"])["slib"],
+            (-1, 1))
+
+        # test package masking
+        masking_validation = \
+            self.Client.ClientSettings()['masking_validation']['cache']
+        package_id, _rc = self.test_db.atomMatch(pkg_name)
+        f_match_mask = (package_id, self.test_db_name,)
+        self._settings['live_packagemasking']['mask_matches'].add(
+            f_match_mask)
+        masking_validation.clear()
+        try:
+            self.assertEqual(
+                self.test_db.atomMatchMany([pkg_name])[pkg_name], (-1, 1))
+            _compare()
+        finally:
+            self._settings['live_packagemasking']['mask_matches'].discard(
+                f_match_mask)
+            masking_validation.clear()
+
+    def test_db_mask_filter_all(self):
+        for test_pkg in (_misc.get_test_package(),
+                         _misc.get_test_package2()):
+            data = self.Spm.extract_package_metadata(test_pkg)
+            self.test_db.addPackage(data)
+
+        masking_validation = \
+            self.Client.ClientSettings()['masking_validation']['cache']
+        package_ids = self.test_db.listAllPackageIds()
+        f_match_mask = (package_ids[0], self.test_db_name,)
+        self._settings['live_packagemasking']['mask_matches'].add(
+            f_match_mask)
+        masking_validation.clear()
+
+        mask_data = self.test_db.maskFilterAll()
+        self.assertEqual(sorted(mask_data.keys()), sorted(package_ids))
+        self.assertEqual(mask_data[package_ids[0]], (-1, 12))
+        for package_id in package_ids:
+            self.assertEqual(mask_data[package_id],
+                self.test_db.maskFilter(package_id))
+
+        self._settings['live_packagemasking']['mask_matches'].discard(
+            f_match_mask)
+        masking_validation.clear()
+        self.assertNotEqual(self.test_db.maskFilterAll()[package_ids[0]],
+            (-1, 12))
+
+    def test_db_mask_filter_bitmap_evict(self):
+        import entropy.dump
+        from entropy.cache import EntropyCacher
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+
+        cacher = EntropyCacher()
+        started = cacher.is_started()
+        cacher.start()
+        old_backend = EntropyCacher.backend()
+        old_dump_dir = entropy.dump.D_DIR
+        tmp_dir = tempfile.mkdtemp()
+        self.test_db._caching = True
+
+        try:
+            for backend in (EntropyCacher.BACKEND_FILES,
+                            EntropyCacher.BACKEND_STORE):
+                EntropyCacher.set_backend(backend)
+                entropy.dump.D_DIR = os.path.join(tmp_dir, backend)
+                os.makedirs(entropy.dump.D_DIR)
+
+                package_id = self.test_db.addPackage(data)
+                mask_data = self.test_db.maskFilterAll()
+                old_key = self.test_db._maskFilter_bitmap_key()
+                cacher.sync()
+                self.assertTrue(cacher.pop(old_key))
+
+                # the bitmap of the changed repository replaces
+                # the old one
+                package_id2 = self.test_db.addPackage(data2)
+                self.assertEqual(self.test_db.maskFilterAll()[package_id],
+                    mask_data[package_id])
+                new_key = self.test_db._maskFilter_bitmap_key()
+                self.assertNotEqual(new_key, old_key)
+                cacher.sync()
+                self.assertEqual(cacher.pop(old_key), None)
+                self.assertTrue(cacher.pop(new_key))
+
+                self.test_db.removePackage(package_id2)
+                self.test_db.removePackage(package_id)
+                EntropyCacher._close_stores()
+        finally:
+            self.test_db._caching = False
+            EntropyCacher._close_stores()
+            EntropyCacher.set_backend(old_backend)
+            entropy.dump.D_DIR = old_dump_dir
+            shutil.rmtree(tmp_dir, True)
+            if not started:
+                cacher.stop()
+
     def test_db_insert_compare_match_utf(self):
 
         # insert/compare
@@ -753,6 +1013,221 @@ class EntropyRepositoryTest(unittest.TestCase):
         pkg_data = self.test_db.retrieveUnusedPackageIds()
         self.assertEqual(pkg_data, tuple())
 
+    def test_db_reverse_deps_index(self):
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        data2['pkg_dependencies'] += ((
+                _misc.get_test_package_atom(),
+                etpConst['dependency_type_ids']['rdepend_id']),)
+
+        idpackage = self.test_db.addPackage(data)
+        # generate the index, then let addPackage() and
+        # removePackage() update it
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage),
+            frozenset())
+        self.assertEqual(self.test_db.retrieveUnusedPackageIds(),
+            (idpackage,))
+
+        idpackage2 = self.test_db.addPackage(data2)
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage),
+            frozenset([idpackage2]))
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage,
+                exclude_deptypes = (
+                    etpConst['dependency_type_ids']['rdepend_id'],)),
+            frozenset())
+        self.assertEqual(self.test_db.retrieveUnusedPackageIds(),
+            (idpackage2,))
+
+        # replace the required package, the dependency must
+        # be resolved against the new one
+        self.test_db.removePackage(idpackage)
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage),
+            frozenset())
+        idpackage3 = self.test_db.addPackage(data)
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage3,
+                atoms = True),
+            frozenset([_misc.get_test_package_atom2()]))
+
+        self.test_db.removePackage(idpackage2)
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage3),
+            frozenset())
+        self.assertEqual(self.test_db.retrieveUnusedPackageIds(),
+            (idpackage3,))
+
+    def test_db_reverse_deps_index_evict(self):
+        import entropy.dump
+        from entropy.cache import EntropyCacher
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        data2['pkg_dependencies'] += ((
+                _misc.get_test_package_atom(),
+                etpConst['dependency_type_ids']['rdepend_id']),)
+
+        cacher = EntropyCacher()
+        old_backend = EntropyCacher.backend()
+        old_dump_dir = entropy.dump.D_DIR
+        tmp_dir = tempfile.mkdtemp()
+
+        try:
+            for backend in (EntropyCacher.BACKEND_FILES,
+                            EntropyCacher.BACKEND_STORE):
+                EntropyCacher.set_backend(backend)
+                entropy.dump.D_DIR = os.path.join(tmp_dir, backend)
+                os.makedirs(entropy.dump.D_DIR)
+
+                idpackage = self.test_db.addPackage(data)
+                self.assertEqual(
+                    self.test_db.retrieveReverseDependencies(idpackage),
+                    frozenset())
+                old_key = self.test_db._reverseDependenciesIndexCacheKey()
+                self.assertTrue(cacher.pop(old_key))
+
+                # the index of the changed repository replaces the old one
+                idpackage2 = self.test_db.addPackage(data2)
+                self.assertEqual(
+                    self.test_db.retrieveReverseDependencies(idpackage),
+                    frozenset([idpackage2]))
+                self.test_db._flushReverseDependenciesIndex()
+                new_key = self.test_db._reverseDependenciesIndexCacheKey()
+                self.assertNotEqual(new_key, old_key)
+                self.assertEqual(cacher.pop(old_key), None)
+                self.assertTrue(cacher.pop(new_key))
+
+                self.test_db.removePackage(idpackage2)
+                self.test_db.removePackage(idpackage)
+                self.test_db._clearLiveCache("reverseDependenciesIndex")
+                EntropyCacher._close_stores()
+        finally:
+            EntropyCacher._close_stores()
+            EntropyCacher.set_backend(old_backend)
+            entropy.dump.D_DIR = old_dump_dir
+            shutil.rmtree(tmp_dir, True)
+
+    def test_db_checksum_digests(self):
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+
+        def _checksums():
+            return [self.test_db.checksum(strict = strict,
+                include_signatures = sigs, include_dependencies = deps) \
+                    for strict in (True, False) for sigs in (True, False) \
+                        for deps in (True, False)]
+
+        def _generated_checksums():
+            self.test_db._clearLiveCache("checksumDigests")
+            return _checksums()
+
+        empty = _checksums()
+        ordered = self.test_db.checksum(do_order = True)
+
+        # let addPackage(), set*() and removePackage() update the digests
+        idpackage = self.test_db.addPackage(data)
+        checksums = _checksums()
+        self.assertNotEqual(checksums, empty)
+        self.assertEqual(checksums, _generated_checksums())
+
+        idpackage2 = self.test_db.addPackage(data2)
+        self.assertEqual(_checksums(), _generated_checksums())
+
+        self.test_db.setSlot(idpackage, "foo")
+        self.test_db.setRevision(idpackage2, 123)
+        self.test_db.setSignatures(idpackage, "a", "b", "c")
+        self.assertEqual(_checksums(), _generated_checksums())
+
+        self.test_db.removePackage(idpackage2)
+        self.test_db.removePackage(idpackage)
+        self.assertEqual(_checksums(), empty)
+        self.assertEqual(self.test_db.checksum(do_order = True), ordered)
+
+    def test_repository_index(self):
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        data['pkg_dependencies'] += ((
+                _misc.get_test_package_atom2(),
+                etpConst['dependency_type_ids']['pdepend_id']),)
+
+        idpackage = self.test_db.addPackage(data)
+        idpackage2 = self.test_db.addPackage(data2)
+
+        index = EntropyRepositoryIndex(self.test_db)
+        self.assertTrue(index.isValid(self.test_db))
+
+        for pkg_id in (idpackage, idpackage2):
+            self.assertTrue(index.isPackageIdAvailable(pkg_id))
+            self.assertEqual(index.retrieveKeySlot(pkg_id),
+                self.test_db.retrieveKeySlot(pkg_id))
+            self.assertEqual(index.getVersioningData(pkg_id),
+                self.test_db.getVersioningData(pkg_id))
+            self.assertEqual(index.retrieveDependenciesList(pkg_id),
+                self.test_db.retrieveDependenciesList(pkg_id))
+            self.assertEqual(index.retrievePostDependencies(pkg_id),
+                self.test_db.retrievePostDependencies(pkg_id))
+
+        self.assertFalse(index.isPackageIdAvailable(idpackage2 + 1))
+        self.assertEqual(index.retrieveKeySlot(idpackage2 + 1), None)
+
+        self.test_db.addPackage(data2)
+        self.assertFalse(index.isValid(self.test_db))
+
+    def test_repository_path_index(self):
+
+        utf_path = const_convert_to_unicode("/usr/share/àè/X", "utf-8")
+        index = EntropyRepositoryPathIndex([
+                ("/usr/lib/libz.so.1", 1), ("/usr/lib/libz.so", 1),
+                ("/usr/lib/libZ.so", 2), ("/usr/bin/foo", 2),
+                ("/usr/lib/libz.so", 3), (utf_path, 3)])
+
+        self.assertEqual(index.search("/usr/lib/libz.so"), set([1, 3]))
+        self.assertEqual(index.search("/usr/lib/libz"), set())
+        self.assertEqual(index.searchMany(["/usr/bin/foo", "/foo"]),
+            {"/usr/bin/foo": set([2]), "/foo": set()})
+        self.assertEqual(index.searchPrefix("/usr/lib/"), set([1, 2, 3]))
+        self.assertEqual(index.searchLike("/usr/lib/libz.so"),
+            set([1, 2, 3]))
+        self.assertEqual(index.searchLike("%.so._"), set([1]))
+        self.assertEqual(index.searchLike("/usr/share/__/x"), set([3]))
+        self.assertEqual(index.searchGlob("/usr/lib/libz.so*"),
+            set([1, 3]))
+        self.assertEqual(index.searchGlob("/usr/lib/lib[!z].so"), set([2]))
+        self.assertEqual(index.searchGlob("/usr/share/??/X"), set([3]))
+
+        loaded = EntropyRepositoryPathIndex.load(index.dump())
+        self.assertEqual(len(loaded), len(index))
+        self.assertEqual(loaded.searchLike("%"), set([1, 2, 3]))
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg3 = _misc.get_test_package3()
+        data3 = self.Spm.extract_package_metadata(test_pkg3)
+        self.test_db.addPackage(data)
+        self.test_db.addPackage(data3)
+
+        paths = ["/usr/sbin/htdbm", "/usr/include/zconf.h", "/not/there"]
+        owners = self.test_db.searchBelongsMany(paths)
+        for path in paths:
+            self.assertEqual(owners[path], self.test_db.searchBelongs(path))
+        self.assertEqual(
+            self.test_db.searchBelongs("/usr/%/zlib%", like = True),
+            self.test_db.searchBelongsMany(
+                ["/usr/%/zlib%"], like = True)["/usr/%/zlib%"])
+
     def test_similar(self):
         test_pkg = _misc.get_test_package()
         data = self.Spm.extract_package_metadata(test_pkg)
@@ -896,6 +1371,66 @@ class EntropyRepositoryTest(unittest.TestCase):
         os.remove(buf_file)
         os.remove(new_db_path)
 
+    def test_db_repository_delta(self):
+
+        data = self.Spm.extract_package_metadata(_misc.get_test_package())
+        package_id = self.test_db.addPackage(data)
+        self.test_db2.addPackage(data, package_id = package_id)
+        data3 = self.Spm.extract_package_metadata(_misc.get_test_package3())
+        package_id3 = self.test_db.addPackage(data3)
+        self.test_db2.addPackage(data3, package_id = package_id3)
+        base_fingerprints = EntropyRepositoryDelta.fingerprints(self.test_db)
+        self.assertEqual(EntropyRepositoryDelta.checksum(self.test_db),
+            EntropyRepositoryDelta.checksum(self.test_db2))
+
+        # move the source repository forward
+        data2 = self.Spm.extract_package_metadata(_misc.get_test_package2())
+        data2['changelog'] = const_convert_to_unicode("delta changelog")
+        package_id2 = self.test_db.addPackage(data2)
+        self.test_db.removePackage(package_id)
+        # change a package in place
+        self.test_db.insertDependencies(package_id3,
+            [("app-misc/delta-dep", 0)])
+        self.test_db.insertPackageSets({'my_test_set': set(["app-foo/foo"])})
+        self.test_db.commit()
+        self.assertNotEqual(EntropyRepositoryDelta.checksum(self.test_db),
+            EntropyRepositoryDelta.checksum(self.test_db2))
+
+        fd, delta_path = const_mkstemp()
+        os.close(fd)
+        delta_db = self.Client.open_generic_repository(delta_path,
+            skip_checks = True)
+        delta = EntropyRepositoryDelta(delta_db)
+        added, removed, modified = delta.create(self.test_db,
+            self.test_db_name, 1, 2, base_fingerprints)
+        self.assertEqual(added, [package_id2])
+        self.assertEqual(removed, [package_id])
+        self.assertEqual(modified, [package_id3])
+
+        self.assertTrue(delta.isValid())
+        self.assertEqual(delta.fromRevision(), 1)
+        self.assertEqual(delta.toRevision(), 2)
+        delta.apply(self.test_db2, self.test_db_name)
+        delta_db.close()
+        os.remove(delta_path)
+
+        self.assertEqual(sorted(self.test_db2.listAllPackageIds()),
+            sorted([package_id2, package_id3]))
+        self.assertEqual(self.test_db2.retrieveDependencies(package_id3),
+            self.test_db.retrieveDependencies(package_id3))
+        self.assertEqual(self.test_db2.retrieveChangelog(package_id2),
+            data2['changelog'])
+        self.assertEqual(self.test_db2.retrievePackageSets(),
+            self.test_db.retrievePackageSets())
+        self.assertEqual(EntropyRepositoryDelta.checksum(self.test_db2),
+            delta.expectedChecksum())
+
+        entries = [(1, 2, "a", "0"), (2, 4, "b", "0"), (4, 5, "c", "0")]
+        self.assertEqual(EntropyRepositoryDelta.findChain(entries, 2, 5),
+            entries[1:])
+        self.assertEqual(EntropyRepositoryDelta.findChain(entries, 3, 5),
+            None)
+
     def test_use_defaults(self):
         test_pkg = _misc.get_test_package()
         data = self.Spm.extract_package_metadata(test_pkg)
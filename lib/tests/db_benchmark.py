@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Entropy repository database layer benchmark.
+
+Build synthetic EntropySQLiteRepository instances of the requested sizes,
+time the hot repository calls and write the results as JSON, so that
+the performance of a change to entropy.db can be compared against the
+results obtained on a previous commit.
+
+The package metadata is generated (deterministically, see --seed) from
+the same metadata layout produced by Spm.extract_package_metadata(),
+which is what tests/db.py feeds to addPackage(), without requiring a
+working Source Package Manager.
+
+Usage (from lib/tests):
+
+    python db_benchmark.py --sizes 1000,10000 --output results.json
+    python db_benchmark.py --sizes 1000,10000 --baseline results.json
+"""
+import sys
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+import argparse
+import json
+import os
+import platform
+import random
+import time
+
+from entropy.const import etpConst, etpSys, const_mkstemp
+etpSys['unittest'] = True
+from entropy.output import set_mute
+from entropy.db.sqlite import EntropySQLiteRepository
+
+BENCHMARK_VERSION = 1
+
+_CATEGORIES = ("app-misc", "dev-libs", "dev-util", "media-libs",
+    "net-misc", "sys-apps", "sys-libs", "x11-libs", "x11-misc",
+    "www-client", "games-action", "kde-base")
+_DIRECTORIES = ("/usr/bin", "/usr/lib", "/usr/lib64", "/usr/share/doc",
+    "/usr/share/man/man1", "/usr/include", "/etc", "/usr/share/locale")
+
+
+class SyntheticRepository(object):
+    """
+    Build a synthetic Entropy repository with a realistic dependency and
+    content fan-out.
+    """
+
+    def __init__(self, size, seed, dependencies = 8, content = 40):
+        self._size = size
+        self._random = random.Random(seed)
+        self._dependencies = dependencies
+        self._content = content
+
+    def _package_key(self, index):
+        category = _CATEGORIES[index % len(_CATEGORIES)]
+        return category, "pkg%d" % (index,)
+
+    def package_metadata(self, index, version = "1.0"):
+        """
+        Return the package metadata dictionary of the synthetic package
+        at the given index, suitable for addPackage().
+        """
+        rnd = self._random
+        category, name = self._package_key(index)
+        dep_t = etpConst['dependency_type_ids']['rdepend_id']
+        bdep_t = etpConst['dependency_type_ids']['bdepend_id']
+
+        deps = []
+        if index:
+            for x in range(rnd.randint(0, self._dependencies * 2)):
+                dep_cat, dep_name = self._package_key(rnd.randrange(index))
+                deps.append(("%s/%s" % (dep_cat, dep_name),
+                    rnd.choice((dep_t, dep_t, bdep_t))))
+
+        content = {}
+        for x in range(rnd.randint(1, self._content * 2)):
+            directory = rnd.choice(_DIRECTORIES)
+            content["%s/%s/file%d" % (directory, name, x)] = "obj"
+            content["%s/%s" % (directory, name)] = "dir"
+
+        atom = "%s/%s-%s" % (category, name, version)
+        return {
+            'category': category,
+            'name': name,
+            'version': version,
+            'versiontag': '',
+            'revision': 0,
+            'branch': '5',
+            'slot': '0',
+            'license': 'GPL-2',
+            'etpapi': etpConst['etpapi'],
+            'trigger': '',
+            'description': 'synthetic package %s' % (atom,),
+            'homepage': 'http://www.sabayon.org',
+            'download': 'packages/%s/%s-%s%s' % (
+                category, name, version, etpConst['packagesext']),
+            'size': rnd.randint(1024, 1024000),
+            'chost': 'x86_64-pc-linux-gnu',
+            'cflags': '-O2 -pipe',
+            'cxxflags': '-O2 -pipe',
+            'digest': '%032x' % (rnd.getrandbits(128),),
+            'datecreation': str(1300000000 + index),
+            'config_protect': '/etc',
+            'config_protect_mask': '',
+            'needed': (),
+            'pkg_dependencies': tuple(deps),
+            'sources': set(),
+            'useflags': set(["foo", "-bar"]),
+            'keywords': set(["amd64", "~amd64"]),
+            'licensedata': {},
+            'mirrorlinks': [],
+            'content': content,
+            'counter': -1,
+            'injected': False,
+            'disksize': rnd.randint(1024, 1024000),
+            'conflicts': set(),
+            'provide_extended': set(),
+            'systempackage': False,
+            'spm_phases': None,
+            'spm_repository': None,
+            'content_safety': None,
+            'signatures': {
+                'sha1': '%040x' % (rnd.getrandbits(160),),
+                'sha256': '%064x' % (rnd.getrandbits(256),),
+                'sha512': '%0128x' % (rnd.getrandbits(512),),
+                'gpg': None,
+            },
+        }
+
+    def build(self, repository):
+        """
+        Fill the given (initialized) repository with the synthetic
+        packages. Return the list of package identifiers.
+        """
+        package_ids = []
+        for index in range(self._size):
+            package_ids.append(
+                repository.addPackage(self.package_metadata(index)))
+        repository.commit()
+        return package_ids
+
+
+class Timer(object):
+    """
+    Collect timings of a repository operation.
+    """
+
+    def __init__(self):
+        self._timings = []
+
+    def time(self, func, *args, **kwargs):
+        start = time.time()
+        result = func(*args, **kwargs)
+        self._timings.append(time.time() - start)
+        return result
+
+    def results(self):
+        timings = self._timings
+        if not timings:
+            return {'calls': 0}
+        total = sum(timings)
+        ordered = sorted(timings)
+        return {
+            'calls': len(timings),
+            'total': total,
+            'mean': total / len(timings),
+            'median': ordered[len(ordered) // 2],
+            'min': ordered[0],
+            'max': ordered[-1],
+        }
+
+
+def _sample(rnd, items, amount):
+    items = list(items)
+    if len(items) <= amount:
+        return items
+    return rnd.sample(items, amount)
+
+
+def run_benchmark(size, seed, samples, dependencies, content):
+    """
+    Run the benchmark against a synthetic repository of the given size.
+    Return a dictionary of operation name -> timings.
+    """
+    rnd = random.Random(seed)
+    results = {}
+    fd, db_path = const_mkstemp(prefix = "entropy.db_benchmark")
+    os.close(fd)
+    repository = EntropySQLiteRepository(dbFile = db_path,
+        name = "benchmark", xcache = False, indexing = True,
+        skipChecks = True)
+    try:
+        repository.initializeRepository()
+        synthetic = SyntheticRepository(size, seed,
+            dependencies = dependencies, content = content)
+
+        start = time.time()
+        package_ids = synthetic.build(repository)
+        results['build'] = {'calls': 1, 'total': time.time() - start}
+
+        start = time.time()
+        repository.createAllIndexes()
+        repository.commit()
+        results['createAllIndexes'] = {
+            'calls': 1, 'total': time.time() - start}
+
+        sample_ids = _sample(rnd, package_ids, samples)
+
+        timer = Timer()
+        for package_id in sample_ids:
+            key, slot = repository.retrieveKeySlot(package_id)
+            timer.time(repository.atomMatch, key)
+        results['atomMatch'] = timer.results()
+
+        timer = Timer()
+        for package_id in sample_ids:
+            timer.time(repository.retrieveDependencies, package_id)
+        results['retrieveDependencies'] = timer.results()
+
+        timer = Timer()
+        for package_id in sample_ids:
+            timer.time(repository.retrieveReverseDependencies, package_id)
+        results['retrieveReverseDependencies'] = timer.results()
+
+        timer = Timer()
+        for package_id in sample_ids:
+            paths = list(repository.retrieveContent(package_id))
+            if paths:
+                timer.time(repository.searchBelongs, rnd.choice(paths))
+        results['searchBelongs'] = timer.results()
+
+        # the first call builds the path index
+        timer = Timer()
+        for package_id in sample_ids:
+            paths = list(repository.retrieveContent(package_id))
+            if paths:
+                directory = os.path.dirname(rnd.choice(paths))
+                timer.time(repository.searchBelongs, directory + "/%",
+                    like = True)
+        results['searchBelongsLike'] = timer.results()
+
+        timer = Timer()
+        paths = []
+        for package_id in sample_ids:
+            paths.extend(repository.retrieveContent(package_id))
+        timer.time(repository.searchBelongsMany, paths)
+        results['searchBelongsMany'] = timer.results()
+
+        timer = Timer()
+        for package_id in sample_ids:
+            timer.time(repository.getPackageData, package_id)
+        results['getPackageData'] = timer.results()
+
+        timer = Timer()
+        new_package_ids = []
+        for index in range(min(samples, size)):
+            pkg_data = synthetic.package_metadata(
+                rnd.randrange(size), version = "2.0")
+            new_package_ids.append(
+                timer.time(repository.addPackage, pkg_data))
+        repository.commit()
+        results['addPackage'] = timer.results()
+
+        timer = Timer()
+        for package_id in new_package_ids:
+            timer.time(repository.removePackage, package_id)
+        repository.commit()
+        results['removePackage'] = timer.results()
+
+        timer = Timer()
+        timer.time(repository.checksum, do_order = True, strict = False,
+            include_signatures = True)
+        results['checksum'] = timer.results()
+
+        fd, dump_path = const_mkstemp(prefix = "entropy.db_benchmark.dump")
+        os.close(fd)
+        try:
+            timer = Timer()
+            with open(dump_path, "w") as dump_f:
+                timer.time(repository.exportRepository, dump_f)
+            results['exportRepository'] = timer.results()
+        finally:
+            os.remove(dump_path)
+
+    finally:
+        repository.close()
+        os.remove(db_path)
+
+    return results
+
+
+def compare_results(baseline, data, out_f):
+    """
+    Write to out_f the ratio between the timings in data and the ones
+    in baseline (> 1.0 means slower than baseline).
+    """
+    for size in sorted(data['results'], key = int):
+        base_size = baseline['results'].get(size)
+        if base_size is None:
+            continue
+        out_f.write("%s packages:\n" % (size,))
+        for name, timings in sorted(data['results'][size].items()):
+            base_timings = base_size.get(name)
+            if not base_timings or not base_timings.get('total'):
+                continue
+            ratio = timings['total'] / base_timings['total']
+            out_f.write("  %-30s %8.3fs  %6.2fx\n" % (
+                    name, timings['total'], ratio))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description = "Entropy repository database layer benchmark")
+    parser.add_argument("--sizes", default = "1000,5000",
+        help = "comma separated list of repository sizes (packages)")
+    parser.add_argument("--samples", type = int, default = 200,
+        help = "amount of calls timed for every operation")
+    parser.add_argument("--dependencies", type = int, default = 8,
+        help = "average amount of dependencies per package")
+    parser.add_argument("--content", type = int, default = 40,
+        help = "average amount of files per package")
+    parser.add_argument("--seed", type = int, default = 0,
+        help = "random seed used to generate the repositories")
+    parser.add_argument("--label", default = None,
+        help = "free form label stored in the results (commit, branch)")
+    parser.add_argument("--output", default = "-",
+        help = "path to the JSON results file, - for stdout")
+    parser.add_argument("--baseline", default = None,
+        help = "JSON results file of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    except ValueError:
+        parser.error("invalid --sizes value")
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "r") as base_f:
+            baseline = json.load(base_f)
+
+    set_mute(True)
+    data = {
+        'version': BENCHMARK_VERSION,
+        'label': args.label,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlite': EntropySQLiteRepository.ModuleProxy.get().sqlite_version,
+        'seed': args.seed,
+        'samples': args.samples,
+        'dependencies': args.dependencies,
+        'content': args.content,
+        'results': {},
+    }
+    for size in sizes:
+        sys.stderr.write("benchmarking %d packages...\n" % (size,))
+        data['results'][str(size)] = run_benchmark(size, args.seed,
+            args.samples, args.dependencies, args.content)
+    set_mute(False)
+
+    output = json.dumps(data, indent = 4, sort_keys = True)
+    if args.output == "-":
+        sys.stdout.write(output + "\n")
+    else:
+        with open(args.output, "w") as out_f:
+            out_f.write(output + "\n")
+
+    if baseline is not None:
+        compare_results(baseline, data, sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
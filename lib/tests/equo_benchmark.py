@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Entropy Command Line Client (equo) startup benchmark.
+
+Every sample runs a fresh interpreter, so that the timings include
+the whole module import work done by equo before executing a command.
+Two figures are collected for every command:
+
+    - import: time spent importing solo.main and loading the requested
+      command class, plus the amount of modules imported.
+    - run: wall clock time of the whole "equo <command>" execution.
+
+Commands that do not require the Entropy Client to be instantiated
+(like "version" or "query --help") are the interesting ones, because
+their running time is dominated by imports.
+
+Usage (from lib/tests):
+
+    python equo_benchmark.py --runs 20 --output results.json
+    python equo_benchmark.py --runs 20 --baseline results.json
+"""
+import sys
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+BENCHMARK_VERSION = 1
+
+_CLIENT_DIR = os.path.abspath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "client"))
+_DEFAULT_COMMANDS = "version;help;query --help;match --help;install --help"
+
+_IMPORT_PROBE = """
+import os, sys, time
+os.environ['ETP_GETTEXT_DOMAIN'] = "entropy"
+start = time.time()
+sys.path.insert(0, "../lib")
+sys.path.insert(0, "../client")
+import solo.main
+try:
+    from solo.commands import load
+except ImportError:
+    # all the commands are imported by solo.main
+    load = None
+if load is not None:
+    load(%r)
+sys.stdout.write("%%f %%d\\n" %% (time.time() - start, len(sys.modules)))
+"""
+
+
+def _stats(timings):
+    total = sum(timings)
+    ordered = sorted(timings)
+    return {
+        'runs': len(timings),
+        'total': total,
+        'mean': total / len(timings),
+        'median': ordered[len(ordered) // 2],
+        'min': ordered[0],
+        'max': ordered[-1],
+    }
+
+
+def run_benchmark(command, runs):
+    """
+    Benchmark the given equo command (list of arguments) and return
+    the collected timings.
+    """
+    devnull = open(os.devnull, "w")
+    try:
+        import_timings = []
+        modules = 0
+        for _run in range(runs):
+            proc = subprocess.Popen(
+                [sys.executable, "-c", _IMPORT_PROBE % (command[0],)],
+                stdout = subprocess.PIPE, cwd = _CLIENT_DIR)
+            output = proc.communicate()[0]
+            if proc.returncode != 0:
+                raise SystemError("import probe failed for %s" % (
+                        command,))
+            elapsed, modules = output.split()
+            import_timings.append(float(elapsed))
+
+        run_timings = []
+        for _run in range(runs):
+            start = time.time()
+            subprocess.call(
+                [sys.executable, "equo.py"] + command,
+                stdout = devnull, stderr = devnull, cwd = _CLIENT_DIR)
+            run_timings.append(time.time() - start)
+    finally:
+        devnull.close()
+
+    results = {
+        'import': _stats(import_timings),
+        'run': _stats(run_timings),
+    }
+    results['import']['modules'] = int(modules)
+    return results
+
+
+def compare_results(baseline, data, out_f):
+    """
+    Write to out_f the ratio between the median timings in data and the
+    ones in baseline (> 1.0 means slower than baseline).
+    """
+    for name, timings in sorted(data['results'].items()):
+        base_timings = baseline['results'].get(name)
+        if base_timings is None:
+            continue
+        out_f.write("equo %s:\n" % (name,))
+        for kind in ("import", "run"):
+            median = timings[kind]['median']
+            base_median = base_timings[kind]['median']
+            if not base_median:
+                continue
+            out_f.write("  %-8s %8.3fs  %6.2fx\n" % (
+                    kind, median, median / base_median))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description = "Entropy Command Line Client startup benchmark")
+    parser.add_argument("--commands", default = _DEFAULT_COMMANDS,
+        help = "semicolon separated list of equo commands to run")
+    parser.add_argument("--runs", type = int, default = 10,
+        help = "amount of runs timed for every command")
+    parser.add_argument("--label", default = None,
+        help = "free form label stored in the results (commit, branch)")
+    parser.add_argument("--output", default = "-",
+        help = "path to the JSON results file, - for stdout")
+    parser.add_argument("--baseline", default = None,
+        help = "JSON results file of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    commands = [x.split() for x in args.commands.split(";") if x.strip()]
+    if not commands or args.runs < 1:
+        parser.error("nothing to benchmark")
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "r") as base_f:
+            baseline = json.load(base_f)
+
+    data = {
+        'version': BENCHMARK_VERSION,
+        'label': args.label,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'results': {},
+    }
+    for command in commands:
+        name = " ".join(command)
+        sys.stderr.write("benchmarking equo %s...\n" % (name,))
+        data['results'][name] = run_benchmark(command, args.runs)
+
+    output = json.dumps(data, indent = 4, sort_keys = True)
+    if args.output == "-":
+        sys.stdout.write(output + "\n")
+    else:
+        with open(args.output, "w") as out_f:
+            out_f.write(output + "\n")
+
+    if baseline is not None:
+        compare_results(baseline, data, sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -1,14 +1,88 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import hashlib
+import shutil
+import tempfile
+import threading
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
 sys.path.insert(0, '.')
 sys.path.insert(0, '../')
 import unittest
 import tests._misc as _misc
-from entropy.fetchers import UrlFetcher, MultipleUrlFetcher
+from entropy.fetchers import UrlFetcher, MultipleUrlFetcher, \
+    SegmentedUrlFetcher, UrlConnectionPool
 from entropy.output import set_mute
 import entropy.tools
 
+
+class _MirrorsHandler(BaseHTTPRequestHandler):
+    """
+    Serve the same payload from several mirrors (/<mirror>/file),
+    honouring byte ranges. Mirrors behaviour is set via the "mirrors"
+    server attribute: "ok", "norange" (byte ranges ignored), "short"
+    (connections drop in the middle of the byte ranges) or an int (the
+    amount of requests served before failing).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        mirror = self.path.split("/")[1]
+        server = self.server
+        payload = server.payload
+        byte_range = self.headers.get("range")
+        with server.lock:
+            mode = server.mirrors[mirror]
+            server.requests.append((mirror, byte_range))
+            if isinstance(mode, int):
+                server.mirrors[mirror] = mode - 1
+                if mode < 1:
+                    self.send_error(503)
+                    return
+
+        if byte_range is None or mode == "norange":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        start, end = byte_range.split("=", 1)[1].split("-", 1)
+        start, end = int(start), min(int(end), len(payload) - 1)
+        data = payload[start:end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes %d-%d/%d" % (
+                start, end, len(payload)))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if mode == "short" and len(data) > 1:
+            self.wfile.write(data[:len(data) // 2])
+            self.close_connection = 1
+            return
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _MirrorsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients drop the connections of failed mirrors
+        pass
+
+
 class FetchersTest(unittest.TestCase):
 
     def setUp(self):
@@ -47,6 +121,254 @@ class FetchersTest(unittest.TestCase):
         self.assertEqual(rc.pop(1), ck_sum)
         os.remove(path_to_save)
 
+    def test_segmented_urlfetcher_fallback(self):
+
+        file_path = "file://" + os.path.realpath(self._random_file)
+        ck_f = open(self._random_file_md5, "r")
+        ck_sum = ck_f.readline().strip().split()[0]
+        ck_f.close()
+        path_to_save = os.path.join(os.path.dirname(self._random_file),
+            "test_urlfetcher")
+
+        # file:// URLs cannot be segmented, UrlFetcher is used instead
+        self.assertFalse(
+            SegmentedUrlFetcher.supports_segmented_download(file_path))
+        fetcher = SegmentedUrlFetcher([file_path, file_path], path_to_save,
+            show_speed = False, resume = False)
+        rc = fetcher.download()
+        self.assertEqual(rc, ck_sum)
+        self.assertEqual(fetcher.get_mirror_statistics(), [])
+        os.remove(path_to_save)
+
+    def test_url_connection_pool(self):
+
+        pool = UrlConnectionPool()
+        pool.clear()
+        self.assertTrue(pool is UrlConnectionPool())
+
+        key = (httplib.HTTPConnection, "localhost", None)
+        self.assertEqual(pool.acquire(key), None)
+
+        conns = [httplib.HTTPConnection("localhost") for x in range(
+                pool.MAX_IDLE_CONNECTIONS + 1)]
+        for conn in conns:
+            pool.release(key, conn)
+        # the last connection exceeds the limit and gets closed
+        acquired = []
+        conn = pool.acquire(key)
+        while conn is not None:
+            acquired.append(conn)
+            conn = pool.acquire(key)
+        self.assertEqual(len(acquired), pool.MAX_IDLE_CONNECTIONS)
+        self.assertTrue(conns[-1] not in acquired)
+
+        # non reusable connections are not kept
+        pool.release(key, conns[0], reusable = False)
+        self.assertEqual(pool.acquire(key), None)
+        pool.clear()
+
+    def test_urlfetcher_connection_reuse(self):
+
+        payload = b"entropy" * 1024
+        clients = []
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                clients.append(self.client_address)
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = Server(("127.0.0.1", 0), Handler)
+        server_t = threading.Thread(target = server.serve_forever)
+        server_t.daemon = True
+        server_t.start()
+
+        tmp_dir = tempfile.mkdtemp()
+        pool = UrlConnectionPool()
+        pool.clear()
+        try:
+            url = "http://127.0.0.1:%d/file" % (server.server_address[1],)
+            for idx in range(2):
+                path_to_save = os.path.join(tmp_dir, "file%d" % (idx,))
+                fetcher = UrlFetcher(url, path_to_save,
+                    show_speed = False, resume = False)
+                self.assertEqual(fetcher.download(),
+                    hashlib.md5(payload).hexdigest())
+                with open(path_to_save, "rb") as saved_f:
+                    self.assertEqual(saved_f.read(), payload)
+            # both requests went through the same connection
+            self.assertEqual(len(clients), 1)
+        finally:
+            pool.clear()
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(tmp_dir, True)
+
+    def _start_mirrors(self, mirrors):
+        server = _MirrorsServer(("127.0.0.1", 0), _MirrorsHandler)
+        server.payload = os.urandom(64 * 1024 + 123)
+        server.mirrors = mirrors
+        server.requests = []
+        server.lock = threading.Lock()
+        server_t = threading.Thread(target = server.serve_forever)
+        server_t.daemon = True
+        server_t.start()
+        self._tmp_dir = tempfile.mkdtemp()
+        return server
+
+    def _stop_mirrors(self, server):
+        UrlConnectionPool().clear()
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(self._tmp_dir, True)
+
+    def _segmented_fetcher(self, server, mirrors, klass = None, **kwargs):
+        if klass is None:
+            klass = SegmentedUrlFetcher
+        urls = ["http://127.0.0.1:%d/%s/file" % (
+                server.server_address[1], x) for x in mirrors]
+        path_to_save = os.path.join(self._tmp_dir, "file")
+        fetcher = klass(urls, path_to_save, show_speed = False,
+            segment_size = 4096, max_connections = len(urls),
+            **kwargs)
+        return fetcher, path_to_save
+
+    def _read(self, path):
+        with open(path, "rb") as saved_f:
+            return saved_f.read()
+
+    def test_segmented_urlfetcher_download(self):
+        mirrors = ["a", "b", "c"]
+        server = self._start_mirrors(dict((x, "ok") for x in mirrors))
+        try:
+            fetcher, path_to_save = self._segmented_fetcher(
+                server, mirrors, resume = False)
+            self.assertEqual(fetcher.download(),
+                hashlib.md5(server.payload).hexdigest())
+            self.assertEqual(self._read(path_to_save), server.payload)
+            self.assertFalse(os.path.lexists(path_to_save + ".segments"))
+
+            stats = fetcher.get_mirror_statistics()
+            self.assertEqual([x['status'] for x in stats], ["active"] * 3)
+            self.assertEqual(sum(x['downloaded'] for x in stats),
+                len(server.payload))
+            # the probe and byte ranges only
+            self.assertTrue(server.requests)
+            for mirror, byte_range in server.requests:
+                self.assertTrue(byte_range.startswith("bytes="))
+        finally:
+            self._stop_mirrors(server)
+
+    def test_segmented_urlfetcher_no_ranges(self):
+        mirrors = ["a", "b"]
+        server = self._start_mirrors({"a": "norange", "b": "ok"})
+        try:
+            fetcher, path_to_save = self._segmented_fetcher(
+                server, mirrors, resume = False)
+            self.assertEqual(fetcher.download(),
+                hashlib.md5(server.payload).hexdigest())
+            self.assertEqual(self._read(path_to_save), server.payload)
+            # plain download from the primary mirror
+            self.assertEqual(fetcher.get_mirror_statistics(), [])
+            self.assertEqual(set(x for x, _r in server.requests), set(["a"]))
+        finally:
+            self._stop_mirrors(server)
+
+    def test_segmented_urlfetcher_failover(self):
+        mirrors = ["a", "b", "c"]
+        # "b" drops the connections, "c" fails after two requests
+        server = self._start_mirrors({"a": "ok", "b": "short", "c": 2})
+        try:
+            fetcher, path_to_save = self._segmented_fetcher(
+                server, mirrors, resume = False)
+            self.assertEqual(fetcher.download(),
+                hashlib.md5(server.payload).hexdigest())
+            self.assertEqual(self._read(path_to_save), server.payload)
+
+            stats = dict((x['url'].split("/")[-2], x) for x in \
+                             fetcher.get_mirror_statistics())
+            self.assertEqual(stats["a"]['status'], "active")
+            self.assertEqual(stats["b"]['status'], "failed")
+            self.assertEqual(stats["c"]['status'], "failed")
+        finally:
+            self._stop_mirrors(server)
+
+    def test_segmented_urlfetcher_resume(self):
+        mirrors = ["a", "b"]
+        # all the mirrors fail halfway
+        server = self._start_mirrors({"a": 4, "b": 3})
+        try:
+            fetcher, path_to_save = self._segmented_fetcher(
+                server, mirrors, resume = True)
+            self.assertEqual(fetcher.download(),
+                UrlFetcher.GENERIC_FETCH_ERROR)
+            # only the data written from the beginning is kept
+            partial = self._read(path_to_save)
+            self.assertTrue(0 < len(partial) < len(server.payload))
+            self.assertEqual(partial, server.payload[:len(partial)])
+            self.assertFalse(os.path.lexists(path_to_save + ".segments"))
+
+            server.mirrors.update({"a": "ok", "b": "ok"})
+            del server.requests[:]
+            fetcher, path_to_save = self._segmented_fetcher(
+                server, mirrors, resume = True)
+            self.assertEqual(fetcher.download(),
+                hashlib.md5(server.payload).hexdigest())
+            self.assertTrue(fetcher.is_resumed())
+            self.assertEqual(self._read(path_to_save), server.payload)
+
+            # the data already available is not fetched again
+            starts = [int(x.split("=")[1].split("-")[0]) for _m, x in \
+                          server.requests[1:]]
+            self.assertTrue(min(starts) >= len(partial))
+        finally:
+            self._stop_mirrors(server)
+
+    def test_segmented_urlfetcher_demoted_fallback(self):
+        demoted = []
+
+        class DemotingFetcher(SegmentedUrlFetcher):
+            # demote mirror "b" as soon as it transfers some data
+            def _SegmentedUrlFetcher__demote_check(self, mirror):
+                if mirror.url.endswith("/b/file") and not demoted:
+                    demoted.append(mirror.url)
+                    mirror.status = "demoted"
+                    return True
+                return False
+
+        mirrors = ["a", "b"]
+        # the only mirror left fails, the demoted one must be used
+        server = self._start_mirrors({"a": 3, "b": "ok"})
+        try:
+            fetcher, path_to_save = self._segmented_fetcher(
+                server, mirrors, klass = DemotingFetcher, resume = False)
+            self.assertEqual(fetcher.download(),
+                hashlib.md5(server.payload).hexdigest())
+            self.assertEqual(self._read(path_to_save), server.payload)
+            self.assertTrue(demoted)
+
+            stats = dict((x['url'].split("/")[-2], x) for x in \
+                             fetcher.get_mirror_statistics())
+            self.assertEqual(stats["a"]['status'], "failed")
+            self.assertEqual(stats["b"]['status'], "active")
+        finally:
+            self._stop_mirrors(server)
+
+
 if __name__ == '__main__':
     unittest.main()
     raise SystemExit(0)
@@ -3,12 +3,14 @@ import sys
 sys.path.insert(0, '.')
 sys.path.insert(0, '../')
 import os
+import shutil
 import unittest
 import tempfile
 import json
 from entropy.const import const_convert_to_unicode, const_mkstemp
 from entropy.misc import Lifo, TimeScheduled, ParallelTask, EmailSender, \
     FastRSS, FlockFile
+from entropy.cache import EntropyCacheStore, EntropyCacher
 
 class MiscTest(unittest.TestCase):
 
@@ -64,6 +66,126 @@ class MiscTest(unittest.TestCase):
         # test if it raises ValueError exception
         self.assertRaises(ValueError, self.__lifo.pop)
 
+    def test_cache_store(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            store = EntropyCacheStore(tmp_dir, 1024000)
+            store.set("foo/bar", self._lifo_item3)
+            store.set("foo/baz", self._lifo_item4)
+            store.set("qux", self._lifo_item5)
+            self.assertEqual(store.get("foo/bar"), self._lifo_item3)
+            self.assertEqual(store.get("foo/bar", aging_days = 1),
+                self._lifo_item3)
+            self.assertEqual(store.get("missing"), None)
+            store.close()
+
+            # reload from disk
+            store = EntropyCacheStore(tmp_dir, 1024000)
+            self.assertEqual(store.get("foo/baz"), self._lifo_item4)
+            store.remove_prefix("foo/")
+            self.assertEqual(store.get("foo/bar"), None)
+            self.assertEqual(store.get("foo/baz"), None)
+            self.assertEqual(store.get("qux"), self._lifo_item5)
+            store.close()
+
+            # size bound, least recently used objects go first
+            store = EntropyCacheStore(tmp_dir, 2048)
+            for idx in range(20):
+                store.set("item%d" % (idx,), "x" * 256)
+                self.assertEqual(store.get("item0"), "x" * 256)
+            self.assertEqual(store.get("item0"), "x" * 256)
+            self.assertEqual(store.get("item1"), None)
+            self.assertEqual(store.get("item19"), "x" * 256)
+            store.close()
+        finally:
+            shutil.rmtree(tmp_dir, True)
+
+    def test_cache_store_concurrent(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            # two stores on the same file, as two processes would do
+            store_a = EntropyCacheStore(tmp_dir, 2048)
+            store_b = EntropyCacheStore(tmp_dir, 2048)
+            self.assertEqual(store_a.get("foo"), None)
+            self.assertEqual(store_b.get("foo"), None)
+
+            store_a.set("foo", self._lifo_item3)
+            self.assertEqual(store_b.get("foo"), self._lifo_item3)
+            store_b.set("bar", self._lifo_item4)
+            self.assertEqual(store_a.get("bar"), self._lifo_item4)
+
+            store_b.remove_prefix("foo")
+            self.assertEqual(store_a.get("foo"), None)
+
+            # eviction must account for objects written by the other
+            for idx in range(10):
+                store_a.set("a%d" % (idx,), "x" * 256)
+                store_b.set("b%d" % (idx,), "x" * 256)
+            self.assertEqual(store_a.get("b9"), "x" * 256)
+            self.assertEqual(store_b.get("a9"), "x" * 256)
+            self.assertTrue(store_a._size <= 2048)
+            self.assertEqual(store_a._size, store_b._size)
+            self.assertEqual(sorted(store_a._index.keys()),
+                sorted(store_b._index.keys()))
+            store_a.close()
+            store_b.close()
+        finally:
+            shutil.rmtree(tmp_dir, True)
+
+    def test_cache_store_purge(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            store = EntropyCacher._get_store(tmp_dir)
+            # as another process would do
+            other = EntropyCacheStore(tmp_dir, 1024000)
+            store.set("foo", self._lifo_item3)
+            self.assertEqual(other.get("foo"), self._lifo_item3)
+
+            EntropyCacher.purge_stores()
+            self.assertEqual(other.get("foo"), None)
+            new_store = EntropyCacher._get_store(tmp_dir)
+            self.assertTrue(new_store is not store)
+            self.assertEqual(new_store.get("foo"), None)
+            EntropyCacher._close_stores()
+            other.close()
+        finally:
+            shutil.rmtree(tmp_dir, True)
+
+    def test_cacher_remove_prefix(self):
+        cacher = EntropyCacher()
+        old_backend = EntropyCacher.backend()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for backend in (EntropyCacher.BACKEND_FILES,
+                            EntropyCacher.BACKEND_STORE):
+                EntropyCacher.set_backend(backend)
+                cache_dir = os.path.join(tmp_dir, backend)
+                os.mkdir(cache_dir)
+                keys = ["match/foo/a_1", "match/foo/b_1", "match/foo/a_2",
+                        "match/foo/sub/c_2", "match/foobar_2", "other_2"]
+                for key in keys:
+                    cacher.save(key, key, cache_dir = cache_dir)
+
+                EntropyCacher.remove_prefix("match/foo/", keep_suffix = "_1",
+                    cache_dir = cache_dir)
+                self.assertEqual(
+                    [x for x in keys if cacher.pop(
+                            x, cache_dir = cache_dir) is not None],
+                    ["match/foo/a_1", "match/foo/b_1", "match/foobar_2",
+                     "other_2"])
+
+                EntropyCacher.remove_prefix("match/foo",
+                    cache_dir = cache_dir)
+                self.assertEqual(
+                    [x for x in keys if cacher.pop(
+                            x, cache_dir = cache_dir) is not None],
+                    ["other_2"])
+                EntropyCacher._close_stores()
+        finally:
+            EntropyCacher._close_stores()
+            EntropyCacher.set_backend(old_backend)
+            shutil.rmtree(tmp_dir, True)
+
     """
     XXX: causes random lock ups
     def test_timesched(self):
@@ -2,8 +2,15 @@
 import sys
 sys.path.insert(0, '.')
 sys.path.insert(0, '../')
+import codecs
+import json
+import os
+import shutil
+import threading
 import unittest
 import entropy.qa
+import entropy.elf
+from entropy.const import etpConst
 from entropy.output import TextInterface, set_mute
 import entropy.tools
 import tests._misc as _misc
@@ -26,6 +33,152 @@ class QATest(unittest.TestCase):
             self.assertTrue(self.QA.entropy_package_checks(pkg))
         set_mute(False)
 
+    def test_libtest_metadata(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            elf_path = os.path.join(tmp_dir, "libkdb5.so.4.0")
+            shutil.copy2(_misc.get_dl_so_amd_2(), elf_path)
+            elf_obj = entropy.elf.read_elf(elf_path, symbols = False)
+            expected = (elf_obj.elf_class, tuple(elf_obj.needed),
+                        tuple(elf_obj.linker_paths()))
+
+            new_cache = {}
+            metadata = self.QA._read_libtest_metadata(elf_path, {}, new_cache)
+            self.assertEqual(metadata, expected)
+            self.assertTrue("libkrb5.so.3" in metadata[1])
+            st = os.stat(elf_path)
+            key = (st.st_ino, st.st_mtime, st.st_size)
+            self.assertEqual(new_cache, {elf_path: (key, expected)})
+
+            # unchanged object, metadata comes from the cache
+            fake = (elf_obj.elf_class, ("libfake.so.1",), ())
+            cache = {elf_path: (key, fake)}
+            new_cache = {}
+            self.assertEqual(
+                self.QA._read_libtest_metadata(elf_path, cache, new_cache),
+                fake)
+            self.assertEqual(new_cache, cache)
+
+            # changed object (size), the cached metadata is ignored
+            with open(elf_path, "ab") as elf_f:
+                elf_f.write(b"\0" * 16)
+            new_cache = {}
+            self.assertEqual(
+                self.QA._read_libtest_metadata(elf_path, cache, new_cache),
+                expected)
+            self.assertNotEqual(new_cache[elf_path][0], key)
+
+            # stale key (inode), the cached metadata is ignored
+            st = os.stat(elf_path)
+            cache = {elf_path: ((st.st_ino + 1, st.st_mtime, st.st_size),
+                                fake)}
+            self.assertEqual(
+                self.QA._read_libtest_metadata(elf_path, cache, {}),
+                expected)
+
+            # executable, not an ELF object
+            txt_path = os.path.join(tmp_dir, "script.sh")
+            with open(txt_path, "w") as txt_f:
+                txt_f.write("#!/bin/sh\n")
+            os.chmod(txt_path, 0o755)
+            new_cache = {}
+            self.assertEqual(
+                self.QA._read_libtest_metadata(txt_path, {}, new_cache), None)
+            self.assertEqual(new_cache[txt_path][1], None)
+
+            # not executable, not even a candidate
+            os.chmod(txt_path, 0o644)
+            new_cache = {}
+            self.assertEqual(
+                self.QA._read_libtest_metadata(txt_path, {}, new_cache), None)
+            self.assertEqual(new_cache, {})
+        finally:
+            shutil.rmtree(tmp_dir, True)
+
+    def test_libtest_report(self):
+        broken_executables = {
+            "/usr/bin/foo": (set(["libbar.so.1", "libbaz.so.2"]),
+                             set(["bar_init"])),
+            "/usr/lib/libqux.so.3": (set(["libbar.so.1"]), set()),
+        }
+        pkgs_matched = {
+            "/usr/bin/foo": set([(2, "sabayonlinux.org"),
+                                 (1, "sabayonlinux.org")]),
+        }
+        report = self.QA._libtest_report(
+            broken_executables, pkgs_matched, 42)
+
+        self.assertEqual(report['version'], self.QA._LIBTEST_REPORT_VERSION)
+        self.assertEqual(report['root'], etpConst['systemroot'])
+        self.assertEqual(report['scanned'], 42)
+        self.assertEqual(report['broken'], [
+            {
+                'path': "/usr/bin/foo",
+                'libraries': ["libbar.so.1", "libbaz.so.2"],
+                'symbols': ["bar_init"],
+                'packages': [
+                    {'package_id': 1, 'repository': "sabayonlinux.org"},
+                    {'package_id': 2, 'repository': "sabayonlinux.org"},
+                ],
+            },
+            {
+                'path': "/usr/lib/libqux.so.3",
+                'libraries': ["libbar.so.1"],
+                'symbols': [],
+                'packages': [],
+            },
+        ])
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            report_path = os.path.join(tmp_dir, "libtest_results.json")
+            with codecs.open(report_path, "w", encoding = "utf-8") as rep_f:
+                self.QA._write_libtest_report(report, rep_f)
+            with codecs.open(report_path, "r", encoding = "utf-8") as rep_f:
+                self.assertEqual(json.load(rep_f), report)
+        finally:
+            shutil.rmtree(tmp_dir, True)
+
+    def test_libtest_workers(self):
+        items = list(range(200))
+        lock = threading.Lock()
+        progress = []
+
+        def _progress(count, total):
+            progress.append((count, total))
+
+        for jobs in (1, 4):
+            done = []
+            threads = set()
+            del progress[:]
+
+            def _func(item):
+                with lock:
+                    done.append(item)
+                    threads.add(threading.current_thread().name)
+
+            self.QA._run_libtest_workers(_func, items, jobs, None, _progress)
+            self.assertEqual(sorted(done), items)
+            self.assertEqual(progress[-1], (len(items), len(items)))
+            if jobs > 1:
+                for name in threads:
+                    self.assertTrue(name.startswith("QAInterfaceLibtest-"))
+            else:
+                self.assertEqual(threads,
+                    set([threading.current_thread().name]))
+
+        # the first exception raised by a worker is propagated
+        def _func_fail(item):
+            if item == 100:
+                raise KeyError(item)
+
+        set_mute(True)
+        try:
+            self.assertRaises(KeyError, self.QA._run_libtest_workers,
+                _func_fail, items, 4, None, _progress)
+        finally:
+            set_mute(False)
+
 if __name__ == '__main__':
     unittest.main()
     raise SystemExit(0)
@@ -86,6 +86,24 @@ class SecurityTest(unittest.TestCase):
         self.assertEqual(s_rc, 0)
         self.assertEqual(self._system.available(), True)
 
+    def test_security_advisories_index(self):
+        set_mute(True)
+        s_rc = self._system.update()
+        set_mute(False)
+        self.assertEqual(s_rc, 0)
+        # update() compiles the advisories index
+        self.assertTrue(os.path.isfile(self._system._index_path()))
+
+        advisory_ids = self._system.list()
+        self.assertTrue(advisory_ids)
+        for advisory_id in advisory_ids[:20]:
+            xml_metadata = System._get_xml_metadata(
+                self._system._id_to_xml(advisory_id))
+            self.assertEqual(self._system.advisory(advisory_id),
+                xml_metadata)
+            self.assertTrue(
+                isinstance(self._system.affected_id(advisory_id), set))
+
     def test_gpg_handling(self):
 
         # available keys should be empty
@@ -5,7 +5,15 @@ sys.path.insert(0, '../')
 import unittest
 import os
 import shutil
+import tempfile
+import threading
 from entropy.server.interfaces import Server
+from entropy.server.transceivers import TransceiverServerHandler
+from entropy.transceivers import EntropyTransceiver
+from entropy.transceivers.exceptions import TransceiverConnectionError
+from entropy.transceivers.uri_handlers.plugins.interfaces.file_plugin import \
+    EntropyFileUriHandler
+from entropy.output import set_mute
 from entropy.const import etpConst, initconfig_entropy_constants, etpSys
 from entropy.core.settings.base import SystemSettings
 from entropy.db import EntropyRepository
@@ -163,6 +171,194 @@ class EntropyRepositoryTest(unittest.TestCase):
         self.assertEqual(False, const_key in etpConst)
         self.assertEqual(None, etpConst.get(const_key))
 
+
+class _FaultyUriHandler(EntropyFileUriHandler):
+    """
+    Local mirror URI handler (faulty:///path) with fault injection.
+    """
+
+    lock = threading.Lock()
+    # mirrors that cannot be reached
+    unreachable = set()
+    # file names whose upload drops the connection, once
+    drops = set()
+    # file names whose upload raises an unexpected exception
+    errors = set()
+    # file names whose upload gets corrupted, and how many times
+    corrupt = {}
+    # (uri, file name) of the completed uploads, in order
+    uploads = []
+
+    @staticmethod
+    def approve_uri(uri):
+        return uri.startswith("faulty://")
+
+    @staticmethod
+    def get_uri_name(uri):
+        return uri
+
+    def __init__(self, uri):
+        if uri in _FaultyUriHandler.unreachable:
+            raise TransceiverConnectionError("cannot connect to %s" % (uri,))
+        EntropyFileUriHandler.__init__(self, uri)
+
+    def _drop_file_protocol(self, uri_str):
+        return uri_str[len("faulty://"):]
+
+    def upload(self, load_path, remote_path):
+        cls = _FaultyUriHandler
+        name = os.path.basename(load_path)
+        with cls.lock:
+            if name in cls.errors:
+                raise ValueError("unexpected error for %s" % (name,))
+            if name in cls.drops:
+                cls.drops.discard(name)
+                raise TransceiverConnectionError("connection dropped")
+            corrupt = cls.corrupt.get(name, 0)
+            if corrupt:
+                cls.corrupt[name] = corrupt - 1
+
+        rc = EntropyFileUriHandler.upload(self, load_path, remote_path)
+        if corrupt:
+            with open(self._setup_remote_path(remote_path), "w") as f:
+                f.write("garbage")
+        with cls.lock:
+            cls.uploads.append((self._uri, name))
+        return rc
+
+
+class TransceiverServerHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.default_repo = "foo"
+        etpConst['defaultserverrepositoryid'] = self.default_repo
+        etpConst['uid'] = 0
+
+        self.Server = Server(fake_default_repo_id = self.default_repo,
+            fake_default_repo_desc = 'foo desc', fake_default_repo = True)
+
+        _FaultyUriHandler.unreachable.clear()
+        _FaultyUriHandler.drops.clear()
+        _FaultyUriHandler.errors.clear()
+        _FaultyUriHandler.corrupt.clear()
+        del _FaultyUriHandler.uploads[:]
+        EntropyTransceiver.add_uri_handler(_FaultyUriHandler)
+
+        self._tmp_dir = tempfile.mkdtemp()
+        self._local_dir = os.path.join(self._tmp_dir, "local")
+        os.mkdir(self._local_dir)
+        self._files = []
+        for idx in range(6):
+            path = os.path.join(self._local_dir, "file%d" % (idx,))
+            with open(path, "w") as f:
+                f.write("content of file %d\n" % (idx,) * (idx + 1))
+            self._files.append(path)
+        set_mute(True)
+
+    def tearDown(self):
+        set_mute(False)
+        EntropyTransceiver.remove_uri_handler(_FaultyUriHandler)
+        shutil.rmtree(self._tmp_dir, True)
+        self.Server.destroy()
+        self.Server.shutdown()
+
+    def _mirror(self, name):
+        path = os.path.join(self._tmp_dir, name)
+        os.mkdir(path)
+        return "faulty://" + path
+
+    def _mirror_files(self, uri):
+        remote_dir = os.path.join(uri[len("faulty://"):], "repo")
+        if not os.path.isdir(remote_dir):
+            return {}
+        data = {}
+        for name in os.listdir(remote_dir):
+            with open(os.path.join(remote_dir, name), "r") as f:
+                data[name] = f.read()
+        return data
+
+    def _local_files(self):
+        data = {}
+        for path in self._files:
+            with open(path, "r") as f:
+                data[os.path.basename(path)] = f.read()
+        return data
+
+    def _handler(self, uris, critical_files = None, **kwargs):
+        return TransceiverServerHandler(self.Server, uris, self._files,
+            txc_basedir = "repo", local_basedir = self._local_dir,
+            critical_files = critical_files, repo = self.default_repo,
+            **kwargs)
+
+    def test_transceiver_push_parallel(self):
+        uris = [self._mirror("mirror%d" % (idx,)) for idx in range(3)]
+        handler = self._handler(uris, parallel_mirrors = 2,
+            parallel_transfers = 3)
+        errors, fine, broken = handler.go()
+        self.assertFalse(errors)
+        self.assertEqual(fine, set(uris))
+        self.assertEqual(broken, set())
+        for uri in uris:
+            self.assertEqual(self._mirror_files(uri), self._local_files())
+
+    def test_transceiver_push_deferred_verify(self):
+        uri = self._mirror("mirror")
+        _FaultyUriHandler.corrupt["file2"] = 1
+        handler = self._handler([uri], parallel_transfers = 2)
+        errors, fine, broken = handler.go()
+        self.assertFalse(errors)
+        self.assertEqual(broken, set())
+        # the corrupted upload is detected at the end and pushed again
+        self.assertEqual(self._mirror_files(uri), self._local_files())
+        names = [x for _uri, x in _FaultyUriHandler.uploads]
+        self.assertEqual(names.count("file2"), 2)
+        self.assertEqual(names[-1], "file2")
+
+    def test_transceiver_push_critical_verify(self):
+        uri = self._mirror("mirror")
+        # a critical file corrupted on every try
+        _FaultyUriHandler.corrupt["file1"] = 100
+        handler = self._handler([uri], critical_files = self._files[:])
+        errors, fine, broken = handler.go()
+        self.assertTrue(errors)
+        self.assertEqual([x for x, _rc in broken], [uri])
+        # the mirror is stopped before the rest of the queue is pushed
+        names = [x for _uri, x in _FaultyUriHandler.uploads]
+        self.assertEqual(names, ["file0"] + ["file1"] * 5)
+
+    def test_transceiver_push_reconnect(self):
+        uri = self._mirror("mirror")
+        _FaultyUriHandler.drops.update(["file1", "file4"])
+        handler = self._handler([uri], parallel_transfers = 2)
+        errors, fine, broken = handler.go()
+        self.assertFalse(errors)
+        self.assertEqual(fine, set([uri]))
+        self.assertEqual(broken, set())
+        self.assertEqual(self._mirror_files(uri), self._local_files())
+
+    def test_transceiver_push_failover(self):
+        uris = [self._mirror("mirror%d" % (idx,)) for idx in range(3)]
+        _FaultyUriHandler.unreachable.add(uris[1])
+        handler = self._handler(uris, parallel_mirrors = 2,
+            parallel_transfers = 2)
+        errors, fine, broken = handler.go()
+        self.assertTrue(errors)
+        self.assertEqual(fine, set([uris[0], uris[2]]))
+        self.assertEqual([x for x, _err in broken], [uris[1]])
+        self.assertEqual(self._mirror_files(uris[0]), self._local_files())
+        self.assertEqual(self._mirror_files(uris[1]), {})
+        self.assertEqual(self._mirror_files(uris[2]), self._local_files())
+
+    def test_transceiver_push_exception(self):
+        _FaultyUriHandler.errors.add("file3")
+        for parallel_mirrors in (1, 2):
+            uris = [self._mirror("mirror%d-%d" % (parallel_mirrors, idx)) \
+                        for idx in range(2)]
+            handler = self._handler(uris, parallel_mirrors = parallel_mirrors,
+                parallel_transfers = 2)
+            self.assertRaises(ValueError, handler.go)
+
+
 if __name__ == '__main__':
     unittest.main()
     raise SystemExit(0)
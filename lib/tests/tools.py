@@ -446,6 +446,45 @@ class ToolsTest(unittest.TestCase):
         finally:
             os.remove(tmp_path)
 
+    def test_entropy_delta_bspatch(self):
+        import bz2
+        import struct
+
+        def _offset(value):
+            if value < 0:
+                return struct.pack("<Q", -value | (1 << 63))
+            return struct.pack("<Q", value)
+
+        old = const_convert_to_rawstring("hello world, entropy")
+        new = const_convert_to_rawstring("hellp world! entropy rocks!!!")
+        # patch "hello world," into "hellp world!", copy " entropy",
+        # add " rocks" then seek past the end of old, where old bytes are 0
+        diff = bytearray(23)
+        diff[4] = 1
+        diff[11] = (ord("!") - ord(",")) % 256
+        diff[20:23] = bytearray(const_convert_to_rawstring("!!!"))
+        ctrl = _offset(12) + _offset(0) + _offset(0) + \
+            _offset(8) + _offset(6) + _offset(2) + \
+            _offset(3) + _offset(0) + _offset(-25)
+        ctrl_c = bz2.compress(ctrl)
+        diff_c = bz2.compress(bytes(diff))
+        extra_c = bz2.compress(const_convert_to_rawstring(" rocks"))
+
+        tmp_fd, tmp_path = const_mkstemp()
+        try:
+            with os.fdopen(tmp_fd, "wb") as tmp_f:
+                tmp_f.write(const_convert_to_rawstring("BSDIFF40"))
+                tmp_f.write(_offset(len(ctrl_c)) + _offset(len(diff_c)))
+                tmp_f.write(_offset(len(new)))
+                tmp_f.write(ctrl_c + diff_c + extra_c)
+                # trailing package metadata must be ignored
+                tmp_f.write(const_convert_to_rawstring("XPAKPACK"))
+            chunks = []
+            et._bspatch(old, tmp_path, chunks.append)
+            self.assertEqual(const_convert_to_rawstring("").join(chunks), new)
+        finally:
+            os.remove(tmp_path)
+
     def test_read_elf_class(self):
         elf_obj = _misc.get_dl_so_amd()
         elf_class = 2
@@ -544,6 +583,24 @@ class ToolsTest(unittest.TestCase):
         metadata = et.read_elf_linker_paths(elf_obj)
         self.assertEqual(metadata, known_meta)
 
+    def test_read_elf(self):
+        from entropy.elf import read_elf, read_elfs, ELFCLASS64
+        elf_path = _misc.get_dl_so_amd_2()
+        elf_obj = read_elf(elf_path)
+        self.assertEqual(elf_obj.elf_class, ELFCLASS64)
+        self.assertEqual(elf_obj.soname, "libkdb5.so.4")
+        self.assertEqual(elf_obj.needed, ['libgssrpc.so.4', 'libkrb5.so.3',
+            'libk5crypto.so.3', 'libcom_err.so.2', 'libkrb5support.so.0',
+            'libc.so.6'])
+        self.assertEqual(elf_obj.rpath, ['/usr/lib64'])
+        self.assertEqual(elf_obj.runpath, ['/usr/lib64'])
+        self.assertTrue(elf_obj.defined)
+
+        self.assertRaises(ValueError, read_elf, self.test_pkg)
+        elf_objs = read_elfs([elf_path, self.test_pkg])
+        self.assertEqual(elf_objs[elf_path].soname, "libkdb5.so.4")
+        self.assertTrue(elf_objs[self.test_pkg] is None)
+
     def test_xml_from_dict_extended(self):
         data = {
             "foo": 1,
@@ -638,6 +695,36 @@ class ToolsTest(unittest.TestCase):
 
         self.assertEqual(path_perms, new_path_perms)
 
+    def test_uncompress_entropy_package(self):
+
+        for test_pkg in self.test_pkgs:
+            tmp_dir = const_mkdtemp()
+            tmp_dir2 = const_mkdtemp()
+            fd, tmp_path = const_mkstemp()
+            os.close(fd)
+            fd, tmp_path2 = const_mkstemp()
+            os.close(fd)
+
+            rc = et.uncompress_tarball(test_pkg, extract_path = tmp_dir,
+                catch_empty = True)
+            self.assertEqual(rc, 0)
+            self.assertTrue(et.dump_entropy_metadata(test_pkg, tmp_path))
+
+            rc, unresolved = et.uncompress_entropy_package(test_pkg,
+                tmp_dir2, metadata_path = tmp_path2, catch_empty = True)
+            self.assertEqual(rc, 0)
+            self.assertTrue(isinstance(unresolved, list))
+            et.apply_tarball_ownership_entries(unresolved, tmp_dir2)
+
+            self.assertEqual(et.md5sum(tmp_path), et.md5sum(tmp_path2))
+            self.assertEqual(et.md5sum_directory(tmp_dir),
+                et.md5sum_directory(tmp_dir2))
+
+            shutil.rmtree(tmp_dir)
+            shutil.rmtree(tmp_dir2)
+            os.remove(tmp_path)
+            os.remove(tmp_path2)
+
 if __name__ == '__main__':
     unittest.main()
     raise SystemExit(0)
@@ -110,9 +110,10 @@ please use *eit files*.
         results = {}
         flatresults = {}
         reverse_symlink_map = self._settings()['system_rev_symlinks']
+        owners = repo.searchBelongsMany(self._paths)
         for xfile in self._paths:
             results[xfile] = set()
-            pkg_ids = repo.searchBelongs(xfile)
+            pkg_ids = owners[xfile]
             if not pkg_ids:
                 # try real path if possible
                 pkg_ids = repo.searchBelongs(os.path.realpath(xfile))